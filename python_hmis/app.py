@@ -1,13 +1,41 @@
 from __future__ import annotations
-import csv
-import io
+import functools
+import json
 import os
 import sys
 import sqlite3
-from datetime import datetime, date
-from typing import Any, Dict, List, Optional, Tuple
-
-from flask import Flask, redirect, render_template, request, Response, url_for, jsonify, send_from_directory
+import threading
+from datetime import datetime, date, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from flask import Flask, redirect, render_template, request, Response, url_for, jsonify, g, has_request_context
+
+import daily_counters
+import lab_orders
+import lab_ranges
+import latest_vitals
+import medication_safety
+import prescription_items
+import search
+import sync_ingest
+import vitals_analytics
+import vitals_rollups
+from csv_stream import csv_response, iter_cursor
+from db_pool import ConnectionPool, open_connection, pool_config_from_env
+from lab_orders import LabError
+from lab_ranges import RangeError, ReferenceRanges
+from listing import Field, Listing, ListingError, column, fetch_page, to_json as listing_to_json
+from medication_index import DEFAULT_LIMIT as SUGGEST_LIMIT, MAX_LIMIT as SUGGEST_MAX_LIMIT, MedicationIndex
+from medication_safety import SafetyError, SafetyRules
+from migrations import ABNORMAL_LAB_FLAGS, SYNCED_TABLES, current_version, migrate
+from query_trace import QueryTracer, trace_config_from_env, trace_enabled_from_env
+from request_metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, RequestMetrics, metrics_enabled_from_env
+from response_cache import ResponseCache, cache_config_from_env
+from static_assets import StaticAssets
+from vitals_analytics import AnalyticsError, VitalsColumns, bp_category
+from vitals_rollups import RollupError
+from write_queue import WriteQueue, write_config_from_env
 
 # Allow overriding data directory (useful for frozen/EXE builds)
 APP_DIR = os.environ.get("HMIS_DATA_DIR") or os.path.dirname(os.path.abspath(__file__))
@@ -19,6 +47,9 @@ os.makedirs(APP_DIR, exist_ok=True)
 DB_PATH = os.path.join(APP_DIR, "hmis.db")
 
 app = Flask(__name__)
+request_metrics = RequestMetrics()
+if metrics_enabled_from_env():
+    request_metrics.init_app(app)
 
 # Add CORS headers to all responses
 @app.after_request
@@ -26,8 +57,30 @@ def after_request(response):
     response.headers.add('Access-Control-Allow-Origin', '*')
     response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
+    response.headers.add('Access-Control-Expose-Headers', 'X-Next-Cursor, ETag, X-Cache, X-Query-Count, X-DB-Time')
     return response
 
+# Rebuild/reconcile endpoints rewrite whole tables under the exclusive writer,
+# and the CORS policy above lets any page a clinician opens send a POST. They
+# are off unless HMIS_MAINTENANCE_API=1, and then only answer requests from
+# this machine that no other site sent. Each has a CLI (python <module>.py).
+MAINTENANCE_API = os.environ.get("HMIS_MAINTENANCE_API", "0") in ("1", "true", "on")
+LOOPBACK_ADDRS = ("127.0.0.1", "::1")
+
+
+def maintenance_endpoint(view: Callable[..., Any]) -> Callable[..., Any]:
+    @functools.wraps(view)
+    def guarded(*args: Any, **kwargs: Any) -> Any:
+        if not MAINTENANCE_API:
+            return jsonify({"error": "Maintenance endpoints are off; set HMIS_MAINTENANCE_API=1"}), 403
+        origin = request.headers.get("Origin")
+        if request.remote_addr not in LOOPBACK_ADDRS or (origin and urlsplit(origin).netloc != request.host):
+            return jsonify({"error": "Maintenance endpoints only answer local, same-origin requests"}), 403
+        return view(*args, **kwargs)
+
+    return guarded
+
+
 # Handle preflight requests
 @app.route('/<path:path>', methods=['OPTIONS'])
 @app.route('/', methods=['OPTIONS'])
@@ -40,330 +93,168 @@ def handle_options(path=None):
 
 # --- Frontend (serve SPA) ---
 
+# Read and precompressed once here, served from memory; see static_assets.py.
+# Referenced assets go first so the SPA's links to them get hashed URLs.
+static_assets = StaticAssets()
+static_assets.add_dir(PUBLIC_DIR, "public/")
+for _name in ("nhce_25-scaled-1-2048x683.png", "nhce_logo.png", "favicon.ico"):
+    static_assets.add(_name, PROJECT_ROOT, PUBLIC_DIR)
+static_assets.add("hmis-standalone.html", PROJECT_ROOT)
+
+
 @app.route("/")
 def serve_spa_root():
     """Serve the standalone SPA (hmis-standalone.html) from project root."""
-    spa_path = os.path.join(PROJECT_ROOT, "hmis-standalone.html")
-    if os.path.exists(spa_path):
-        return send_from_directory(PROJECT_ROOT, "hmis-standalone.html")
+    spa = static_assets.get("hmis-standalone.html")
+    if spa:
+        return static_assets.response(spa)
     # Fallback to simple template if standalone file missing
     return render_template("index.html")
 
 
+def _serve_asset(name: str, missing=("Not Found", 404)):
+    asset = static_assets.get(name)
+    return static_assets.response(asset) if asset else missing
+
+
 @app.route("/hmis-standalone.html")
 def serve_spa_explicit():
-    return send_from_directory(PROJECT_ROOT, "hmis-standalone.html")
+    return _serve_asset("hmis-standalone.html")
+
+
+@app.route("/assets/<digest>/<path:name>")
+def serve_hashed_asset(digest: str, name: str):
+    """Content-addressed URL for any asset: safe to cache forever."""
+    asset = static_assets.get_hashed(digest, name)
+    if not asset:
+        return ("Not Found", 404)
+    return static_assets.response(asset, immutable=True)
 
 
 @app.route("/public/<path:filename>")
 def serve_public(filename: str):
-    if os.path.exists(os.path.join(PUBLIC_DIR, filename)):
-        return send_from_directory(PUBLIC_DIR, filename)
-    return ("Not Found", 404)
+    return _serve_asset("public/" + filename)
 
 
 @app.route("/favicon.ico")
 def serve_favicon():
-    # Try public first, then project root
-    fav_public = os.path.join(PUBLIC_DIR, "favicon.ico")
-    if os.path.exists(fav_public):
-        return send_from_directory(PUBLIC_DIR, "favicon.ico")
-    fav_root = os.path.join(PROJECT_ROOT, "favicon.ico")
-    if os.path.exists(fav_root):
-        return send_from_directory(PROJECT_ROOT, "favicon.ico")
-    return ("", 204)
+    # Public first, then project root
+    return _serve_asset("public/favicon.ico", None) or _serve_asset("favicon.ico", ("", 204))
 
 
 # A few known root-level assets referenced by the SPA
 @app.route("/nhce_25-scaled-1-2048x683.png")
 def serve_root_banner():
-    return send_from_directory(PROJECT_ROOT, "nhce_25-scaled-1-2048x683.png")
+    return _serve_asset("nhce_25-scaled-1-2048x683.png")
 
 @app.route("/nhce_logo.png")
 def serve_root_logo():
-    return send_from_directory(PROJECT_ROOT, "nhce_logo.png")
+    return _serve_asset("nhce_logo.png")
+
+
+@app.route("/api/debug/static-assets")
+def api_static_asset_stats():
+    """Bytes held per asset and encoding."""
+    return jsonify(static_assets.stats())
 
 # --- Database helpers ---
 
+_pool = ConnectionPool(DB_PATH, **pool_config_from_env())
+# Every write goes through one writer thread and connection, see write_queue.py;
+# the pool above serves reads
+writer = WriteQueue(lambda: open_connection(DB_PATH, pool_config_from_env()["pragmas"]),
+                    **write_config_from_env())
+# Per-request statement counts, slow-query log and N+1 flags, see query_trace.py
+query_tracer = QueryTracer(**trace_config_from_env())
+if trace_enabled_from_env():
+    query_tracer.init_app(app, _pool.acquire)
+# Write paths bump the tables they touched after commit; see response_cache.py
+response_cache = ResponseCache(cache_config_from_env())
+# Columnar copy of vitals behind /api/analytics/vitals, loaded on first use
+vitals_columns = VitalsColumns()
+# Prefix index behind /api/medications/suggest, loaded on first use
+medication_index = MedicationIndex()
+# Allergy/interaction maps behind prescribe-time screening, loaded on first use
+safety_rules = SafetyRules()
+# Parsed reference ranges per lab test, for flagging results as they are written
+reference_ranges = ReferenceRanges()
+
+
 def get_db() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON;")
+    """Pooled connection; inside a request every call shares one connection."""
+    if not has_request_context():
+        return _pool.acquire()
+    conn = g.get("_db")
+    if conn is None or not conn.checked_out:
+        conn = _pool.acquire()
+        conn.request_bound = True
+        g._db = conn
     return conn
 
 
+def _write(sql: str, params: Tuple[Any, ...] = ()) -> int:
+    """Run one write statement on the writer; return lastrowid once committed."""
+    return writer.submit(lambda conn: conn.execute(sql, params).lastrowid)
+
+
+@app.teardown_request
+def release_db(exc: Optional[BaseException] = None) -> None:
+    conn = g.pop("_db", None)
+    if conn is not None:
+        _pool.release(conn)
+
+
 def init_db() -> None:
+    """Bring the schema up to date. Run once at startup, never per request."""
+    global _schema_ready
+    with _schema_lock:
+        conn = get_db()
+        try:
+            migrate(conn)
+        finally:
+            conn.close()
+        _schema_ready = True
+
+
+def run_maintenance(job: Callable[[sqlite3.Connection], Any], exclusive: bool = True) -> Any:
+    """Run a rebuild/reconcile job for a module's command line.
+
+    Migrates, then runs ``job`` as the maintenance endpoints do: an exclusive
+    unit on the writer connection, with the pool's PRAGMAs (foreign keys,
+    WAL, busy_timeout, so it waits out a running server's writes). Jobs that
+    submit their own writes to ``writer`` pass ``exclusive=False`` and get a
+    pooled connection to read from.
+    """
+    init_db()
+    try:
+        if exclusive:
+            return writer.submit(job, exclusive=True)
+        conn = get_db()
+        try:
+            return job(conn)
+        finally:
+            conn.close()
+    finally:
+        _pool.close_all()
+
+
+def schema_version() -> int:
     conn = get_db()
-    cur = conn.cursor()
-    # Create tables if not existing (idempotent)
-    cur.executescript(
-        """
-        CREATE TABLE IF NOT EXISTS patients (
-            usn TEXT PRIMARY KEY,
-            full_name TEXT NOT NULL,
-            age INTEGER NOT NULL,
-            gender TEXT NOT NULL,
-            contact TEXT NOT NULL,
-            address TEXT NOT NULL
-        );
-
-        CREATE TABLE IF NOT EXISTS vitals (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            usn TEXT NOT NULL,
-            weight REAL NOT NULL,
-            height REAL NOT NULL,
-            bmi REAL GENERATED ALWAYS AS (weight / ((height/100.0) * (height/100.0))) STORED,
-            blood_pressure_systolic INTEGER NOT NULL,
-            blood_pressure_diastolic INTEGER NOT NULL,
-            heart_rate INTEGER NOT NULL,
-            temperature REAL NOT NULL,
-            respiratory_rate INTEGER NULL,
-            oxygen_saturation INTEGER NULL,
-            notes TEXT NULL,
-            recorded_at TEXT NOT NULL,
-            recorded_by TEXT NOT NULL DEFAULT 'System User',
-            FOREIGN KEY (usn) REFERENCES patients(usn) ON DELETE CASCADE
-        );
-
-        CREATE TABLE IF NOT EXISTS prescriptions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            usn TEXT NOT NULL,
-            diagnosis TEXT NOT NULL,
-            medications TEXT NOT NULL, -- JSON string of medications array
-            notes TEXT NULL,
-            follow_up_date TEXT NULL,
-            prescribed_at TEXT NOT NULL,
-            prescribed_by TEXT DEFAULT 'NHCE Clinic',
-            status TEXT DEFAULT 'Active',
-            patient_name TEXT NULL,
-            patient_age INTEGER NULL,
-            patient_gender TEXT NULL,
-            FOREIGN KEY (usn) REFERENCES patients(usn) ON DELETE CASCADE
-        );
-
-        -- New: encounters (visits)
-        CREATE TABLE IF NOT EXISTS encounters (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            usn TEXT NOT NULL,
-            encounter_dt TEXT NOT NULL,
-            encounter_type TEXT NOT NULL DEFAULT 'OPD',
-            clinician TEXT NULL,
-            reason TEXT NULL,
-            notes TEXT NULL,
-            FOREIGN KEY (usn) REFERENCES patients(usn) ON DELETE CASCADE
-        );
-
-        -- New: problems (conditions)
-        CREATE TABLE IF NOT EXISTS problems (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            usn TEXT NOT NULL,
-            code TEXT NULL,
-            description TEXT NOT NULL,
-            onset_date TEXT NULL,
-            status TEXT NOT NULL DEFAULT 'Active',
-            recorded_at TEXT NOT NULL,
-            FOREIGN KEY (usn) REFERENCES patients(usn) ON DELETE CASCADE
-        );
-
-        -- New: allergies
-        CREATE TABLE IF NOT EXISTS allergies (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            usn TEXT NOT NULL,
-            substance TEXT NOT NULL,
-            reaction TEXT NULL,
-            severity TEXT NULL,
-            recorded_at TEXT NOT NULL,
-            FOREIGN KEY (usn) REFERENCES patients(usn) ON DELETE CASCADE
-        );
-
-        -- New: medications master
-        CREATE TABLE IF NOT EXISTS medications (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            generic_name TEXT NULL,
-            form TEXT NULL,
-            strength TEXT NULL,
-            is_active INTEGER NOT NULL DEFAULT 1,
-            UNIQUE(name, strength, form)
-        );
-
-        -- New: itemized prescription lines
-        CREATE TABLE IF NOT EXISTS prescription_items (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            prescription_id INTEGER NOT NULL,
-            medication_id INTEGER NOT NULL,
-            dose TEXT NULL,
-            route TEXT NULL,
-            frequency TEXT NULL,
-            duration_days INTEGER NULL,
-            instructions TEXT NULL,
-            FOREIGN KEY (prescription_id) REFERENCES prescriptions(id) ON DELETE CASCADE,
-            FOREIGN KEY (medication_id) REFERENCES medications(id)
-        );
-
-        -- New: lab tests and orders
-        CREATE TABLE IF NOT EXISTS lab_tests (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            code TEXT NOT NULL UNIQUE,
-            name TEXT NOT NULL,
-            specimen TEXT NULL,
-            unit TEXT NULL,
-            ref_range TEXT NULL,
-            is_active INTEGER NOT NULL DEFAULT 1
-        );
-
-        CREATE TABLE IF NOT EXISTS lab_orders (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            usn TEXT NOT NULL,
-            encounter_id INTEGER NULL,
-            ordered_at TEXT NOT NULL,
-            status TEXT NOT NULL DEFAULT 'Ordered',
-            notes TEXT NULL,
-            FOREIGN KEY (usn) REFERENCES patients(usn) ON DELETE CASCADE,
-            FOREIGN KEY (encounter_id) REFERENCES encounters(id) ON DELETE SET NULL
-        );
-
-        CREATE TABLE IF NOT EXISTS lab_order_items (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            lab_order_id INTEGER NOT NULL,
-            lab_test_id INTEGER NOT NULL,
-            status TEXT NOT NULL DEFAULT 'Ordered',
-            result_value TEXT NULL,
-            result_notes TEXT NULL,
-            result_at TEXT NULL,
-            FOREIGN KEY (lab_order_id) REFERENCES lab_orders(id) ON DELETE CASCADE,
-            FOREIGN KEY (lab_test_id) REFERENCES lab_tests(id)
-        );
-
-        -- New: appointments (calendar)
-        CREATE TABLE IF NOT EXISTS appointments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            usn TEXT NOT NULL,
-            starts_at TEXT NOT NULL,
-            ends_at TEXT NOT NULL,
-            status TEXT NOT NULL DEFAULT 'Scheduled',
-            title TEXT NULL,
-            clinician TEXT NULL,
-            notes TEXT NULL,
-            FOREIGN KEY (usn) REFERENCES patients(usn) ON DELETE CASCADE
-        );
-
-        -- New: inventory (basic)
-        CREATE TABLE IF NOT EXISTS inventory_items (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            medication_id INTEGER NULL,
-            sku TEXT UNIQUE,
-            name TEXT NOT NULL,
-            unit TEXT NULL,
-            is_active INTEGER NOT NULL DEFAULT 1,
-            FOREIGN KEY (medication_id) REFERENCES medications(id)
-        );
-
-        CREATE TABLE IF NOT EXISTS inventory_stock (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            item_id INTEGER NOT NULL,
-            quantity_on_hand INTEGER NOT NULL DEFAULT 0,
-            reorder_level INTEGER NULL,
-            updated_at TEXT NOT NULL,
-            UNIQUE(item_id),
-            FOREIGN KEY (item_id) REFERENCES inventory_items(id) ON DELETE CASCADE
-        );
-
-        CREATE TABLE IF NOT EXISTS inventory_movements (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            item_id INTEGER NOT NULL,
-            movement_dt TEXT NOT NULL,
-            quantity INTEGER NOT NULL,
-            reason TEXT NULL,
-            ref_type TEXT NULL,
-            ref_id INTEGER NULL,
-            FOREIGN KEY (item_id) REFERENCES inventory_items(id) ON DELETE CASCADE
-        );
-
-        -- New: audit logs
-        CREATE TABLE IF NOT EXISTS audit_logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            occurred_at TEXT NOT NULL,
-            entity TEXT NOT NULL,
-            entity_id TEXT NOT NULL,
-            action TEXT NOT NULL,
-            details TEXT NULL
-        );
-
-        -- New: case reports
-        CREATE TABLE IF NOT EXISTS case_reports (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            report_number TEXT NOT NULL UNIQUE,
-            usn TEXT NOT NULL,
-            patient_name TEXT NULL,
-            patient_age INTEGER NULL,
-            patient_gender TEXT NULL,
-            report_type TEXT NOT NULL DEFAULT 'medical',
-            chief_complaint TEXT NULL,
-            history_of_present_illness TEXT NULL,
-            past_medical_history TEXT NULL,
-            family_history TEXT NULL,
-            social_history TEXT NULL,
-            physical_examination TEXT NULL,
-            investigations TEXT NULL,
-            diagnosis TEXT NULL,
-            treatment TEXT NULL,
-            prognosis TEXT NULL,
-            recommendations TEXT NULL,
-            follow_up TEXT NULL,
-            doctor_name TEXT NULL,
-            report_date TEXT NULL,
-            status TEXT NOT NULL DEFAULT 'Active',
-            created_at TEXT NOT NULL DEFAULT (datetime('now')),
-            FOREIGN KEY (usn) REFERENCES patients(usn) ON DELETE CASCADE
-        );
-
-        -- New: sick intimations
-        CREATE TABLE IF NOT EXISTS sick_intimations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            intimation_number TEXT NOT NULL UNIQUE,
-            usn TEXT NOT NULL,
-            patient_name TEXT NULL,
-            patient_age INTEGER NULL,
-            patient_gender TEXT NULL,
-            case_report_id TEXT NULL, -- report_number
-            sick_leave_from TEXT NOT NULL,
-            sick_leave_to TEXT NOT NULL,
-            total_days INTEGER NULL,
-            reason TEXT NOT NULL,
-            symptoms TEXT NULL,
-            rest_recommended INTEGER NOT NULL DEFAULT 1,
-            doctor_name TEXT NULL,
-            issue_date TEXT NULL,
-            status TEXT NOT NULL DEFAULT 'Active',
-            created_at TEXT NOT NULL DEFAULT (datetime('now')),
-            FOREIGN KEY (usn) REFERENCES patients(usn) ON DELETE CASCADE
-        );
-        """
-    )
+    try:
+        return current_version(conn)
+    finally:
+        conn.close()
 
-    # Seed some lab tests if empty
-    if cur.execute("SELECT COUNT(1) FROM lab_tests").fetchone()[0] == 0:
-        cur.executemany(
-            "INSERT INTO lab_tests(code, name, specimen, unit, ref_range) VALUES(?,?,?,?,?)",
-            [
-                ("CBC", "Complete Blood Count", "Blood", None, None),
-                ("GLU", "Blood Glucose (Fasting)", "Blood", "mg/dL", "70-100"),
-                ("LFT", "Liver Function Test", "Blood", None, None),
-            ],
-        )
 
-    conn.commit()
-    conn.close()
+_schema_ready = False
+_schema_lock = threading.Lock()
 
 
 @app.before_request
 def ensure_db() -> None:
-    # Auto-create DB and tables
-    if not os.path.exists(DB_PATH):
-        init_db()
-    else:
-        # Ensure new tables exist on older DBs
+    # Entry points (launcher, __main__) migrate at startup; this only covers
+    # embedders such as tests or `flask run` that skip that step.
+    if not _schema_ready:
         init_db()
 
 
@@ -423,17 +314,14 @@ def patient_create() -> Response:
     except ValueError:
         return redirect(url_for("index", e="Age must be a number"))
 
-    conn = get_db()
     try:
-        conn.execute(
+        _write(
             "INSERT INTO patients(usn, full_name, age, gender, contact, address) VALUES(?,?,?,?,?,?)",
             (data["usn"], data["full_name"], age, data["gender"], data["contact"], data["address"]),
         )
-        conn.commit()
     except sqlite3.IntegrityError:
         return redirect(url_for("index", e="USN must be unique"))
-    finally:
-        conn.close()
+    response_cache.bump("patients")
 
     return redirect(url_for("index", m="Patient created"))
 
@@ -455,23 +343,19 @@ def patient_update() -> Response:
     except ValueError:
         return redirect(url_for("index", e="Age must be a number"))
 
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute(
+    _write(
         "UPDATE patients SET full_name=?, age=?, gender=?, contact=?, address=? WHERE usn=?",
         (full_name, age, gender, contact, address, usn),
     )
-    conn.commit()
-    conn.close()
+    response_cache.bump("patients")
     return redirect(url_for("index", m="Patient updated", q=usn))
 
 
 @app.post("/patient/delete/<usn>")
 def patient_delete(usn: str) -> Response:
-    conn = get_db()
-    conn.execute("DELETE FROM patients WHERE usn=?", (usn,))
-    conn.commit()
-    conn.close()
+    _write("DELETE FROM patients WHERE usn=?", (usn,))
+    # Deletes cascade to every patient-linked table
+    response_cache.bump_all()
     return redirect(url_for("index", m="Patient deleted"))
 
 
@@ -511,39 +395,117 @@ def vitals_create() -> Response:
         conn.close()
         return redirect(url_for("index", e="Patient not found", q=usn))
 
-    conn.execute(
+    conn.close()
+
+    _write(
         """INSERT INTO vitals(usn, weight, height, blood_pressure_systolic, blood_pressure_diastolic, 
            heart_rate, temperature, respiratory_rate, oxygen_saturation, notes, recorded_at) 
            VALUES(?,?,?,?,?,?,?,?,?,?,?)""",
         (usn, weight_f, height_f, bp_sys_i, bp_dia_i, hr_i, temp_f, resp_rate_i, o2_sat_i, notes, datetime.utcnow().isoformat()),
     )
-    conn.commit()
-    conn.close()
+    response_cache.bump("vitals")
     return redirect(url_for("index", m="Vitals saved", q=usn))
 
 
 # API endpoints for frontend integration
+
+# Row -> frontend (camelCase) format, shared by list, sync and chart endpoints.
+# Each field names the columns it needs so ?fields= can narrow the SELECT.
+def _medications(row: sqlite3.Row) -> List[Any]:
+    try:
+        return json.loads(row["medications"]) if row["medications"] else []
+    except ValueError:
+        return []
+
+
+PATIENTS_LISTING = Listing("patients", ("full_name", "usn"), False, {
+    "id": Field(("usn",), lambda r: hash(r["usn"]) % (10**8)),  # Generate consistent ID
+    "usn": column("usn"),
+    "fullName": column("full_name"),
+    "age": column("age"),
+    "gender": column("gender"),
+    "contact": column("contact"),
+    "phone": column("contact"),  # Alias for compatibility
+    "address": column("address"),
+})
+
+VITALS_LISTING = Listing("vitals", ("recorded_at", "id"), True, {
+    "id": column("id"),
+    "usn": column("usn"),
+    "weight": column("weight"),
+    "height": column("height"),
+    "bmi": column("bmi"),
+    "bloodPressureSystolic": column("blood_pressure_systolic"),
+    "bloodPressureDiastolic": column("blood_pressure_diastolic"),
+    "heartRate": column("heart_rate"),
+    "temperature": column("temperature"),
+    "respiratoryRate": column("respiratory_rate"),
+    "oxygenSaturation": column("oxygen_saturation"),
+    "notes": column("notes"),
+    "recordedAt": column("recorded_at"),
+    "recordedBy": column("recorded_by"),
+})
+
+PRESCRIPTIONS_LISTING = Listing("prescriptions", ("prescribed_at", "id"), True, {
+    "id": column("id"),
+    "usn": column("usn"),
+    "diagnosis": column("diagnosis"),
+    "medications": Field(("medications",), _medications),
+    "notes": column("notes"),
+    "followUpDate": column("follow_up_date"),
+    "prescribedAt": column("prescribed_at"),
+    "prescribedBy": column("prescribed_by"),
+    "status": column("status"),
+    "patientName": column("patient_name"),
+    "patientAge": column("patient_age"),
+    "patientGender": column("patient_gender"),
+})
+
+# Case reports, sick intimations and lab tests are returned under their column
+# names. The columns are listed so the change-tracking ones (rowversion,
+# updated_at) stay internal; the first two are the columns sync writes
+LAB_TEST_COLUMNS = ("id", "code", "name", "specimen", "unit", "ref_range", "is_active", "critical_low",
+                    "critical_high")
+CASE_REPORTS_LISTING = Listing("case_reports", ("created_at", "id"), True,
+                               {c: column(c) for c in sync_ingest.CASE_REPORT_COLUMNS})
+SICK_INTIMATIONS_LISTING = Listing("sick_intimations", ("created_at", "id"), True,
+                                   {c: column(c) for c in sync_ingest.SICK_INTIMATION_COLUMNS})
+# A view over the flagged lab_order_items (migration 12), paged on their partial index
+ABNORMAL_LAB_RESULTS_LISTING = Listing("abnormal_lab_results", ("result_at", "id"), True)
+
+
+def patient_to_json(row: sqlite3.Row) -> Dict[str, Any]:
+    return listing_to_json(PATIENTS_LISTING, row)
+
+
+def vital_to_json(row: sqlite3.Row) -> Dict[str, Any]:
+    return listing_to_json(VITALS_LISTING, row)
+
+
+def prescription_to_json(row: sqlite3.Row) -> Dict[str, Any]:
+    return listing_to_json(PRESCRIPTIONS_LISTING, row)
+
+
+def _list_response(listing: Listing, where: str = "", params: Tuple[Any, ...] = ()) -> Response:
+    """GET handler body for the paginated list endpoints (see listing.py)."""
+    conn = get_db()
+    try:
+        page = fetch_page(conn, listing, request.args, where, params)
+    except ListingError as e:
+        return jsonify({"error": str(e)}), 400
+    finally:
+        conn.close()
+    response = jsonify(page.items)
+    if page.next_cursor:
+        response.headers["X-Next-Cursor"] = page.next_cursor
+    return response
+
+
 @app.route("/api/patients", methods=["GET", "POST"])
+@response_cache.cached("patients")
 def api_patients():
     if request.method == "GET":
-        conn = get_db()
-        patients = conn.execute("SELECT * FROM patients ORDER BY full_name").fetchall()
-        conn.close()
-        
-        # Convert to frontend format
-        result = []
-        for row in patients:
-            result.append({
-                "id": hash(row["usn"]) % (10**8),  # Generate consistent ID
-                "usn": row["usn"],
-                "fullName": row["full_name"],
-                "age": row["age"],
-                "gender": row["gender"],
-                "contact": row["contact"],
-                "phone": row["contact"],  # Alias for compatibility
-                "address": row["address"]
-            })
-        return jsonify(result)
+        return _list_response(PATIENTS_LISTING)
     
     elif request.method == "POST":
         data = request.get_json()
@@ -562,13 +524,15 @@ def api_patients():
         except (ValueError, TypeError):
             return jsonify({"error": "Age must be a number"}), 400
 
-        conn = get_db()
         try:
-            conn.execute(
-                "INSERT OR REPLACE INTO patients(usn, full_name, age, gender, contact, address) VALUES(?,?,?,?,?,?)",
+            _write(
+                # Upsert, not INSERT OR REPLACE: REPLACE deletes the row and cascades to vitals etc.
+                """INSERT INTO patients(usn, full_name, age, gender, contact, address) VALUES(?,?,?,?,?,?)
+                   ON CONFLICT(usn) DO UPDATE SET full_name=excluded.full_name, age=excluded.age,
+                   gender=excluded.gender, contact=excluded.contact, address=excluded.address""",
                 (usn, full_name, age, gender, contact or "", address or ""),
             )
-            conn.commit()
+            response_cache.bump("patients")
             
             # Return the created patient in frontend format
             result = {
@@ -584,8 +548,6 @@ def api_patients():
             return jsonify(result), 201
         except sqlite3.IntegrityError:
             return jsonify({"error": "USN already exists"}), 409
-        finally:
-            conn.close()
 
 
 @app.route("/api/patients/<usn>", methods=["DELETE"])
@@ -593,52 +555,186 @@ def api_patient_delete(usn: str):
     """Delete a patient and cascade related records."""
     if not usn:
         return jsonify({"error": "USN required"}), 400
+    deleted = writer.submit(lambda conn: conn.execute("DELETE FROM patients WHERE usn=?", (usn,)).rowcount)
+    if not deleted:
+        return jsonify({"ok": True, "deleted": False})
+    response_cache.bump_all()
+    return jsonify({"ok": True, "deleted": True})
+
+CHART_DEFAULT_LIMIT = 20
+CHART_MAX_LIMIT = 200
+
+# Chart sections served by a Listing: newest first, with a cursor for the list endpoint
+_CHART_LISTINGS = {
+    "vitals": VITALS_LISTING,
+    "prescriptions": PRESCRIPTIONS_LISTING,
+    "case_reports": CASE_REPORTS_LISTING,
+    "sick_intimations": SICK_INTIMATIONS_LISTING,
+}
+CHART_SECTIONS = (*_CHART_LISTINGS, "appointments", "lab_orders")
+# Everything the chart reads, for response cache invalidation
+CHART_TABLES = (*CHART_SECTIONS, "lab_order_items", "lab_tests")
+
+
+@app.get("/api/patients/<usn>/chart")
+@response_cache.cached("patients", *CHART_TABLES)
+def api_patient_chart(usn: str):
+    """Patient plus their most recent records, in one request and one read snapshot.
+
+    ``?limit=N`` caps every section (default 20, max 200); ``?<section>_limit=N``
+    overrides one. ``has_more`` flags truncated sections and ``cursors`` gives
+    the ``?after=`` value to page the rest from the matching list endpoint.
+    """
+    limits: Dict[str, int] = {}
+    try:
+        default = int(request.args.get("limit") or CHART_DEFAULT_LIMIT)
+        for section in CHART_SECTIONS:
+            limits[section] = int(request.args.get(f"{section}_limit") or default)
+    except ValueError:
+        return jsonify({"error": "limits must be integers"}), 400
+    if any(n < 0 for n in limits.values()):
+        return jsonify({"error": "limits must not be negative"}), 400
+    limits = {k: min(n, CHART_MAX_LIMIT) for k, n in limits.items()}
+
     conn = get_db()
-    cur = conn.cursor()
-    # Ensure patient exists
-    exists = cur.execute("SELECT 1 FROM patients WHERE usn=?", (usn,)).fetchone()
-    if not exists:
+    # One read transaction so every section is read at the same snapshot
+    conn.execute("BEGIN")
+    try:
+        patient = conn.execute("SELECT * FROM patients WHERE usn=?", (usn,)).fetchone()
+        if not patient:
+            return jsonify({"error": "Patient not found"}), 404
+
+        latest = latest_vitals.read(conn, usn)
+        chart: Dict[str, Any] = {
+            "patient": patient_to_json(patient),
+            # Chart header; independent of vitals_limit
+            "latest_vitals": vital_to_json(latest) if latest is not None else None,
+        }
+        has_more: Dict[str, bool] = {}
+        cursors: Dict[str, Optional[str]] = {}
+        for section, listing in _CHART_LISTINGS.items():
+            if not limits[section]:
+                chart[section], has_more[section], cursors[section] = [], False, None
+                continue
+            page = fetch_page(conn, listing, {"limit": str(limits[section])}, "usn=?", (usn,))
+            chart[section] = page.items
+            has_more[section] = page.next_cursor is not None
+            cursors[section] = page.next_cursor
+
+        appointments = conn.execute(
+            "SELECT * FROM appointments WHERE usn = ? ORDER BY starts_at DESC LIMIT ?",
+            (usn, limits["appointments"] + 1),
+        ).fetchall()
+        chart["appointments"] = [dict(r) for r in appointments[:limits["appointments"]]]
+        has_more["appointments"] = len(appointments) > limits["appointments"]
+
+        # Same row shape as /api/lab-orders?usn=, one row per item. The limit
+        # counts orders, so a panel is never cut off partway through its tests
+        lab_orders = conn.execute(
+            """
+            SELECT lo.*, loi.id AS item_id, lt.code, lt.name, loi.status, loi.result_value, loi.result_at,
+                   loi.flag
+            FROM (SELECT * FROM lab_orders WHERE usn = ? ORDER BY ordered_at DESC, id DESC LIMIT ?) lo
+            JOIN lab_order_items loi ON loi.lab_order_id = lo.id
+            JOIN lab_tests lt ON lt.id = loi.lab_test_id
+            """,
+            (usn, limits["lab_orders"] + 1),
+        ).fetchall()
+        # Newest order first, items in entry order; sorted here, it is only limit + 1 orders
+        lab_orders.sort(key=lambda r: r["item_id"])
+        lab_orders.sort(key=lambda r: (r["ordered_at"], r["id"]), reverse=True)
+        order_ids = list(dict.fromkeys(r["id"] for r in lab_orders))
+        shown = set(order_ids[:limits["lab_orders"]])
+        chart["lab_orders"] = [dict(r) for r in lab_orders if r["id"] in shown]
+        has_more["lab_orders"] = len(order_ids) > limits["lab_orders"]
+    finally:
+        conn.rollback()
+
+    chart["has_more"] = has_more
+    chart["cursors"] = cursors
+    return jsonify(chart)
+
+
+@app.get("/api/patients/<usn>/vitals/series")
+@response_cache.cached("vitals")
+def api_vitals_series(usn: str):
+    """Vitals downsampled to day/week/month buckets from vitals_rollups.
+
+    ``?resolution=day|week|month|auto`` (auto: finest with at most 400 points),
+    ``?agg=min,max,mean``, ``?metrics=systolic,bmi`` and ``?from=&to=`` dates.
+    """
+    try:
+        query = vitals_rollups.parse_query(request.args)
+    except RollupError as e:
+        return jsonify({"error": str(e)}), 400
+    conn = get_db()
+    try:
+        if not conn.execute("SELECT 1 FROM patients WHERE usn=?", (usn,)).fetchone():
+            return jsonify({"error": "Patient not found"}), 404
+        return jsonify(vitals_rollups.read_series(conn, usn, query))
+    finally:
         conn.close()
-        return jsonify({"ok": True, "deleted": False})
-    cur.execute("DELETE FROM patients WHERE usn=?", (usn,))
-    conn.commit()
+
+
+@app.get("/api/search")
+def api_search():
+    """Ranked full-text search, see search.py.
+
+    ``?q=`` words, ``?mode=prefix|trigram``, ``?types=patients,case_reports,prescriptions``
+    and ``?limit=`` per type (default 20, max 100).
+    """
+    q = (request.args.get("q") or "").strip()
+    mode = request.args.get("mode") or "prefix"
+    if mode not in search.MODES:
+        return jsonify({"error": f"mode must be one of: {', '.join(search.MODES)}"}), 400
+    types = [t.strip() for t in (request.args.get("types") or "").split(",") if t.strip()]
+    unknown = [t for t in types if t not in search.SEARCH_TYPES]
+    if unknown:
+        return jsonify({"error": f"Unknown types: {', '.join(unknown)}"}), 400
+    try:
+        limit = min(int(request.args.get("limit") or search.DEFAULT_LIMIT), search.MAX_LIMIT)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if limit < 1:
+        return jsonify({"error": "limit must be positive"}), 400
+
+    conn = get_db()
+    results = search.search(conn, q, mode, types or tuple(search.SEARCH_TYPES), limit)
     conn.close()
-    return jsonify({"ok": True, "deleted": True})
+    return jsonify({"q": q, "mode": mode, "results": results})
+
+
+@app.get("/api/medications/suggest")
+def api_medication_suggest():
+    """Typeahead over medication names, generic names, strengths and forms; see medication_index.py.
+
+    ``?q=para 500``, ``?limit=`` (default 10, max 50), ``?include_inactive=1``.
+    """
+    q = (request.args.get("q") or "").strip()
+    try:
+        limit = min(int(request.args.get("limit") or SUGGEST_LIMIT), SUGGEST_MAX_LIMIT)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if limit < 1:
+        return jsonify({"error": "limit must be positive"}), 400
+    include_inactive = (request.args.get("include_inactive") or "") in ("1", "true")
+
+    conn = get_db()
+    try:
+        medication_index.refresh(conn)
+    finally:
+        conn.close()
+    return jsonify({"q": q, "results": medication_index.suggest(q, limit, include_inactive)})
+
 
 @app.route("/api/vitals", methods=["GET", "POST"])
+@response_cache.cached("vitals")
 def api_vitals():
     if request.method == "GET":
         usn = request.args.get("usn")
-        conn = get_db()
         if usn:
-            vitals = conn.execute(
-                "SELECT * FROM vitals WHERE usn=? ORDER BY recorded_at DESC", 
-                (usn,)
-            ).fetchall()
-        else:
-            vitals = conn.execute("SELECT * FROM vitals ORDER BY recorded_at DESC").fetchall()
-        conn.close()
-        
-        # Convert to frontend format
-        result = []
-        for row in vitals:
-            result.append({
-                "id": row["id"],
-                "usn": row["usn"],
-                "weight": row["weight"],
-                "height": row["height"],
-                "bmi": row["bmi"],
-                "bloodPressureSystolic": row["blood_pressure_systolic"],
-                "bloodPressureDiastolic": row["blood_pressure_diastolic"],
-                "heartRate": row["heart_rate"],
-                "temperature": row["temperature"],
-                "respiratoryRate": row["respiratory_rate"],
-                "oxygenSaturation": row["oxygen_saturation"],
-                "notes": row["notes"],
-                "recordedAt": row["recorded_at"],
-                "recordedBy": row["recorded_by"]
-            })
-        return jsonify(result)
+            return _list_response(VITALS_LISTING, "usn=?", (usn,))
+        return _list_response(VITALS_LISTING)
     
     elif request.method == "POST":
         data = request.get_json()
@@ -671,36 +767,25 @@ def api_vitals():
             return jsonify({"error": "Patient not found"}), 404
 
         try:
-            cur = conn.cursor()
-            cur.execute(
-                """INSERT OR REPLACE INTO vitals(id, usn, weight, height, blood_pressure_systolic, blood_pressure_diastolic, 
+            lastrowid = _write(
+                # Upsert, not INSERT OR REPLACE: REPLACE skips the delete triggers (counters, sync)
+                """INSERT INTO vitals(id, usn, weight, height, blood_pressure_systolic, blood_pressure_diastolic, 
                    heart_rate, temperature, respiratory_rate, oxygen_saturation, notes, recorded_at, recorded_by) 
-                   VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?)""",
+                   VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?)
+                   ON CONFLICT(id) DO UPDATE SET usn=excluded.usn, weight=excluded.weight, height=excluded.height,
+                   blood_pressure_systolic=excluded.blood_pressure_systolic,
+                   blood_pressure_diastolic=excluded.blood_pressure_diastolic, heart_rate=excluded.heart_rate,
+                   temperature=excluded.temperature, respiratory_rate=excluded.respiratory_rate,
+                   oxygen_saturation=excluded.oxygen_saturation, notes=excluded.notes,
+                   recorded_at=excluded.recorded_at, recorded_by=excluded.recorded_by""",
                 (data.get("id"), usn, weight, height, bp_sys, bp_dia, heart_rate, temperature, resp_rate, o2_sat, notes, recorded_at, recorded_by),
             )
-            conn.commit()
+            response_cache.bump("vitals")
             
             # Get the inserted record with calculated BMI
-            record_id = data.get("id") or cur.lastrowid
+            record_id = data.get("id") or lastrowid
             vital_record = conn.execute("SELECT * FROM vitals WHERE id=?", (record_id,)).fetchone()
-            
-            result = {
-                "id": vital_record["id"],
-                "usn": vital_record["usn"],
-                "weight": vital_record["weight"],
-                "height": vital_record["height"],
-                "bmi": vital_record["bmi"],
-                "bloodPressureSystolic": vital_record["blood_pressure_systolic"],
-                "bloodPressureDiastolic": vital_record["blood_pressure_diastolic"],
-                "heartRate": vital_record["heart_rate"],
-                "temperature": vital_record["temperature"],
-                "respiratoryRate": vital_record["respiratory_rate"],
-                "oxygenSaturation": vital_record["oxygen_saturation"],
-                "notes": vital_record["notes"],
-                "recordedAt": vital_record["recorded_at"],
-                "recordedBy": vital_record["recorded_by"]
-            }
-            return jsonify(result), 201
+            return jsonify(vital_to_json(vital_record)), 201
         finally:
             conn.close()
 
@@ -708,96 +793,73 @@ def api_vitals():
 @app.route("/api/export/patients")
 def api_export_patients():
     conn = get_db()
-    patients = conn.execute("SELECT * FROM patients ORDER BY full_name").fetchall()
-    conn.close()
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Write comprehensive header matching frontend structure
-    writer.writerow([
+    cur = conn.execute("SELECT usn, full_name, age, gender, contact, address FROM patients ORDER BY full_name")
+
+    # Comprehensive header matching frontend structure
+    header = [
         "USN", "Full Name", "Age", "Gender", "Phone", "Address", 
         "Emergency Contact", "Emergency Phone", "Email", "Date Registered"
-    ])
-    
-    # Write data
-    for patient in patients:
-        writer.writerow([
-            patient["usn"], 
-            patient["full_name"], 
-            patient["age"], 
-            patient["gender"], 
-            patient["contact"] if "contact" in patient.keys() else "",
-            patient["address"] if "address" in patient.keys() else "",
-            "",  # Emergency contact not in current schema
-            "",  # Emergency phone not in current schema  
-            "",  # Email not in current schema
-            ""   # Date registered not in current schema
-        ])
-    
-    response = Response(output.getvalue(), mimetype="text/csv")
-    response.headers["Content-Disposition"] = "attachment; filename=patients.csv"
-    return response
+    ]
+
+    def rows():
+        for patient in iter_cursor(cur):
+            yield [
+                patient["usn"], 
+                patient["full_name"], 
+                patient["age"], 
+                patient["gender"], 
+                patient["contact"],
+                patient["address"],
+                "",  # Emergency contact not in current schema
+                "",  # Emergency phone not in current schema  
+                "",  # Email not in current schema
+                ""   # Date registered not in current schema
+            ]
+
+    return csv_response("patients.csv", header, rows())
 
 
 @app.route("/api/export/vitals")
 def api_export_vitals():
     conn = get_db()
-    vitals = conn.execute("""
+    cur = conn.execute("""
         SELECT v.*, p.full_name 
         FROM vitals v 
         LEFT JOIN patients p ON v.usn = p.usn 
         ORDER BY v.recorded_at DESC
-    """).fetchall()
-    conn.close()
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Write comprehensive header matching frontend structure
-    writer.writerow([
+    """)
+
+    # Comprehensive header matching frontend structure
+    header = [
         "USN", "Patient Name", "Weight (kg)", "Height (cm)", "BMI", 
         "Blood Pressure Systolic", "Blood Pressure Diastolic", "Blood Pressure Category",
         "Heart Rate (bpm)", "Temperature (°F)", "Respiratory Rate", "Oxygen Saturation (%)",
         "Notes", "Recorded At", "Recorded By"
-    ])
-    
-    # Write data with proper null handling
-    for vital in vitals:
-        # Calculate blood pressure category
-        systolic = vital["blood_pressure_systolic"] if "blood_pressure_systolic" in vital.keys() else 0
-        diastolic = vital["blood_pressure_diastolic"] if "blood_pressure_diastolic" in vital.keys() else 0
-        
-        if systolic >= 140 or diastolic >= 90:
-            bp_category = "High"
-        elif systolic >= 120 or diastolic >= 80:
-            bp_category = "Elevated"
-        elif systolic >= 90 and diastolic >= 60:
-            bp_category = "Normal"
-        else:
-            bp_category = "Low"
-        
-        writer.writerow([
-            vital["usn"] if "usn" in vital.keys() else "",
-            vital["full_name"] if "full_name" in vital.keys() else "",
-            vital["weight"] if "weight" in vital.keys() else "",
-            vital["height"] if "height" in vital.keys() else "",
-            round(vital["bmi"], 1) if "bmi" in vital.keys() and vital["bmi"] else "",
-            systolic,
-            diastolic,
-            bp_category,
-            vital["heart_rate"] if "heart_rate" in vital.keys() else "",
-            vital["temperature"] if "temperature" in vital.keys() else "",
-            vital["respiratory_rate"] if "respiratory_rate" in vital.keys() else "",
-            vital["oxygen_saturation"] if "oxygen_saturation" in vital.keys() else "",
-            vital["notes"] if "notes" in vital.keys() else "",
-            vital["recorded_at"] if "recorded_at" in vital.keys() else "",
-            vital["recorded_by"] if "recorded_by" in vital.keys() else "System User"
-        ])
-    
-    response = Response(output.getvalue(), mimetype="text/csv")
-    response.headers["Content-Disposition"] = "attachment; filename=vitals.csv"
-    return response
+    ]
+
+    def rows():
+        for vital in iter_cursor(cur):
+            systolic = vital["blood_pressure_systolic"]
+            diastolic = vital["blood_pressure_diastolic"]
+            yield [
+                vital["usn"],
+                vital["full_name"],
+                vital["weight"],
+                vital["height"],
+                round(vital["bmi"], 1) if vital["bmi"] else "",
+                systolic,
+                diastolic,
+                bp_category(systolic, diastolic),
+                vital["heart_rate"],
+                vital["temperature"],
+                vital["respiratory_rate"],
+                vital["oxygen_saturation"],
+                vital["notes"],
+                vital["recorded_at"],
+                vital["recorded_by"] or "System User"
+            ]
+
+    return csv_response("vitals.csv", header, rows())
 
 
 @app.route("/api/export/complete")
@@ -805,7 +867,7 @@ def api_export_complete():
     conn = get_db()
     
     # Get comprehensive patient data with proper field mapping
-    patients_data = conn.execute("""
+    cur = conn.execute(f"""
         SELECT 
             p.*,
             v.weight as latest_weight,
@@ -816,104 +878,74 @@ def api_export_complete():
             v.temperature as latest_temp,
             v.oxygen_saturation as latest_spo2,
             v.respiratory_rate as latest_rr,
-            (SELECT COUNT(*) FROM vitals WHERE usn = p.usn) as total_vitals,
+            COALESCE(lv.vitals_count, 0) as total_vitals,
             (SELECT COUNT(*) FROM prescriptions WHERE usn = p.usn) as total_prescriptions,
             (SELECT diagnosis FROM prescriptions WHERE usn = p.usn ORDER BY prescribed_at DESC LIMIT 1) as latest_diagnosis,
             (SELECT notes FROM prescriptions WHERE usn = p.usn ORDER BY prescribed_at DESC LIMIT 1) as latest_prescription_notes
         FROM patients p
-        LEFT JOIN vitals v ON p.usn = v.usn AND v.id = (
-            SELECT id FROM vitals WHERE usn = p.usn ORDER BY recorded_at DESC LIMIT 1
-        )
+        {latest_vitals.JOIN}
         ORDER BY p.full_name
-    """).fetchall()
-    conn.close()
+    """)
     
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Write comprehensive header matching frontend data structure
-    writer.writerow([
+    # Comprehensive header matching frontend data structure
+    header = [
         "USN", "Full Name", "Age", "Gender", "Phone", "Address", "Email",
         "Emergency Contact Name", "Emergency Contact Phone", "Blood Group", "Allergies",
         "Latest Weight (kg)", "Latest Height (cm)", "Latest BMI", "Latest Blood Pressure",
         "Latest Heart Rate (bpm)", "Latest Temperature (°F)", "Latest SpO2 (%)", "Latest Respiratory Rate",
         "Total Vitals Records", "Total Prescriptions", "Latest Diagnosis", "Latest Prescription Notes",
         "Registration Date", "Last Updated"
-    ])
-    
-    # Write data with proper field mapping and null handling
-    for row in patients_data:
-        writer.writerow([
-            row["usn"] if "usn" in row.keys() else "",
-            row["full_name"] if "full_name" in row.keys() else "",
-            row["age"] if "age" in row.keys() else "",
-            row["gender"] if "gender" in row.keys() else "",
-            row["contact"] if "contact" in row.keys() else "",  # Map contact to phone
-            row["address"] if "address" in row.keys() else "",
-            row["email"] if "email" in row.keys() else "",
-            row["emergency_contact_name"] if "emergency_contact_name" in row.keys() else "",
-            row["emergency_contact_phone"] if "emergency_contact_phone" in row.keys() else "",
-            row["blood_group"] if "blood_group" in row.keys() else "",
-            row["allergies"] if "allergies" in row.keys() else "",
-            row["latest_weight"] if "latest_weight" in row.keys() else "",
-            row["latest_height"] if "latest_height" in row.keys() else "",
-            round(row["latest_bmi"], 1) if "latest_bmi" in row.keys() and row["latest_bmi"] else "",
-            row["latest_bp"] if "latest_bp" in row.keys() and row["latest_bp"] != "/" else "",
-            row["latest_hr"] if "latest_hr" in row.keys() else "",
-            row["latest_temp"] if "latest_temp" in row.keys() else "",
-            row["latest_spo2"] if "latest_spo2" in row.keys() else "",
-            row["latest_rr"] if "latest_rr" in row.keys() else "",
-            row["total_vitals"] if "total_vitals" in row.keys() else 0,
-            row["total_prescriptions"] if "total_prescriptions" in row.keys() else 0,
-            row["latest_diagnosis"] if "latest_diagnosis" in row.keys() else "",
-            row["latest_prescription_notes"] if "latest_prescription_notes" in row.keys() else "",
-            row["created_at"] if "created_at" in row.keys() else "",
-            row["updated_at"] if "updated_at" in row.keys() else ""
-        ])
-    
-    response = Response(output.getvalue(), mimetype="text/csv")
-    response.headers["Content-Disposition"] = "attachment; filename=complete_patient_data.csv"
-    return response
+    ]
+
+    def rows():
+        for row in iter_cursor(cur):
+            yield [
+                row["usn"],
+                row["full_name"],
+                row["age"],
+                row["gender"],
+                row["contact"],  # Map contact to phone
+                row["address"],
+                "",  # Email not in current schema
+                "",  # Emergency contact name not in current schema
+                "",  # Emergency contact phone not in current schema
+                "",  # Blood group not in current schema
+                "",  # Allergies live in the allergies table
+                row["latest_weight"],
+                row["latest_height"],
+                round(row["latest_bmi"], 1) if row["latest_bmi"] else "",
+                row["latest_bp"] or "",
+                row["latest_hr"],
+                row["latest_temp"],
+                row["latest_spo2"],
+                row["latest_rr"],
+                row["total_vitals"],
+                row["total_prescriptions"],
+                row["latest_diagnosis"],
+                row["latest_prescription_notes"],
+                "",  # Registration date not in current schema
+                row["updated_at"]
+            ]
+
+    return csv_response("complete_patient_data.csv", header, rows())
 
 
 @app.route("/api/prescriptions", methods=["GET", "POST"])
+@response_cache.cached("prescriptions", "medications")
 def api_prescriptions():
     if request.method == "GET":
+        clauses: List[str] = []
+        params: List[Any] = []
         usn = request.args.get("usn")
-        conn = get_db()
         if usn:
-            prescriptions = conn.execute(
-                "SELECT * FROM prescriptions WHERE usn=? ORDER BY prescribed_at DESC", 
-                (usn,)
-            ).fetchall()
-        else:
-            prescriptions = conn.execute("SELECT * FROM prescriptions ORDER BY prescribed_at DESC").fetchall()
-        conn.close()
-        
-        # Convert to frontend format
-        result = []
-        for row in prescriptions:
-            try:
-                import json
-                medications = json.loads(row["medications"]) if row["medications"] else []
-            except:
-                medications = []
-                
-            result.append({
-                "id": row["id"],
-                "usn": row["usn"],
-                "diagnosis": row["diagnosis"] if "diagnosis" in row.keys() else "",
-                "medications": medications,
-                "notes": row["notes"] if "notes" in row.keys() else "",
-                "followUpDate": row["follow_up_date"] if "follow_up_date" in row.keys() else "",
-                "prescribedAt": row["prescribed_at"],
-                "prescribedBy": row["prescribed_by"] if "prescribed_by" in row.keys() else "NHCE Clinic",
-                "status": row["status"] if "status" in row.keys() else "Active",
-                "patientName": row["patient_name"] if "patient_name" in row.keys() else "",
-                "patientAge": row["patient_age"] if "patient_age" in row.keys() else None,
-                "patientGender": row["patient_gender"] if "patient_gender" in row.keys() else ""
-            })
-        return jsonify(result)
+            clauses.append("usn=?")
+            params.append(usn)
+        medication = (request.args.get("medication") or "").strip()
+        if medication:
+            # Who was prescribed X, through prescription_items
+            clauses.append(prescription_items.MEDICATION_FILTER)
+            params.extend((medication, medication))
+        return _list_response(PRESCRIPTIONS_LISTING, " AND ".join(clauses), tuple(params))
     
     elif request.method == "POST":
         data = request.get_json()
@@ -947,21 +979,24 @@ def api_prescriptions():
             patient_gender = patient["gender"]
 
         try:
-            import json
             medications_json = json.dumps(medications) if medications else "[]"
-            
-            cur = conn.cursor()
-            cur.execute(
-                """INSERT INTO prescriptions(usn, diagnosis, medications, notes, follow_up_date, 
-                   prescribed_at, prescribed_by, status, patient_name, patient_age, patient_gender) 
-                   VALUES(?,?,?,?,?,?,?,?,?,?,?)""",
-                (usn, diagnosis, medications_json, notes, follow_up_date, 
-                 datetime.utcnow().isoformat(), prescribed_by, status, 
-                 patient_name, patient_age, patient_gender),
-            )
-            
-            prescription_id = cur.lastrowid
-            conn.commit()
+            # Screened before the write; warnings are returned and kept, never blocking
+            alerts = safety_rules.check(conn, usn, medications if isinstance(medications, list) else [])
+
+            def create_prescription(wconn: sqlite3.Connection) -> int:
+                rx_id = wconn.execute(
+                    """INSERT INTO prescriptions(usn, diagnosis, medications, notes, follow_up_date, 
+                       prescribed_at, prescribed_by, status, patient_name, patient_age, patient_gender) 
+                       VALUES(?,?,?,?,?,?,?,?,?,?,?)""",
+                    (usn, diagnosis, medications_json, notes, follow_up_date, 
+                     datetime.utcnow().isoformat(), prescribed_by, status, 
+                     patient_name, patient_age, patient_gender),
+                ).lastrowid
+                medication_safety.save_alerts(wconn, rx_id, alerts)
+                return rx_id
+
+            prescription_id = writer.submit(create_prescription)
+            response_cache.bump("prescriptions", "prescription_items", "medications", "prescription_alerts")
             
             # Return the created prescription in frontend format
             result = {
@@ -976,7 +1011,8 @@ def api_prescriptions():
                 "status": status,
                 "patientName": patient_name,
                 "patientAge": patient_age,
-                "patientGender": patient_gender
+                "patientGender": patient_gender,
+                "warnings": [a.to_json() for a in alerts],
             }
             
             return jsonify(result), 201
@@ -984,20 +1020,89 @@ def api_prescriptions():
             conn.close()
 
 
+@app.post("/api/prescriptions/check")
+def api_prescription_check():
+    """Screen ``{usn, medications}`` against the patient's allergies, problems and current
+    prescriptions without saving anything; same warnings as POST /api/prescriptions."""
+    data = request.get_json(silent=True) or {}
+    usn = (data.get("usn") or "").strip()
+    medications = data.get("medications") or []
+    if not usn or not isinstance(medications, list):
+        return jsonify({"error": "usn and a medications list are required"}), 400
+    conn = get_db()
+    try:
+        if not conn.execute("SELECT 1 FROM patients WHERE usn=?", (usn,)).fetchone():
+            return jsonify({"error": "Patient not found"}), 404
+        alerts = safety_rules.check(conn, usn, medications)
+    finally:
+        conn.close()
+    return jsonify({"usn": usn, "warnings": [a.to_json() for a in alerts]})
+
+
+@app.get("/api/prescriptions/<int:pid>/alerts")
+@response_cache.cached("prescription_alerts")
+def api_prescription_alerts(pid: int):
+    """Stored warnings for one prescription, from prescribe time or the last re-screen."""
+    conn = get_db()
+    try:
+        return jsonify({"prescriptionId": pid, "alerts": medication_safety.read_alerts(conn, pid)})
+    finally:
+        conn.close()
+
+
+@app.post("/api/prescriptions/rescreen")
+@maintenance_endpoint
+def api_prescriptions_rescreen():
+    """Re-check every active prescription against the current rules and rewrite their alerts."""
+    summary = writer.submit(safety_rules.rescreen, exclusive=True)
+    response_cache.bump("prescription_alerts")
+    return jsonify(dict(summary, ok=True))
+
+
+@app.route("/api/interaction-rules", methods=["GET"])
+@response_cache.cached("interaction_rules", "substance_groups")
+def api_interaction_rules():
+    """Interaction/contraindication rules and substance groups."""
+    conn = get_db()
+    try:
+        return jsonify(medication_safety.list_rules(conn))
+    finally:
+        conn.close()
+
+
+@app.route("/api/interaction-rules", methods=["POST"])
+@maintenance_endpoint
+def api_interaction_rules_save():
+    """Upsert rules and substance groups, then re-screen active prescriptions.
+
+    ``{"rules": [{kind, substanceA, substanceB, severity, message, isActive}],
+    "groups": [{member, substance, remove}]}``; ``"rescreen": false`` skips the
+    re-screen (e.g. while importing in several requests). Gated like the other
+    maintenance endpoints: it rewrites the clinical rules and the re-screen
+    holds the writer for the whole prescriptions table.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        rules, groups = medication_safety.parse_rules(data)
+    except SafetyError as e:
+        return jsonify({"error": str(e)}), 400
+    writer.submit(lambda conn: medication_safety.save_rules(conn, rules, groups))
+    response_cache.bump("interaction_rules", "substance_groups")
+    result: Dict[str, Any] = {"ok": True, "rules": len(rules), "groups": len(groups)}
+    if data.get("rescreen", True):
+        result["rescreen"] = writer.submit(safety_rules.rescreen, exclusive=True)
+        response_cache.bump("prescription_alerts")
+    return jsonify(result)
+
+
 @app.route("/api/case-reports", methods=["GET", "POST"])
+@response_cache.cached("case_reports")
 def api_case_reports():
     if request.method == "GET":
         usn = request.args.get("usn")
-        conn = get_db()
         if usn:
-            rows = conn.execute(
-                "SELECT * FROM case_reports WHERE usn=? ORDER BY created_at DESC",
-                (usn,),
-            ).fetchall()
-        else:
-            rows = conn.execute("SELECT * FROM case_reports ORDER BY created_at DESC").fetchall()
-        conn.close()
-        return jsonify([dict(r) for r in rows])
+            return _list_response(CASE_REPORTS_LISTING, "usn=?", (usn,))
+        return _list_response(CASE_REPORTS_LISTING)
 
     # POST create or upsert by unique report_number
     data = request.get_json(silent=True) or {}
@@ -1006,91 +1111,86 @@ def api_case_reports():
     if not (report_number and usn):
         return jsonify({"error": "reportNumber and usn are required"}), 400
 
-    conn = get_db()
-    # ensure patient exists (create minimal if needed)
-    p = conn.execute("SELECT 1 FROM patients WHERE usn=?", (usn,)).fetchone()
-    if not p:
-        # Create minimal placeholder patient if frontend didn't sync yet
+    def upsert_report(conn: sqlite3.Connection) -> None:
+        # ensure patient exists (create minimal if needed)
+        p = conn.execute("SELECT 1 FROM patients WHERE usn=?", (usn,)).fetchone()
+        if not p:
+            # Create minimal placeholder patient if frontend didn't sync yet
+            conn.execute(
+                "INSERT OR IGNORE INTO patients(usn, full_name, age, gender, contact, address) VALUES(?,?,?,?,?,?)",
+                (usn, data.get("patientName", "Unknown"), data.get("patientAge") or 0, data.get("patientGender", "Unknown"), "", ""),
+            )
+
         conn.execute(
-            "INSERT OR IGNORE INTO patients(usn, full_name, age, gender, contact, address) VALUES(?,?,?,?,?,?)",
-            (usn, data.get("patientName", "Unknown"), data.get("patientAge") or 0, data.get("patientGender", "Unknown"), "", ""),
+            """
+            INSERT INTO case_reports(
+                report_number, usn, patient_name, patient_age, patient_gender, report_type,
+                chief_complaint, history_of_present_illness, past_medical_history, family_history,
+                social_history, physical_examination, investigations, diagnosis, treatment, prognosis,
+                recommendations, follow_up, doctor_name, report_date, status, created_at
+            ) VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+            ON CONFLICT(report_number) DO UPDATE SET
+                usn=excluded.usn,
+                patient_name=excluded.patient_name,
+                patient_age=excluded.patient_age,
+                patient_gender=excluded.patient_gender,
+                report_type=excluded.report_type,
+                chief_complaint=excluded.chief_complaint,
+                history_of_present_illness=excluded.history_of_present_illness,
+                past_medical_history=excluded.past_medical_history,
+                family_history=excluded.family_history,
+                social_history=excluded.social_history,
+                physical_examination=excluded.physical_examination,
+                investigations=excluded.investigations,
+                diagnosis=excluded.diagnosis,
+                treatment=excluded.treatment,
+                prognosis=excluded.prognosis,
+                recommendations=excluded.recommendations,
+                follow_up=excluded.follow_up,
+                doctor_name=excluded.doctor_name,
+                report_date=excluded.report_date,
+                status=excluded.status
+            """,
+            (
+                report_number,
+                usn,
+                data.get("patientName"),
+                data.get("patientAge"),
+                data.get("patientGender"),
+                (data.get("reportType") or "medical"),
+                data.get("chiefComplaint"),
+                data.get("historyOfPresentIllness"),
+                data.get("pastMedicalHistory"),
+                data.get("familyHistory"),
+                data.get("socialHistory"),
+                data.get("physicalExamination"),
+                data.get("investigations"),
+                data.get("diagnosis"),
+                data.get("treatment"),
+                data.get("prognosis"),
+                data.get("recommendations"),
+                data.get("followUp"),
+                data.get("doctorName"),
+                data.get("reportDate"),
+                data.get("status", "Active"),
+                datetime.utcnow().isoformat(),
+            ),
         )
 
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO case_reports(
-            report_number, usn, patient_name, patient_age, patient_gender, report_type,
-            chief_complaint, history_of_present_illness, past_medical_history, family_history,
-            social_history, physical_examination, investigations, diagnosis, treatment, prognosis,
-            recommendations, follow_up, doctor_name, report_date, status, created_at
-        ) VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-        ON CONFLICT(report_number) DO UPDATE SET
-            usn=excluded.usn,
-            patient_name=excluded.patient_name,
-            patient_age=excluded.patient_age,
-            patient_gender=excluded.patient_gender,
-            report_type=excluded.report_type,
-            chief_complaint=excluded.chief_complaint,
-            history_of_present_illness=excluded.history_of_present_illness,
-            past_medical_history=excluded.past_medical_history,
-            family_history=excluded.family_history,
-            social_history=excluded.social_history,
-            physical_examination=excluded.physical_examination,
-            investigations=excluded.investigations,
-            diagnosis=excluded.diagnosis,
-            treatment=excluded.treatment,
-            prognosis=excluded.prognosis,
-            recommendations=excluded.recommendations,
-            follow_up=excluded.follow_up,
-            doctor_name=excluded.doctor_name,
-            report_date=excluded.report_date,
-            status=excluded.status
-        """,
-        (
-            report_number,
-            usn,
-            data.get("patientName"),
-            data.get("patientAge"),
-            data.get("patientGender"),
-            (data.get("reportType") or "medical"),
-            data.get("chiefComplaint"),
-            data.get("historyOfPresentIllness"),
-            data.get("pastMedicalHistory"),
-            data.get("familyHistory"),
-            data.get("socialHistory"),
-            data.get("physicalExamination"),
-            data.get("investigations"),
-            data.get("diagnosis"),
-            data.get("treatment"),
-            data.get("prognosis"),
-            data.get("recommendations"),
-            data.get("followUp"),
-            data.get("doctorName"),
-            data.get("reportDate"),
-            data.get("status", "Active"),
-            datetime.utcnow().isoformat(),
-        ),
-    )
-    conn.commit()
-    conn.close()
+    writer.submit(upsert_report)
+    # A placeholder patient may have been created above
+    response_cache.bump("case_reports", "patients")
     return jsonify({"ok": True, "reportNumber": report_number}), 201
 
 
 @app.route("/api/sick-intimations", methods=["GET", "POST"])
+@response_cache.cached("sick_intimations")
 def api_sick_intimations():
     if request.method == "GET":
         usn = request.args.get("usn")
-        conn = get_db()
         if usn:
-            rows = conn.execute(
-                "SELECT * FROM sick_intimations WHERE usn=? ORDER BY created_at DESC",
-                (usn,),
-            ).fetchall()
-        else:
-            rows = conn.execute("SELECT * FROM sick_intimations ORDER BY created_at DESC").fetchall()
-        conn.close()
-        return jsonify([dict(r) for r in rows])
+            return _list_response(SICK_INTIMATIONS_LISTING, "usn=?", (usn,))
+        return _list_response(SICK_INTIMATIONS_LISTING)
 
     data = request.get_json(silent=True) or {}
     intimation_number = (data.get("intimationNumber") or data.get("intimation_number") or "").strip()
@@ -1098,404 +1198,290 @@ def api_sick_intimations():
     if not (intimation_number and usn):
         return jsonify({"error": "intimationNumber and usn are required"}), 400
 
-    conn = get_db()
-    p = conn.execute("SELECT 1 FROM patients WHERE usn=?", (usn,)).fetchone()
-    if not p:
+    def upsert_intimation(conn: sqlite3.Connection) -> None:
+        p = conn.execute("SELECT 1 FROM patients WHERE usn=?", (usn,)).fetchone()
+        if not p:
+            conn.execute(
+                "INSERT OR IGNORE INTO patients(usn, full_name, age, gender, contact, address) VALUES(?,?,?,?,?,?)",
+                (usn, data.get("patientName", "Unknown"), data.get("patientAge") or 0, data.get("patientGender", "Unknown"), "", ""),
+            )
+
         conn.execute(
-            "INSERT OR IGNORE INTO patients(usn, full_name, age, gender, contact, address) VALUES(?,?,?,?,?,?)",
-            (usn, data.get("patientName", "Unknown"), data.get("patientAge") or 0, data.get("patientGender", "Unknown"), "", ""),
+            """
+            INSERT INTO sick_intimations(
+                intimation_number, usn, patient_name, patient_age, patient_gender, case_report_id,
+                sick_leave_from, sick_leave_to, total_days, reason, symptoms, rest_recommended,
+                doctor_name, issue_date, status, created_at
+            ) VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+            ON CONFLICT(intimation_number) DO UPDATE SET
+                usn=excluded.usn,
+                patient_name=excluded.patient_name,
+                patient_age=excluded.patient_age,
+                patient_gender=excluded.patient_gender,
+                case_report_id=excluded.case_report_id,
+                sick_leave_from=excluded.sick_leave_from,
+                sick_leave_to=excluded.sick_leave_to,
+                total_days=excluded.total_days,
+                reason=excluded.reason,
+                symptoms=excluded.symptoms,
+                rest_recommended=excluded.rest_recommended,
+                doctor_name=excluded.doctor_name,
+                issue_date=excluded.issue_date,
+                status=excluded.status
+            """,
+            (
+                intimation_number,
+                usn,
+                data.get("patientName"),
+                data.get("patientAge"),
+                data.get("patientGender"),
+                data.get("caseReportId"),
+                data.get("sickLeaveFrom"),
+                data.get("sickLeaveTo"),
+                data.get("totalDays"),
+                data.get("reason"),
+                data.get("symptoms"),
+                1 if data.get("restRecommended", True) else 0,
+                data.get("doctorName"),
+                data.get("issueDate"),
+                data.get("status", "Active"),
+                datetime.utcnow().isoformat(),
+            ),
         )
 
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO sick_intimations(
-            intimation_number, usn, patient_name, patient_age, patient_gender, case_report_id,
-            sick_leave_from, sick_leave_to, total_days, reason, symptoms, rest_recommended,
-            doctor_name, issue_date, status, created_at
-        ) VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-        ON CONFLICT(intimation_number) DO UPDATE SET
-            usn=excluded.usn,
-            patient_name=excluded.patient_name,
-            patient_age=excluded.patient_age,
-            patient_gender=excluded.patient_gender,
-            case_report_id=excluded.case_report_id,
-            sick_leave_from=excluded.sick_leave_from,
-            sick_leave_to=excluded.sick_leave_to,
-            total_days=excluded.total_days,
-            reason=excluded.reason,
-            symptoms=excluded.symptoms,
-            rest_recommended=excluded.rest_recommended,
-            doctor_name=excluded.doctor_name,
-            issue_date=excluded.issue_date,
-            status=excluded.status
-        """,
-        (
-            intimation_number,
-            usn,
-            data.get("patientName"),
-            data.get("patientAge"),
-            data.get("patientGender"),
-            data.get("caseReportId"),
-            data.get("sickLeaveFrom"),
-            data.get("sickLeaveTo"),
-            data.get("totalDays"),
-            data.get("reason"),
-            data.get("symptoms"),
-            1 if data.get("restRecommended", True) else 0,
-            data.get("doctorName"),
-            data.get("issueDate"),
-            data.get("status", "Active"),
-            datetime.utcnow().isoformat(),
-        ),
-    )
-    conn.commit()
-    conn.close()
+    writer.submit(upsert_intimation)
+    response_cache.bump("sick_intimations", "patients")
     return jsonify({"ok": True, "intimationNumber": intimation_number}), 201
 
 
 @app.route("/api/export/prescriptions")
 def api_export_prescriptions():
     conn = get_db()
-    prescriptions = conn.execute("""
-        SELECT p.*, pa.full_name 
+    # Medication columns come from prescription_items, grouped once, not from the JSON per row
+    cur = conn.execute(f"""
+        SELECT p.*, pa.full_name, rx.medications_text, rx.dosage_instructions
         FROM prescriptions p 
         LEFT JOIN patients pa ON p.usn = pa.usn 
+        {prescription_items.EXPORT_JOIN}
         ORDER BY p.prescribed_at DESC
-    """).fetchall()
-    conn.close()
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
+    """)
     
-    # Write comprehensive header matching frontend structure
-    writer.writerow([
+    # Comprehensive header matching frontend structure
+    header = [
         "USN", "Patient Name", "Age", "Gender", "Contact", "Address",
         "Diagnosis", "Medications (Detailed)", "Dosage Instructions", 
         "Notes", "Follow Up Date", "Prescribed At", "Prescribed By", 
         "Status", "Chief Complaint", "Physical Examination"
-    ])
-    
-    # Write data with proper medication formatting
-    for prescription in prescriptions:
-        # Parse medications JSON safely
-        medications_text = ""
-        dosage_instructions = ""
-        try:
-            import json
-            medications_data = prescription["medications"] if "medications" in prescription.keys() else "{}"
-            if medications_data:
-                medications_list = json.loads(medications_data) if medications_data != "{}" else []
-                med_details = []
-                dosage_details = []
-                for med in medications_list:
-                    med_name = med.get('name', 'Unknown')
-                    med_dosage = med.get('dosage', '')
-                    med_frequency = med.get('frequency', '')
-                    med_duration = med.get('duration', '')
-                    
-                    med_details.append(f"{med_name}")
-                    dosage_details.append(f"{med_name}: {med_dosage} {med_frequency} for {med_duration}")
-                
-                medications_text = "; ".join(med_details)
-                dosage_instructions = "; ".join(dosage_details)
-        except Exception:
-            medications_text = prescription["medications"] if "medications" in prescription.keys() else ""
-            dosage_instructions = ""
-        
-        # Get patient name with fallback
-        patient_name = ""
-        if "patient_name" in prescription.keys() and prescription["patient_name"]:
-            patient_name = prescription["patient_name"]
-        elif "full_name" in prescription.keys() and prescription["full_name"]:
-            patient_name = prescription["full_name"]
-            
-        writer.writerow([
-            prescription["usn"] if "usn" in prescription.keys() else "",
-            patient_name,
-            prescription["patient_age"] if "patient_age" in prescription.keys() else "",
-            prescription["patient_gender"] if "patient_gender" in prescription.keys() else "",
-            prescription["patient_contact"] if "patient_contact" in prescription.keys() else "",
-            prescription["patient_address"] if "patient_address" in prescription.keys() else "",
-            prescription["diagnosis"] if "diagnosis" in prescription.keys() else "",
-            medications_text,
-            dosage_instructions,
-            prescription["notes"] if "notes" in prescription.keys() else "",
-            prescription["follow_up_date"] if "follow_up_date" in prescription.keys() else "",
-            prescription["prescribed_at"] if "prescribed_at" in prescription.keys() else "",
-            prescription["prescribed_by"] if "prescribed_by" in prescription.keys() else "NHCE Clinic",
-            prescription["status"] if "status" in prescription.keys() else "Active",
-            prescription["chief_complaint"] if "chief_complaint" in prescription.keys() else "",
-            prescription["physical_examination"] if "physical_examination" in prescription.keys() else ""
-        ])
-    
-    response = Response(output.getvalue(), mimetype="text/csv")
-    response.headers["Content-Disposition"] = "attachment; filename=prescriptions.csv"
-    return response
+    ]
+
+    def rows():
+        for prescription in iter_cursor(cur):
+            yield [
+                prescription["usn"],
+                # Patient name with fallback
+                prescription["patient_name"] or prescription["full_name"] or "",
+                prescription["patient_age"],
+                prescription["patient_gender"],
+                "",  # Contact not in current schema
+                "",  # Address not in current schema
+                prescription["diagnosis"],
+                prescription["medications_text"] or "",
+                prescription["dosage_instructions"] or "",
+                prescription["notes"],
+                prescription["follow_up_date"],
+                prescription["prescribed_at"],
+                prescription["prescribed_by"],
+                prescription["status"],
+                "",  # Chief complaint lives on case reports
+                ""   # Physical examination lives on case reports
+            ]
+
+    return csv_response("prescriptions.csv", header, rows())
 
 
 @app.route("/api/health")
 def api_health():
-    print("Health check endpoint called")  # Debug log
     return jsonify({"status": "ok", "timestamp": datetime.utcnow().isoformat()})
 
 @app.route("/health")
 def health():
-    print("Simple health endpoint called")  # Debug log
     return jsonify({"status": "ok", "timestamp": datetime.utcnow().isoformat()})
 
 @app.route("/test")
 def test():
-    print("Test endpoint called")  # Debug log
     return "Server is running!"
 
+@app.route("/metrics")
+def metrics():
+    """Per-route latency histograms, status counts and SQLite time (Prometheus text format)."""
+    return Response(request_metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route("/api/debug/db-pool")
+def api_db_pool_stats():
+    """Connection pool counters, for sizing HMIS_DB_POOL_SIZE."""
+    return jsonify(_pool.stats())
+
+
+@app.route("/api/debug/queries")
+def api_query_trace():
+    """Recent slow statements (with query plans) and repeated-statement (N+1) findings."""
+    return jsonify(query_tracer.report())
+
+
+@app.route("/api/debug/write-queue")
+def api_write_queue_stats():
+    """Writer queue depth, commit batch sizes and wait times."""
+    return jsonify(writer.stats())
+
+
+@app.route("/api/debug/medication-index")
+def api_medication_index_stats():
+    """Size (entries, approximate bytes) and refresh counters of the medication suggest index."""
+    return jsonify(medication_index.stats())
+
+
+@app.route("/api/debug/medication-safety")
+def api_medication_safety_stats():
+    """Sizes and refresh/check counters of the allergy and interaction maps."""
+    return jsonify(safety_rules.stats())
+
+
+@app.route("/api/debug/response-cache")
+def api_response_cache_stats():
+    """Response cache hit/miss/eviction counters, for sizing HMIS_RESPONSE_CACHE_MB."""
+    return jsonify(response_cache.stats())
+
 # Enhanced sync endpoints
-@app.route("/api/sync/patients", methods=["POST"])
-def sync_patients():
-    """Bulk sync patients from offline data"""
+def _run_sync(spec: sync_ingest.SyncSpec, label: str, *tables: str):
     try:
-        patients_data = request.get_json()
-        if not isinstance(patients_data, list):
-            return jsonify({"error": "Expected array of patients"}), 400
-        
-        conn = get_db()
-        cur = conn.cursor()
-        synced_count = 0
-        skipped_count = 0
-        errors: List[str] = []
-        
-        for patient in patients_data:
-            try:
-                # Normalize and validate minimal fields
-                usn = (patient.get('usn') or '').strip()
-                full_name = (patient.get('fullName') or '').strip()
-                # Age: cast to int; if missing/invalid, default to 0
-                age_val = patient.get('age')
-                try:
-                    age = int(age_val) if age_val is not None and str(age_val).strip() != '' else 0
-                except Exception:
-                    age = 0
-                gender = (patient.get('gender') or '').strip() or 'Unknown'
-                # Contact/address: coalesce to empty strings to satisfy NOT NULL constraint
-                contact = (patient.get('contact') or patient.get('phone') or '').strip()
-                address = (patient.get('address') or '').strip()
-
-                # Require at least USN and full name; skip otherwise
-                if not usn or not full_name:
-                    skipped_count += 1
-                    continue
-
-                # Use INSERT OR REPLACE to handle duplicates safely
-                cur.execute(
-                    """INSERT OR REPLACE INTO patients (usn, full_name, age, gender, contact, address)
-                       VALUES (?, ?, ?, ?, ?, ?)""",
-                    (usn, full_name, age, gender, contact or "", address or "")
-                )
-                synced_count += 1
-            except Exception as e:
-                # Log and continue; don't let a single bad record block the batch
-                err_usn = patient.get('usn', 'unknown')
-                msg = f"Error syncing patient {err_usn}: {e}"
-                print(msg)
-                errors.append(msg)
-                skipped_count += 1
-        
-        conn.commit()
-        conn.close()
-        
-        return jsonify({
-            "status": "success",
-            "synced_count": synced_count,
-            "total_received": len(patients_data),
-            "skipped_count": skipped_count
-        })
-    
+        records = request.get_json()
+        if not isinstance(records, list):
+            return jsonify({"error": f"Expected array of {label}"}), 400
+
+        try:
+            # ingest() runs its own transactions, so it gets the writer to itself
+            result = writer.submit(lambda conn: sync_ingest.ingest(conn, spec, records), exclusive=True)
+        finally:
+            response_cache.bump(*tables)
+        return jsonify(result.as_dict())
+
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/sync/patients", methods=["POST"])
+def sync_patients():
+    """Bulk sync patients from offline data"""
+    return _run_sync(sync_ingest.PATIENTS, "patients", "patients")
+
 @app.route("/api/sync/vitals", methods=["POST"])
 def sync_vitals():
     """Bulk sync vitals from offline data"""
-    try:
-        vitals_data = request.get_json()
-        if not isinstance(vitals_data, list):
-            return jsonify({"error": "Expected array of vitals"}), 400
-        
-        conn = get_db()
-        cur = conn.cursor()
-        synced_count = 0
-        
-        for vital in vitals_data:
-            try:
-                # Check if patient exists
-                if not cur.execute("SELECT 1 FROM patients WHERE usn = ?", (vital.get('usn'),)).fetchone():
-                    continue  # Skip if patient doesn't exist
-                
-                cur.execute(
-                    """INSERT OR REPLACE INTO vitals 
-                       (id, usn, weight, height, blood_pressure_systolic, blood_pressure_diastolic,
-                        heart_rate, temperature, respiratory_rate, oxygen_saturation, notes, 
-                        recorded_at, recorded_by)
-                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                    (vital.get('id'), vital.get('usn'), vital.get('weight'), vital.get('height'),
-                     vital.get('bloodPressureSystolic'), vital.get('bloodPressureDiastolic'),
-                     vital.get('heartRate'), vital.get('temperature'), vital.get('respiratoryRate'),
-                     vital.get('oxygenSaturation'), vital.get('notes'), vital.get('recordedAt'),
-                     vital.get('recordedBy', 'System User'))
-                )
-                synced_count += 1
-            except Exception as e:
-                print(f"Error syncing vital {vital.get('id', 'unknown')}: {e}")
-        
-        conn.commit()
-        conn.close()
-        
-        return jsonify({
-            "status": "success",
-            "synced_count": synced_count,
-            "total_received": len(vitals_data)
-        })
-    
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    return _run_sync(sync_ingest.VITALS, "vitals", "vitals")
 
 @app.route("/api/sync/prescriptions", methods=["POST"])
 def sync_prescriptions():
     """Bulk sync prescriptions from offline data"""
-    try:
-        prescriptions_data = request.get_json()
-        if not isinstance(prescriptions_data, list):
-            return jsonify({"error": "Expected array of prescriptions"}), 400
-        
-        conn = get_db()
-        cur = conn.cursor()
-        synced_count = 0
-        
-        for prescription in prescriptions_data:
-            try:
-                # Check if patient exists
-                if not cur.execute("SELECT 1 FROM patients WHERE usn = ?", (prescription.get('usn'),)).fetchone():
-                    continue  # Skip if patient doesn't exist
-                
-                import json
-                medications_json = json.dumps(prescription.get('medications', []))
-                
-                cur.execute(
-                    """INSERT OR REPLACE INTO prescriptions 
-                       (id, usn, diagnosis, medications, notes, follow_up_date, prescribed_at, 
-                        prescribed_by, status, patient_name, patient_age, patient_gender)
-                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                    (prescription.get('id'), prescription.get('usn'), 
-                     prescription.get('diagnosis', ''), medications_json,
-                     prescription.get('notes', ''), prescription.get('followUpDate'),
-                     prescription.get('prescribedAt'), prescription.get('prescribedBy', 'NHCE Clinic'),
-                     prescription.get('status', 'Active'), prescription.get('patientName'),
-                     prescription.get('patientAge'), prescription.get('patientGender'))
-                )
-                synced_count += 1
-            except Exception as e:
-                print(f"Error syncing prescription {prescription.get('id', 'unknown')}: {e}")
-        
-        conn.commit()
-        conn.close()
-        
-        return jsonify({
-            "status": "success",
-            "synced_count": synced_count,
-            "total_received": len(prescriptions_data)
-        })
-    
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    return _run_sync(sync_ingest.PRESCRIPTIONS, "prescriptions", "prescriptions", "prescription_items", "medications")
 
 @app.route("/api/sync/case-reports", methods=["POST"])
 def sync_case_reports():
     """Bulk sync case reports from offline data"""
-    try:
-        data = request.get_json()
-        if not isinstance(data, list):
-            return jsonify({"error": "Expected array of case reports"}), 400
-
-        conn = get_db()
-        cur = conn.cursor()
-        synced_count = 0
-        for cr in data:
-            try:
-                if not cr.get('reportNumber') or not cr.get('usn'):
-                    continue
-                # ensure patient exists
-                cur.execute(
-                    "INSERT OR IGNORE INTO patients(usn, full_name, age, gender, contact, address) VALUES(?,?,?,?,?,?)",
-                    (cr.get('usn'), cr.get('patientName') or 'Unknown', cr.get('patientAge') or 0, cr.get('patientGender') or 'Unknown', '', ''),
-                )
-                cur.execute(
-                    """
-                    INSERT OR REPLACE INTO case_reports(
-                        id, report_number, usn, patient_name, patient_age, patient_gender, report_type,
-                        chief_complaint, history_of_present_illness, past_medical_history, family_history,
-                        social_history, physical_examination, investigations, diagnosis, treatment, prognosis,
-                        recommendations, follow_up, doctor_name, report_date, status, created_at
-                    ) VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-                    """,
-                    (
-                        cr.get('id'), cr.get('reportNumber'), cr.get('usn'), cr.get('patientName'), cr.get('patientAge'), cr.get('patientGender'),
-                        cr.get('reportType', 'medical'), cr.get('chiefComplaint'), cr.get('historyOfPresentIllness'), cr.get('pastMedicalHistory'),
-                        cr.get('familyHistory'), cr.get('socialHistory'), cr.get('physicalExamination'), cr.get('investigations'), cr.get('diagnosis'),
-                        cr.get('treatment'), cr.get('prognosis'), cr.get('recommendations'), cr.get('followUp'), cr.get('doctorName'), cr.get('reportDate'),
-                        cr.get('status', 'Active'), cr.get('createdAt') or datetime.utcnow().isoformat()
-                    ),
-                )
-                synced_count += 1
-            except Exception as e:
-                print(f"Error syncing case report {cr.get('reportNumber', 'unknown')}: {e}")
-        conn.commit()
-        conn.close()
-        return jsonify({"status": "success", "synced_count": synced_count, "total_received": len(data)})
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    return _run_sync(sync_ingest.CASE_REPORTS, "case reports", "case_reports", "patients")
 
 @app.route("/api/sync/sick-intimations", methods=["POST"])
 def sync_sick_intimations():
     """Bulk sync sick intimations from offline data"""
+    return _run_sync(sync_ingest.SICK_INTIMATIONS, "sick intimations", "sick_intimations", "patients")
+
+SYNC_CHANGES_MAX_LIMIT = 5000
+
+_SYNC_ROW_FORMATTERS = {
+    "patients": patient_to_json,
+    "vitals": vital_to_json,
+    "prescriptions": prescription_to_json,
+    "case_reports": lambda r: listing_to_json(CASE_REPORTS_LISTING, r),
+    "sick_intimations": lambda r: listing_to_json(SICK_INTIMATIONS_LISTING, r),
+}
+
+
+@app.get("/api/sync/changes")
+def api_sync_changes():
+    """Rows changed and deleted since ``since`` (a cursor from a previous call), oldest first.
+
+    Pages hold at most ``limit`` changes across all requested ``tables``;
+    keep calling with the returned cursor while ``has_more`` is true.
+    """
     try:
-        data = request.get_json()
-        if not isinstance(data, list):
-            return jsonify({"error": "Expected array of sick intimations"}), 400
+        since = int(request.args.get("since") or 0)
+        limit = min(int(request.args.get("limit") or 1000), SYNC_CHANGES_MAX_LIMIT)
+    except ValueError:
+        return jsonify({"error": "since and limit must be integers"}), 400
+    if limit < 1:
+        return jsonify({"error": "limit must be positive"}), 400
+    requested = [t.strip() for t in (request.args.get("tables") or "").split(",") if t.strip()]
+    unknown = [t for t in requested if t not in SYNCED_TABLES]
+    if unknown:
+        return jsonify({"error": f"Unknown tables: {', '.join(unknown)}"}), 400
+    tables = requested or list(SYNCED_TABLES)
+
+    conn = get_db()
+    # One read transaction so every table is read at the same snapshot
+    conn.execute("BEGIN")
+    try:
+        # (rowversion, table, row, is_tombstone)
+        entries: List[Tuple[int, str, sqlite3.Row, bool]] = []
+        for table in tables:
+            for row in conn.execute(
+                f"SELECT * FROM {table} WHERE rowversion > ? ORDER BY rowversion LIMIT ?",
+                (since, limit + 1),
+            ):
+                entries.append((row["rowversion"], table, row, False))
+        tombstones = conn.execute(
+            "SELECT rowversion, table_name, row_key FROM sync_tombstones "
+            "WHERE rowversion > ? AND table_name IN (SELECT value FROM json_each(?)) "
+            "ORDER BY rowversion LIMIT ?",
+            (since, json.dumps(tables), limit + 1),
+        ).fetchall()
+        entries.extend((t["rowversion"], t["table_name"], t, True) for t in tombstones)
+        entries.sort(key=lambda e: e[0])
+        has_more = len(entries) > limit
+        page = entries[:limit]
+        # A cursor below ``since`` tells the client the DB was replaced and to start over
+        cursor = page[-1][0] if has_more else conn.execute(
+            "SELECT seq FROM change_seq WHERE id = 1"
+        ).fetchone()[0]
+
+        changes: Dict[str, List[Dict[str, Any]]] = {t: [] for t in tables}
+        deleted: Dict[str, List[str]] = {t: [] for t in tables}
+        for _, table, row, is_tombstone in page:
+            if is_tombstone:
+                deleted[table].append(row["row_key"])
+            else:
+                changes[table].append(_SYNC_ROW_FORMATTERS[table](row))
+
+        # A key deleted and then re-created is live; only report current deletions
+        for table, keys in deleted.items():
+            if keys:
+                key_col = SYNCED_TABLES[table]
+                live = {
+                    str(r[0]) for r in conn.execute(
+                        f"SELECT {key_col} FROM {table} WHERE {key_col} IN (SELECT value FROM json_each(?))",
+                        (json.dumps(keys),),
+                    )
+                }
+                deleted[table] = [
+                    int(k) if key_col == "id" else k for k in keys if k not in live
+                ]
+    finally:
+        conn.rollback()
+
+    return jsonify({
+        "cursor": cursor,
+        "has_more": has_more,
+        "changes": changes,
+        "deleted": deleted,
+    })
 
-        conn = get_db()
-        cur = conn.cursor()
-        synced_count = 0
-        for si in data:
-            try:
-                if not si.get('intimationNumber') or not si.get('usn'):
-                    continue
-                cur.execute(
-                    "INSERT OR IGNORE INTO patients(usn, full_name, age, gender, contact, address) VALUES(?,?,?,?,?,?)",
-                    (si.get('usn'), si.get('patientName') or 'Unknown', si.get('patientAge') or 0, si.get('patientGender') or 'Unknown', '', ''),
-                )
-                cur.execute(
-                    """
-                    INSERT OR REPLACE INTO sick_intimations(
-                        id, intimation_number, usn, patient_name, patient_age, patient_gender, case_report_id,
-                        sick_leave_from, sick_leave_to, total_days, reason, symptoms, rest_recommended,
-                        doctor_name, issue_date, status, created_at
-                    ) VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-                    """,
-                    (
-                        si.get('id'), si.get('intimationNumber'), si.get('usn'), si.get('patientName'), si.get('patientAge'), si.get('patientGender'),
-                        si.get('caseReportId'), si.get('sickLeaveFrom'), si.get('sickLeaveTo'), si.get('totalDays'), si.get('reason'), si.get('symptoms'),
-                        1 if si.get('restRecommended', True) else 0, si.get('doctorName'), si.get('issueDate'), si.get('status', 'Active'),
-                        si.get('createdAt') or datetime.utcnow().isoformat()
-                    ),
-                )
-                synced_count += 1
-            except Exception as e:
-                print(f"Error syncing sick intimation {si.get('intimationNumber', 'unknown')}: {e}")
-        conn.commit()
-        conn.close()
-        return jsonify({"status": "success", "synced_count": synced_count, "total_received": len(data)})
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
 
 @app.route("/api/sync/status")
 def sync_status():
@@ -1552,12 +1538,13 @@ def vitals_create_legacy() -> Response:
         conn.close()
         return redirect(url_for("index", e="Patient not found", q=usn))
 
-    conn.execute(
+    conn.close()
+
+    _write(
         "INSERT INTO vitals(usn, blood_pressure, pulse, temperature, weight, height, recorded_at) VALUES(?,?,?,?,?,?,?)",
         (usn, bp, pulse_i, temp_f, weight_f, height_f, datetime.utcnow().isoformat()),
     )
-    conn.commit()
-    conn.close()
+    response_cache.bump("vitals")
     return redirect(url_for("index", m="Vitals saved", q=usn))
 
 
@@ -1575,14 +1562,13 @@ def prescription_create() -> Response:
         conn.close()
         return redirect(url_for("index", e="Patient not found", q=usn))
 
-    cur = conn.cursor()
-    cur.execute(
+    conn.close()
+
+    _write(
         "INSERT INTO prescriptions(usn, notes, prescribed_at) VALUES(?,?,?)",
         (usn, notes, datetime.utcnow().isoformat()),
     )
-    rx_id = cur.lastrowid
-    conn.commit()
-    conn.close()
+    response_cache.bump("prescriptions")
     return redirect(url_for("index", m="Prescription saved", q=usn))
 
 
@@ -1600,30 +1586,21 @@ def prescription_item_create() -> Response:
     if not (prescription_id and med_name):
         return redirect(url_for("index", e="Prescription and medication required"))
 
-    conn = get_db()
-    cur = conn.cursor()
-    # Upsert medication by name
-    med = cur.execute("SELECT id FROM medications WHERE name=?", (med_name,)).fetchone()
-    if med:
-        med_id = med["id"]
-    else:
-        cur.execute("INSERT INTO medications(name) VALUES(?)", (med_name,))
-        med_id = cur.lastrowid
-
     try:
         dur_i = int(duration_days) if duration_days else None
     except ValueError:
         dur_i = None
 
-    cur.execute(
-        """
-        INSERT INTO prescription_items(prescription_id, medication_id, dose, route, frequency, duration_days, instructions)
-        VALUES (?,?,?,?,?,?,?)
-        """,
-        (int(prescription_id), med_id, dose, route, frequency, dur_i, instructions or None),
-    )
-    conn.commit()
-    conn.close()
+    item = {"name": med_name, "dose": dose, "route": route, "frequency": frequency,
+            "durationDays": dur_i, "instructions": instructions}
+    try:
+        rx_id = int(prescription_id)
+    except ValueError:
+        return redirect(url_for("index", e="Prescription not found"))
+    # Same path as the API: the item goes into the medications JSON, triggers do the rest
+    if not writer.submit(lambda conn: prescription_items.append_item(conn, rx_id, item)):
+        return redirect(url_for("index", e="Prescription not found"))
+    response_cache.bump("prescriptions", "prescription_items", "medications")
     return redirect(url_for("index", m="Medication added to prescription"))
 
 
@@ -1641,7 +1618,7 @@ def prescription_print(pid: int) -> str:
         FROM prescription_items pi
         JOIN medications m ON m.id = pi.medication_id
         WHERE pi.prescription_id = ?
-        ORDER BY pi.id
+        ORDER BY pi.position
         """,
         (pid,),
     ).fetchall()
@@ -1651,6 +1628,7 @@ def prescription_print(pid: int) -> str:
 
 # New: Appointments CRUD (basic)
 @app.get("/api/appointments")
+@response_cache.cached("appointments")
 def api_appointments_list() -> Response:
     usn = (request.args.get("usn") or "").strip()
     conn = get_db()
@@ -1686,17 +1664,16 @@ def api_appointments_create() -> Response:
         conn.close()
         return jsonify({"error": "Patient not found"}), 404
 
-    cur = conn.cursor()
-    cur.execute(
+    conn.close()
+
+    appt_id = _write(
         """
         INSERT INTO appointments(usn, starts_at, ends_at, status, title, clinician, notes)
         VALUES (?,?,?,?,?,?,?)
         """,
         (usn, starts_at, ends_at, "Scheduled", title, clinician, notes),
     )
-    appt_id = cur.lastrowid
-    conn.commit()
-    conn.close()
+    response_cache.bump("appointments")
     return jsonify({"id": appt_id}), 201
 
 
@@ -1710,9 +1687,7 @@ def api_appointments_update(aid: int) -> Response:
     starts_at = (data.get("starts_at") or "").strip() or None
     ends_at = (data.get("ends_at") or "").strip() or None
 
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute(
+    _write(
         """
         UPDATE appointments
         SET status = COALESCE(?, status),
@@ -1725,38 +1700,41 @@ def api_appointments_update(aid: int) -> Response:
         """,
         (status, title, clinician, notes, starts_at, ends_at, aid),
     )
-    conn.commit()
-    conn.close()
+    response_cache.bump("appointments")
     return jsonify({"ok": True})
 
 
 @app.post("/api/appointments/<int:aid>/delete")
 def api_appointments_delete(aid: int) -> Response:
-    conn = get_db()
-    conn.execute("DELETE FROM appointments WHERE id=?", (aid,))
-    conn.commit()
-    conn.close()
+    _write("DELETE FROM appointments WHERE id=?", (aid,))
+    response_cache.bump("appointments")
     return jsonify({"ok": True})
 
 
 # New: Labs basic APIs
 @app.get("/api/lab-tests")
+@response_cache.cached("lab_tests")
 def api_lab_tests() -> Response:
     conn = get_db()
-    rows = conn.execute("SELECT * FROM lab_tests WHERE is_active = 1 ORDER BY name").fetchall()
+    rows = conn.execute(
+        f"SELECT {', '.join(LAB_TEST_COLUMNS)} FROM lab_tests WHERE is_active = 1 ORDER BY name").fetchall()
     conn.close()
     return jsonify([dict(r) for r in rows])
 
 
 @app.post("/api/lab-orders")
 def api_create_lab_order() -> Response:
+    """Order one or more tests: ``{"usn", "test_codes": ["CBC", "GLU"], "notes"}`` (``test_code`` still works)."""
     data = request.get_json(silent=True) or {}
     usn = (data.get("usn") or "").strip()
-    test_code = (data.get("test_code") or "").strip()
     notes = (data.get("notes") or "").strip() or None
+    try:
+        codes = lab_orders.parse_test_codes(data)
+    except LabError as e:
+        return jsonify({"error": str(e)}), 400
 
-    if not (usn and test_code):
-        return jsonify({"error": "usn and test_code required"}), 400
+    if not (usn and codes):
+        return jsonify({"error": "usn and test_code(s) required"}), 400
 
     conn = get_db()
     p = conn.execute("SELECT 1 FROM patients WHERE usn=?", (usn,)).fetchone()
@@ -1764,34 +1742,34 @@ def api_create_lab_order() -> Response:
         conn.close()
         return jsonify({"error": "Patient not found"}), 404
 
-    test = conn.execute("SELECT id FROM lab_tests WHERE code=? AND is_active=1", (test_code,)).fetchone()
-    if not test:
-        conn.close()
-        return jsonify({"error": "Lab test not found"}), 404
-
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO lab_orders(usn, ordered_at, status, notes) VALUES(?,?,?,?)",
-        (usn, datetime.utcnow().isoformat(), "Ordered", notes),
-    )
-    order_id = cur.lastrowid
-    cur.execute(
-        "INSERT INTO lab_order_items(lab_order_id, lab_test_id) VALUES(?,?)",
-        (order_id, test["id"]),
-    )
-    conn.commit()
+    found = {
+        r["code"]: r["id"]
+        for r in conn.execute(
+            "SELECT id, code FROM lab_tests WHERE is_active=1 AND code IN (SELECT value FROM json_each(?))",
+            (json.dumps(codes),),
+        )
+    }
     conn.close()
-    return jsonify({"id": order_id}), 201
+    missing = [c for c in codes if c not in found]
+    if missing:
+        return jsonify({"error": "Lab test not found", "codes": missing}), 404
+
+    tests = [(found[c], c) for c in codes]
+    order_id, items = writer.submit(lambda conn: lab_orders.create_order(conn, usn, tests, notes))
+    response_cache.bump("lab_orders", "lab_order_items")
+    return jsonify({"id": order_id, "items": items}), 201
 
 
 @app.get("/api/lab-orders")
+@response_cache.cached("lab_orders", "lab_order_items", "lab_tests")
 def api_list_lab_orders() -> Response:
     usn = (request.args.get("usn") or "").strip()
     conn = get_db()
     if usn:
         rows = conn.execute(
             """
-            SELECT lo.*, loi.id AS item_id, lt.code, lt.name, loi.status, loi.result_value, loi.result_at
+            SELECT lo.*, loi.id AS item_id, lt.code, lt.name, loi.status, loi.result_value, loi.result_at,
+                   loi.flag
             FROM lab_orders lo
             JOIN lab_order_items loi ON loi.lab_order_id = lo.id
             JOIN lab_tests lt ON lt.id = loi.lab_test_id
@@ -1803,9 +1781,10 @@ def api_list_lab_orders() -> Response:
     else:
         rows = conn.execute(
             """
-            SELECT lo.*, loi.id AS item_id, lt.code, lt.name, loi.status, loi.result_value, loi.result_at
+            SELECT lo.*, loi.id AS item_id, lt.code, lt.name, loi.status, loi.result_value, loi.result_at,
+                   loi.flag
             FROM lab_orders lo
-            JOIN lab_order_items loi ON loi.lab_order_id = lo.id
+            CROSS JOIN lab_order_items loi ON loi.lab_order_id = lo.id
             JOIN lab_tests lt ON lt.id = loi.lab_test_id
             ORDER BY lo.ordered_at DESC
             LIMIT 200
@@ -1820,117 +1799,212 @@ def api_set_lab_result(item_id: int) -> Response:
     data = request.get_json(silent=True) or {}
     value = (data.get("result_value") or "").strip()
     notes = (data.get("result_notes") or "").strip() or None
+    result = lab_orders.LabResult(item_id, None, None, value, notes, None)
 
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        UPDATE lab_order_items
-        SET result_value = ?, result_notes = ?, result_at = ?, status = 'Completed'
-        WHERE id = ?
-        """,
-        (value, notes, datetime.utcnow().isoformat(), item_id),
-    )
-    # If all items completed, mark order completed
-    cur.execute(
-        """
-        UPDATE lab_orders
-           SET status = CASE WHEN NOT EXISTS (
-                SELECT 1 FROM lab_order_items WHERE lab_order_id = lab_orders.id AND status <> 'Completed'
-           ) THEN 'Completed' ELSE status END
-        WHERE id = (SELECT lab_order_id FROM lab_order_items WHERE id = ?)
-        """,
-        (item_id,),
-    )
-    conn.commit()
-    conn.close()
+    try:
+        writer.submit(lambda conn: lab_orders.record_results(conn, [result], reference_ranges))
+    except LabError:
+        return jsonify({"error": "Lab order item not found"}), 404
+    response_cache.bump("lab_orders", "lab_order_items")
     return jsonify({"ok": True})
 
 
+@app.post("/api/lab-results")
+def api_set_lab_results() -> Response:
+    """Bulk result entry, e.g. an analyser export, in one transaction.
+
+    ``{"results": [{"item_id" | "order_id" + "test_code", "result_value", "result_notes", "result_at"}]}``;
+    if any row does not match an item nothing is saved. See lab_orders.py.
+    """
+    try:
+        results = lab_orders.parse_results(request.get_json(silent=True) or {})
+        summary = writer.submit(lambda conn: lab_orders.record_results(conn, results, reference_ranges))
+    except LabError as e:
+        return jsonify({"error": str(e)}), 400
+    response_cache.bump("lab_orders", "lab_order_items")
+    return jsonify(dict(summary, ok=True))
+
+
+@app.get("/api/lab-results/abnormal")
+@response_cache.cached("lab_orders", "lab_order_items", "lab_tests")
+def api_abnormal_lab_results() -> Response:
+    """Worklist of low/high/critical results, newest first; ``?flag=critical``, ``?usn=``, keyset
+    ``?limit=``/``?after=`` as the other lists. Served from the partial index on flagged results."""
+    clauses: List[str] = []
+    params: List[Any] = []
+    flags = [f for f in (request.args.get("flag") or "").split(",") if f]
+    if any(f not in ABNORMAL_LAB_FLAGS for f in flags):
+        return jsonify({"error": f"flag must be one of: {', '.join(ABNORMAL_LAB_FLAGS)}"}), 400
+    if flags:
+        clauses.append(f"flag IN ({', '.join('?' * len(flags))})")
+        params.extend(flags)
+    usn = (request.args.get("usn") or "").strip()
+    if usn:
+        clauses.append("usn=?")
+        params.append(usn)
+    return _list_response(ABNORMAL_LAB_RESULTS_LISTING, " AND ".join(clauses), tuple(params))
+
+
+@app.post("/api/lab-tests/<code>/range")
+def api_set_lab_test_range(code: str) -> Response:
+    """Change a test's ``ref_range`` and/or ``critical_low``/``critical_high``, then re-flag its stored results."""
+    try:
+        update = lab_ranges.parse_range_update(request.get_json(silent=True) or {})
+    except RangeError as e:
+        return jsonify({"error": str(e)}), 400
+    assignments = ", ".join(f"{k} = ?" for k in update)
+    row = writer.submit(lambda conn: conn.execute(
+        f"UPDATE lab_tests SET {assignments} WHERE code = ? RETURNING id", (*update.values(), code)
+    ).fetchone())
+    if row is None:
+        return jsonify({"error": "Lab test not found"}), 404
+    response_cache.bump("lab_tests")
+
+    conn = get_db()
+    try:
+        summary = lab_ranges.recompute(conn, writer.submit, reference_ranges, [row[0]])
+    finally:
+        conn.close()
+    response_cache.bump("lab_order_items")
+    return jsonify(dict(summary, ok=True, code=code, **update))
+
+
 # Dashboard metrics
 @app.get("/api/metrics")
+# daily_counters only changes through triggers on these tables (or reconcile)
+@response_cache.cached("patients", "appointments", "vitals", "lab_order_items", "daily_counters",
+                       vary=lambda: date.today().isoformat())
 def api_metrics() -> Response:
-    today = date.today().isoformat()
+    # Trigger-maintained summary rows (daily_counters.py), not COUNTs over base tables
     conn = get_db()
-    patients_count = conn.execute("SELECT COUNT(1) FROM patients").fetchone()[0]
-    appts_today = conn.execute(
-        "SELECT COUNT(1) FROM appointments WHERE substr(starts_at,1,10) = ?",
-        (today,),
-    ).fetchone()[0]
-    labs_pending = conn.execute(
-        "SELECT COUNT(1) FROM lab_order_items WHERE status <> 'Completed'"
-    ).fetchone()[0]
-    vitals_today = conn.execute(
-        "SELECT COUNT(1) FROM vitals WHERE substr(recorded_at,1,10) = ?",
-        (today,),
-    ).fetchone()[0]
+    metrics = daily_counters.read_metrics(conn, date.today().isoformat())
     conn.close()
-    return jsonify({
-        "patients": patients_count,
-        "appointments_today": appts_today,
-        "labs_pending": labs_pending,
-        "vitals_today": vitals_today,
-    })
+    return jsonify(metrics)
+
+
+@app.get("/api/analytics/vitals")
+@response_cache.cached("vitals", "patients", vary=lambda: date.today().isoformat())
+def api_vitals_analytics() -> Response:
+    """Distributions, BP categories, out-of-range counts and trends over a date window.
+
+    ``?from=&to=`` (default the last 90 days), ``?metrics=a,b``, ``?trend=<metric>
+    &direction=rising|falling&limit=N`` and ``?usn=a,b[&series=1&rolling=N]``;
+    see vitals_analytics.py.
+    """
+    if not vitals_analytics.available():
+        return jsonify({"error": "vitals analytics needs numpy (pip install numpy)"}), 501
+    try:
+        query = vitals_analytics.parse_query(request.args, date.today())
+    except AnalyticsError as e:
+        return jsonify({"error": str(e)}), 400
+    conn = get_db()
+    try:
+        result = vitals_analytics.analyse(vitals_columns, conn, query)
+    finally:
+        conn.close()
+    return jsonify(result)
+
+
+@app.post("/api/debug/search/rebuild")
+@maintenance_endpoint
+def api_rebuild_search() -> Response:
+    """Re-derive the FTS5 search indexes from their tables (e.g. after VACUUM)."""
+    writer.submit(search.rebuild_indexes, exclusive=True)
+    return jsonify({"ok": True})
+
+
+@app.post("/api/debug/counters/reconcile")
+@maintenance_endpoint
+def api_reconcile_counters() -> Response:
+    """Recount daily_counters from the base tables and report drift."""
+    drift = writer.submit(daily_counters.reconcile, exclusive=True)
+    response_cache.bump("daily_counters")
+    return jsonify({"ok": True, "drifted": len(drift), "drift": drift})
+
+
+@app.post("/api/debug/latest-vitals/reconcile")
+@maintenance_endpoint
+def api_reconcile_latest_vitals() -> Response:
+    """Rebuild latest_vitals from vitals and report drift."""
+    drift = writer.submit(latest_vitals.reconcile, exclusive=True)
+    response_cache.bump("vitals")
+    return jsonify({"ok": True, "drifted": len(drift), "drift": drift})
+
+
+@app.post("/api/debug/vitals-rollups/reconcile")
+@maintenance_endpoint
+def api_reconcile_vitals_rollups() -> Response:
+    """Rebuild vitals_rollups from vitals and report drift."""
+    drift = writer.submit(vitals_rollups.reconcile, exclusive=True)
+    response_cache.bump("vitals")
+    return jsonify({"ok": True, "drifted": len(drift), "drift": drift})
+
+
+@app.post("/api/debug/lab-results/recompute")
+@maintenance_endpoint
+def api_recompute_lab_flags() -> Response:
+    """Re-flag every stored lab result against the current ranges (``?reparse=1`` also re-parses values)."""
+    conn = get_db()
+    try:
+        summary = lab_ranges.recompute(conn, writer.submit, reference_ranges,
+                                       reparse=request.args.get("reparse") in ("1", "true"))
+    finally:
+        conn.close()
+    response_cache.bump("lab_order_items")
+    return jsonify(dict(summary, ok=True))
+
+
+@app.post("/api/debug/prescription-items/reconcile")
+@maintenance_endpoint
+def api_reconcile_prescription_items() -> Response:
+    """Rebuild prescription_items from the medications JSON and report drift."""
+    drift = writer.submit(prescription_items.reconcile, exclusive=True)
+    response_cache.bump("prescription_items", "medications")
+    return jsonify({"ok": True, "drifted": len(drift), "drift": drift})
 
 
 # Export CSV (fix latest vitals selection)
 @app.get("/export.csv")
 def export_csv() -> Response:
     conn = get_db()
-    patients = conn.execute("SELECT * FROM patients").fetchall()
-    vitals_map: Dict[str, sqlite3.Row] = {}
-    for v in conn.execute(
-        """
-        SELECT v.* FROM vitals v
-        JOIN (
-            SELECT usn, MAX(recorded_at) AS latest
-            FROM vitals
-            GROUP BY usn
-        ) m ON m.usn = v.usn AND m.latest = v.recorded_at
+    # One ordered join instead of a per-patient scan of every prescription:
+    # patients in usn order, their latest vitals from latest_vitals, then
+    # their prescriptions from the (usn, prescribed_at) index.
+    cur = conn.execute(
+        f"""
+        SELECT p.usn, p.full_name, p.age, p.gender, p.contact, p.address,
+               v.blood_pressure_systolic, v.blood_pressure_diastolic, v.heart_rate,
+               v.temperature, v.weight, v.height, v.recorded_at,
+               r.notes AS rx_notes, r.prescribed_at
+        FROM patients p
+        {latest_vitals.JOIN}
+        LEFT JOIN prescriptions r ON r.usn = p.usn
+        ORDER BY p.usn, r.prescribed_at DESC, r.id DESC
         """
-    ).fetchall():
-        vitals_map[v["usn"]] = v
-
-    rx = conn.execute("SELECT * FROM prescriptions").fetchall()
-    conn.close()
+    )
 
     header = [
         "USN","Full Name","Age","Gender","Contact","Address",
         "BP","Pulse","Temp","Weight","Height","Vitals Time",
         "Prescription","Prescribed At"
     ]
-    rows: List[List[str]] = []
-
-    for p in patients:
-        p_usn = p["usn"]
-        v = vitals_map.get(p_usn)
-        related = [r for r in rx if r["usn"] == p_usn]
-        if not related:
-            rows.append([
-                p_usn, p["full_name"], str(p["age"]), p["gender"], p["contact"], p["address"],
-                v["blood_pressure"] if v else "", str(v["pulse"]) if v else "", str(v["temperature"]) if v else "",
-                str(v["weight"]) if v else "", str(v["height"]) if v else "", v["recorded_at"] if v else "",
-                "", ""
-            ])
-        else:
-            for r in related:
-                rows.append([
-                    p_usn, p["full_name"], str(p["age"]), p["gender"], p["contact"], p["address"],
-                    v["blood_pressure"] if v else "", str(v["pulse"]) if v else "", str(v["temperature"]) if v else "",
-                    str(v["weight"]) if v else "", str(v["height"]) if v else "", v["recorded_at"] if v else "",
-                    r["notes"].replace("\n", " "), r["prescribed_at"]
-                ])
-
-    buf = io.StringIO()
-    cw = csv.writer(buf)
-    cw.writerow(header)
-    cw.writerows(rows)
-    data = buf.getvalue()
-    return Response(
-        data,
-        mimetype="text/csv",
-        headers={"Content-Disposition": f"attachment; filename=hmis-export.csv"},
-    )
+
+    def rows():
+        for row in iter_cursor(cur):
+            has_vitals = row["recorded_at"] is not None
+            yield [
+                row["usn"], row["full_name"], str(row["age"]), row["gender"], row["contact"], row["address"],
+                f"{row['blood_pressure_systolic']}/{row['blood_pressure_diastolic']}" if has_vitals else "",
+                str(row["heart_rate"]) if has_vitals else "",
+                str(row["temperature"]) if has_vitals else "",
+                str(row["weight"]) if has_vitals else "",
+                str(row["height"]) if has_vitals else "",
+                row["recorded_at"] or "",
+                (row["rx_notes"] or "").replace("\n", " "),
+                row["prescribed_at"] or "",
+            ]
+
+    return csv_response("hmis-export.csv", header, rows())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,110 @@
+"""
+Concurrent writes: one commit per handler thread vs the single-writer queue.
+
+N threads each insert vitals as fast as they can, the way Waitress worker
+threads do at peak. "per-thread commits" is the old handler pattern (own
+connection, INSERT, COMMIT, with the pool's busy_timeout); "writer queue"
+submits the same INSERT through app.writer, which group-commits whatever is
+queued. Reports throughput, ``database is locked`` failures, per-write
+latency and the writer's batch sizes (lower HMIS_DB_BUSY_TIMEOUT to make
+lock contention fail sooner):
+
+    python benchmarks/bench_concurrent_writes.py [--threads 16] [--writes 200]
+"""
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List
+
+from common import load_app, percentile
+
+VITAL_SQL = ("INSERT INTO vitals(usn, weight, height, blood_pressure_systolic, blood_pressure_diastolic, "
+             "heart_rate, temperature, recorded_at) VALUES(?,?,?,?,?,?,?,?)")
+
+
+def run(threads: int, writes: int, write: Callable[[int], None]) -> Dict[str, float]:
+    latencies: List[float] = []
+    errors = {"locked": 0, "other": 0}
+    lock = threading.Lock()
+    start = threading.Barrier(threads)
+
+    def worker(tid: int) -> None:
+        mine: List[float] = []
+        start.wait()
+        for i in range(writes):
+            t0 = time.perf_counter()
+            try:
+                write(tid * writes + i)
+            except sqlite3.OperationalError as e:
+                with lock:
+                    errors["locked" if "locked" in str(e) else "other"] += 1
+                continue
+            mine.append((time.perf_counter() - t0) * 1e6)
+        with lock:
+            latencies.extend(mine)
+
+    t0 = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    return {
+        "ok": len(latencies),
+        "locked": errors["locked"],
+        "other": errors["other"],
+        "writes_per_s": len(latencies) / elapsed,
+        "p50_us": percentile(latencies, 50),
+        "p99_us": percentile(latencies, 99),
+    }
+
+
+def show(label: str, r: Dict[str, float]) -> None:
+    print(f"{label:<20} ok={r['ok']:6d}  locked={r['locked']:5d}  {r['writes_per_s']:8.0f} writes/s  "
+          f"p50={r['p50_us']:9.0f}us  p99={r['p99_us']:9.0f}us")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--writes", type=int, default=200, help="writes per thread")
+    args = parser.parse_args()
+
+    app_module = load_app()
+    conn = app_module.get_db()
+    conn.execute("INSERT INTO patients(usn, full_name, age, gender, contact, address) "
+                 "VALUES('BENCH1', 'Bench', 20, 'M', '', '')")
+    conn.commit()
+    conn.close()
+
+    def params(n: int):
+        return ("BENCH1", 70, 170, 120, 80, 72, 98.4, f"2024-01-01T00:00:{n:09d}")
+
+    local = threading.local()
+
+    def per_thread_commit(n: int) -> None:
+        # What every POST handler did before: its own connection and commit
+        c = getattr(local, "conn", None)
+        if c is None:
+            c = local.conn = app_module._pool.acquire()
+        c.execute(VITAL_SQL, params(n))
+        c.commit()
+
+    def via_writer(n: int) -> None:
+        app_module._write(VITAL_SQL, params(n))
+
+    print(f"{args.threads} threads x {args.writes} vitals inserts")
+    show("per-thread commits", run(args.threads, args.writes, per_thread_commit))
+    show("writer queue", run(args.threads, args.writes, via_writer))
+    stats = app_module.writer.stats()
+    print(f"writer: {stats['batches']} commits, mean batch {stats['mean_batch_size']}, "
+          f"max batch {stats['max_batch_size']}, peak queue depth {stats['peak_queue_depth']}, "
+          f"batch sizes {stats['batch_sizes']}")
+
+
+if __name__ == "__main__":
+    main()
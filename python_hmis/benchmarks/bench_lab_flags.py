@@ -0,0 +1,87 @@
+"""
+Cost of lab reference-range flagging (lab_ranges.py).
+
+Builds a synthetic clinic (synth_data, 200k rows by default, ~11k lab
+results), then times:
+
+* the engine flagging a bulk batch of results (``ReferenceRanges.evaluate``);
+* bulk result entry through POST /api/lab-results, which now flags on write;
+* re-flagging every stored result, with and without re-parsing the text,
+  and after a range change through POST /api/lab-tests/<code>/range;
+* worklist pages from GET /api/lab-results/abnormal (all, critical only, and
+  a page behind a cursor).
+
+    python benchmarks/bench_lab_flags.py [--rows 200000] [--batch 500] [-n 500]
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+from common import load_app, print_row, time_calls
+from synth_data import generate
+
+VALUES = ("92", "35 mg/dL", "412", "<5", "7.8", "Positive", "1:80", "140.0", "n/a")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--batch", type=int, default=500, help="results per bulk request")
+    parser.add_argument("-n", type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(25)
+    app_module = load_app()
+    conn = app_module.get_db()
+    t0 = time.perf_counter()
+    usns = generate(conn, args.rows)["usns"]
+    tests = conn.execute("SELECT id, code FROM lab_tests WHERE is_active = 1").fetchall()
+    results = conn.execute("SELECT COUNT(*) FROM lab_order_items WHERE result_value IS NOT NULL").fetchone()[0]
+    conn.close()
+    print(f"seeded {args.rows} rows ({results} lab results) in {time.perf_counter() - t0:.1f}s")
+    client = app_module.app.test_client()
+    ranges = app_module.reference_ranges
+
+    batch = [(rng.choice(tests)["id"], rng.choice(VALUES)) for _ in range(args.batch)]
+
+    def evaluate() -> None:
+        db = app_module.get_db()
+        try:
+            ranges.evaluate(db, batch)
+        finally:
+            db.close()
+
+    print_row(f"engine: {args.batch} results", time_calls(evaluate, args.n))
+
+    def bulk() -> None:
+        order = client.post("/api/lab-orders", json={
+            "usn": rng.choice(usns), "test_codes": [t["code"] for t in rng.sample(tests, 3)]}).get_json()
+        rows = [{"item_id": item["item_id"], "result_value": rng.choice(VALUES)} for item in order["items"]]
+        resp = client.post("/api/lab-results", json={"results": rows})
+        assert resp.status_code == 200, resp.data
+
+    print_row("http: order + flagged results", time_calls(bulk, args.n // 5))
+
+    for label, query in (("re-flag, all tests", ""), ("re-flag, nothing changed", ""),
+                         ("re-flag with reparse", "?reparse=1")):
+        summary = client.post(f"/api/debug/lab-results/recompute{query}").get_json()
+        print(f"{label:<28} {summary['elapsed_ms']:9.1f}ms  changed={summary['changed']} "
+              f"batches={summary['batches']}")
+
+    summary = client.post("/api/lab-tests/GLU/range", json={"ref_range": "70-110"}).get_json()
+    print(f"{'range change: GLU':<28} {summary['elapsed_ms']:9.1f}ms  changed={summary['changed']}")
+
+    print_row("worklist: first page", time_calls(
+        lambda: client.get("/api/lab-results/abnormal?limit=50"), args.n))
+    print_row("worklist: critical", time_calls(
+        lambda: client.get("/api/lab-results/abnormal?flag=critical&limit=50"), args.n))
+    cursor = client.get("/api/lab-results/abnormal?limit=50").headers.get("X-Next-Cursor")
+    assert cursor, "fewer than 50 abnormal results"
+    print_row("worklist: page 2", time_calls(
+        lambda: client.get(f"/api/lab-results/abnormal?limit=50&after={cursor}"), args.n))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Throughput of lab ordering and result entry.
+
+Seeds patients, then times:
+
+* ordering a three-test panel as one multi-test order vs three single-test
+  orders (POST /api/lab-orders);
+* entering results one item per request (POST /api/lab-results/<id>) vs in
+  bulk, analyser-export style (POST /api/lab-results, ``--batch`` rows per
+  request keyed by order id + test code), reported as results per second.
+
+    python benchmarks/bench_lab_results.py [--orders 2000] [--batch 500]
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+from common import load_app, print_row, time_calls
+
+PANEL = ("CBC", "GLU", "LFT")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--orders", type=int, default=2000, help="panel orders per result-entry run")
+    parser.add_argument("--batch", type=int, default=500, help="results per bulk request")
+    parser.add_argument("--patients", type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = random.Random(24)
+    app_module = load_app()
+    conn = app_module.get_db()
+    usns = [f"1NH{i:07d}" for i in range(args.patients)]
+    conn.executemany(
+        "INSERT INTO patients(usn, full_name, age, gender, contact, address) VALUES(?,?,?,?,?,?)",
+        ((usn, f"Patient {i}", 20, "F", f"9{i:09d}", "Bengaluru") for i, usn in enumerate(usns)),
+    )
+    conn.commit()
+    conn.close()
+    client = app_module.app.test_client()
+
+    def order(codes) -> dict:
+        resp = client.post("/api/lab-orders", json={"usn": rng.choice(usns), "test_codes": list(codes)})
+        assert resp.status_code == 201, resp.data
+        return resp.get_json()
+
+    n = args.orders // 10
+    print_row("panel: three orders", time_calls(lambda: [order([c]) for c in PANEL], n))
+    print_row("panel: one 3-test order", time_calls(lambda: order(PANEL), n))
+
+    def run(label: str, enter) -> None:
+        orders = [order(PANEL) for _ in range(args.orders)]
+        t0 = time.perf_counter()
+        entered = enter(orders)
+        elapsed = time.perf_counter() - t0
+        db = app_module.get_db()
+        pending = db.execute(
+            "SELECT COUNT(*) FROM lab_orders WHERE id IN (SELECT value FROM json_each(?)) AND status <> 'Completed'",
+            (str([o["id"] for o in orders]),)).fetchone()[0]
+        db.close()
+        assert pending == 0, pending
+        print(f"{label:<28} {entered / elapsed:9.0f} results/s  ({entered} results, {elapsed:.2f}s)")
+
+    def one_by_one(orders) -> int:
+        for o in orders:
+            for item in o["items"]:
+                resp = client.post(f"/api/lab-results/{item['item_id']}", json={"result_value": "92"})
+                assert resp.status_code == 200, resp.data
+        return sum(len(o["items"]) for o in orders)
+
+    def bulk(orders) -> int:
+        rows = [{"order_id": o["id"], "test_code": item["code"], "result_value": str(rng.randint(70, 140)),
+                 "result_at": "2026-10-01T09:30:00"} for o in orders for item in o["items"]]
+        rng.shuffle(rows)
+        for i in range(0, len(rows), args.batch):
+            resp = client.post("/api/lab-results", json={"results": rows[i:i + args.batch]})
+            assert resp.status_code == 200, resp.data
+        return len(rows)
+
+    run("results: one per request", one_by_one)
+    run(f"results: bulk, {args.batch} per request", bulk)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Cost of prescribe-time allergy and interaction screening (medication_safety.py).
+
+Builds a synthetic clinic (synth_data, 200k rows by default: ~12k patients
+with allergies, problems and prescriptions), then adds a few thousand
+interaction rules and groups over made-up substances plus medications that
+carry them, so the lookup maps are the size of a real rule set. Times:
+
+* the first check (loads the maps) and the reload after a rule change;
+* one prescription of 1-4 formulary medications, in the engine and through
+  POST /api/prescriptions/check, plus a full POST /api/prescriptions;
+* a re-screen of every active prescription.
+
+The target is under 2ms per prescription in the engine.
+
+    python benchmarks/bench_medication_safety.py [--rows 200000] [--rules 3000] [-n 2000]
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+from common import load_app, print_row, time_calls
+from synth_data import FORMULARY, generate
+
+SYLLABLES = "ab al am an ar ce ci co da de di fa fe lo ma me mi mo na ne no pa pe pi ra re ri sa se si ta te ti to".split()
+SUFFIXES = ("cillin", "mycin", "prazole", "sartan", "olol", "statin", "tidine", "vir", "zole", "mab", "pam", "ine")
+
+
+def substance(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))) + rng.choice(SUFFIXES)
+
+
+def seed_rules(conn, n: int, rng: random.Random) -> None:
+    substances = sorted({substance(rng) for _ in range(n)})
+    groups = [(s, f"{s[-5:]} class") for s in substances if rng.random() < 0.3]
+    conn.executemany("INSERT OR IGNORE INTO substance_groups(member, substance) VALUES(?,?)", groups)
+    pool = substances + [g for _, g in groups] + [m[1].lower() for m in FORMULARY]
+    rules = set()
+    while len(rules) < n:
+        a, b = sorted((rng.choice(pool), rng.choice(pool)))
+        rules.add(("drug", a, b))
+    conn.executemany(
+        "INSERT OR IGNORE INTO interaction_rules(kind, substance_a, substance_b, severity, message) "
+        "VALUES(?,?,?,?,?)",
+        ((kind, a, b, rng.choice(("major", "moderate", "minor")), f"{a} with {b}") for kind, a, b in rules),
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO medications(name, generic_name, form, strength) VALUES(?,?,?,?)",
+        ((s.title(), s, "Tablet", rng.choice(("10mg", "50mg", "250mg"))) for s in substances),
+    )
+    conn.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--rules", type=int, default=3000)
+    parser.add_argument("-n", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(23)
+    app_module = load_app()
+    conn = app_module.get_db()
+    t0 = time.perf_counter()
+    usns = generate(conn, args.rows)["usns"]
+    seed_rules(conn, args.rules, rng)
+    conn.close()
+    print(f"seeded {args.rows} rows and {args.rules} rules in {time.perf_counter() - t0:.1f}s")
+    client = app_module.app.test_client()
+    rules = app_module.safety_rules
+    labels = [f"{m[0]} {m[3]}" for m in FORMULARY]
+
+    def items() -> list:
+        return [{"name": label, "dosage": "1 tab"} for label in rng.sample(labels, rng.randint(1, 4))]
+
+    t0 = time.perf_counter()
+    conn = app_module.get_db()
+    rules.check(conn, usns[0], items())
+    conn.close()
+    stats = rules.stats()
+    print(f"{'first check (load maps)':<28} {(time.perf_counter() - t0) * 1000:9.1f}ms  "
+          f"medications={stats['medications']} rules={stats['rules']} groups={stats['groups']}")
+
+    def check() -> None:
+        db = app_module.get_db()
+        try:
+            rules.check(db, rng.choice(usns), items())
+        finally:
+            db.close()
+
+    print_row("engine: one prescription", time_calls(check, args.n))
+    print_row("http: /prescriptions/check", time_calls(
+        lambda: client.post("/api/prescriptions/check", json={"usn": rng.choice(usns), "medications": items()}),
+        args.n // 4))
+    print_row("http: POST /prescriptions", time_calls(
+        lambda: client.post("/api/prescriptions", json={"usn": rng.choice(usns), "diagnosis": "Bench",
+                                                          "medications": items()}),
+        args.n // 10))
+    stats = rules.stats()
+    print(f"{'':<28} {stats['alerts'] / stats['checks']:.2f} alerts per prescription")
+
+    resp = client.post("/api/interaction-rules", json={
+        "rules": [{"substanceA": "Paracetamol", "substanceB": "Benchamol", "message": "bench"}], "rescreen": False})
+    assert resp.status_code == 200, resp.data
+    t0 = time.perf_counter()
+    check()
+    print(f"{'check after a rule change':<28} {(time.perf_counter() - t0) * 1000:9.1f}ms  "
+          f"reload={rules.stats()['last_refresh_ms']}ms")
+
+    summary = client.post("/api/prescriptions/rescreen").get_json()
+    print(f"{'rescreen, all active':<28} {summary['elapsed_ms']:9.1f}ms  screened={summary['screened']} "
+          f"flagged={summary['flagged']} alerts={summary['alerts']}")
+
+
+if __name__ == "__main__":
+    main()
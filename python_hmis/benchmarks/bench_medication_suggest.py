@@ -0,0 +1,84 @@
+"""
+Latency of the medication typeahead (GET /api/medications/suggest).
+
+Seeds a synthetic formulary (20k medications by default: made-up brand
+names over real-looking generics, strengths and forms) and times 1-4 letter
+prefixes and two-word queries, both through the index alone and end to end
+through the Flask test client. Also reports the index's memory footprint and
+what one new medication costs the next lookup.
+
+    python benchmarks/bench_medication_suggest.py [--medications 20000] [-n 2000]
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+from common import load_app, print_row, time_calls
+
+SYLLABLES = "ab al am an ar ce ci co da de di fa fe lo ma me mi mo na ne no pa pe pi ra re ri sa se si ta te ti to va ve zo".split()
+SUFFIXES = ("cillin", "mycin", "prazole", "sartan", "olol", "statin", "tidine", "vir", "zole", "mab", "pam", "ine")
+FORMS = ("Tablet", "Capsule", "Syrup", "Injection", "Cream", "Gel", "Inhaler", "Sachet", "Drops")
+STRENGTHS = ("5mg", "10mg", "20mg", "40mg", "50mg", "100mg", "250mg", "500mg", "650mg", "1g", "1%", "2%")
+
+
+def drug_name(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3))) + rng.choice(SUFFIXES)
+
+
+def seed(conn, n: int, rng: random.Random) -> None:
+    rows = {}  # (name, form, strength) is unique
+    while len(rows) < n:
+        key = (drug_name(rng).title(), rng.choice(FORMS), rng.choice(STRENGTHS))
+        rows[key] = drug_name(rng).title()
+    conn.executemany(
+        "INSERT INTO medications(name, form, strength, generic_name) VALUES(?,?,?,?)",
+        (key + (generic,) for key, generic in rows.items()),
+    )
+    conn.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--medications", type=int, default=20_000)
+    parser.add_argument("-n", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(22)
+    app_module = load_app()
+    conn = app_module.get_db()
+    seed(conn, args.medications, rng)
+    conn.close()
+    client = app_module.app.test_client()
+    index = app_module.medication_index
+
+    t0 = time.perf_counter()
+    assert client.get("/api/medications/suggest?q=a").status_code == 200
+    stats = index.stats()
+    print(f"first lookup (full load)     {(time.perf_counter() - t0) * 1000:9.1f}ms  "
+          f"medications={stats['medications']} words={stats['words']} bytes={stats['bytes']}")
+
+    def prefix() -> str:
+        word = "".join(rng.choice(SYLLABLES) for _ in range(2))
+        return word[:rng.randint(1, 4)]
+
+    for label, make_query in (
+        ("prefix 1-4 letters", prefix),
+        ("two words", lambda: f"{prefix()} {rng.choice(STRENGTHS)[:2]}"),
+    ):
+        print_row(f"index: {label}", time_calls(lambda: index.suggest(make_query()), args.n))
+        print_row(f"http: {label}", time_calls(
+            lambda: client.get(f"/api/medications/suggest?q={make_query()}"), args.n // 4))
+
+    app_module.writer.submit(lambda c: c.execute(
+        "INSERT INTO medications(name, generic_name, form, strength) VALUES('Benchamol', 'Benchamol', 'Tablet', '1mg')"))
+    t0 = time.perf_counter()
+    names = [m["name"] for m in client.get("/api/medications/suggest?q=benchamol").get_json()["results"]]
+    assert names == ["Benchamol"], names
+    print(f"lookup after one insert      {(time.perf_counter() - t0) * 1000:9.3f}ms  "
+          f"refresh={index.stats()['last_refresh_ms']}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Opening a patient: GET /api/patients/<usn>/chart against the per-section fan-out.
+
+Seeds a clinic of synthetic patients, then times, through the Flask test
+client, the seven calls the SPA makes today (patient list plus one call per
+section, each with its own get_db()) against the single chart request. Only
+in-process server time is measured; on a real network every extra call also
+costs a round trip, which the "calls" column makes explicit.
+
+    python benchmarks/bench_patient_chart.py [--patients 2000] [--per-patient 40] [-n 200]
+"""
+from __future__ import annotations
+
+import argparse
+import random
+
+from common import load_app, print_row, time_calls
+
+
+def seed(conn, patients: int, per_patient: int) -> None:
+    rng = random.Random(3)
+    conn.executemany(
+        "INSERT INTO patients(usn, full_name, age, gender, contact, address) VALUES(?,?,?,?,?,?)",
+        ((f"CH{i:05d}", f"Patient {i}", rng.randint(18, 80), "M", "", "") for i in range(patients)),
+    )
+    usns = [f"CH{i:05d}" for i in range(patients)]
+
+    def stamp() -> str:
+        return f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:00:00"
+
+    for usn in usns:
+        conn.executemany(
+            """INSERT INTO vitals(usn, weight, height, blood_pressure_systolic, blood_pressure_diastolic,
+               heart_rate, temperature, recorded_at) VALUES(?,?,?,?,?,?,?,?)""",
+            ((usn, 70, 170, 120, 80, 72, 98.4, stamp()) for _ in range(per_patient)),
+        )
+        conn.executemany(
+            "INSERT INTO prescriptions(usn, diagnosis, medications, prescribed_at) VALUES(?,?,?,?)",
+            ((usn, "URTI", '[{"name": "Paracetamol", "dosage": "500mg"}]', stamp()) for _ in range(per_patient // 4)),
+        )
+        conn.executemany(
+            "INSERT INTO case_reports(report_number, usn, created_at) VALUES(?,?,?)",
+            ((f"CR-{usn}-{k}", usn, stamp()) for k in range(per_patient // 8)),
+        )
+        conn.executemany(
+            "INSERT INTO sick_intimations(intimation_number, usn, sick_leave_from, sick_leave_to, reason, created_at) "
+            "VALUES(?,?,?,?,?,?)",
+            ((f"SI-{usn}-{k}", usn, "2024-01-01", "2024-01-03", "fever", stamp()) for k in range(per_patient // 8)),
+        )
+        conn.executemany(
+            "INSERT INTO appointments(usn, starts_at, ends_at) VALUES(?,?,?)",
+            ((usn, stamp(), stamp()) for _ in range(per_patient // 8)),
+        )
+        for _ in range(per_patient // 8):
+            order_id = conn.execute(
+                "INSERT INTO lab_orders(usn, ordered_at) VALUES(?,?)", (usn, stamp())
+            ).lastrowid
+            conn.execute("INSERT INTO lab_order_items(lab_order_id, lab_test_id) VALUES(?, 1)", (order_id,))
+    conn.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--patients", type=int, default=2000)
+    parser.add_argument("--per-patient", type=int, default=40)
+    parser.add_argument("-n", type=int, default=200)
+    args = parser.parse_args()
+
+    app_module = load_app()
+    conn = app_module.get_db()
+    seed(conn, args.patients, args.per_patient)
+    conn.close()
+    client = app_module.app.test_client()
+    usn = f"CH{args.patients // 2:05d}"
+
+    sections = [
+        f"/api/vitals?usn={usn}",
+        f"/api/prescriptions?usn={usn}",
+        f"/api/case-reports?usn={usn}",
+        f"/api/sick-intimations?usn={usn}",
+        f"/api/appointments?usn={usn}",
+        f"/api/lab-orders?usn={usn}",
+    ]
+
+    def get_all(urls):
+        def run():
+            for url in urls:
+                resp = client.get(url)
+                assert resp.status_code == 200, (url, resp.status_code)
+        return run
+
+    print(f"{args.patients} patients, ~{args.per_patient} vitals each; opening {usn}")
+    print_row("fan-out (7 calls)", time_calls(get_all(["/api/patients"] + sections), args.n))
+    print_row("sections only (6 calls)", time_calls(get_all(sections), args.n))
+    print_row("chart (1 call)", time_calls(get_all([f"/api/patients/{usn}/chart"]), args.n))
+    print_row("chart, limit=200 (1 call)", time_calls(get_all([f"/api/patients/{usn}/chart?limit=200"]), args.n))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Cost of request instrumentation (request_metrics.py, query_trace.py and the
+timed cursors).
+
+Two measurements:
+
+* end to end: GET /api/health and GET /api/lab-tests through the test
+  client with no hooks, metrics only, tracing only, and both (the default).
+  The four set-ups take turns request by request, rotating which goes first,
+  so drift and warm-up land on all of them alike;
+* SQLite timing: one execute + fetchall through the pool's TimedCursor vs a
+  plain sqlite3 cursor on the same connection. The pool always hands out
+  timed cursors, so this part is not in the end-to-end deltas.
+
+Exits non-zero if the default set-up's overhead, the end-to-end p50 delta
+over no hooks plus the cursor cost of each statement the route runs, reaches
+the 50us budget on either route.
+
+    python benchmarks/bench_request_metrics.py [-n 20000]
+"""
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import sys
+import time
+from typing import Dict, List
+
+from common import load_app, percentile, print_row, time_calls
+
+BUDGET_US = 50.0
+URLS = ("/api/health", "/api/lab-tests")
+
+
+def summarise(samples: List[float]) -> Dict[str, float]:
+    return {
+        "n": len(samples),
+        "mean_us": sum(samples) / len(samples),
+        "p50_us": percentile(samples, 50),
+        "p95_us": percentile(samples, 95),
+        "p99_us": percentile(samples, 99),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", type=int, default=20000, help="requests per route and set-up")
+    args = parser.parse_args()
+
+    app_module = load_app()
+    app, metrics, tracer = app_module.app, app_module.request_metrics, app_module.query_tracer
+    client = app.test_client()
+
+    hook_lists = (app.before_request_funcs, app.after_request_funcs, app.teardown_request_funcs)
+    installed = [list(funcs[None]) for funcs in hook_lists]
+    setups = {"bare": (), "metrics": (metrics,), "tracing": (tracer,), "metrics+tracing": (metrics, tracer)}
+
+    def use(extensions) -> None:
+        dropped = {metrics, tracer}.difference(extensions)
+        for funcs, original in zip(hook_lists, installed):
+            funcs[None] = [f for f in original if getattr(f, "__self__", None) not in dropped]
+
+    statements: Dict[str, int] = {}
+    samples: Dict[str, Dict[str, List[float]]] = {url: {name: [] for name in setups} for url in URLS}
+    names = list(setups)
+    for url in URLS:
+        use(setups["metrics+tracing"])
+        resp = client.get(url)
+        statements[url] = int(resp.headers.get("X-Query-Count", "0"))
+        resp.close()
+        for _ in range(200):
+            client.get(url).close()
+        for i in range(args.n):
+            for name in names[i % len(names):] + names[:i % len(names)]:
+                use(setups[name])
+                t0 = time.perf_counter()
+                client.get(url).close()
+                samples[url][name].append((time.perf_counter() - t0) * 1e6)
+    use(setups["metrics+tracing"])
+
+    conn = app_module.get_db()
+    sql = "SELECT * FROM lab_tests WHERE is_active = 1 ORDER BY name"
+    timed = time_calls(lambda: conn.execute(sql).fetchall(), args.n)
+    plain = time_calls(lambda: sqlite3.Connection.execute(conn, sql).fetchall(), args.n)
+    conn.close()
+    cursor_us = max(timed["p50_us"] - plain["p50_us"], 0.0)
+
+    worst = 0.0
+    for url in URLS:
+        stats = {name: summarise(s) for name, s in samples[url].items()}
+        print(url)
+        for name in setups:
+            print_row(f"  {name}", stats[name])
+        bare = stats["bare"]["p50_us"]
+        delta = {name: stats[name]["p50_us"] - bare for name in setups if name != "bare"}
+        overhead = delta["metrics+tracing"] + statements[url] * cursor_us
+        worst = max(worst, overhead)
+        print(f"  p50 over bare: metrics {delta['metrics']:+.1f}us, tracing {delta['tracing']:+.1f}us, "
+              f"both {delta['metrics+tracing']:+.1f}us; + {statements[url]} statement(s) x "
+              f"{cursor_us:.1f}us cursor = {overhead:.1f}us")
+    print_row("lab-tests query timed", timed)
+    print_row("lab-tests query plain", plain)
+
+    print(f"per-request overhead (metrics + tracing, worst route): {worst:.1f}us (budget {BUDGET_US:.0f}us)")
+    if worst >= BUDGET_US:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Per-request fixed cost before and after moving schema setup out of the
+request path.
+
+"before" replays the old ``ensure_db`` behaviour (full baseline DDL script,
+seed probe and commit on every request); "after" is the current app, which
+only checks an in-memory flag.
+
+    python benchmarks/bench_request_overhead.py [-n 2000]
+"""
+from __future__ import annotations
+
+import argparse
+
+from common import load_app, print_row, time_calls
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", type=int, default=2000, help="requests per scenario")
+    args = parser.parse_args()
+
+    app_module = load_app()
+    from migrations import BASELINE_SCHEMA  # type: ignore
+
+    client = app_module.app.test_client()
+
+    def request() -> None:
+        client.get("/api/lab-tests")
+
+    after = time_calls(request, args.n)
+
+    def legacy_ensure_db() -> None:
+        conn = app_module.get_db()
+        conn.executescript(BASELINE_SCHEMA)
+        conn.execute("SELECT COUNT(1) FROM lab_tests").fetchone()
+        conn.commit()
+        conn.close()
+
+    app_module.app.before_request_funcs.setdefault(None, []).insert(0, legacy_ensure_db)
+    before = time_calls(request, args.n)
+
+    print(f"GET /api/lab-tests x {args.n}")
+    print_row("before (DDL per request)", before)
+    print_row("after (migrate at startup)", after)
+    print(f"speedup (mean): {before['mean_us'] / after['mean_us']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Latency of GET /api/search at clinic-scale data (500k patients by default).
+
+Patients get synthetic Indian first/last names, phone numbers and
+localities. Queries are drawn from the generated data: name prefixes
+(prefix mode), inner substrings (trigram mode) and names with one typo
+(trigram mode, which then takes the fuzzy fallback). Each is timed end to
+end through the Flask test client.
+
+    python benchmarks/bench_search.py [--patients 500000] [-n 300]
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from urllib.parse import quote
+
+from common import load_app, print_row, time_calls
+
+FIRST = (
+    "aarav aditi akash ananya arjun asha bala deepa divya ganesh gita harish isha "
+    "kavya kiran lakshmi manoj meera mohan nandini naveen neha nikhil pooja pradeep "
+    "priya rahul rajesh ramesh ravi rohan sahana sanjay sneha suresh swati tanvi "
+    "uma varun vidya vijay vikram yash"
+).split()
+LAST = (
+    "acharya bhat chandra das desai gowda hegde iyer jain joshi kamath kulkarni "
+    "kumar menon mishra murthy naidu nair patel pillai prasad rao reddy shah "
+    "sharma shenoy shetty singh srinivas subramanian varma verma"
+).split()
+AREAS = (
+    "jayanagar indiranagar koramangala malleshwaram basavanagudi whitefield "
+    "marathahalli yelahanka hebbal banashankari rajajinagar btm"
+).split()
+
+
+def typo(word: str, rng: random.Random) -> str:
+    i = rng.randrange(1, len(word) - 1)
+    kind = rng.choice(("swap", "drop", "double"))
+    if kind == "swap":
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    if kind == "drop":
+        return word[:i] + word[i + 1:]
+    return word[:i] + word[i] + word[i:]
+
+
+def seed(conn, n: int, rng: random.Random) -> None:
+    conn.executemany(
+        "INSERT INTO patients(usn, full_name, age, gender, contact, address) VALUES(?,?,?,?,?,?)",
+        (
+            (f"1NH{i:07d}", f"{rng.choice(FIRST).title()} {rng.choice(LAST).title()}",
+             rng.randint(17, 30), rng.choice("MF"), f"9{rng.randrange(10**9):09d}",
+             f"{rng.randint(1, 999)} {rng.choice(AREAS).title()} Bengaluru")
+            for i in range(n)
+        ),
+    )
+    conn.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--patients", type=int, default=500_000)
+    parser.add_argument("-n", type=int, default=300)
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    app_module = load_app()
+    conn = app_module.get_db()
+    t0 = time.perf_counter()
+    seed(conn, args.patients, rng)
+    conn.close()
+    print(f"seeded {args.patients} patients (with FTS triggers) in {time.perf_counter() - t0:.1f}s")
+    client = app_module.app.test_client()
+
+    def bench(label: str, make_query) -> None:
+        def run():
+            resp = client.get(f"/api/search?types=patients&{make_query()}")
+            assert resp.status_code == 200, resp.data
+        print_row(label, time_calls(run, args.n))
+
+    bench("prefix 'asha ra'", lambda: "q=" + quote(
+        f"{rng.choice(FIRST)[:rng.randint(2, 4)]} {rng.choice(LAST)[:2]}"))
+    bench("prefix full name", lambda: "q=" + quote(f"{rng.choice(FIRST)} {rng.choice(LAST)}"))
+    bench("trigram substring", lambda: "mode=trigram&q=" + quote(rng.choice(LAST)[1:5]))
+    bench("trigram one typo", lambda: "mode=trigram&q=" + quote(
+        f"{rng.choice(FIRST)} {typo(rng.choice([w for w in LAST if len(w) > 4]), rng)}"))
+    bench("prefix phone", lambda: f"q=9{rng.randrange(10**4):04d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Records/sec for the /api/sync/* bulk ingest path.
+
+Posts batches of synthetic vitals (the largest offline backlog in practice)
+through the Flask test client at each size. For comparison the legacy
+per-record probe + INSERT loop is mounted on a scratch route and fed the
+same payload, so both numbers include request parsing and JSON.
+
+    python benchmarks/bench_sync_ingest.py [--sizes 1000 10000 100000] [--skip-legacy]
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+from common import load_app
+
+N_PATIENTS = 2000
+
+
+def make_vitals(n: int, rng: random.Random):
+    return [
+        {
+            "usn": f"BENCH{rng.randrange(N_PATIENTS):05d}",
+            "weight": round(rng.uniform(40, 110), 1),
+            "height": round(rng.uniform(140, 195), 1),
+            "bloodPressureSystolic": rng.randint(90, 170),
+            "bloodPressureDiastolic": rng.randint(55, 105),
+            "heartRate": rng.randint(55, 110),
+            "temperature": round(rng.uniform(97.0, 101.5), 1),
+            "oxygenSaturation": rng.randint(90, 100),
+            "recordedAt": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:00:00",
+        }
+        for _ in range(n)
+    ]
+
+
+def legacy_sync_vitals():
+    from flask import jsonify, request
+    import app as app_module  # type: ignore
+
+    vitals = request.get_json()
+    conn = app_module.get_db()
+    cur = conn.cursor()
+    synced = 0
+    for vital in vitals:
+        if not cur.execute("SELECT 1 FROM patients WHERE usn = ?", (vital.get("usn"),)).fetchone():
+            continue
+        cur.execute(
+            """INSERT OR REPLACE INTO vitals
+               (id, usn, weight, height, blood_pressure_systolic, blood_pressure_diastolic,
+                heart_rate, temperature, respiratory_rate, oxygen_saturation, notes,
+                recorded_at, recorded_by)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (vital.get("id"), vital.get("usn"), vital.get("weight"), vital.get("height"),
+             vital.get("bloodPressureSystolic"), vital.get("bloodPressureDiastolic"),
+             vital.get("heartRate"), vital.get("temperature"), vital.get("respiratoryRate"),
+             vital.get("oxygenSaturation"), vital.get("notes"), vital.get("recordedAt"),
+             vital.get("recordedBy", "System User")),
+        )
+        synced += 1
+    conn.commit()
+    conn.close()
+    return jsonify({"status": "success", "synced_count": synced, "total_received": len(vitals)})
+
+
+def timed_post(client, url: str, payload) -> float:
+    t0 = time.perf_counter()
+    resp = client.post(url, json=payload)
+    elapsed = time.perf_counter() - t0
+    assert resp.status_code == 200 and resp.get_json()["synced_count"] == len(payload), resp.get_json()
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    app_module = load_app()
+    app_module.app.add_url_rule(
+        "/bench/legacy-sync-vitals", view_func=legacy_sync_vitals, methods=["POST"]
+    )
+    client = app_module.app.test_client()
+    rng = random.Random(42)
+    client.post("/api/sync/patients", json=[
+        {"usn": f"BENCH{i:05d}", "fullName": f"Bench Patient {i}", "age": 30, "gender": "F"}
+        for i in range(N_PATIENTS)
+    ])
+
+    print(f"{'rows':>8}  {'bulk rec/s':>12}  {'legacy rec/s':>12}")
+    for n in args.sizes:
+        vitals = make_vitals(n, rng)
+        bulk = n / timed_post(client, "/api/sync/vitals", vitals)
+        legacy = "-" if args.skip_legacy else (
+            f"{n / timed_post(client, '/bench/legacy-sync-vitals', vitals):.0f}"
+        )
+        print(f"{n:>8}  {bulk:12.0f}  {legacy:>12}")
+
+
+if __name__ == "__main__":
+    main()
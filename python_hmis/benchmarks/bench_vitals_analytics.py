@@ -0,0 +1,104 @@
+"""
+Latency of GET /api/analytics/vitals over a large vitals table (1M rows by default).
+
+Vitals are seeded straight into the table (the app's triggers still run), spread
+over two years and 50k patients. Timed through the Flask test client:
+
+* the first request, which loads the columnar copy in chunks;
+* the refresh after one new reading (only the changed rows are read);
+* population summaries over random windows (each window is a new cache key);
+* the same plus a rising-systolic trend ranking, and one patient's series.
+
+The target is well under a second at 5M rows (``--vitals 5000000``).
+
+    python benchmarks/bench_vitals_analytics.py [--vitals 1000000] [-n 50]
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from common import load_app, print_row, time_calls
+
+END = date(2026, 6, 30)
+DAYS = 730
+CHUNK = 50_000
+
+
+def seed(conn, n: int, patients: int, rng: random.Random) -> None:
+    conn.executemany(
+        "INSERT INTO patients(usn, full_name, age, gender, contact, address) VALUES(?,?,?,?,?,?)",
+        ((f"1NH{i:07d}", f"Patient {i}", rng.randint(17, 60), rng.choice("MF"), f"9{i:09d}", "Bengaluru")
+         for i in range(patients)),
+    )
+    start = datetime.combine(END - timedelta(days=DAYS - 1), datetime.min.time())
+
+    def row():
+        sys_bp = int(rng.gauss(118, 14))
+        return (
+            f"1NH{rng.randrange(patients):07d}", round(rng.gauss(62, 10), 1), round(rng.gauss(168, 9), 1),
+            sys_bp, int(sys_bp * 0.65 + rng.gauss(0, 6)), int(rng.gauss(76, 10)),
+            round(rng.gauss(98.4, 0.6), 1), rng.choice((None, 97, 98, 99)),
+            (start + timedelta(seconds=rng.randrange(DAYS * 86400))).isoformat(timespec="seconds"),
+        )
+
+    for done in range(0, n, CHUNK):
+        conn.executemany(
+            "INSERT INTO vitals(usn, weight, height, blood_pressure_systolic, blood_pressure_diastolic, "
+            "heart_rate, temperature, oxygen_saturation, recorded_at) VALUES(?,?,?,?,?,?,?,?,?)",
+            (row() for _ in range(min(CHUNK, n - done))),
+        )
+    conn.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--vitals", type=int, default=1_000_000)
+    parser.add_argument("--patients", type=int, default=50_000)
+    parser.add_argument("-n", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(19)
+    app_module = load_app()
+    conn = app_module.get_db()
+    t0 = time.perf_counter()
+    seed(conn, args.vitals, args.patients, rng)
+    conn.close()
+    print(f"seeded {args.vitals} vitals for {args.patients} patients in {time.perf_counter() - t0:.1f}s")
+    client = app_module.app.test_client()
+
+    def get(query: str) -> dict:
+        resp = client.get(f"/api/analytics/vitals?{query}")
+        assert resp.status_code == 200, resp.data
+        return resp.get_json()
+
+    def window() -> str:
+        end = END - timedelta(days=rng.randrange(DAYS // 2))
+        return f"from={end - timedelta(days=rng.randint(30, 365))}&to={end}"
+
+    t0 = time.perf_counter()
+    source = get("from=2000-01-01")["source"]
+    print(f"{'first request (full load)':<28} {(time.perf_counter() - t0) * 1000:9.1f}ms  "
+          f"rows={source['rows']} bytes={source['bytes']}")
+
+    resp = client.post("/api/vitals", json={
+        "usn": "1NH0000001", "weight": 60, "height": 170, "bloodPressureSystolic": 150,
+        "bloodPressureDiastolic": 95, "heartRate": 80, "temperature": 98.6, "recordedAt": f"{END}T10:00:00",
+    })
+    assert resp.status_code == 201, resp.data
+    t0 = time.perf_counter()
+    source = get("from=2000-01-02")["source"]
+    print(f"{'refresh after one insert':<28} {(time.perf_counter() - t0) * 1000:9.1f}ms  "
+          f"refresh={source['last_refresh_ms']}ms compute={source['compute_ms']}ms")
+
+    print_row("summary, random window", time_calls(lambda: get(window()), args.n, warmup=2))
+    print_row("summary + systolic trend", time_calls(
+        lambda: get(f"{window()}&trend=systolic&limit=20"), args.n, warmup=2))
+    print_row("one patient, series", time_calls(
+        lambda: get(f"{window()}&usn=1NH{rng.randrange(args.patients):07d}&series=1"), args.n, warmup=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Memory ceiling check for the streaming CSV exports.
+
+Loads N synthetic vitals (1M by default) straight into a throwaway database,
+then streams /api/export/vitals through the Flask test client, reading the
+body chunk by chunk while sampling the process's anonymous RSS (heap, not
+the mmap'd database file). Fails (exit 1) if RSS grows by more than the
+ceiling, i.e. if an export starts buffering rows again.
+
+    python benchmarks/check_export_memory.py [--rows 1000000] [--ceiling-mb 64] [--gzip]
+
+Linux only: reads RssAnon from /proc/self/status.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+
+from common import load_app
+
+N_PATIENTS = 5000
+BATCH = 50_000
+
+
+def rss_anon_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1]) / 1024.0
+    raise RuntimeError("RssAnon not available (Linux only)")
+
+
+def load_vitals(conn, n: int) -> None:
+    rng = random.Random(7)
+    conn.executemany(
+        "INSERT INTO patients(usn, full_name, age, gender, contact, address) VALUES(?,?,?,?,?,?)",
+        ((f"MEM{i:05d}", f"Patient {i}", rng.randint(18, 80), "F", "", "") for i in range(N_PATIENTS)),
+    )
+    sql = """INSERT INTO vitals(usn, weight, height, blood_pressure_systolic, blood_pressure_diastolic,
+             heart_rate, temperature, respiratory_rate, oxygen_saturation, notes, recorded_at, recorded_by)
+             VALUES(?,?,?,?,?,?,?,?,?,?,?,?)"""
+    for start in range(0, n, BATCH):
+        conn.executemany(sql, (
+            (f"MEM{rng.randrange(N_PATIENTS):05d}", round(rng.uniform(40, 110), 1),
+             round(rng.uniform(140, 195), 1), rng.randint(90, 170), rng.randint(55, 105),
+             rng.randint(55, 110), round(rng.uniform(97.0, 101.5), 1), rng.randint(12, 20),
+             rng.randint(90, 100), "routine check",
+             f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{i % 60:02d}:00",
+             "Bench")
+            for i in range(start, min(n, start + BATCH))
+        ))
+    conn.commit()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--ceiling-mb", type=float, default=64.0)
+    parser.add_argument("--gzip", action="store_true")
+    args = parser.parse_args()
+
+    app_module = load_app()
+    conn = app_module.get_db()
+    t0 = time.perf_counter()
+    load_vitals(conn, args.rows)
+    conn.close()
+    print(f"loaded {args.rows} vitals in {time.perf_counter() - t0:.1f}s")
+
+    client = app_module.app.test_client()
+    url = "/api/export/vitals" + ("?gzip=1" if args.gzip else "")
+    baseline = peak = rss_anon_mb()
+    t0 = time.perf_counter()
+    first_byte = None
+    total = 0
+    resp = client.get(url, buffered=False)
+    for i, chunk in enumerate(resp.response):
+        if first_byte is None:
+            first_byte = time.perf_counter() - t0
+        total += len(chunk)
+        if i % 50 == 0:
+            peak = max(peak, rss_anon_mb())
+    resp.close()
+    peak = max(peak, rss_anon_mb())
+    elapsed = time.perf_counter() - t0
+
+    growth = peak - baseline
+    print(f"{url}: {total / 1e6:.1f} MB in {elapsed:.1f}s, first byte after {first_byte * 1000:.1f} ms")
+    print(f"RssAnon baseline {baseline:.1f} MB, peak {peak:.1f} MB, growth {growth:.1f} MB "
+          f"(ceiling {args.ceiling_mb:.0f} MB)")
+    if growth > args.ceiling_mb:
+        print("FAIL: export memory grows with row count")
+        return 1
+    print("ok")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
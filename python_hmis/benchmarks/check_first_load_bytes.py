@@ -0,0 +1,48 @@
+"""
+Bytes on the wire to open the SPA: cold first load and a reload.
+
+Fetches "/" the way a browser does (Accept-Encoding: gzip, br) and then
+every same-origin asset the page references, and compares the total with the
+uncompressed file sizes. The reload replays the page with If-None-Match;
+hashed assets are not re-requested at all since they are cached immutable.
+
+    python benchmarks/check_first_load_bytes.py
+"""
+from __future__ import annotations
+
+import re
+
+from common import load_app
+
+ACCEPT = {"Accept-Encoding": "gzip, deflate, br"}
+
+
+def main() -> None:
+    app_module = load_app()
+    client = app_module.app.test_client()
+    spa = app_module.static_assets.get("hmis-standalone.html")
+    if spa is None:
+        raise SystemExit("hmis-standalone.html not found next to python_hmis/")
+
+    page = client.get("/", headers=ACCEPT)
+    wire = len(page.data)
+    raw = len(spa.variants[""])
+    urls = sorted(set(re.findall(r"\./(assets/[0-9a-f]+/[^'\"\s)]+)", spa.variants[""].decode("utf-8", "replace"))))
+    print(f"{'/':<56} {page.headers.get('Content-Encoding') or 'identity':>8} {len(page.data):>9} B")
+    for url in urls:
+        resp = client.get("/" + url, headers=ACCEPT)
+        assert resp.status_code == 200, (url, resp.status_code)
+        wire += len(resp.data)
+        raw += len(app_module.static_assets.get(url.split("/", 2)[2]).variants[""])
+        print(f"{url:<56} {resp.headers.get('Content-Encoding') or 'identity':>8} {len(resp.data):>9} B")
+        resp.close()
+
+    reload = client.get("/", headers={**ACCEPT, "If-None-Match": page.headers["ETag"]})
+    page.close()
+    print(f"first load: {wire} B on the wire vs {raw} B uncompressed ({raw / wire:.1f}x smaller)")
+    print(f"reload: {reload.status_code}, {len(reload.data)} B body; hashed assets served from browser cache")
+    reload.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+EXPLAIN QUERY PLAN regression check for the SQL in app.py.
+
+Every literal statement passed to ``execute``/``executemany`` in app.py, and
+the keyset page queries built for each list endpoint (listing.py), is
+planned against a freshly migrated database. The check fails (exit 1) when a
+query reads a large table with a bare ``SCAN`` (no index) or sorts it with a
+temp B-tree, which is what a missing or unusable index looks like.
+
+    python benchmarks/check_query_plans.py [-v]
+"""
+from __future__ import annotations
+
+import argparse
+import ast
+import os
+import re
+import sys
+from typing import Iterator, List, Tuple
+
+from common import APP_DIR, load_app
+
+# Tables that grow with clinic history; small lookup tables may be scanned
+LARGE_TABLES = {
+    "patients", "vitals", "prescriptions", "prescription_items", "case_reports",
+    "sick_intimations", "appointments", "lab_orders", "lab_order_items",
+    "encounters", "problems", "allergies", "audit_logs", "inventory_movements",
+}
+
+# Queries that read a whole table on purpose (exports, unfiltered counts).
+# Matched against the whitespace-normalised SQL text.
+INTENTIONAL_FULL_READS = [
+    r"^SELECT \* FROM patients$",
+    r"^SELECT \* FROM prescriptions$",
+]
+
+
+def iter_app_queries(path: str) -> Iterator[Tuple[int, str]]:
+    tree = ast.parse(open(path, encoding="utf-8").read(), path)
+    for node in ast.walk(tree):
+        if (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Attribute)
+            and node.func.attr in ("execute", "executemany")
+            and node.args
+            and isinstance(node.args[0], ast.Constant)
+            and isinstance(node.args[0].value, str)
+        ):
+            sql = " ".join(node.args[0].value.split())
+            if sql.upper().startswith(("SELECT", "UPDATE", "DELETE", "WITH")):
+                yield node.lineno, sql
+
+
+def iter_listing_queries(app_module, conn) -> Iterator[Tuple[str, str]]:
+    """First and follow-up pages of every Listing, with and without ?usn=."""
+    import listing  # importable once load_app() has put APP_DIR on sys.path
+
+    for name, value in vars(app_module).items():
+        if not isinstance(value, listing.Listing):
+            continue
+        after = listing.encode_cursor([None] * len(value.order))
+        for args in ({"limit": "50"}, {"limit": "50", "after": after}):
+            yield name, listing.page_query(conn, value, args).sql
+            if "usn" in listing.table_columns(conn, value.table) and value.table != "patients":
+                yield name, listing.page_query(conn, value, args, "usn=?", (None,)).sql
+
+
+def plan_problems(sql: str, plan: List[str]) -> List[str]:
+    # Plans name tables by alias (e.g. "SCAN v"); map aliases back to tables
+    aliases = {
+        alias: table
+        for table, alias in re.findall(r"(?:FROM|JOIN) (\w+) (?:AS )?(\w+)", sql)
+    }
+    touches_large = any(
+        re.search(rf"\b{t}\b", sql) for t in LARGE_TABLES
+    )
+    problems = []
+    for detail in plan:
+        m = re.match(r"SCAN (\w+)", detail)
+        if m and "USING" not in detail and aliases.get(m.group(1), m.group(1)) in LARGE_TABLES:
+            problems.append(detail)
+        if detail.startswith("USE TEMP B-TREE FOR ORDER BY") and touches_large:
+            problems.append(detail)
+    return problems
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    app_module = load_app()
+    conn = app_module.get_db()
+    failures = 0
+    queries = [(f"app.py:{lineno}", sql) for lineno, sql in iter_app_queries(os.path.join(APP_DIR, "app.py"))]
+    queries += iter_listing_queries(app_module, conn)
+    for where, sql in queries:
+        params = (None,) * sql.count("?")
+        plan = [r[3] for r in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+        problems = plan_problems(sql, plan)
+        intentional = any(re.search(p, sql) for p in INTENTIONAL_FULL_READS)
+        if problems and not intentional:
+            failures += 1
+            print(f"FAIL {where}: {sql}")
+            for d in plan:
+                print(f"    {d}")
+        elif args.verbose:
+            print(f"ok   {where}: {sql[:90]}")
+            for d in plan:
+                print(f"    {d}")
+    conn.close()
+    print(f"{failures} query plan regression(s)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
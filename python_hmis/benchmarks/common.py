@@ -0,0 +1,61 @@
+"""
+Shared helpers for the HMIS benchmark scripts.
+
+Benchmarks run against a throwaway data directory so they never touch the
+clinic's hmis.db. Import ``load_app`` before anything that imports ``app``.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(data_dir: Optional[str] = None):
+    """Import the Flask app module bound to ``data_dir`` (a temp dir by default)."""
+    os.environ["HMIS_DATA_DIR"] = data_dir or tempfile.mkdtemp(prefix="hmis-bench-")
+    # Benchmarks drive the rebuild/reconcile endpoints through the test client
+    os.environ.setdefault("HMIS_MAINTENANCE_API", "1")
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)
+    import app as app_module  # type: ignore
+
+    app_module.init_db()
+    return app_module
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def time_calls(fn: Callable[[], object], n: int, warmup: int = 10) -> Dict[str, float]:
+    """Call ``fn`` ``n`` times and summarise per-call latency in microseconds."""
+    for _ in range(warmup):
+        fn()
+    samples: List[float] = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1e6)
+    return {
+        "n": n,
+        "mean_us": sum(samples) / n,
+        "p50_us": percentile(samples, 50),
+        "p95_us": percentile(samples, 95),
+        "p99_us": percentile(samples, 99),
+    }
+
+
+def print_row(label: str, stats: Dict[str, float]) -> None:
+    print(
+        f"{label:<28} mean={stats['mean_us']:9.1f}us  p50={stats['p50_us']:9.1f}us  "
+        f"p95={stats['p95_us']:9.1f}us  p99={stats['p99_us']:9.1f}us"
+    )
@@ -0,0 +1,335 @@
+"""
+Load test: a mixed clinic workload replayed against the app in process.
+
+Generates a synthetic clinic with ``synth_data.py`` (or reuses ``--data-dir``
+if it already holds one), then drives the Flask test client with a weighted,
+seeded mix of what the clinic does all day:
+front desk lookups and search, opening charts, recording vitals, prescribing,
+booking appointments, ordering labs and entering results, dashboard polling
+and sync pulls. Half of the per-patient requests go to a small "today's
+patients" set, the way a clinic day revisits the same charts.
+
+Prints throughput and p50/p95/p99 per endpoint (labelled by route, as in
+/metrics). ``--save-baseline`` stores the results as JSON; later runs with the
+same size, request count and threads are compared against it and the script
+exits non-zero if an endpoint's p95, the error count or overall throughput
+got worse by more than ``--tolerance``. Baselines are per machine.
+
+The default single thread replays the same request sequence every run, which
+keeps per-endpoint percentiles steady enough to compare (about 1% apart run
+to run). ``--threads N`` measures throughput under concurrency, but latencies
+then mostly reflect GIL and writer-queue scheduling and vary far more.
+
+    python benchmarks/load_test.py --save-baseline      # record benchmarks/baselines/load_test.json
+    python benchmarks/load_test.py                      # compare against it
+    python benchmarks/load_test.py --rows 1000000 --requests 20000 --threads 8 --baseline /tmp/big.json
+
+Everything runs offline against a throwaway data dir; latencies are server
+time only (no network, no Waitress).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import date, datetime
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from common import load_app, percentile
+from synth_data import CONDITIONS, FIRST_F, FIRST_M, LAST, generate
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "load_test.json")
+# Bump when MIX changes, so old baselines are not compared against a different workload
+MIX_VERSION = 1
+
+Request = Tuple[str, str, Optional[Dict[str, Any]]]  # method, url, JSON body
+
+
+class Workload:
+    """Shared state the request generators draw from; one per run."""
+
+    def __init__(self, conn: sqlite3.Connection, seed: int) -> None:
+        self.usns = [r[0] for r in conn.execute("SELECT usn FROM patients")]
+        rng = random.Random(seed)
+        self.today = rng.sample(self.usns, max(1, len(self.usns) // 20))
+        self.pending_results: Deque[int] = deque(
+            r[0] for r in conn.execute("SELECT id FROM lab_order_items WHERE status = 'Ordered'"))
+        self.any_item = conn.execute("SELECT MAX(id) FROM lab_order_items").fetchone()[0] or 1
+        self.test_codes = [r[0] for r in conn.execute("SELECT code FROM lab_tests WHERE is_active = 1")]
+        self.sync_cursor = 0
+        self.seq = 0
+        self.lock = threading.Lock()
+
+    def patient(self, rng: random.Random) -> str:
+        return rng.choice(self.today if rng.random() < 0.5 else self.usns)
+
+    def next_seq(self) -> int:
+        with self.lock:
+            self.seq += 1
+            return self.seq
+
+    def result_item(self, rng: random.Random) -> int:
+        try:
+            return self.pending_results.popleft()
+        except IndexError:
+            return rng.randint(1, self.any_item)
+
+
+def _vitals(w: Workload, rng: random.Random) -> Request:
+    return "POST", "/api/vitals", {
+        "usn": w.patient(rng), "weight": round(rng.gauss(62, 9), 1), "height": round(rng.gauss(164, 9), 1),
+        "bloodPressureSystolic": round(rng.gauss(118, 11)), "bloodPressureDiastolic": round(rng.gauss(76, 8)),
+        "heartRate": round(rng.gauss(78, 10)), "temperature": round(rng.gauss(98.6, 0.6), 1),
+        "oxygenSaturation": 98, "recordedBy": "Nurse Latha",
+    }
+
+
+def _prescription(w: Workload, rng: random.Random) -> Request:
+    condition = rng.choices(CONDITIONS, weights=[c[0] for c in CONDITIONS])[0]
+    meds = [{"name": m, "dosage": m.split()[-1], "frequency": "BID", "duration": "5 days"} for m in condition[4]]
+    return "POST", "/api/prescriptions", {"usn": w.patient(rng), "diagnosis": condition[1], "medications": meds}
+
+
+def _case_report(w: Workload, rng: random.Random) -> Request:
+    condition = rng.choice(CONDITIONS)
+    return "POST", "/api/case-reports", {
+        "reportNumber": f"LT-{os.getpid()}-{w.next_seq()}", "usn": w.patient(rng),
+        "chiefComplaint": condition[3], "diagnosis": condition[1], "doctorName": "Dr. Meena Rao",
+    }
+
+
+def _appointment(w: Workload, rng: random.Random) -> Request:
+    day = date.today().isoformat()
+    slot = rng.randrange(9 * 4, 17 * 4)
+    return "POST", "/api/appointments", {
+        "usn": w.patient(rng), "starts_at": f"{day}T{slot // 4:02d}:{slot % 4 * 15:02d}",
+        "ends_at": f"{day}T{(slot + 1) // 4:02d}:{(slot + 1) % 4 * 15:02d}", "title": "Consultation",
+    }
+
+
+def _new_patient(w: Workload, rng: random.Random) -> Request:
+    return "POST", "/api/patients", {
+        "usn": f"1NHLT{os.getpid() % 1000:03d}{w.next_seq():05d}",
+        "fullName": f"{rng.choice(FIRST_F + FIRST_M).title()} {rng.choice(LAST).title()}",
+        "age": rng.randint(17, 24), "gender": rng.choice(("Male", "Female")), "contact": f"9{rng.randrange(10**9):09d}",
+        "address": "Bengaluru",
+    }
+
+
+def _search(w: Workload, rng: random.Random) -> Request:
+    first = rng.choice(FIRST_F + FIRST_M)
+    q = first[:rng.randint(2, len(first))]
+    if rng.random() < 0.4:
+        q += " " + rng.choice(LAST)[:rng.randint(1, 3)]
+    return "GET", f"/api/search?q={q.replace(' ', '+')}&limit=20", None
+
+
+def _sync_changes(w: Workload, rng: random.Random) -> Request:
+    return "GET", f"/api/sync/changes?since={w.sync_cursor}&limit=500", None
+
+
+# weight, route label, request factory
+MIX: List[Tuple[int, str, Callable[[Workload, random.Random], Request]]] = [
+    (18, "GET /api/patients/<usn>/chart", lambda w, r: ("GET", f"/api/patients/{w.patient(r)}/chart", None)),
+    (9, "GET /api/search", _search),
+    (6, "GET /api/patients", lambda w, r: ("GET", "/api/patients?limit=50", None)),
+    (7, "GET /api/vitals", lambda w, r: ("GET", f"/api/vitals?usn={w.patient(r)}", None)),
+    (6, "GET /api/prescriptions", lambda w, r: ("GET", f"/api/prescriptions?usn={w.patient(r)}", None)),
+    (2, "GET /api/case-reports", lambda w, r: ("GET", "/api/case-reports?limit=50", None)),
+    (4, "GET /api/lab-orders", lambda w, r: ("GET", f"/api/lab-orders?usn={w.patient(r)}", None)),
+    (3, "GET /api/appointments", lambda w, r: ("GET", "/api/appointments", None)),
+    (3, "GET /api/appointments?usn", lambda w, r: ("GET", f"/api/appointments?usn={w.patient(r)}", None)),
+    (2, "GET /api/lab-tests", lambda w, r: ("GET", "/api/lab-tests", None)),
+    (7, "GET /api/metrics", lambda w, r: ("GET", "/api/metrics", None)),
+    (3, "GET /api/sync/changes", _sync_changes),
+    (10, "POST /api/vitals", _vitals),
+    (6, "POST /api/prescriptions", _prescription),
+    (4, "POST /api/appointments", _appointment),
+    (3, "POST /api/lab-orders", lambda w, r: ("POST", "/api/lab-orders",
+                                              {"usn": w.patient(r), "test_code": r.choice(w.test_codes)})),
+    (3, "POST /api/lab-results/<item_id>", lambda w, r: ("POST", f"/api/lab-results/{w.result_item(r)}",
+                                                         {"result_value": str(r.randint(70, 140))})),
+    (2, "POST /api/case-reports", _case_report),
+    (2, "POST /api/patients", _new_patient),
+]
+
+
+def run(app_module, workload: Workload, requests: int, threads: int, warmup: int, seed: int) -> Dict[str, Any]:
+    samples: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    lock = threading.Lock()
+    weights = [m[0] for m in MIX]
+
+    def worker(tid: int, count: int, start: threading.Barrier) -> None:
+        rng = random.Random(seed * 1000 + tid)
+        client = app_module.app.test_client()
+        mine: List[Tuple[str, float, bool]] = []
+        start.wait()
+        for _ in range(count):
+            _, label, make = rng.choices(MIX, weights=weights)[0]
+            method, url, body = make(workload, rng)
+            t0 = time.perf_counter()
+            try:
+                resp = client.open(url, method=method, json=body)
+                ok = resp.status_code < 400
+                if ok and label == "GET /api/sync/changes":
+                    cursor = resp.get_json()["cursor"]
+                    with workload.lock:
+                        workload.sync_cursor = max(workload.sync_cursor, cursor)
+                resp.close()
+            except Exception:
+                ok = False
+            mine.append((label, (time.perf_counter() - t0) * 1000, ok))
+        with lock:
+            for label, ms, ok in mine:
+                samples[label].append(ms)
+                if not ok:
+                    errors[label] += 1
+
+    def phase(total: int, tid_base: int) -> float:
+        counts = [total // threads + (1 if t < total % threads else 0) for t in range(threads)]
+        start = threading.Barrier(threads + 1)
+        pool = [threading.Thread(target=worker, args=(tid_base + t, n, start)) for t, n in enumerate(counts)]
+        for t in pool:
+            t.start()
+        start.wait()
+        t0 = time.perf_counter()
+        for t in pool:
+            t.join()
+        return time.perf_counter() - t0
+
+    if warmup:
+        # Warm caches, pools and the writer with the same mix, unrecorded
+        phase(warmup, threads)
+        samples.clear()
+        errors.clear()
+    elapsed = phase(requests, 0)
+
+    every = [ms for values in samples.values() for ms in values]
+    endpoints = {
+        label: {
+            "n": len(values),
+            "errors": errors.get(label, 0),
+            "mean_ms": round(sum(values) / len(values), 3),
+            "p50_ms": round(percentile(values, 50), 3),
+            "p95_ms": round(percentile(values, 95), 3),
+            "p99_ms": round(percentile(values, 99), 3),
+        }
+        for label, values in sorted(samples.items())
+    }
+    return {
+        "overall": {
+            "n": len(every),
+            "errors": sum(errors.values()),
+            "seconds": round(elapsed, 3),
+            "requests_per_s": round(len(every) / elapsed, 1),
+            "p50_ms": round(percentile(every, 50), 3),
+            "p95_ms": round(percentile(every, 95), 3),
+            "p99_ms": round(percentile(every, 99), 3),
+        },
+        "endpoints": endpoints,
+    }
+
+
+def show(results: Dict[str, Any]) -> None:
+    print(f"{'endpoint':<36} {'n':>6} {'err':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for label, s in results["endpoints"].items():
+        print(f"{label:<36} {s['n']:>6} {s['errors']:>4} {s['p50_ms']:>8.2f} {s['p95_ms']:>8.2f} {s['p99_ms']:>8.2f}")
+    o = results["overall"]
+    print(f"{'all':<36} {o['n']:>6} {o['errors']:>4} {o['p50_ms']:>8.2f} {o['p95_ms']:>8.2f} {o['p99_ms']:>8.2f}")
+    print(f"throughput: {o['requests_per_s']:.0f} requests/s ({o['n']} requests in {o['seconds']:.1f}s)")
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, min_delta_ms: float) -> int:
+    """Print regressions against ``baseline``; returns how many there are."""
+    regressions = 0
+    print(f"compared with baseline from {baseline['meta']['created']} (tolerance {tolerance:.0%}):")
+    for label, s in results["endpoints"].items():
+        base = baseline["endpoints"].get(label)
+        if base is None:
+            continue
+        worse = s["p95_ms"] > base["p95_ms"] * (1 + tolerance) and s["p95_ms"] - base["p95_ms"] >= min_delta_ms
+        if worse or s["errors"] > base["errors"]:
+            regressions += 1
+            print(f"  REGRESSION {label}: p95 {base['p95_ms']:.2f} -> {s['p95_ms']:.2f} ms, "
+                  f"errors {base['errors']} -> {s['errors']}")
+    now, then = results["overall"]["requests_per_s"], baseline["overall"]["requests_per_s"]
+    if now < then * (1 - tolerance):
+        regressions += 1
+        print(f"  REGRESSION throughput: {then:.0f} -> {now:.0f} requests/s")
+    print(f"  throughput {then:.0f} -> {now:.0f} requests/s, overall p95 "
+          f"{baseline['overall']['p95_ms']:.2f} -> {results['overall']['p95_ms']:.2f} ms; {regressions} regression(s)")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000, help="synthetic dataset size (see synth_data.py)")
+    parser.add_argument("--data-dir", help="reuse (or create) the dataset in this directory")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--warmup", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON to compare with or save to")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.30, help="allowed fractional p95/throughput change")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore p95 changes smaller than this")
+    args = parser.parse_args()
+
+    app_module = load_app(args.data_dir)
+    conn = app_module.get_db()
+    existing = conn.execute("SELECT COUNT(*) FROM patients").fetchone()[0]
+    if existing:
+        print(f"reusing {app_module.DB_PATH} ({existing} patients)")
+    else:
+        t0 = time.perf_counter()
+        counts = generate(conn, args.rows, seed=args.seed)["counts"]
+        print(f"generated {sum(counts.values())} rows in {time.perf_counter() - t0:.1f}s -> {app_module.DB_PATH}")
+    workload = Workload(conn, args.seed)
+    conn.close()
+
+    print(f"{args.requests} requests from {args.threads} threads (+{args.warmup} warm-up)")
+    results = run(app_module, workload, args.requests, args.threads, args.warmup, args.seed)
+    show(results)
+
+    meta = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "rows": args.rows if not existing else None,
+        "patients": len(workload.usns),
+        "requests": args.requests,
+        "threads": args.threads,
+        "mix_version": MIX_VERSION,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPUs",
+    }
+    results = {"meta": meta, **results}
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"baseline saved to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; run with --save-baseline to record one")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    same = all(baseline["meta"].get(k) == meta[k] for k in ("patients", "requests", "threads", "mix_version"))
+    if not same:
+        print(f"baseline at {args.baseline} was recorded with a different dataset, request count, "
+              f"thread count or mix; not comparing")
+        return 0
+    return 1 if compare(results, baseline, args.tolerance, args.min_delta_ms) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,499 @@
+"""
+Reproducible synthetic clinic data for benchmarks and load tests.
+
+Fills every table the app creates: patients, vitals, prescriptions (with the
+medications JSON the SPA posts), encounters, problems, allergies, the
+medications master, case reports, sick intimations, appointments, lab orders
+and items, inventory (items, stock, movements) and audit logs. The derived
+tables (search indexes, daily counters, sync stamps) are filled by the app's
+own triggers, exactly as in production.
+
+``--rows`` is the approximate total across tables (10k to 5M); patients are
+about 1 in 17 rows. Shapes are meant to look like a college health centre:
+
+* mostly students aged 17-25, some staff up to 60;
+* visits skewed by patient (log-normal activity: most come once or twice, a
+  few chronic patients come often) and towards the recent past, weekdays,
+  clinic hours with a morning peak;
+* vitals drawn per gender and age (a few percent hypertensive or febrile),
+  diagnoses and prescriptions from a weighted list of common conditions;
+* lab results around each test's reference range, a tenth out of range.
+
+The same ``--seed`` and ``--end`` date give the same database.
+
+    python benchmarks/synth_data.py --rows 100000 [--data-dir DIR] [--seed 7]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import random
+import time
+from datetime import date, datetime, timedelta
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from common import APP_DIR, load_app
+
+# Rows per patient, by table; patients themselves count 1
+PER_PATIENT = {
+    "vitals": 5.0,
+    "encounters": 2.5,
+    "prescriptions": 2.0,
+    "appointments": 1.5,
+    "inventory_movements": 1.6,
+    "lab_orders": 0.8,
+    "lab_order_items": 1.05,
+    "audit_logs": 0.5,
+    "case_reports": 0.4,
+    "problems": 0.3,
+    "sick_intimations": 0.25,
+    "allergies": 0.12,
+}
+ROWS_PER_PATIENT = 1 + sum(PER_PATIENT.values())
+CHUNK = 20_000
+
+FIRST_M = ("aarav akash arjun bala ganesh harish karthik kiran manoj mohan naveen nikhil pradeep "
+           "rahul rajesh ramesh ravi rohan sanjay suresh varun vijay vikram yash abhishek").split()
+FIRST_F = ("aditi ananya asha deepa divya gita isha kavya lakshmi meera nandini neha pooja priya "
+           "sahana sneha swati tanvi uma vidya shreya anjali bhavana chaitra rashmi").split()
+LAST = ("acharya bhat chandra das desai gowda hegde iyer jain joshi kamath kulkarni kumar menon "
+        "mishra murthy naidu nair patel pillai prasad rao reddy shah sharma shenoy shetty singh "
+        "srinivas subramanian varma verma").split()
+AREAS = ("Jayanagar Indiranagar Koramangala Malleshwaram Basavanagudi Whitefield Marathahalli "
+         "Yelahanka Hebbal Banashankari Rajajinagar BTM Layout Kadubeesanahalli Bellandur").split()
+DEPTS = ("CS", "IS", "EC", "EE", "ME", "CV", "AI", "MB")
+CLINICIANS = ("Dr. Meena Rao", "Dr. Suresh Hegde", "Dr. Farah Khan", "Dr. Anil Kumar", "Nurse Latha")
+STAFF = ("System User", "Nurse Latha", "Nurse Joseph", "Dr. Meena Rao")
+
+# name, generic, form, strength, dosage, frequency, duration (days)
+FORMULARY: Tuple[Tuple[str, str, str, str, str, str, int], ...] = (
+    ("Paracetamol", "Acetaminophen", "Tablet", "500mg", "500mg", "TID", 3),
+    ("Paracetamol", "Acetaminophen", "Tablet", "650mg", "650mg", "TID", 3),
+    ("Ibuprofen", "Ibuprofen", "Tablet", "400mg", "400mg", "BID", 3),
+    ("Amoxicillin", "Amoxicillin", "Capsule", "500mg", "500mg", "TID", 5),
+    ("Azithromycin", "Azithromycin", "Tablet", "500mg", "500mg", "OD", 3),
+    ("Cetirizine", "Cetirizine HCl", "Tablet", "10mg", "10mg", "OD", 5),
+    ("Levocetirizine", "Levocetirizine", "Tablet", "5mg", "5mg", "OD", 5),
+    ("Omeprazole", "Omeprazole", "Capsule", "20mg", "20mg", "OD", 7),
+    ("Pantoprazole", "Pantoprazole", "Tablet", "40mg", "40mg", "OD", 7),
+    ("Ondansetron", "Ondansetron", "Tablet", "4mg", "4mg", "SOS", 2),
+    ("ORS", "Oral rehydration salts", "Sachet", "21g", "1 sachet", "After each stool", 2),
+    ("Metformin", "Metformin HCl", "Tablet", "500mg", "500mg", "BID", 30),
+    ("Amlodipine", "Amlodipine Besylate", "Tablet", "5mg", "5mg", "OD", 30),
+    ("Atorvastatin", "Atorvastatin Calcium", "Tablet", "20mg", "20mg", "HS", 30),
+    ("Salbutamol", "Salbutamol Sulfate", "Inhaler", "100mcg", "2 puffs", "SOS", 30),
+    ("Montelukast", "Montelukast", "Tablet", "10mg", "10mg", "HS", 14),
+    ("Dicyclomine", "Dicyclomine", "Tablet", "10mg", "10mg", "SOS", 3),
+    ("Sumatriptan", "Sumatriptan", "Tablet", "50mg", "50mg", "SOS", 5),
+    ("Diclofenac Gel", "Diclofenac", "Gel", "1%", "Apply thin layer", "TID", 7),
+    ("Povidone Iodine", "Povidone Iodine", "Ointment", "5%", "Apply", "BID", 5),
+    ("Vitamin D3", "Cholecalciferol", "Sachet", "60000IU", "1 sachet", "Weekly", 56),
+    ("Ferrous Sulfate", "Ferrous Sulfate", "Tablet", "200mg", "200mg", "OD", 30),
+    ("Fluconazole", "Fluconazole", "Tablet", "150mg", "150mg", "Weekly", 14),
+    ("Clotrimazole", "Clotrimazole", "Cream", "1%", "Apply", "BID", 14),
+)
+MEDS = {f"{m[0]} {m[3]}": m for m in FORMULARY}
+
+# weight, diagnosis, ICD-10, chief complaint, typical medications (FORMULARY keys), sick days
+CONDITIONS = (
+    (22, "Upper respiratory tract infection", "J06.9", "Sore throat and runny nose for 2 days",
+     ("Paracetamol 500mg", "Cetirizine 10mg", "Azithromycin 500mg"), 2),
+    (16, "Viral fever", "B34.9", "Fever with body ache since yesterday",
+     ("Paracetamol 650mg", "ORS 21g"), 3),
+    (10, "Acute gastritis", "K29.1", "Burning epigastric pain after meals",
+     ("Pantoprazole 40mg", "Ondansetron 4mg"), 1),
+    (8, "Acute gastroenteritis", "A09", "Loose stools and vomiting since morning",
+     ("ORS 21g", "Ondansetron 4mg", "Dicyclomine 10mg"), 2),
+    (7, "Tension-type headache", "G44.2", "Headache after long study hours",
+     ("Paracetamol 500mg", "Ibuprofen 400mg"), 0),
+    (5, "Migraine", "G43.9", "Throbbing one-sided headache with nausea",
+     ("Sumatriptan 50mg", "Ondansetron 4mg"), 1),
+    (7, "Allergic rhinitis", "J30.4", "Sneezing and itchy eyes, worse in the morning",
+     ("Levocetirizine 5mg", "Montelukast 10mg"), 0),
+    (6, "Musculoskeletal sprain", "S93.4", "Ankle pain after football",
+     ("Diclofenac Gel 1%", "Ibuprofen 400mg"), 2),
+    (4, "Superficial abrasion", "T14.0", "Graze on knee after a fall",
+     ("Povidone Iodine 5%",), 0),
+    (4, "Dermatophytosis", "B35.4", "Itchy ring-shaped rash in the groin",
+     ("Clotrimazole 1%", "Fluconazole 150mg"), 0),
+    (3, "Bronchial asthma", "J45.9", "Wheeze and breathlessness at night",
+     ("Salbutamol 100mcg", "Montelukast 10mg"), 1),
+    (3, "Iron deficiency anaemia", "D50.9", "Tiredness and breathlessness on climbing stairs",
+     ("Ferrous Sulfate 200mg",), 0),
+    (2, "Vitamin D deficiency", "E55.9", "Generalised body pain",
+     ("Vitamin D3 60000IU",), 0),
+    (2, "Essential hypertension", "I10", "Routine BP check, headache",
+     ("Amlodipine 5mg",), 0),
+    (1, "Type 2 diabetes mellitus", "E11.9", "Follow-up for sugar control",
+     ("Metformin 500mg", "Atorvastatin 20mg"), 0),
+    (1, "Urinary tract infection", "N39.0", "Burning micturition for 3 days",
+     ("Amoxicillin 500mg", "Paracetamol 500mg"), 1),
+)
+CONDITION_WEIGHTS = [c[0] for c in CONDITIONS]
+ALLERGENS = (("Penicillin", "Rash", "Moderate"), ("Sulfonamides", "Hives", "Mild"),
+             ("NSAIDs", "Bronchospasm", "Severe"), ("Peanuts", "Swelling of lips", "Severe"),
+             ("Dust mites", "Sneezing", "Mild"), ("Latex", "Contact dermatitis", "Mild"))
+
+
+def _chunks(rows: Iterable[tuple], size: int = CHUNK) -> Iterator[List[tuple]]:
+    it = iter(rows)
+    while True:
+        block = list(islice(it, size))
+        if not block:
+            return
+        yield block
+
+
+class ClinicData:
+    """Generates the dataset into ``conn``; call :meth:`generate`."""
+
+    def __init__(self, conn, rows: int, seed: int = 7, end: Optional[date] = None,
+                 years: float = 2.0) -> None:
+        self.conn = conn
+        self.rng = random.Random(seed)
+        self.patients = max(10, round(rows / ROWS_PER_PATIENT))
+        self.counts = {table: max(1, round(self.patients * ratio)) for table, ratio in PER_PATIENT.items()}
+        self.end = datetime.combine(end or date.today(), datetime.min.time())
+        self.span_days = max(1, int(years * 365))
+        self.usns: List[str] = []
+        self.ages: Dict[str, Tuple[int, str]] = {}
+        self._activity: List[float] = []
+        self._med_ids: Dict[str, int] = {}
+        # (prescription id, prescribed at, medication) for dispensing movements
+        self._dispensed: List[Tuple[int, str, str]] = []
+        self.inserted: Dict[str, int] = {}
+
+    # -- distributions --
+
+    def when(self, ahead_days: int = 0) -> datetime:
+        """A clinic-hours timestamp, denser towards ``end``; ``ahead_days`` allows the future."""
+        rng = self.rng
+        offset = int(self.span_days * (1 - math.sqrt(rng.random()))) - (rng.randrange(ahead_days) if ahead_days else 0)
+        day = self.end - timedelta(days=offset)
+        if day.weekday() == 6:  # closed on Sundays
+            day -= timedelta(days=1)
+        hour = rng.triangular(9.0, 17.5, 10.5)
+        return day + timedelta(hours=hour, seconds=rng.randrange(60))
+
+    def patient_sample(self, k: int) -> List[str]:
+        """``k`` USNs weighted by per-patient activity (repeat visitors)."""
+        return self.rng.choices(self.usns, cum_weights=self._activity, k=k)
+
+    def condition(self) -> tuple:
+        return self.rng.choices(CONDITIONS, weights=CONDITION_WEIGHTS)[0]
+
+    # -- tables --
+
+    def _insert(self, table: str, sql: str, rows: Iterable[tuple]) -> None:
+        n = 0
+        for block in _chunks(rows):
+            self.conn.executemany(sql, block)
+            n += len(block)
+        self.conn.commit()
+        self.inserted[table] = self.inserted.get(table, 0) + n
+
+    def _next_id(self, table: str) -> int:
+        return self.conn.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}").fetchone()[0]
+
+    def _patients(self) -> None:
+        rng = self.rng
+        base = self.conn.execute("SELECT COUNT(*) FROM patients").fetchone()[0]
+        weights = 0.0
+        rows = []
+        for i in range(base, base + self.patients):
+            year = 18 + i % 8
+            usn = f"1NH{year:02d}{DEPTS[(i // 8) % len(DEPTS)]}{i // (8 * len(DEPTS)):04d}"
+            gender = "Female" if rng.random() < 0.46 else "Male"
+            first = rng.choice(FIRST_F if gender == "Female" else FIRST_M)
+            staff = rng.random() < 0.08
+            age = rng.randint(26, 60) if staff else min(25, max(17, round(rng.gauss(20.5, 1.8))))
+            self.usns.append(usn)
+            self.ages[usn] = (age, gender)
+            weights += rng.lognormvariate(0, 1.0)
+            self._activity.append(weights)
+            rows.append((usn, f"{first.title()} {rng.choice(LAST).title()}", age, gender,
+                         f"9{rng.randrange(10**9):09d}" if rng.random() < 0.95 else "",
+                         f"{rng.randint(1, 999)}, {rng.randint(1, 20)}th Cross, {rng.choice(AREAS)}, Bengaluru"))
+        self._insert("patients", "INSERT INTO patients(usn, full_name, age, gender, contact, address) "
+                                 "VALUES(?,?,?,?,?,?)", rows)
+
+    def _vitals(self) -> None:
+        rng = self.rng
+
+        def rows():
+            for usn in self.patient_sample(self.counts["vitals"]):
+                age, gender = self.ages[usn]
+                height = rng.gauss(170, 7) if gender == "Male" else rng.gauss(157, 6)
+                weight = max(35.0, rng.gauss(22, 3.5) * (height / 100) ** 2)
+                systolic = rng.gauss(114 + max(0, age - 25) * 0.6, 10)
+                if rng.random() < 0.06:
+                    systolic += rng.uniform(20, 45)
+                diastolic = systolic * 0.64 + rng.gauss(0, 6)
+                temperature = rng.gauss(98.4, 0.4) if rng.random() > 0.07 else rng.uniform(99.8, 103.2)
+                yield (usn, round(weight, 1), round(height, 1), round(systolic), round(diastolic),
+                       round(rng.gauss(76 + (temperature - 98.4) * 8, 9)), round(temperature, 1),
+                       rng.choice((14, 16, 16, 18, 20)) if rng.random() < 0.6 else None,
+                       min(100, round(rng.gauss(98, 1.2))) if rng.random() < 0.7 else None,
+                       "", self.when().isoformat(timespec="seconds"), rng.choice(STAFF))
+
+        self._insert("vitals", """INSERT INTO vitals(usn, weight, height, blood_pressure_systolic,
+                     blood_pressure_diastolic, heart_rate, temperature, respiratory_rate, oxygen_saturation,
+                     notes, recorded_at, recorded_by) VALUES(?,?,?,?,?,?,?,?,?,?,?,?)""", rows())
+
+    def _medications(self) -> None:
+        self._insert("medications", """INSERT INTO medications(name, generic_name, form, strength)
+                     VALUES(?,?,?,?) ON CONFLICT(name, strength, form) DO NOTHING""",
+                     ((m[0], m[1], m[2], m[3]) for m in FORMULARY))
+        for key, m in MEDS.items():
+            self._med_ids[key] = self.conn.execute(
+                "SELECT id FROM medications WHERE name=? AND strength=? AND form=?", (m[0], m[3], m[2])
+            ).fetchone()[0]
+
+    def _medication_json(self, meds: Sequence[str]) -> str:
+        rng = self.rng
+        picked = [m for m in meds if rng.random() < 0.8] or [meds[0]]
+        if rng.random() < 0.85:
+            # hmis-standalone.html shape
+            items = [{"name": f"{MEDS[k][0]} {MEDS[k][3]}", "dosage": MEDS[k][4], "frequency": MEDS[k][5],
+                      "duration": f"{MEDS[k][6]} days", "instructions": rng.choice(("", "After food", "Before food"))}
+                     for k in picked]
+        else:
+            # React form (EnhancedPrescriptionForm) shape
+            items = [{"medicationId": self._med_ids[k], "medicationName": MEDS[k][0], "dose": MEDS[k][4],
+                      "route": "Topical" if MEDS[k][2] in ("Gel", "Cream", "Ointment") else "Oral",
+                      "frequency": MEDS[k][5], "durationDays": MEDS[k][6], "instructions": ""}
+                     for k in picked]
+        return json.dumps(items)
+
+    def _prescriptions(self) -> None:
+        rng = self.rng
+        first_id = self._next_id("prescriptions")
+
+        def rows():
+            for n, usn in enumerate(self.patient_sample(self.counts["prescriptions"])):
+                age, gender = self.ages[usn]
+                _, diagnosis, _, _, meds, _ = self.condition()
+                at = self.when()
+                if n % 4 == 0:
+                    self._dispensed.append((first_id + n, at.isoformat(timespec="seconds"), meds[0]))
+                yield (first_id + n, usn, diagnosis, self._medication_json(meds),
+                       rng.choice(("", "", "Plenty of fluids", "Review if symptoms persist")),
+                       (at + timedelta(days=7)).date().isoformat() if rng.random() < 0.2 else "",
+                       at.isoformat(timespec="seconds"), rng.choice(CLINICIANS), "Active", None, age, gender)
+
+        self._insert("prescriptions", """INSERT INTO prescriptions(id, usn, diagnosis, medications, notes,
+                     follow_up_date, prescribed_at, prescribed_by, status, patient_name, patient_age,
+                     patient_gender) VALUES(?,?,?,?,?,?,?,?,?,?,?,?)""", rows())
+
+    def _encounters_problems_allergies(self) -> None:
+        rng = self.rng
+        self._insert("encounters", """INSERT INTO encounters(usn, encounter_dt, encounter_type, clinician,
+                     reason) VALUES(?,?,?,?,?)""",
+                     ((usn, self.when().isoformat(timespec="seconds"),
+                       rng.choices(("OPD", "Follow-up", "Emergency"), weights=(80, 15, 5))[0],
+                       rng.choice(CLINICIANS), self.condition()[3])
+                      for usn in self.patient_sample(self.counts["encounters"])))
+
+        def problems():
+            for usn in self.patient_sample(self.counts["problems"]):
+                _, diagnosis, code, _, _, _ = self.condition()
+                at = self.when()
+                yield (usn, code, diagnosis, at.date().isoformat(),
+                       "Active" if rng.random() < 0.3 else "Resolved", at.isoformat(timespec="seconds"))
+
+        self._insert("problems", """INSERT INTO problems(usn, code, description, onset_date, status,
+                     recorded_at) VALUES(?,?,?,?,?,?)""", problems())
+        self._insert("allergies", """INSERT INTO allergies(usn, substance, reaction, severity, recorded_at)
+                     VALUES(?,?,?,?,?)""",
+                     ((usn, *rng.choice(ALLERGENS), self.when().isoformat(timespec="seconds"))
+                      for usn in rng.sample(self.usns, min(len(self.usns), self.counts["allergies"]))))
+
+    def _case_reports(self) -> None:
+        rng = self.rng
+        first = self._next_id("case_reports")
+        reports: List[Tuple[str, str, datetime, tuple]] = []
+
+        def rows():
+            for n, usn in enumerate(self.patient_sample(self.counts["case_reports"])):
+                age, gender = self.ages[usn]
+                condition = self.condition()
+                at = self.when()
+                number = f"CR-{at.year}-{first + n:07d}"
+                reports.append((number, usn, at, condition))
+                meds = ", ".join(condition[4])
+                yield (number, usn, age, gender, condition[3],
+                       f"{condition[3]}. No similar episodes in the past.",
+                       rng.choice(("Nil significant", "Childhood asthma", "Appendicectomy 2019")),
+                       "Temperature recorded, chest clear, abdomen soft.", condition[1],
+                       f"{meds}; rest and fluids", "Good", "Review if not better in 3 days",
+                       rng.choice(CLINICIANS), at.date().isoformat(), at.isoformat(sep=" ", timespec="seconds"))
+
+        self._insert("case_reports", """INSERT INTO case_reports(report_number, usn, patient_age, patient_gender,
+                     chief_complaint, history_of_present_illness, past_medical_history, physical_examination,
+                     diagnosis, treatment, prognosis, recommendations, doctor_name, report_date, created_at)
+                     VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)""", rows())
+
+        # Sick leave follows a report whose condition warrants it
+        def intimations():
+            candidates = [r for r in reports if r[3][5] > 0] or reports
+            for n in range(min(self.counts["sick_intimations"], len(candidates))):
+                number, usn, at, condition = candidates[n]
+                age, gender = self.ages[usn]
+                days = max(1, condition[5] + rng.randint(-1, 1))
+                start = at.date()
+                yield (f"SI-{at.year}-{first + n:07d}", usn, age, gender, number, start.isoformat(),
+                       (start + timedelta(days=days - 1)).isoformat(), days, condition[1], condition[3],
+                       rng.choice(CLINICIANS), start.isoformat(), at.isoformat(sep=" ", timespec="seconds"))
+
+        self._insert("sick_intimations", """INSERT INTO sick_intimations(intimation_number, usn, patient_age,
+                     patient_gender, case_report_id, sick_leave_from, sick_leave_to, total_days, reason, symptoms,
+                     doctor_name, issue_date, created_at) VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?)""", intimations())
+
+    def _appointments(self) -> None:
+        rng = self.rng
+
+        def rows():
+            for usn in self.patient_sample(self.counts["appointments"]):
+                start = self.when(ahead_days=14 if rng.random() < 0.1 else 0)
+                start = start.replace(minute=start.minute // 15 * 15, second=0)
+                if start > self.end:
+                    status = "Scheduled"
+                else:
+                    status = rng.choices(("Completed", "Cancelled", "No-show"), weights=(82, 10, 8))[0]
+                yield (usn, start.isoformat(timespec="minutes"),
+                       (start + timedelta(minutes=rng.choice((15, 15, 30)))).isoformat(timespec="minutes"),
+                       status, rng.choice(("Consultation", "Follow-up", "BP check", "Dressing")),
+                       rng.choice(CLINICIANS), None)
+
+        self._insert("appointments", """INSERT INTO appointments(usn, starts_at, ends_at, status, title, clinician,
+                     notes) VALUES(?,?,?,?,?,?,?)""", rows())
+
+    def _lab(self) -> None:
+        from lab_ranges import lab_flag, parse_lab_value, parse_ref_range  # on sys.path once the app is loaded
+
+        rng = self.rng
+        tests = self.conn.execute(
+            "SELECT id, ref_range, critical_low, critical_high FROM lab_tests WHERE is_active = 1").fetchall()
+        if not tests:
+            return
+        first = self._next_id("lab_orders")
+        n_orders = self.counts["lab_orders"]
+        items: List[tuple] = []
+
+        def result(ref_range: Optional[str]) -> str:
+            try:
+                low, high = (float(x) for x in (ref_range or "").split("-"))
+            except ValueError:
+                return rng.choices(("Within normal limits", "Borderline, repeat advised", "Abnormal"),
+                                   weights=(85, 10, 5))[0]
+            mid, sd = (low + high) / 2, (high - low) / 4
+            value = rng.gauss(mid, sd) if rng.random() > 0.1 else rng.choice((low - 2 * sd, high + 3 * sd))
+            return f"{max(value, 0):.0f}" if high >= 20 else f"{max(value, 0):.1f}"
+
+        def orders():
+            extra = self.counts["lab_order_items"] - n_orders
+            for n, usn in enumerate(self.patient_sample(n_orders)):
+                at = self.when()
+                done = at < self.end - timedelta(days=1) and rng.random() < 0.9
+                k = 1 + (1 if rng.random() < extra / n_orders else 0)
+                for test in rng.sample(tests, min(k, len(tests))):
+                    result_at = (at + timedelta(hours=rng.uniform(2, 30))).isoformat(timespec="seconds")
+                    value = result(test["ref_range"]) if done else None
+                    # Parsed and flagged as the app's write path does (lab_ranges.py)
+                    number = parse_lab_value(value)
+                    flag = lab_flag(number, *parse_ref_range(test["ref_range"]), test["critical_low"],
+                                    test["critical_high"])
+                    items.append((first + n, test["id"], "Completed" if done else "Ordered", value, None,
+                                  result_at if done else None, number, flag))
+                yield (first + n, usn, at.isoformat(timespec="seconds"), "Completed" if done else "Ordered")
+
+        self._insert("lab_orders", "INSERT INTO lab_orders(id, usn, ordered_at, status) VALUES(?,?,?,?)", orders())
+        self._insert("lab_order_items", """INSERT INTO lab_order_items(lab_order_id, lab_test_id, status,
+                     result_value, result_notes, result_at, result_numeric, flag) VALUES(?,?,?,?,?,?,?,?)""", items)
+
+    def _inventory(self) -> None:
+        rng, med_ids, dispensed = self.rng, self._med_ids, self._dispensed
+        stamp = self.end.isoformat(timespec="seconds")
+        self._insert("inventory_items", """INSERT INTO inventory_items(medication_id, sku, name, unit)
+                     VALUES(?,?,?,?) ON CONFLICT(sku) DO NOTHING""",
+                     ((med_ids[k], f"MED-{med_ids[k]:04d}", k, MEDS[k][2]) for k in MEDS))
+        item_ids = {k: self.conn.execute("SELECT id FROM inventory_items WHERE sku=?",
+                                         (f"MED-{med_ids[k]:04d}",)).fetchone()[0] for k in MEDS}
+        self._insert("inventory_stock", """INSERT INTO inventory_stock(item_id, quantity_on_hand, reorder_level,
+                     updated_at) VALUES(?,?,?,?) ON CONFLICT(item_id) DO NOTHING""",
+                     ((item_ids[k], rng.randint(40, 900), 50, stamp) for k in MEDS))
+
+        def movements():
+            restocks = max(0, self.counts["inventory_movements"] - len(dispensed))
+            for rx_id, at, key in dispensed:
+                yield (item_ids[key], at, -rng.choice((3, 6, 9, 10, 15)), "Dispensed", "prescription", rx_id)
+            for _ in range(restocks):
+                yield (item_ids[rng.choice(list(MEDS))], self.when().isoformat(timespec="seconds"),
+                       rng.choice((100, 200, 500)), "Restock", "purchase", None)
+
+        self._insert("inventory_movements", """INSERT INTO inventory_movements(item_id, movement_dt, quantity,
+                     reason, ref_type, ref_id) VALUES(?,?,?,?,?,?)""", movements())
+
+    def _audit(self) -> None:
+        rng = self.rng
+        self._insert("audit_logs", """INSERT INTO audit_logs(occurred_at, entity, entity_id, action, details)
+                     VALUES(?,?,?,?,?)""",
+                     ((self.when().isoformat(timespec="seconds"), "patient", usn,
+                       rng.choices(("create", "update", "print"), weights=(30, 50, 20))[0], None)
+                      for usn in self.patient_sample(self.counts["audit_logs"])))
+
+    def generate(self, progress: bool = False) -> Dict[str, int]:
+        steps = (
+            ("patients", self._patients),
+            ("medications", self._medications),
+            ("prescriptions", self._prescriptions),
+            ("inventory", self._inventory),
+            ("vitals", self._vitals),
+            ("encounters, problems, allergies", self._encounters_problems_allergies),
+            ("case reports, sick intimations", self._case_reports),
+            ("appointments", self._appointments),
+            ("lab orders", self._lab),
+            ("audit logs", self._audit),
+        )
+        for label, step in steps:
+            t0 = time.perf_counter()
+            step()
+            if progress:
+                print(f"  {label:<34} {time.perf_counter() - t0:6.1f}s")
+        return dict(self.inserted)
+
+
+def generate(conn, rows: int, seed: int = 7, end: Optional[date] = None, progress: bool = False) -> Dict[str, Any]:
+    """Fill ``conn`` with about ``rows`` rows; returns the inserted counts and a USN sample."""
+    data = ClinicData(conn, rows, seed=seed, end=end)
+    counts = data.generate(progress=progress)
+    return {"counts": counts, "usns": data.usns}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000, help="approximate total rows (10k-5M)")
+    parser.add_argument("--data-dir", help="directory for hmis.db (default: a new temp dir)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--end", type=date.fromisoformat, help="last day of history, YYYY-MM-DD (default today)")
+    args = parser.parse_args()
+
+    if args.data_dir and os.path.realpath(args.data_dir) == os.path.realpath(APP_DIR):
+        parser.error("refusing to write synthetic data into the app directory's hmis.db")
+    app_module = load_app(args.data_dir)
+    conn = app_module.get_db()
+    t0 = time.perf_counter()
+    counts = generate(conn, args.rows, seed=args.seed, end=args.end, progress=True)["counts"]
+    conn.close()
+    elapsed = time.perf_counter() - t0
+    total = sum(counts.values())
+    print(f"{total} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s) -> {app_module.DB_PATH}")
+    for table, n in sorted(counts.items(), key=lambda kv: -kv[1]):
+        print(f"  {table:<22} {n:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Dashboard counters for /api/metrics.
+
+``daily_counters`` is kept current by triggers on patients, appointments,
+vitals and lab_order_items (migration 5), so the dashboard reads a handful
+of rows instead of counting base tables. ``reconcile`` recounts everything
+from the base tables, rewrites the summary table and reports any drift
+(``python daily_counters.py``).
+"""
+from __future__ import annotations
+
+import sqlite3
+from typing import Any, Dict, List
+
+from migrations import DAILY_COUNTER_SOURCES
+
+
+def read_metrics(conn: sqlite3.Connection, day: str) -> Dict[str, int]:
+    values = {
+        (d, counter): value
+        for d, counter, value in conn.execute(
+            "SELECT day, counter, value FROM daily_counters WHERE day IN ('', ?)", (day,)
+        )
+    }
+    return {
+        "patients": values.get(("", "patients"), 0),
+        "appointments_today": values.get((day, "appointments"), 0),
+        "labs_pending": values.get(("", "labs_pending"), 0),
+        "vitals_today": values.get((day, "vitals"), 0),
+    }
+
+
+def reconcile(conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+    """Rebuild ``daily_counters`` from the base tables; return the rows that had drifted."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        expected = {(d, c): v for d, c, v in conn.execute(DAILY_COUNTER_SOURCES)}
+        actual = {(d, c): v for d, c, v in conn.execute("SELECT day, counter, value FROM daily_counters")}
+        drift = [
+            {"day": day, "counter": counter,
+             "expected": expected.get((day, counter), 0), "actual": actual.get((day, counter), 0)}
+            for day, counter in sorted(expected.keys() | actual.keys())
+            if expected.get((day, counter), 0) != actual.get((day, counter), 0)
+        ]
+        conn.execute("DELETE FROM daily_counters")
+        conn.execute(f"INSERT INTO daily_counters(day, counter, value) {DAILY_COUNTER_SOURCES}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return drift
+
+
+if __name__ == "__main__":
+    from app import run_maintenance
+
+    rows = run_maintenance(reconcile)
+    for row in rows:
+        print(f"{row['day'] or '(total)'} {row['counter']}: stored {row['actual']}, recounted {row['expected']}")
+    print(f"{len(rows)} counter(s) drifted; daily_counters rebuilt")
@@ -0,0 +1,290 @@
+"""
+Bounded SQLite connection pool for the HMIS backend.
+
+Connections are opened and tuned once (WAL, synchronous, mmap, cache,
+temp_store, foreign keys) and then handed out to Waitress worker threads.
+A thread gets back the connection it used last whenever that one is idle,
+so the per-connection page cache stays warm. ``close()`` on a pooled
+connection returns it to the pool instead of closing the file.
+
+Tuning is read from ``HMIS_DB_*`` environment variables, see
+``pool_config_from_env``.
+
+Time spent inside SQLite on pooled connections (execute plus fetches) is
+added to a per-thread total, read with ``take_db_time``; request metrics use
+it to split request time into SQLite and Python.
+"""
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+class PoolTimeout(RuntimeError):
+    """Raised when no connection becomes free within the pool timeout."""
+
+
+_db_time = threading.local()
+
+
+def add_db_time(seconds: float) -> None:
+    _db_time.seconds = getattr(_db_time, "seconds", 0.0) + seconds
+
+
+def take_db_time() -> float:
+    """SQLite seconds this thread accumulated since the last call."""
+    seconds = getattr(_db_time, "seconds", 0.0)
+    _db_time.seconds = 0.0
+    return seconds
+
+
+def set_query_trace(trace: Any) -> None:
+    """Record this thread's statements into ``trace`` (see query_trace.py); None stops."""
+    _db_time.trace = trace
+
+
+def current_query_trace() -> Any:
+    return getattr(_db_time, "trace", None)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that adds the time each SQLite call takes to ``add_db_time``.
+
+    While a query trace is set on the thread, each statement is also recorded
+    there, with its execute and fetch time.
+    """
+
+    _entry: Any = None
+
+    def _spent(self, t0: float) -> None:
+        elapsed = time.perf_counter() - t0
+        add_db_time(elapsed)
+        if self._entry is not None:
+            self._entry.seconds += elapsed
+
+    def _start(self, sql: str, parameters: Any) -> None:
+        trace = getattr(_db_time, "trace", None)
+        self._entry = trace.statement(sql, parameters) if trace is not None else None
+
+    def execute(self, sql: str, parameters: Any = ()) -> "TimedCursor":
+        self._start(sql, parameters)
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._spent(t0)
+
+    def executemany(self, sql: str, seq_of_parameters: Any) -> "TimedCursor":
+        self._start(sql, None)
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._spent(t0)
+
+    def fetchone(self) -> Any:
+        t0 = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._spent(t0)
+
+    def fetchmany(self, size: Optional[int] = None) -> List[Any]:
+        t0 = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            self._spent(t0)
+
+    def fetchall(self) -> List[Any]:
+        t0 = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._spent(t0)
+
+    def __next__(self) -> Any:
+        t0 = time.perf_counter()
+        try:
+            return super().__next__()
+        finally:
+            self._spent(t0)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors are TimedCursors."""
+
+    # sqlite3's Connection.execute does not go through cursor(), so route the
+    # shortcuts explicitly to get timed cursors
+    def execute(self, sql: str, parameters: Any = ()) -> TimedCursor:  # type: ignore[override]
+        return self.cursor(TimedCursor).execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters: Any) -> TimedCursor:  # type: ignore[override]
+        return self.cursor(TimedCursor).executemany(sql, seq_of_parameters)
+
+    def cursor(self, factory: type = TimedCursor) -> sqlite3.Cursor:  # type: ignore[override]
+        return super().cursor(factory)
+
+
+class PooledConnection(TimedConnection):
+    """sqlite3 connection whose ``close()`` hands it back to its pool."""
+
+    _pool: Optional["ConnectionPool"] = None
+    checked_out: bool = False
+    # Set while bound to a Flask request; the request teardown releases it
+    request_bound: bool = False
+
+    def close(self) -> None:  # type: ignore[override]
+        if self._pool is None:
+            super().close()
+        elif self.request_bound:
+            # Keep close() semantics (uncommitted work is discarded) without
+            # giving the connection away while the request may still use it
+            if self.in_transaction:
+                self.rollback()
+        else:
+            self._pool.release(self)
+
+    def close_for_real(self) -> None:
+        sqlite3.Connection.close(self)
+
+
+def pool_config_from_env() -> Dict[str, Any]:
+    env = os.environ.get
+    return {
+        "max_size": int(env("HMIS_DB_POOL_SIZE", "16")),
+        "timeout": float(env("HMIS_DB_POOL_TIMEOUT", "30")),
+        "pragmas": {
+            # busy_timeout first so switching journal mode waits out other writers
+            "busy_timeout": int(env("HMIS_DB_BUSY_TIMEOUT", "5000")),
+            "journal_mode": env("HMIS_DB_JOURNAL_MODE", "WAL"),
+            "synchronous": env("HMIS_DB_SYNCHRONOUS", "NORMAL"),
+            "mmap_size": int(env("HMIS_DB_MMAP_SIZE", str(256 * 1024 * 1024))),
+            # Negative values are KiB, so the default is ~20 MB per connection
+            "cache_size": int(env("HMIS_DB_CACHE_SIZE", "-20000")),
+            "temp_store": env("HMIS_DB_TEMP_STORE", "MEMORY"),
+            "foreign_keys": "ON",
+        },
+    }
+
+
+def open_connection(path: str, pragmas: Dict[str, Any], factory: type = TimedConnection) -> sqlite3.Connection:
+    """Open and tune one connection the way the pool does."""
+    conn = sqlite3.connect(path, factory=factory, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    for name, value in pragmas.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+class ConnectionPool:
+    def __init__(self, path: str, max_size: int = 16, timeout: float = 30.0,
+                 pragmas: Optional[Dict[str, Any]] = None) -> None:
+        self.path = path
+        self.max_size = max(1, max_size)
+        self.timeout = timeout
+        self.pragmas = dict(pragmas or {})
+        self._idle: List[PooledConnection] = []
+        self._all: List[PooledConnection] = []
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._stats = {
+            "created": 0,
+            "acquired": 0,
+            "reused_same_thread": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+            "timeouts": 0,
+            "peak_checked_out": 0,
+        }
+
+    def _connect(self) -> PooledConnection:
+        conn = open_connection(self.path, self.pragmas, PooledConnection)
+        conn._pool = self
+        return conn
+
+    def acquire(self) -> PooledConnection:
+        deadline = None
+        with self._cond:
+            while True:
+                conn = self._take_idle()
+                if conn is None and len(self._all) < self.max_size:
+                    conn = self._connect()
+                    self._all.append(conn)
+                    self._stats["created"] += 1
+                if conn is not None:
+                    break
+                if deadline is None:
+                    deadline = time.monotonic() + self.timeout
+                    self._stats["waits"] += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(
+                        f"No SQLite connection free after {self.timeout:.0f}s "
+                        f"(pool size {self.max_size})"
+                    )
+                t0 = time.monotonic()
+                self._cond.wait(remaining)
+                self._stats["wait_seconds"] += time.monotonic() - t0
+
+            conn.checked_out = True
+            self._stats["acquired"] += 1
+            busy = len(self._all) - len(self._idle)
+            if busy > self._stats["peak_checked_out"]:
+                self._stats["peak_checked_out"] = busy
+        self._local.last = conn
+        return conn
+
+    def _take_idle(self) -> Optional[PooledConnection]:
+        if not self._idle:
+            return None
+        last = getattr(self._local, "last", None)
+        if last is not None and last in self._idle:
+            self._idle.remove(last)
+            self._stats["reused_same_thread"] += 1
+            return last
+        return self._idle.pop()
+
+    def release(self, conn: PooledConnection) -> None:
+        if not conn.checked_out:
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Broken connection: drop it and let the pool open a fresh one
+            with self._cond:
+                conn.checked_out = False
+                if conn in self._all:
+                    self._all.remove(conn)
+                self._cond.notify()
+            conn.close_for_real()
+            return
+        with self._cond:
+            conn.checked_out = False
+            conn.request_bound = False
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def close_all(self) -> None:
+        with self._cond:
+            for conn in self._idle:
+                conn.close_for_real()
+                self._all.remove(conn)
+            self._idle.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            out = dict(self._stats)
+            out.update({
+                "max_size": self.max_size,
+                "open": len(self._all),
+                "idle": len(self._idle),
+                "checked_out": len(self._all) - len(self._idle),
+                "wait_seconds": round(self._stats["wait_seconds"], 6),
+            })
+        return out
@@ -23,14 +23,15 @@ def main() -> int:
 
     # Import the Flask app after setting HMIS_DATA_DIR
     try:
-        from app import app as flask_app, init_db  # type: ignore
+        from app import app as flask_app, init_db, schema_version  # type: ignore
     except Exception as e:
         print(f"Failed to import Flask app: {e}")
         return 1
 
-    # Initialize DB (idempotent)
+    # Apply pending schema migrations once, before serving any request
     try:
         init_db()
+        print(f"\U0001F5C4 Schema version: {schema_version()}")
     except Exception as e:
         print(f"DB initialization error: {e}")
 
@@ -0,0 +1,167 @@
+"""
+Lab orders with several tests, and result entry in bulk.
+
+An order carries any number of tests (``test_codes``), so a routine panel is
+one order with one item per test instead of one order per test.
+``record_results`` writes a batch of results (an analyser export, hundreds
+of rows) in the caller's transaction. It resolves every row first, then
+issues one UPDATE per row and a single status rollup over the orders it
+touched, rather than a rollup per result. Each row names its item by
+``item_id``, or by ``order_id`` + ``test_code`` as analysers report them.
+If any row does not resolve, nothing is written. Values are parsed and
+flagged against their test's reference range on the way in (lab_ranges.py).
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+from lab_ranges import ReferenceRanges
+
+# Rows accepted by one bulk result request
+MAX_RESULTS = 2000
+
+
+class LabError(ValueError):
+    """Bad order or result input; the message is safe to return."""
+
+
+class LabResult(NamedTuple):
+    item_id: Optional[int]
+    order_id: Optional[int]
+    test_code: Optional[str]
+    value: str
+    notes: Optional[str]
+    result_at: Optional[str]
+
+
+def parse_test_codes(data: Mapping[str, Any]) -> List[str]:
+    """``test_codes`` (a list or "CBC,GLU") and/or the single ``test_code``, de-duplicated in order."""
+    codes = data.get("test_codes") or []
+    if isinstance(codes, str):
+        codes = codes.split(",")
+    if not isinstance(codes, list):
+        raise LabError("test_codes must be a list of test codes")
+    codes = [str(c).strip() for c in [data.get("test_code")] + codes if c is not None]
+    return list(dict.fromkeys(c for c in codes if c))
+
+
+def create_order(conn: sqlite3.Connection, usn: str, tests: Sequence[Tuple[int, str]],
+                 notes: Optional[str]) -> Tuple[int, List[Dict[str, Any]]]:
+    """Insert one order with an item per ``(lab_test_id, code)``; return its id and items."""
+    order_id = conn.execute(
+        "INSERT INTO lab_orders(usn, ordered_at, status, notes) VALUES(?,?,?,?)",
+        (usn, datetime.utcnow().isoformat(), "Ordered", notes),
+    ).lastrowid
+    items = []
+    for test_id, code in tests:
+        item_id = conn.execute(
+            "INSERT INTO lab_order_items(lab_order_id, lab_test_id) VALUES(?,?)", (order_id, test_id)
+        ).lastrowid
+        items.append({"item_id": item_id, "code": code})
+    return order_id, items
+
+
+def _int(value: Any, field: str, n: int) -> Optional[int]:
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise LabError(f"results[{n}].{field} must be an integer")
+
+
+def parse_results(data: Mapping[str, Any]) -> List[LabResult]:
+    rows = data.get("results")
+    if not isinstance(rows, list) or not rows:
+        raise LabError("results must be a non-empty list")
+    if len(rows) > MAX_RESULTS:
+        raise LabError(f"at most {MAX_RESULTS} results per request")
+    results = []
+    for n, row in enumerate(rows):
+        if not isinstance(row, dict):
+            raise LabError(f"results[{n}] must be an object")
+        item_id = _int(row.get("item_id"), "item_id", n)
+        order_id = _int(row.get("order_id"), "order_id", n)
+        code = (str(row.get("test_code") or "")).strip() or None
+        if item_id is None and not (order_id is not None and code):
+            raise LabError(f"results[{n}] needs item_id, or order_id and test_code")
+        value = row.get("result_value")
+        if value is None or str(value).strip() == "":
+            raise LabError(f"results[{n}].result_value is required")
+        result_at = row.get("result_at") or None
+        if result_at is not None:
+            try:
+                result_at = datetime.fromisoformat(str(result_at)).isoformat()
+            except ValueError:
+                raise LabError(f"results[{n}].result_at must be an ISO date-time")
+        results.append(LabResult(item_id, order_id, code, str(value).strip(),
+                                 (str(row.get("result_notes") or "")).strip() or None, result_at))
+    return results
+
+
+def _resolve(conn: sqlite3.Connection, results: Sequence[LabResult]) -> List[Tuple[int, int, int]]:
+    """(item id, order id, test id) for each result, in order; LabError naming the rows that match no item."""
+    item_ids = json.dumps(sorted({r.item_id for r in results if r.item_id is not None}))
+    order_ids = json.dumps(sorted({r.order_id for r in results if r.item_id is None}))
+    by_id: Dict[int, Tuple[int, int, int]] = {}
+    by_code: Dict[Tuple[int, str], List[Tuple[int, int, int]]] = {}
+    for item_id, order_id, test_id, code in conn.execute(
+        """SELECT loi.id, loi.lab_order_id, loi.lab_test_id, lt.code FROM lab_order_items loi
+           JOIN lab_tests lt ON lt.id = loi.lab_test_id
+           WHERE loi.id IN (SELECT value FROM json_each(?1))
+              OR loi.lab_order_id IN (SELECT value FROM json_each(?2))""",
+        (item_ids, order_ids),
+    ):
+        by_id[item_id] = (item_id, order_id, test_id)
+        by_code.setdefault((order_id, code), []).append(by_id[item_id])
+
+    resolved, errors = [], []
+    for n, r in enumerate(results):
+        if r.item_id is not None:
+            if r.item_id in by_id:
+                resolved.append(by_id[r.item_id])
+                continue
+            errors.append(f"results[{n}]: no lab order item {r.item_id}")
+            continue
+        matches = by_code.get((r.order_id, r.test_code), [])
+        if len(matches) == 1:
+            resolved.append(matches[0])
+        elif matches:
+            errors.append(f"results[{n}]: order {r.order_id} has {r.test_code} {len(matches)} times; use item_id")
+        else:
+            errors.append(f"results[{n}]: order {r.order_id} has no {r.test_code} test")
+    if errors:
+        more = f" (and {len(errors) - 20} more)" if len(errors) > 20 else ""
+        raise LabError("; ".join(errors[:20]) + more)
+    return resolved
+
+
+def record_results(conn: sqlite3.Connection, results: Sequence[LabResult],
+                   ranges: ReferenceRanges) -> Dict[str, int]:
+    """Write and flag ``results``, then roll up the status of each order they touched, once."""
+    resolved = _resolve(conn, results)
+    evaluated = ranges.evaluate(conn, [(test_id, r.value) for r, (_, _, test_id) in zip(results, resolved)])
+    now = datetime.utcnow().isoformat()
+    updated = conn.executemany(
+        """UPDATE lab_order_items
+           SET result_value = ?, result_notes = ?, result_at = ?, status = 'Completed',
+               result_numeric = ?, flag = ?
+           WHERE id = ?""",
+        [(r.value, r.notes, r.result_at or now, number, flag, item_id)
+         for r, (item_id, _, _), (number, flag) in zip(results, resolved, evaluated)],
+    ).rowcount
+    flags = [flag for _, flag in evaluated]
+    orders = sorted({order_id for _, order_id, _ in resolved})
+    # An order is Completed once none of its items is outstanding
+    completed = conn.execute(
+        """UPDATE lab_orders SET status = 'Completed'
+           WHERE id IN (SELECT value FROM json_each(?)) AND status <> 'Completed'
+             AND NOT EXISTS (SELECT 1 FROM lab_order_items
+                             WHERE lab_order_id = lab_orders.id AND status <> 'Completed')""",
+        (json.dumps(orders),),
+    ).rowcount
+    return {"updated": updated, "orders": len(orders), "completed_orders": completed,
+            "abnormal": sum(f not in (None, "normal") for f in flags), "critical": flags.count("critical")}
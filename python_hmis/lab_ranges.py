@@ -0,0 +1,209 @@
+"""
+Reference-range evaluation for lab results.
+
+``lab_tests.ref_range`` stays free text ("70-100", "3.5 to 5 g/dL",
+"<200"); ``ReferenceRanges`` parses it once per test, together with the
+test's critical limits, and keeps the bounds until a lab test is added,
+edited (stamped, migration 12) or deleted. Results are parsed to ``result_numeric`` and flagged
+low/normal/high/critical as they are written (lab_orders.py); text results
+and tests without a parsable range get no flag. Flagged rows feed the
+abnormal worklist through a partial index.
+
+``recompute`` re-flags stored results after a range changes: one set-based
+UPDATE per BATCH item ids of a test, each its own short write, so a large
+history does not hold the writer. The UPDATE calls ``lab_flag`` as an SQL
+function, so stored and new results are flagged by the same code. The
+ranges endpoint runs it for the test it changed, ``python lab_ranges.py
+[--reparse]`` for every test.
+"""
+from __future__ import annotations
+
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+# Item ids per recompute UPDATE
+BATCH = 20_000
+
+_NUMBER = r"(-?\d+(?:\.\d+)?)"
+# "92", "92 mg/dL", "<5", ">= 1.2"; not titres or ratios ("1:80", "12/80")
+_LAB_VALUE = re.compile(rf"^\s*(?:[<>]=?|≤|≥)?\s*{_NUMBER}(?![\d.:/])")
+_REF_BETWEEN = re.compile(rf"^\s*{_NUMBER}\s*(?:-|–|to)\s*{_NUMBER}", re.IGNORECASE)
+_REF_UPPER = re.compile(rf"^\s*(?:<=?|≤|up to)\s*{_NUMBER}", re.IGNORECASE)
+_REF_LOWER = re.compile(rf"^\s*(?:>=?|≥)\s*{_NUMBER}")
+
+
+class RangeError(ValueError):
+    """Bad range input; the message is safe to return."""
+
+
+def parse_lab_value(text: Optional[str]) -> Optional[float]:
+    m = _LAB_VALUE.match(text or "")
+    return float(m.group(1)) if m else None
+
+
+def parse_ref_range(text: Optional[str]) -> Tuple[Optional[float], Optional[float]]:
+    """(low, high) from "70-100", "3.5 to 5 g/dL", "<200" or ">40"; (None, None) if not a range."""
+    text = text or ""
+    m = _REF_BETWEEN.match(text)
+    if m:
+        return float(m.group(1)), float(m.group(2))
+    m = _REF_UPPER.match(text)
+    if m:
+        return None, float(m.group(1))
+    m = _REF_LOWER.match(text)
+    if m:
+        return float(m.group(1)), None
+    return None, None
+
+
+def lab_flag(value: Optional[float], low: Optional[float], high: Optional[float],
+             critical_low: Optional[float], critical_high: Optional[float]) -> Optional[str]:
+    """Bounds are inclusive; no value or no bounds at all means no flag."""
+    if value is None or (low is None and high is None and critical_low is None and critical_high is None):
+        return None
+    if (critical_low is not None and value < critical_low) or (critical_high is not None and value > critical_high):
+        return "critical"
+    if low is not None and value < low:
+        return "low"
+    if high is not None and value > high:
+        return "high"
+    return "normal"
+
+
+class Bounds(NamedTuple):
+    low: Optional[float]
+    high: Optional[float]
+    critical_low: Optional[float]
+    critical_high: Optional[float]
+
+    def evaluate(self, value: Optional[str]) -> Tuple[Optional[float], Optional[str]]:
+        """(numeric value, flag) for a result as written."""
+        number = parse_lab_value(value)
+        return number, lab_flag(number, *self)
+
+
+NO_BOUNDS = Bounds(None, None, None, None)
+
+
+class ReferenceRanges:
+    """Parsed bounds per lab test id, reloaded when lab_tests changes."""
+
+    def __init__(self) -> None:
+        self._bounds: Dict[int, Bounds] = {}
+        # (row count, newest rowversion) of lab_tests: an insert or update
+        # raises the rowversion, a delete lowers the count
+        self._version: Optional[Tuple[int, Optional[int]]] = None
+        self._lock = threading.Lock()
+        self._stats = {"loads": 0, "evaluated": 0}
+
+    def refresh(self, conn: sqlite3.Connection) -> None:
+        version = tuple(conn.execute("SELECT COUNT(*), MAX(rowversion) FROM lab_tests").fetchone())
+        with self._lock:
+            if self._version is not None and version == self._version:
+                return
+            self._bounds = {
+                test_id: Bounds(*parse_ref_range(ref_range), critical_low, critical_high)
+                for test_id, ref_range, critical_low, critical_high in conn.execute(
+                    "SELECT id, ref_range, critical_low, critical_high FROM lab_tests")
+            }
+            self._version = version
+            self._stats["loads"] += 1
+
+    def get(self, test_id: int) -> Bounds:
+        return self._bounds.get(test_id, NO_BOUNDS)
+
+    def evaluate(self, conn: sqlite3.Connection,
+                 results: Sequence[Tuple[int, Optional[str]]]) -> List[Tuple[Optional[float], Optional[str]]]:
+        """(numeric value, flag) for each ``(lab_test_id, result_value)``."""
+        self.refresh(conn)
+        with self._lock:
+            self._stats["evaluated"] += len(results)
+            return [self._bounds.get(test_id, NO_BOUNDS).evaluate(value) for test_id, value in results]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, tests=len(self._bounds), version=self._version)
+
+
+def parse_range_update(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate ``{"ref_range", "critical_low", "critical_high"}`` for one test; only the keys sent change."""
+    update: Dict[str, Any] = {}
+    if "ref_range" in data:
+        text = (str(data["ref_range"] or "")).strip() or None
+        if text is not None and parse_ref_range(text) == (None, None):
+            raise RangeError('ref_range must look like "70-100", "<200" or ">40"')
+        update["ref_range"] = text
+    for key in ("critical_low", "critical_high"):
+        if key in data:
+            value = data[key]
+            try:
+                update[key] = None if value in (None, "") else float(value)
+            except (TypeError, ValueError):
+                raise RangeError(f"{key} must be a number")
+    if not update:
+        raise RangeError("send ref_range, critical_low and/or critical_high")
+    return update
+
+
+def _recompute_batch(conn: sqlite3.Connection, test_id: int, bounds: Bounds,
+                     lo: int, hi: int, reparse: bool) -> int:
+    window = "lab_test_id = :test_id AND id BETWEEN :lo AND :hi"
+    params = dict(bounds._asdict(), test_id=test_id, lo=lo, hi=hi)
+    if reparse:
+        conn.create_function("lab_number", 1, parse_lab_value, deterministic=True)
+        conn.execute(f"UPDATE lab_order_items SET result_numeric = lab_number(result_value) WHERE {window}",
+                     params)
+    conn.create_function("lab_flag", 5, lab_flag, deterministic=True)
+    flag = "lab_flag(result_numeric, :low, :high, :critical_low, :critical_high)"
+    return conn.execute(
+        f"UPDATE lab_order_items SET flag = {flag} WHERE {window} AND flag IS NOT {flag}", params
+    ).rowcount
+
+
+def recompute(conn: sqlite3.Connection, submit: Callable[[Callable[[sqlite3.Connection], Any]], Any],
+              ranges: ReferenceRanges, test_ids: Optional[Sequence[int]] = None,
+              reparse: bool = False) -> Dict[str, Any]:
+    """Re-flag the stored results of ``test_ids`` (default all tests); return how many flags changed.
+
+    ``conn`` reads the id windows; each batch UPDATE is passed to ``submit``
+    (``writer.submit`` in the app) to run and commit as its own write.
+    ``reparse`` also re-derives ``result_numeric`` from the text.
+    """
+    t0 = time.perf_counter()
+    ranges.refresh(conn)
+    if test_ids is None:
+        test_ids = [r[0] for r in conn.execute("SELECT id FROM lab_tests ORDER BY id")]
+    changed: Dict[int, int] = {}
+    batches = 0
+    for test_id in test_ids:
+        bounds = ranges.get(test_id)
+        first, last = conn.execute(
+            "SELECT MIN(id), MAX(id) FROM lab_order_items WHERE lab_test_id = ?", (test_id,)).fetchone()
+        changed[test_id] = 0
+        if first is None:
+            continue
+        for lo in range(first, last + 1, BATCH):
+            hi = min(lo + BATCH - 1, last)
+            changed[test_id] += submit(
+                lambda c, lo=lo, hi=hi: _recompute_batch(c, test_id, bounds, lo, hi, reparse))
+            batches += 1
+    return {"tests": len(changed), "changed": sum(changed.values()), "changed_by_test": changed,
+            "batches": batches, "elapsed_ms": round((time.perf_counter() - t0) * 1000, 3)}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import app
+
+    parser = argparse.ArgumentParser(description="Re-flag stored lab results against the current ranges")
+    parser.add_argument("--reparse", action="store_true", help="also re-parse result_numeric from the text")
+    args = parser.parse_args()
+
+    summary = app.run_maintenance(
+        lambda conn: recompute(conn, app.writer.submit, ReferenceRanges(), reparse=args.reparse), exclusive=False)
+    print(f"{summary['changed']} flag(s) changed across {summary['tests']} test(s) "
+          f"in {summary['batches']} batch(es), {summary['elapsed_ms']:.0f}ms")
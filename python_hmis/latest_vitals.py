@@ -0,0 +1,55 @@
+"""
+Latest vitals per patient.
+
+``latest_vitals`` holds, per usn, the id and time of the newest vitals row by
+(recorded_at, id) and how many vitals the patient has. Triggers on vitals
+(migration 7) keep it current on insert, update and delete, including rows
+synced late with an older recordedAt, so readers join one row per patient
+instead of searching vitals for each. ``python latest_vitals.py`` runs
+``reconcile``, which rebuilds it from vitals and reports any drift.
+"""
+from __future__ import annotations
+
+import sqlite3
+from typing import Any, Dict, List, Optional
+
+from migrations import LATEST_VITALS_SOURCE
+
+# Patients ``p`` with their latest vitals ``v`` (NULL columns when they have none)
+JOIN = "LEFT JOIN latest_vitals lv ON lv.usn = p.usn LEFT JOIN vitals v ON v.id = lv.vitals_id"
+
+
+def read(conn: sqlite3.Connection, usn: str) -> Optional[sqlite3.Row]:
+    return conn.execute(
+        "SELECT v.* FROM latest_vitals lv JOIN vitals v ON v.id = lv.vitals_id WHERE lv.usn = ?", (usn,)
+    ).fetchone()
+
+
+def reconcile(conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+    """Rebuild ``latest_vitals`` from vitals; return the patients whose row had drifted."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        expected = {r[0]: tuple(r[1:]) for r in conn.execute(LATEST_VITALS_SOURCE)}
+        actual = {r[0]: tuple(r[1:]) for r in conn.execute(
+            "SELECT usn, vitals_id, recorded_at, vitals_count FROM latest_vitals")}
+        drift = [
+            {"usn": usn, "expected": expected.get(usn), "actual": actual.get(usn)}
+            for usn in sorted(expected.keys() | actual.keys())
+            if expected.get(usn) != actual.get(usn)
+        ]
+        conn.execute("DELETE FROM latest_vitals")
+        conn.execute(f"INSERT INTO latest_vitals(usn, vitals_id, recorded_at, vitals_count) {LATEST_VITALS_SOURCE}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return drift
+
+
+if __name__ == "__main__":
+    from app import run_maintenance
+
+    rows = run_maintenance(reconcile)
+    for row in rows:
+        print(f"{row['usn']}: stored {row['actual']}, recomputed {row['expected']}")
+    print(f"{len(rows)} patient(s) drifted; latest_vitals rebuilt")
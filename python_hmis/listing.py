@@ -0,0 +1,170 @@
+"""
+Keyset pagination and field projection for the HMIS list endpoints.
+
+A ``Listing`` describes one list endpoint: its table, the sort key it pages
+on (the last column must be unique, so ties never straddle a page) and the
+frontend fields it can return, each backed by the SQL columns it needs.
+``fetch_page`` turns ``?limit=``, ``?after=`` and ``?fields=`` into a single
+SELECT that only reads the requested columns and seeks past the cursor
+through the sort-key index, so a page costs the same however big the table.
+
+Without ``limit`` or ``after`` the whole list is returned, as before.
+"""
+from __future__ import annotations
+
+import base64
+import json
+import sqlite3
+from operator import itemgetter
+from typing import Any, Callable, Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class ListingError(ValueError):
+    """Bad pagination/projection parameters; the message is safe to return."""
+
+
+class Field(NamedTuple):
+    columns: Tuple[str, ...]
+    get: Callable[[sqlite3.Row], Any]
+
+
+def column(name: str) -> Field:
+    """A field that is just one column, unchanged."""
+    return Field((name,), itemgetter(name))
+
+
+class Listing(NamedTuple):
+    table: str
+    order: Tuple[str, ...]
+    descending: bool
+    # None: rows are returned as plain column dicts and fields are column names
+    fields: Optional[Dict[str, Field]] = None
+
+
+class Page(NamedTuple):
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str]
+
+
+def to_json(listing: Listing, row: sqlite3.Row, names: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    fields = listing.fields
+    if fields is None:
+        return dict(row) if names is None else {n: row[n] for n in names}
+    if names is None:
+        return {name: f.get(row) for name, f in fields.items()}
+    return {name: fields[name].get(row) for name in names}
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str, size: int) -> List[Any]:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ListingError("Invalid 'after' cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ListingError("Invalid 'after' cursor")
+    return values
+
+
+_table_columns: Dict[str, Tuple[str, ...]] = {}
+
+
+def table_columns(conn: sqlite3.Connection, table: str) -> Tuple[str, ...]:
+    cols = _table_columns.get(table)
+    if cols is None:
+        # table_xinfo also lists generated columns such as vitals.bmi
+        cols = tuple(r[1] for r in conn.execute(f"PRAGMA table_xinfo({table})"))
+        _table_columns[table] = cols
+    return cols
+
+
+def _parse_limit(args: Mapping[str, str]) -> Optional[int]:
+    raw = args.get("limit")
+    if raw in (None, ""):
+        return DEFAULT_PAGE_SIZE if args.get("after") else None
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise ListingError("'limit' must be an integer")
+    if limit < 1:
+        raise ListingError("'limit' must be at least 1")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def _parse_fields(conn: sqlite3.Connection, listing: Listing,
+                  args: Mapping[str, str]) -> Optional[List[str]]:
+    raw = args.get("fields")
+    if not raw:
+        return None
+    names = list(dict.fromkeys(n.strip() for n in raw.split(",") if n.strip()))
+    known = listing.fields if listing.fields is not None else table_columns(conn, listing.table)
+    unknown = [n for n in names if n not in known]
+    if unknown:
+        raise ListingError(f"Unknown fields: {', '.join(unknown)}")
+    return names or None
+
+
+def select_list(conn: sqlite3.Connection, listing: Listing, names: Optional[Sequence[str]]) -> str:
+    if listing.fields is None:
+        if names is None:
+            return "*"
+        cols = list(names)
+    elif names is None:
+        cols = [c for f in listing.fields.values() for c in f.columns]
+    else:
+        cols = [c for n in names for c in listing.fields[n].columns]
+    # The sort key is always read so the next cursor can be built
+    return ", ".join(dict.fromkeys([*cols, *listing.order]))
+
+
+class PageQuery(NamedTuple):
+    sql: str
+    params: List[Any]
+    limit: Optional[int]
+    names: Optional[List[str]]
+
+
+def page_query(conn: sqlite3.Connection, listing: Listing, args: Mapping[str, str],
+               where: str = "", params: Sequence[Any] = ()) -> PageQuery:
+    """Build the list SELECT for ``args``; ``where`` is an extra filter without WHERE."""
+    limit = _parse_limit(args)
+    names = _parse_fields(conn, listing, args)
+
+    clauses = [where] if where else []
+    params = list(params)
+    after = args.get("after")
+    if after:
+        keys = decode_cursor(after, len(listing.order))
+        op = "<" if listing.descending else ">"
+        clauses.append(f"({', '.join(listing.order)}) {op} ({', '.join('?' * len(keys))})")
+        params.extend(keys)
+
+    direction = " DESC" if listing.descending else ""
+    sql = f"SELECT {select_list(conn, listing, names)} FROM {listing.table}"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY " + ", ".join(c + direction for c in listing.order)
+    if limit is not None:
+        # One extra row tells us whether there is a next page
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+    return PageQuery(sql, params, limit, names)
+
+
+def fetch_page(conn: sqlite3.Connection, listing: Listing, args: Mapping[str, str],
+               where: str = "", params: Sequence[Any] = ()) -> Page:
+    q = page_query(conn, listing, args, where, params)
+    rows = conn.execute(q.sql, q.params).fetchall()
+    next_cursor = None
+    if q.limit is not None and len(rows) > q.limit:
+        rows = rows[:q.limit]
+        next_cursor = encode_cursor([rows[-1][c] for c in listing.order])
+    return Page([to_json(listing, r, q.names) for r in rows], next_cursor)
@@ -0,0 +1,192 @@
+"""
+Prescribing typeahead over the medications master.
+
+``MedicationIndex`` keeps every word of each medication's name, generic
+name, strength and form in one sorted word list (with a parallel list of
+medication ids), so a prefix is a pair of bisects instead of a LIKE scan.
+Results for one- and two-letter queries, which match a large share of the
+formulary, are memoised until the next change. The first lookup loads the
+table; after that each lookup first reads the medications stamped since the
+last one (``rowversion``, migration 10) and their tombstones, so edits show
+up on the next keystroke at the cost of two indexed reads.
+
+A query matches a medication when every query word is a prefix of one of its
+words. Results rank name prefixes first, then name words, then the other
+words; active before inactive; then shorter names.
+"""
+from __future__ import annotations
+
+import heapq
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+# Single-word queries up to this long have their ranked results memoised
+MEMO_MAX_LEN = 2
+_WORD = re.compile(r"[^\W_]+")
+
+
+def words(text: Optional[str]) -> List[str]:
+    return [sys.intern(w) for w in _WORD.findall((text or "").casefold())]
+
+
+def _interned(value: Optional[str]) -> Optional[str]:
+    return None if value is None else sys.intern(value)
+
+
+class Medication(NamedTuple):
+    id: int
+    name: str
+    generic_name: Optional[str]
+    form: Optional[str]
+    strength: Optional[str]
+    is_active: bool
+    folded: str  # casefolded name, for name-prefix ranking
+    name_words: Tuple[str, ...]
+    words: Tuple[str, ...]  # all indexed words, name words first
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"id": self.id, "name": self.name, "genericName": self.generic_name, "form": self.form,
+                "strength": self.strength, "isActive": self.is_active}
+
+
+def _medication(row) -> Medication:
+    med_id, name, generic, form, strength, active = row
+    name_words = tuple(words(name))
+    rest = [w for w in words(generic) + words(strength) + words(form) if w not in name_words]
+    # Forms and strengths repeat across the formulary; share one copy of each
+    return Medication(med_id, name, generic, _interned(form), _interned(strength), bool(active),
+                      (name or "").casefold(), name_words, tuple(dict.fromkeys(name_words + tuple(rest))))
+
+
+class MedicationIndex:
+    """In-process prefix index of ``medications``, refreshed from the change stamps."""
+
+    def __init__(self) -> None:
+        # Sorted words and the medication each came from, index for index
+        self._words: List[str] = []
+        self._ids: List[int] = []
+        self._meds: Dict[int, Medication] = {}
+        self._memo: Dict[Tuple[str, bool], List[Medication]] = {}
+        self._cursor = -1
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._stats = {"full_loads": 0, "refreshes": 0, "lookups": 0, "memo_hits": 0, "last_refresh_ms": 0.0}
+
+    def _add(self, med: Medication) -> None:
+        self._meds[med.id] = med
+        for word in med.words:
+            i = bisect_right(self._words, word)
+            self._words.insert(i, word)
+            self._ids.insert(i, med.id)
+
+    def _remove(self, med_id: int) -> None:
+        med = self._meds.pop(med_id, None)
+        if med is None:
+            return
+        for word in med.words:
+            i = bisect_left(self._words, word)
+            while i < len(self._words) and self._words[i] == word:
+                if self._ids[i] == med_id:
+                    del self._words[i], self._ids[i]
+                    break
+                i += 1
+
+    def refresh(self, conn) -> None:
+        """Bring the index up to date with ``conn``."""
+        select = "SELECT id, name, generic_name, form, strength, is_active FROM medications"
+        with self._lock:
+            conn.execute("BEGIN")  # one read snapshot for the stamp and the rows
+            try:
+                seq = conn.execute("SELECT seq FROM change_seq WHERE id = 1").fetchone()[0]
+                if seq == self._cursor:
+                    return
+                t0 = time.perf_counter()
+                if not self._loaded or seq < self._cursor:
+                    # First use, or the database was replaced
+                    meds = [_medication(r) for r in conn.execute(select)]
+                    self._meds = {m.id: m for m in meds}
+                    entries = sorted((w, m.id) for m in meds for w in m.words)
+                    self._words = [w for w, _ in entries]
+                    self._ids = [i for _, i in entries]
+                    self._loaded = True
+                    self._stats["full_loads"] += 1
+                else:
+                    changed = [_medication(r) for r in conn.execute(
+                        f"{select} WHERE rowversion > ?", (self._cursor,))]
+                    deleted = [int(r[0]) for r in conn.execute(
+                        "SELECT row_key FROM sync_tombstones WHERE rowversion > ? AND table_name = 'medications'",
+                        (self._cursor,))]
+                    for med_id in deleted + [m.id for m in changed]:
+                        self._remove(med_id)
+                    for med in changed:
+                        self._add(med)
+                    self._stats["refreshes"] += 1
+                self._memo.clear()
+                self._cursor = seq
+                self._stats["last_refresh_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+            finally:
+                conn.rollback()
+
+    def _ranked(self, terms: List[str], include_inactive: bool, limit: int) -> List[Medication]:
+        # Medications with a word starting with each term: intersect the id ranges, narrowest first
+        ranges = []
+        for t in terms:
+            lo = bisect_left(self._words, t)
+            ranges.append((bisect_left(self._words, t + "\U0010ffff", lo), lo))
+        ranges.sort(key=lambda r: r[0] - r[1])
+        candidates = set(self._ids[ranges[0][1]:ranges[0][0]])
+        for hi, lo in ranges[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(self._ids[lo:hi])
+        meds = self._meds
+        matches = [meds[i] for i in candidates if include_inactive or meds[i].is_active]
+        folded = " ".join(terms)
+
+        def rank(med: Medication):
+            if med.folded.startswith(folded):
+                tier = 0
+            elif any(w.startswith(terms[0]) for w in med.name_words):
+                tier = 1
+            else:
+                tier = 2
+            return tier, not med.is_active, len(med.name), med.folded, med.id
+
+        return heapq.nsmallest(limit, matches, key=rank)
+
+    def suggest(self, q: str, limit: int = DEFAULT_LIMIT, include_inactive: bool = False) -> List[Dict[str, Any]]:
+        terms = words(q)
+        if not terms:
+            return []
+        with self._lock:
+            self._stats["lookups"] += 1
+            if len(terms) > 1 or len(terms[0]) > MEMO_MAX_LEN:
+                return [m.to_json() for m in self._ranked(terms, include_inactive, limit)]
+            memo_key = (terms[0], include_inactive)
+            ranked = self._memo.get(memo_key)
+            if ranked is None:
+                ranked = self._memo[memo_key] = self._ranked(terms, include_inactive, MAX_LIMIT)
+            else:
+                self._stats["memo_hits"] += 1
+            return [m.to_json() for m in ranked[:limit]]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            # Containers plus each distinct string/tuple they hold (ints are small and shared)
+            seen = set()
+            nbytes = sum(sys.getsizeof(c) for c in (self._words, self._ids, self._meds, self._memo))
+            nbytes += sum(sys.getsizeof(r) for r in self._memo.values())
+            for med in self._meds.values():
+                nbytes += sys.getsizeof(med) + sys.getsizeof(med.words) + sys.getsizeof(med.name_words)
+                for value in (med.name, med.generic_name, med.form, med.strength, med.folded, *med.words):
+                    if value is not None and id(value) not in seen:
+                        seen.add(id(value))
+                        nbytes += sys.getsizeof(value)
+            return dict(self._stats, medications=len(self._meds), words=len(self._words),
+                        memoised=len(self._memo), bytes=nbytes, cursor=self._cursor)
@@ -0,0 +1,459 @@
+"""
+Prescribe-time allergy and interaction screening.
+
+``SafetyRules`` keeps normalised lookup maps in memory: every medication in
+the master mapped to its substances (the words of its name and generic name,
+expanded through ``substance_groups`` so Amoxicillin also counts as
+penicillin), and the active ``interaction_rules`` keyed by substance. A check
+reads the patient's allergies, active problems and current prescriptions
+(all by usn, through their indexes) and screens the prescription with set
+lookups against those maps, never a LIKE scan. Like the medication index,
+the maps load on first use and follow the change stamps (migrations 10 and
+11): an edited medication is re-derived alone, a rule or group change
+rebuilds the maps.
+
+Warnings are returned inline by POST /api/prescriptions and stored in
+``prescription_alerts``. ``rescreen`` re-checks every active prescription
+and rewrites their alerts; the rules endpoint runs it after each change,
+as does ``python medication_safety.py``.
+"""
+from __future__ import annotations
+
+import re
+import sqlite3
+import sys
+import threading
+import time
+from bisect import insort
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from itertools import groupby
+from typing import Any, Dict, FrozenSet, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Set, Tuple
+
+SEVERITIES = ("major", "moderate", "minor")
+RULE_KINDS = ("drug", "condition")
+# Recorded allergy severities on the rule scale; an allergy without one counts as major
+ALLERGY_SEVERITY = {"severe": "major", "moderate": "moderate", "mild": "minor"}
+# Other active prescriptions within this many days count as taken alongside
+CURRENT_DAYS = 90
+# Salt words also dropped for a second key: "cetirizine hcl" matches "cetirizine"
+_SALT_WORDS = frozenset("hcl hydrochloride besylate besilate maleate mesylate calcium sodium potassium".split())
+_WORD = re.compile(r"[^\W_]+")
+MIN_WORD_LEN = 3
+
+
+class SafetyError(ValueError):
+    """Bad rule or group input; the message is safe to return."""
+
+
+def _singular(word: str) -> str:
+    if len(word) > 4 and word.endswith("s") and not word.endswith(("ss", "is", "us")):
+        return word[:-1]
+    return word
+
+
+def normalise(text: Optional[str]) -> str:
+    """Casefolded singular words, single-spaced: "NSAIDs" -> "nsaid"."""
+    return " ".join(_singular(w) for w in _WORD.findall((text or "").casefold()))
+
+
+def _keys(text: Optional[str]) -> Set[str]:
+    """The normalised text, with and without salt words."""
+    full = normalise(text)
+    bare = " ".join(w for w in full.split() if w not in _SALT_WORDS)
+    return {k for k in (full, bare) if k}
+
+
+def _terms(text: Optional[str]) -> Set[str]:
+    """``_keys`` plus their words, for medication names and problem descriptions."""
+    terms = _keys(text)
+    for key in list(terms):
+        terms.update(w for w in key.split() if len(w) >= MIN_WORD_LEN)
+    return terms
+
+
+class Rule(NamedTuple):
+    id: int
+    kind: str
+    a: str
+    b: str
+    severity: str
+    message: str
+
+
+class Drug(NamedTuple):
+    label: str  # "name strength" from the master, or the label as written
+    substances: FrozenSet[str]
+
+
+class Alert(NamedTuple):
+    kind: str  # allergy, interaction or condition
+    severity: str
+    medication: str
+    other: str  # the allergy, the other medication or the condition
+    message: str
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"kind": self.kind, "severity": self.severity, "medication": self.medication,
+                "with": self.other, "message": self.message}
+
+
+def _sorted(alerts: Iterable[Alert]) -> List[Alert]:
+    return sorted(alerts, key=lambda a: (SEVERITIES.index(a.severity), a.kind, a.medication, a.other))
+
+
+class SafetyRules:
+    """Medication substances and interaction rules as in-memory maps, refreshed from the change stamps."""
+
+    def __init__(self) -> None:
+        self._groups: Dict[str, Tuple[str, ...]] = {}  # member -> groups it belongs to
+        # substance -> (other substance or condition, rule), both directions for drug rules
+        self._drug_rules: Dict[str, List[Tuple[str, Rule]]] = {}
+        self._condition_rules: Dict[str, List[Tuple[str, Rule]]] = {}
+        self._meds: Dict[int, Tuple[str, Optional[str], Drug]] = {}  # id -> name, "name strength", drug
+        # Exact names and "name strength" labels -> ids, lowest first (as the item triggers match)
+        self._by_name: Dict[str, List[int]] = {}
+        self._by_label: Dict[str, List[int]] = {}
+        self._rules = 0
+        self._cursor = -1
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._stats = {"full_loads": 0, "refreshes": 0, "checks": 0, "alerts": 0, "rescreens": 0,
+                       "last_refresh_ms": 0.0, "last_rescreen_ms": 0.0}
+
+    def _expand(self, terms: Set[str]) -> FrozenSet[str]:
+        out = set(terms)
+        stack = list(terms)
+        while stack:
+            for group in self._groups.get(stack.pop(), ()):
+                if group not in out:
+                    out.add(group)
+                    stack.append(group)
+        return frozenset(sys.intern(t) for t in out)
+
+    def _add_medication(self, med_id: int, name: str, generic: Optional[str], strength: Optional[str]) -> None:
+        label = f"{name} {strength}" if strength is not None else None
+        drug = Drug(label or name, self._expand(_terms(name) | _terms(generic)))
+        self._meds[med_id] = (name, label, drug)
+        insort(self._by_name.setdefault(name, []), med_id)
+        if label is not None:
+            insort(self._by_label.setdefault(label, []), med_id)
+
+    def _remove_medication(self, med_id: int) -> None:
+        entry = self._meds.pop(med_id, None)
+        if entry is None:
+            return
+        for index, key in ((self._by_name, entry[0]), (self._by_label, entry[1])):
+            ids = index.get(key)
+            if ids is not None:
+                ids.remove(med_id)
+                if not ids:
+                    del index[key]
+
+    def _load(self, conn: sqlite3.Connection) -> None:
+        groups: Dict[str, Set[str]] = defaultdict(set)
+        for member, group in conn.execute("SELECT member, substance FROM substance_groups"):
+            for key in _keys(member):
+                groups[key].add(normalise(group))
+        self._groups = {k: tuple(v - {k}) for k, v in groups.items()}
+
+        drug_rules: Dict[str, List[Tuple[str, Rule]]] = defaultdict(list)
+        condition_rules: Dict[str, List[Tuple[str, Rule]]] = defaultdict(list)
+        rules = [Rule(*r) for r in conn.execute(
+            "SELECT id, kind, substance_a, substance_b, severity, message FROM interaction_rules WHERE is_active")]
+        for rule in rules:
+            a, b = normalise(rule.a), normalise(rule.b)
+            if rule.kind == "condition":
+                condition_rules[a].append((b, rule))
+            else:
+                drug_rules[a].append((b, rule))
+                if a != b:
+                    drug_rules[b].append((a, rule))
+        self._drug_rules, self._condition_rules, self._rules = dict(drug_rules), dict(condition_rules), len(rules)
+
+        self._meds, self._by_name, self._by_label = {}, {}, {}
+        for row in conn.execute("SELECT id, name, generic_name, strength FROM medications ORDER BY id"):
+            self._add_medication(*row)
+
+    def refresh(self, conn: sqlite3.Connection) -> None:
+        """Bring the maps up to date with ``conn``."""
+        with self._lock:
+            conn.execute("BEGIN")  # one read snapshot for the stamp and the rows
+            try:
+                seq = conn.execute("SELECT seq FROM change_seq WHERE id = 1").fetchone()[0]
+                if seq == self._cursor:
+                    return
+                t0 = time.perf_counter()
+                rules_changed = conn.execute(
+                    """SELECT EXISTS(SELECT 1 FROM interaction_rules WHERE rowversion > ?1)
+                           OR EXISTS(SELECT 1 FROM substance_groups WHERE rowversion > ?1)
+                           OR EXISTS(SELECT 1 FROM sync_tombstones WHERE rowversion > ?1
+                                     AND table_name IN ('interaction_rules', 'substance_groups'))""",
+                    (self._cursor,),
+                ).fetchone()[0]
+                if not self._loaded or seq < self._cursor or rules_changed:
+                    # First use, a rule change, or the database was replaced
+                    self._load(conn)
+                    self._loaded = True
+                    self._stats["full_loads"] += 1
+                else:
+                    changed = conn.execute(
+                        "SELECT id, name, generic_name, strength FROM medications WHERE rowversion > ?",
+                        (self._cursor,)).fetchall()
+                    deleted = [int(r[0]) for r in conn.execute(
+                        "SELECT row_key FROM sync_tombstones WHERE rowversion > ? AND table_name = 'medications'",
+                        (self._cursor,))]
+                    for med_id in deleted + [r[0] for r in changed]:
+                        self._remove_medication(med_id)
+                    for row in changed:
+                        self._add_medication(*row)
+                    self._stats["refreshes"] += 1
+                self._cursor = seq
+                self._stats["last_refresh_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+            finally:
+                conn.rollback()
+
+    def _resolve(self, item: Mapping[str, Any]) -> Optional[Drug]:
+        # Same order as the prescription_items triggers: id, then name, then "name strength"
+        label = str(item.get("name") or item.get("medicationName") or "").strip()
+        try:
+            entry = self._meds.get(int(item.get("medicationId")))
+        except (TypeError, ValueError):
+            entry = None
+        if entry is None and label:
+            ids = self._by_name.get(label) or self._by_label.get(label)
+            entry = self._meds[ids[0]] if ids else None
+        if entry is not None:
+            return entry[2]
+        # Not in the master yet (the triggers will add it): screen the label itself
+        return Drug(label, self._expand(_terms(label))) if label else None
+
+    def _screen(self, drugs: Sequence[Drug], current: Sequence[Drug],
+                allergies: Iterable[Tuple[str, Optional[str], Optional[str]]],
+                problems: Iterable[Tuple[Optional[str], str]]) -> List[Alert]:
+        allergy_keys: Dict[str, Tuple[str, Optional[str], Optional[str]]] = {}
+        for allergy in allergies:
+            for key in _keys(allergy[0]):
+                allergy_keys.setdefault(key, allergy)
+        conditions: Dict[str, str] = {}
+        for code, description in problems:
+            for term in _terms(description) | _terms(code):
+                conditions.setdefault(term, description)
+
+        # Which drugs (this prescription's first, then the current ones) hold each substance
+        pool = list(drugs) + list(current)
+        holders: Dict[str, List[int]] = defaultdict(list)
+        for j, drug in enumerate(pool):
+            for substance in drug.substances:
+                holders[substance].append(j)
+
+        alerts: Dict[Tuple[Any, ...], Alert] = {}
+        for i, drug in enumerate(drugs):
+            for substance in drug.substances:
+                allergy = allergy_keys.get(substance)
+                if allergy is not None and ("allergy", i, allergy[0]) not in alerts:
+                    name, reaction, severity = allergy
+                    alerts["allergy", i, name] = Alert(
+                        "allergy", ALLERGY_SEVERITY.get((severity or "").casefold(), "major"), drug.label, name,
+                        f"Recorded allergy to {name}" + (f" ({reaction})" if reaction else ""))
+                for other, rule in self._drug_rules.get(substance, ()):
+                    for j in holders.get(other, ()):
+                        key = ("interaction", rule.id, min(i, j), max(i, j))
+                        if j != i and key not in alerts:
+                            alerts[key] = Alert("interaction", rule.severity, drug.label, pool[j].label, rule.message)
+                for condition, rule in self._condition_rules.get(substance, ()):
+                    if condition in conditions and ("condition", rule.id, i) not in alerts:
+                        alerts["condition", rule.id, i] = Alert(
+                            "condition", rule.severity, drug.label, conditions[condition], rule.message)
+        return _sorted(alerts.values())
+
+    def check(self, conn: sqlite3.Connection, usn: str, items: Sequence[Any],
+              exclude_id: Optional[int] = None) -> List[Alert]:
+        """Alerts for prescribing the medications JSON ``items`` to ``usn`` today."""
+        self.refresh(conn)
+        since = (datetime.utcnow().date() - timedelta(days=CURRENT_DAYS)).isoformat()
+        allergies = conn.execute("SELECT substance, reaction, severity FROM allergies WHERE usn = ?",
+                                 (usn,)).fetchall()
+        problems = conn.execute("SELECT code, description FROM problems WHERE usn = ? AND status = 'Active'",
+                                (usn,)).fetchall()
+        current = conn.execute(
+            """SELECT p.id, pi.medication_id FROM prescriptions p
+               JOIN prescription_items pi ON pi.prescription_id = p.id
+               WHERE p.usn = ? AND p.prescribed_at >= ? AND p.status = 'Active' AND p.id IS NOT ?
+               ORDER BY p.id, pi.position""",
+            (usn, since, exclude_id),
+        ).fetchall()
+        with self._lock:
+            drugs = [d for d in (self._resolve(item) for item in items if isinstance(item, dict)) if d]
+            others = [self._current(rx_id, med_id) for rx_id, med_id in current if med_id in self._meds]
+            alerts = self._screen(drugs, others, allergies, problems)
+            self._stats["checks"] += 1
+            self._stats["alerts"] += len(alerts)
+        return alerts
+
+    def _current(self, rx_id: int, med_id: int) -> Drug:
+        drug = self._meds[med_id][2]
+        return drug._replace(label=f"{drug.label} (Rx {rx_id})")
+
+    def rescreen(self, conn: sqlite3.Connection) -> Dict[str, Any]:
+        """Re-check every active prescription and rewrite its alerts; report those whose alerts changed."""
+        self.refresh(conn)
+        t0 = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            allergies: Dict[str, List[Tuple[str, Optional[str], Optional[str]]]] = defaultdict(list)
+            for usn, *allergy in conn.execute("SELECT usn, substance, reaction, severity FROM allergies"):
+                allergies[usn].append(tuple(allergy))
+            problems: Dict[str, List[Tuple[Optional[str], str]]] = defaultdict(list)
+            for usn, *problem in conn.execute(
+                    "SELECT usn, code, description FROM problems WHERE status = 'Active'"):
+                problems[usn].append(tuple(problem))
+            before: Dict[int, Set[Alert]] = defaultdict(set)
+            for rx_id, *alert in conn.execute(
+                    """SELECT prescription_id, kind, severity, medication, other, message FROM prescription_alerts
+                       WHERE prescription_id IN (SELECT id FROM prescriptions WHERE status = 'Active')"""):
+                before[rx_id].add(Alert(*alert))
+
+            rows = conn.execute(
+                """SELECT p.usn, p.id, substr(p.prescribed_at, 1, 10), pi.medication_id FROM prescriptions p
+                   LEFT JOIN prescription_items pi ON pi.prescription_id = p.id
+                   WHERE p.status = 'Active' ORDER BY p.usn, p.id, pi.position""")
+            screened = 0
+            after: Dict[int, List[Alert]] = {}
+            with self._lock:
+                for usn, patient_rows in groupby(rows, key=lambda r: r[0]):
+                    # Each prescription id -> (day, [medication ids])
+                    rxs: Dict[int, Tuple[str, List[int]]] = {}
+                    for _, rx_id, day, med_id in patient_rows:
+                        meds = rxs.setdefault(rx_id, (day or "", []))[1]
+                        if med_id in self._meds:
+                            meds.append(med_id)
+                    for rx_id, (day, med_ids) in rxs.items():
+                        screened += 1
+                        lo, hi = _window(day)
+                        current = [self._current(other_id, m) for other_id, (other_day, others) in rxs.items()
+                                   if other_id != rx_id and lo <= other_day <= hi for m in others]
+                        alerts = self._screen([self._meds[m][2] for m in med_ids], current,
+                                              allergies.get(usn, ()), problems.get(usn, ()))
+                        if alerts:
+                            after[rx_id] = alerts
+                self._stats["rescreens"] += 1
+
+            conn.execute("DELETE FROM prescription_alerts WHERE prescription_id IN "
+                         "(SELECT id FROM prescriptions WHERE status = 'Active')")
+            now = datetime.utcnow().isoformat()
+            conn.executemany(
+                "INSERT INTO prescription_alerts(prescription_id, kind, severity, medication, other, message, "
+                "screened_at) VALUES(?,?,?,?,?,?,?)",
+                ((rx_id, *alert, now) for rx_id, alerts in after.items() for alert in alerts),
+            )
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        changed = sorted(rx_id for rx_id in before.keys() | after.keys()
+                         if before.get(rx_id, set()) != set(after.get(rx_id, ())))
+        elapsed = round((time.perf_counter() - t0) * 1000, 3)
+        self._stats["last_rescreen_ms"] = elapsed
+        return {"screened": screened, "flagged": len(after), "alerts": sum(map(len, after.values())),
+                "changed": changed, "elapsed_ms": elapsed}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, medications=len(self._meds), rules=self._rules, groups=len(self._groups),
+                        cursor=self._cursor)
+
+
+def _window(day: str) -> Tuple[str, str]:
+    try:
+        d = date.fromisoformat(day)
+    except ValueError:
+        return day, day
+    span = timedelta(days=CURRENT_DAYS)
+    return (d - span).isoformat(), (d + span).isoformat()
+
+
+def save_alerts(conn: sqlite3.Connection, prescription_id: int, alerts: Sequence[Alert]) -> None:
+    conn.executemany(
+        "INSERT INTO prescription_alerts(prescription_id, kind, severity, medication, other, message, screened_at) "
+        "VALUES(?,?,?,?,?,?,?)",
+        [(prescription_id, *alert, datetime.utcnow().isoformat()) for alert in alerts],
+    )
+
+
+def read_alerts(conn: sqlite3.Connection, prescription_id: int) -> List[Dict[str, Any]]:
+    rows = conn.execute(
+        "SELECT kind, severity, medication, other, message, screened_at FROM prescription_alerts "
+        "WHERE prescription_id = ?", (prescription_id,))
+    return [dict(Alert(*r[:5]).to_json(), screenedAt=r[5]) for r in
+            sorted(rows, key=lambda r: (SEVERITIES.index(r[1]), r[0], r[2], r[3]))]
+
+
+def parse_rules(data: Mapping[str, Any]) -> Tuple[List[Tuple[Any, ...]], List[Tuple[str, str, bool]]]:
+    """Validate ``{"rules": [...], "groups": [...]}``; return normalised rule and group rows."""
+    rules, groups = [], []
+    for n, rule in enumerate(data.get("rules") or []):
+        if not isinstance(rule, dict):
+            raise SafetyError(f"rules[{n}] must be an object")
+        kind = rule.get("kind") or "drug"
+        a, b = normalise(rule.get("substanceA")), normalise(rule.get("substanceB"))
+        severity = rule.get("severity") or "moderate"
+        message = (rule.get("message") or "").strip()
+        if kind not in RULE_KINDS:
+            raise SafetyError(f"rules[{n}].kind must be one of: {', '.join(RULE_KINDS)}")
+        if severity not in SEVERITIES:
+            raise SafetyError(f"rules[{n}].severity must be one of: {', '.join(SEVERITIES)}")
+        if not (a and b and message):
+            raise SafetyError(f"rules[{n}] needs substanceA, substanceB and message")
+        if kind == "drug":
+            a, b = sorted((a, b))
+        rules.append((kind, a, b, severity, message, 0 if rule.get("isActive") is False else 1))
+    for n, group in enumerate(data.get("groups") or []):
+        if not isinstance(group, dict):
+            raise SafetyError(f"groups[{n}] must be an object")
+        member, substance = normalise(group.get("member")), normalise(group.get("substance"))
+        if not (member and substance) or member == substance:
+            raise SafetyError(f"groups[{n}] needs a member and a different substance")
+        groups.append((member, substance, bool(group.get("remove"))))
+    if not (rules or groups):
+        raise SafetyError("nothing to save: send rules and/or groups")
+    return rules, groups
+
+
+def save_rules(conn: sqlite3.Connection, rules: Sequence[Tuple[Any, ...]],
+               groups: Sequence[Tuple[str, str, bool]]) -> None:
+    conn.executemany(
+        """INSERT INTO interaction_rules(kind, substance_a, substance_b, severity, message, is_active)
+           VALUES(?,?,?,?,?,?)
+           ON CONFLICT(kind, substance_a, substance_b) DO UPDATE SET
+               severity = excluded.severity, message = excluded.message, is_active = excluded.is_active""",
+        rules,
+    )
+    conn.executemany("INSERT OR IGNORE INTO substance_groups(member, substance) VALUES(?,?)",
+                     [(m, s) for m, s, remove in groups if not remove])
+    conn.executemany("DELETE FROM substance_groups WHERE member = ? AND substance = ?",
+                     [(m, s) for m, s, remove in groups if remove])
+
+
+def list_rules(conn: sqlite3.Connection) -> Dict[str, Any]:
+    return {
+        "rules": [
+            {"id": r[0], "kind": r[1], "substanceA": r[2], "substanceB": r[3], "severity": r[4],
+             "message": r[5], "isActive": bool(r[6])}
+            for r in conn.execute("SELECT id, kind, substance_a, substance_b, severity, message, is_active "
+                                  "FROM interaction_rules ORDER BY kind, substance_a, substance_b")
+        ],
+        "groups": [
+            {"member": m, "substance": s}
+            for m, s in conn.execute("SELECT member, substance FROM substance_groups ORDER BY substance, member")
+        ],
+    }
+
+
+if __name__ == "__main__":
+    from app import run_maintenance
+
+    summary = run_maintenance(SafetyRules().rescreen)
+    print(f"{summary['screened']} active prescription(s) screened in {summary['elapsed_ms']:.0f}ms: "
+          f"{summary['flagged']} flagged, {summary['alerts']} alert(s), "
+          f"{len(summary['changed'])} with changed alerts")
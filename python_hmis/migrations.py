@@ -0,0 +1,1215 @@
+"""
+Versioned schema migrations for the HMIS SQLite database.
+
+Each migration is registered with a version number and applied exactly once,
+in order, inside its own transaction. Applied versions are recorded in the
+``schema_version`` table so startup can skip straight past an up-to-date DB
+and the request path never has to run DDL.
+"""
+from __future__ import annotations
+
+import re
+import sqlite3
+from datetime import datetime
+from typing import Callable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[sqlite3.Connection], None]
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str):
+    """Register ``fn(conn)`` as schema migration ``version``."""
+    def decorator(fn: Callable[[sqlite3.Connection], None]):
+        if any(m.version == version for m in MIGRATIONS):
+            raise ValueError(f"Duplicate migration version {version}")
+        MIGRATIONS.append(Migration(version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return fn
+    return decorator
+
+
+def iter_statements(script: str) -> Iterator[str]:
+    """Split a SQL script into complete statements (trigger bodies included)."""
+    buf: List[str] = []
+    for line in script.splitlines(keepends=True):
+        buf.append(line)
+        stmt = "".join(buf)
+        if sqlite3.complete_statement(stmt):
+            if stmt.strip():
+                yield stmt.strip()
+            buf = []
+    tail = "".join(buf)
+    # Trailing comments/whitespace are not statements; anything else is a syntax error
+    if any(line.strip() and not line.strip().startswith("--") for line in tail.splitlines()):
+        yield tail.strip()
+
+
+def run_script(conn: sqlite3.Connection, script: str) -> None:
+    """Execute a multi-statement script without the implicit COMMIT of executescript()."""
+    for stmt in iter_statements(script):
+        conn.execute(stmt)
+
+
+def latest_version() -> int:
+    return MIGRATIONS[-1].version if MIGRATIONS else 0
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    """Return the applied schema version, 0 for a fresh or pre-migration DB."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='schema_version'"
+    ).fetchone()
+    if not exists:
+        return 0
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Apply all pending migrations in order; returns the resulting version."""
+    version = current_version(conn)
+    if version >= latest_version():
+        return version
+
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )"""
+    )
+    conn.commit()
+
+    for m in MIGRATIONS:
+        # BEGIN IMMEDIATE serialises concurrent starters; re-check under the lock
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute(
+                "SELECT 1 FROM schema_version WHERE version = ?", (m.version,)
+            ).fetchone():
+                conn.rollback()
+                continue
+            m.apply(conn)
+            conn.execute(
+                "INSERT INTO schema_version(version, description, applied_at) VALUES(?,?,?)",
+                (m.version, m.description, datetime.utcnow().isoformat()),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return current_version(conn)
+
+
+# --- Migrations ---
+
+BASELINE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    usn TEXT PRIMARY KEY,
+    full_name TEXT NOT NULL,
+    age INTEGER NOT NULL,
+    gender TEXT NOT NULL,
+    contact TEXT NOT NULL,
+    address TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS vitals (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    usn TEXT NOT NULL,
+    weight REAL NOT NULL,
+    height REAL NOT NULL,
+    bmi REAL GENERATED ALWAYS AS (weight / ((height/100.0) * (height/100.0))) STORED,
+    blood_pressure_systolic INTEGER NOT NULL,
+    blood_pressure_diastolic INTEGER NOT NULL,
+    heart_rate INTEGER NOT NULL,
+    temperature REAL NOT NULL,
+    respiratory_rate INTEGER NULL,
+    oxygen_saturation INTEGER NULL,
+    notes TEXT NULL,
+    recorded_at TEXT NOT NULL,
+    recorded_by TEXT NOT NULL DEFAULT 'System User',
+    FOREIGN KEY (usn) REFERENCES patients(usn) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS prescriptions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    usn TEXT NOT NULL,
+    diagnosis TEXT NOT NULL,
+    medications TEXT NOT NULL, -- JSON string of medications array
+    notes TEXT NULL,
+    follow_up_date TEXT NULL,
+    prescribed_at TEXT NOT NULL,
+    prescribed_by TEXT DEFAULT 'NHCE Clinic',
+    status TEXT DEFAULT 'Active',
+    patient_name TEXT NULL,
+    patient_age INTEGER NULL,
+    patient_gender TEXT NULL,
+    FOREIGN KEY (usn) REFERENCES patients(usn) ON DELETE CASCADE
+);
+
+-- encounters (visits)
+CREATE TABLE IF NOT EXISTS encounters (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    usn TEXT NOT NULL,
+    encounter_dt TEXT NOT NULL,
+    encounter_type TEXT NOT NULL DEFAULT 'OPD',
+    clinician TEXT NULL,
+    reason TEXT NULL,
+    notes TEXT NULL,
+    FOREIGN KEY (usn) REFERENCES patients(usn) ON DELETE CASCADE
+);
+
+-- problems (conditions)
+CREATE TABLE IF NOT EXISTS problems (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    usn TEXT NOT NULL,
+    code TEXT NULL,
+    description TEXT NOT NULL,
+    onset_date TEXT NULL,
+    status TEXT NOT NULL DEFAULT 'Active',
+    recorded_at TEXT NOT NULL,
+    FOREIGN KEY (usn) REFERENCES patients(usn) ON DELETE CASCADE
+);
+
+-- allergies
+CREATE TABLE IF NOT EXISTS allergies (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    usn TEXT NOT NULL,
+    substance TEXT NOT NULL,
+    reaction TEXT NULL,
+    severity TEXT NULL,
+    recorded_at TEXT NOT NULL,
+    FOREIGN KEY (usn) REFERENCES patients(usn) ON DELETE CASCADE
+);
+
+-- medications master
+CREATE TABLE IF NOT EXISTS medications (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    generic_name TEXT NULL,
+    form TEXT NULL,
+    strength TEXT NULL,
+    is_active INTEGER NOT NULL DEFAULT 1,
+    UNIQUE(name, strength, form)
+);
+
+-- itemized prescription lines
+CREATE TABLE IF NOT EXISTS prescription_items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    prescription_id INTEGER NOT NULL,
+    medication_id INTEGER NOT NULL,
+    dose TEXT NULL,
+    route TEXT NULL,
+    frequency TEXT NULL,
+    duration_days INTEGER NULL,
+    instructions TEXT NULL,
+    FOREIGN KEY (prescription_id) REFERENCES prescriptions(id) ON DELETE CASCADE,
+    FOREIGN KEY (medication_id) REFERENCES medications(id)
+);
+
+-- lab tests and orders
+CREATE TABLE IF NOT EXISTS lab_tests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    code TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    specimen TEXT NULL,
+    unit TEXT NULL,
+    ref_range TEXT NULL,
+    is_active INTEGER NOT NULL DEFAULT 1
+);
+
+CREATE TABLE IF NOT EXISTS lab_orders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    usn TEXT NOT NULL,
+    encounter_id INTEGER NULL,
+    ordered_at TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'Ordered',
+    notes TEXT NULL,
+    FOREIGN KEY (usn) REFERENCES patients(usn) ON DELETE CASCADE,
+    FOREIGN KEY (encounter_id) REFERENCES encounters(id) ON DELETE SET NULL
+);
+
+CREATE TABLE IF NOT EXISTS lab_order_items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    lab_order_id INTEGER NOT NULL,
+    lab_test_id INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'Ordered',
+    result_value TEXT NULL,
+    result_notes TEXT NULL,
+    result_at TEXT NULL,
+    FOREIGN KEY (lab_order_id) REFERENCES lab_orders(id) ON DELETE CASCADE,
+    FOREIGN KEY (lab_test_id) REFERENCES lab_tests(id)
+);
+
+-- appointments (calendar)
+CREATE TABLE IF NOT EXISTS appointments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    usn TEXT NOT NULL,
+    starts_at TEXT NOT NULL,
+    ends_at TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'Scheduled',
+    title TEXT NULL,
+    clinician TEXT NULL,
+    notes TEXT NULL,
+    FOREIGN KEY (usn) REFERENCES patients(usn) ON DELETE CASCADE
+);
+
+-- inventory (basic)
+CREATE TABLE IF NOT EXISTS inventory_items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    medication_id INTEGER NULL,
+    sku TEXT UNIQUE,
+    name TEXT NOT NULL,
+    unit TEXT NULL,
+    is_active INTEGER NOT NULL DEFAULT 1,
+    FOREIGN KEY (medication_id) REFERENCES medications(id)
+);
+
+CREATE TABLE IF NOT EXISTS inventory_stock (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    item_id INTEGER NOT NULL,
+    quantity_on_hand INTEGER NOT NULL DEFAULT 0,
+    reorder_level INTEGER NULL,
+    updated_at TEXT NOT NULL,
+    UNIQUE(item_id),
+    FOREIGN KEY (item_id) REFERENCES inventory_items(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS inventory_movements (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    item_id INTEGER NOT NULL,
+    movement_dt TEXT NOT NULL,
+    quantity INTEGER NOT NULL,
+    reason TEXT NULL,
+    ref_type TEXT NULL,
+    ref_id INTEGER NULL,
+    FOREIGN KEY (item_id) REFERENCES inventory_items(id) ON DELETE CASCADE
+);
+
+-- audit logs
+CREATE TABLE IF NOT EXISTS audit_logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    occurred_at TEXT NOT NULL,
+    entity TEXT NOT NULL,
+    entity_id TEXT NOT NULL,
+    action TEXT NOT NULL,
+    details TEXT NULL
+);
+
+-- case reports
+CREATE TABLE IF NOT EXISTS case_reports (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    report_number TEXT NOT NULL UNIQUE,
+    usn TEXT NOT NULL,
+    patient_name TEXT NULL,
+    patient_age INTEGER NULL,
+    patient_gender TEXT NULL,
+    report_type TEXT NOT NULL DEFAULT 'medical',
+    chief_complaint TEXT NULL,
+    history_of_present_illness TEXT NULL,
+    past_medical_history TEXT NULL,
+    family_history TEXT NULL,
+    social_history TEXT NULL,
+    physical_examination TEXT NULL,
+    investigations TEXT NULL,
+    diagnosis TEXT NULL,
+    treatment TEXT NULL,
+    prognosis TEXT NULL,
+    recommendations TEXT NULL,
+    follow_up TEXT NULL,
+    doctor_name TEXT NULL,
+    report_date TEXT NULL,
+    status TEXT NOT NULL DEFAULT 'Active',
+    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+    FOREIGN KEY (usn) REFERENCES patients(usn) ON DELETE CASCADE
+);
+
+-- sick intimations
+CREATE TABLE IF NOT EXISTS sick_intimations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    intimation_number TEXT NOT NULL UNIQUE,
+    usn TEXT NOT NULL,
+    patient_name TEXT NULL,
+    patient_age INTEGER NULL,
+    patient_gender TEXT NULL,
+    case_report_id TEXT NULL, -- report_number
+    sick_leave_from TEXT NOT NULL,
+    sick_leave_to TEXT NOT NULL,
+    total_days INTEGER NULL,
+    reason TEXT NOT NULL,
+    symptoms TEXT NULL,
+    rest_recommended INTEGER NOT NULL DEFAULT 1,
+    doctor_name TEXT NULL,
+    issue_date TEXT NULL,
+    status TEXT NOT NULL DEFAULT 'Active',
+    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+    FOREIGN KEY (usn) REFERENCES patients(usn) ON DELETE CASCADE
+);
+"""
+
+
+@migration(1, "baseline schema and lab test seed")
+def _m0001_baseline(conn: sqlite3.Connection) -> None:
+    # IF NOT EXISTS keeps this safe on DBs created before versioning existed
+    run_script(conn, BASELINE_SCHEMA)
+
+    # Seed some lab tests if empty
+    if conn.execute("SELECT COUNT(1) FROM lab_tests").fetchone()[0] == 0:
+        conn.executemany(
+            "INSERT INTO lab_tests(code, name, specimen, unit, ref_range) VALUES(?,?,?,?,?)",
+            [
+                ("CBC", "Complete Blood Count", "Blood", None, None),
+                ("GLU", "Blood Glucose (Fasting)", "Blood", "mg/dL", "70-100"),
+                ("LFT", "Liver Function Test", "Blood", None, None),
+            ],
+        )
+
+
+# Secondary indexes for the per-patient (usn + timestamp) and list hot paths.
+# name -> (table, column list)
+MANAGED_INDEXES = {
+    "idx_patients_contact": ("patients", "contact"),
+    "idx_patients_full_name": ("patients", "full_name"),
+    "idx_patients_full_name_nocase": ("patients", "full_name COLLATE NOCASE"),
+    "idx_vitals_usn_recorded_at": ("vitals", "usn, recorded_at DESC"),
+    "idx_vitals_recorded_at": ("vitals", "recorded_at DESC"),
+    "idx_prescriptions_usn_prescribed_at": ("prescriptions", "usn, prescribed_at DESC"),
+    "idx_prescriptions_prescribed_at": ("prescriptions", "prescribed_at DESC"),
+    "idx_prescription_items_prescription": ("prescription_items", "prescription_id"),
+    "idx_prescription_items_medication": ("prescription_items", "medication_id"),
+    "idx_medications_name": ("medications", "name"),
+    "idx_case_reports_usn_created_at": ("case_reports", "usn, created_at DESC"),
+    "idx_case_reports_created_at": ("case_reports", "created_at DESC"),
+    "idx_sick_intimations_usn_created_at": ("sick_intimations", "usn, created_at DESC"),
+    "idx_sick_intimations_created_at": ("sick_intimations", "created_at DESC"),
+    "idx_appointments_usn_starts_at": ("appointments", "usn, starts_at DESC"),
+    "idx_appointments_starts_at": ("appointments", "starts_at"),
+    "idx_lab_orders_usn_ordered_at": ("lab_orders", "usn, ordered_at DESC"),
+    "idx_lab_orders_ordered_at": ("lab_orders", "ordered_at DESC"),
+    "idx_lab_order_items_order": ("lab_order_items", "lab_order_id"),
+    "idx_lab_order_items_test": ("lab_order_items", "lab_test_id"),
+    "idx_lab_order_items_status": ("lab_order_items", "status"),
+    # Child-side FK indexes so ON DELETE CASCADE from patients is not a scan
+    "idx_encounters_usn": ("encounters", "usn, encounter_dt DESC"),
+    "idx_problems_usn": ("problems", "usn"),
+    "idx_allergies_usn": ("allergies", "usn"),
+    "idx_inventory_movements_item": ("inventory_movements", "item_id, movement_dt"),
+}
+
+
+def create_indexes(conn: sqlite3.Connection, indexes: dict) -> None:
+    for name, (table, columns) in indexes.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table}({columns})")
+
+
+@migration(2, "secondary indexes for usn/timestamp hot paths")
+def _m0002_indexes(conn: sqlite3.Connection) -> None:
+    create_indexes(conn, MANAGED_INDEXES)
+
+
+# Tables the offline SPA mirrors, with the key it merges on
+SYNCED_TABLES = {
+    "patients": "usn",
+    "vitals": "id",
+    "prescriptions": "id",
+    "case_reports": "id",
+    "sick_intimations": "id",
+}
+
+_NOW_SQL = "strftime('%Y-%m-%dT%H:%M:%f', 'now')"
+
+
+def _stamp_sql(table: str, key: str) -> str:
+    return f"""
+        UPDATE change_seq SET seq = seq + 1 WHERE id = 1;
+        UPDATE {table}
+           SET rowversion = (SELECT seq FROM change_seq WHERE id = 1),
+               updated_at = {_NOW_SQL}
+         WHERE {key} = NEW.{key};
+    """
+
+
+def _stamp_on_update_trigger(table: str, key: str) -> str:
+    # Any column, including ones added by later migrations; the stamp changes
+    # rowversion, so the WHEN keeps it from stamping itself
+    return f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_sync_au AFTER UPDATE ON {table}
+        WHEN NEW.rowversion IS OLD.rowversion
+        BEGIN {_stamp_sql(table, key)} END;
+    """
+
+
+def add_change_tracking(conn: sqlite3.Connection, table: str, key: str) -> None:
+    """Stamp ``table`` rows with rowversion/updated_at from change_seq; deletes leave tombstones."""
+    conn.execute(f"ALTER TABLE {table} ADD COLUMN rowversion INTEGER")
+    conn.execute(f"ALTER TABLE {table} ADD COLUMN updated_at TEXT")
+
+    # Backfill existing rows with distinct versions above the current counter
+    conn.execute(
+        f"UPDATE {table} SET rowversion = (SELECT seq FROM change_seq WHERE id = 1) + rowid, "
+        f"updated_at = {_NOW_SQL}"
+    )
+    conn.execute(
+        f"UPDATE change_seq SET seq = seq + (SELECT COALESCE(MAX(rowid), 0) FROM {table}) WHERE id = 1"
+    )
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_rowversion ON {table}(rowversion)")
+
+    run_script(conn, f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_sync_ai AFTER INSERT ON {table}
+        BEGIN {_stamp_sql(table, key)} END;
+
+        {_stamp_on_update_trigger(table, key)}
+
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_sync_ad AFTER DELETE ON {table}
+        BEGIN
+            UPDATE change_seq SET seq = seq + 1 WHERE id = 1;
+            INSERT INTO sync_tombstones(rowversion, table_name, row_key, deleted_at)
+            VALUES ((SELECT seq FROM change_seq WHERE id = 1), '{table}', OLD.{key}, {_NOW_SQL});
+        END;
+    """)
+
+
+@migration(3, "change tracking (rowversion, updated_at, tombstones) for delta sync")
+def _m0003_change_tracking(conn: sqlite3.Connection) -> None:
+    # One clinic-wide counter, so a single cursor orders changes across tables
+    run_script(conn, """
+        CREATE TABLE IF NOT EXISTS change_seq (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            seq INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO change_seq(id, seq) VALUES (1, 0);
+
+        CREATE TABLE IF NOT EXISTS sync_tombstones (
+            rowversion INTEGER PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            row_key TEXT NOT NULL,
+            deleted_at TEXT NOT NULL
+        );
+    """)
+
+    for table, key in SYNCED_TABLES.items():
+        add_change_tracking(conn, table, key)
+
+
+# Sort key plus a unique tiebreaker, so keyset pages seek and stream in index
+# order (listing.py). They replace the single-key indexes from migration 2.
+KEYSET_INDEXES = {
+    "idx_patients_full_name_usn": ("patients", "full_name, usn"),
+    "idx_vitals_usn_recorded_at_id": ("vitals", "usn, recorded_at DESC, id DESC"),
+    "idx_vitals_recorded_at_id": ("vitals", "recorded_at DESC, id DESC"),
+    "idx_prescriptions_usn_prescribed_at_id": ("prescriptions", "usn, prescribed_at DESC, id DESC"),
+    "idx_prescriptions_prescribed_at_id": ("prescriptions", "prescribed_at DESC, id DESC"),
+    "idx_case_reports_usn_created_at_id": ("case_reports", "usn, created_at DESC, id DESC"),
+    "idx_case_reports_created_at_id": ("case_reports", "created_at DESC, id DESC"),
+    "idx_sick_intimations_usn_created_at_id": ("sick_intimations", "usn, created_at DESC, id DESC"),
+    "idx_sick_intimations_created_at_id": ("sick_intimations", "created_at DESC, id DESC"),
+}
+
+SUPERSEDED_INDEXES = (
+    "idx_patients_full_name",
+    "idx_vitals_usn_recorded_at",
+    "idx_vitals_recorded_at",
+    "idx_prescriptions_usn_prescribed_at",
+    "idx_prescriptions_prescribed_at",
+    "idx_case_reports_usn_created_at",
+    "idx_case_reports_created_at",
+    "idx_sick_intimations_usn_created_at",
+    "idx_sick_intimations_created_at",
+)
+
+
+@migration(4, "keyset pagination indexes (sort key + id tiebreaker)")
+def _m0004_keyset_indexes(conn: sqlite3.Connection) -> None:
+    create_indexes(conn, KEYSET_INDEXES)
+    for name in SUPERSEDED_INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+# Dashboard counters. day is the YYYY-MM-DD prefix of the row's timestamp for
+# per-day counters and '' for running totals. Also used by reconciliation.
+DAILY_COUNTER_SOURCES = """
+    SELECT '' AS day, 'patients' AS counter, COUNT(*) AS value FROM patients
+    UNION ALL
+    SELECT '', 'labs_pending', COUNT(*) FROM lab_order_items WHERE status <> 'Completed'
+    UNION ALL
+    SELECT substr(starts_at, 1, 10), 'appointments', COUNT(*) FROM appointments GROUP BY 1
+    UNION ALL
+    SELECT substr(recorded_at, 1, 10), 'vitals', COUNT(*) FROM vitals GROUP BY 1
+"""
+
+
+def _bump(day: str, counter: str, delta: str) -> str:
+    return (
+        f"INSERT INTO daily_counters(day, counter, value) VALUES ({day}, '{counter}', {delta}) "
+        f"ON CONFLICT(day, counter) DO UPDATE SET value = value + excluded.value;"
+    )
+
+
+@migration(5, "trigger-maintained daily_counters for /api/metrics")
+def _m0005_daily_counters(conn: sqlite3.Connection) -> None:
+    run_script(conn, f"""
+        CREATE TABLE IF NOT EXISTS daily_counters (
+            day TEXT NOT NULL,
+            counter TEXT NOT NULL,
+            value INTEGER NOT NULL,
+            PRIMARY KEY (day, counter)
+        ) WITHOUT ROWID;
+
+        CREATE TRIGGER IF NOT EXISTS trg_patients_counters_ai AFTER INSERT ON patients
+        BEGIN {_bump("''", "patients", "1")} END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_patients_counters_ad AFTER DELETE ON patients
+        BEGIN {_bump("''", "patients", "-1")} END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_appointments_counters_ai AFTER INSERT ON appointments
+        BEGIN {_bump("substr(NEW.starts_at, 1, 10)", "appointments", "1")} END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_appointments_counters_au AFTER UPDATE OF starts_at ON appointments
+        WHEN substr(OLD.starts_at, 1, 10) IS NOT substr(NEW.starts_at, 1, 10)
+        BEGIN
+            {_bump("substr(OLD.starts_at, 1, 10)", "appointments", "-1")}
+            {_bump("substr(NEW.starts_at, 1, 10)", "appointments", "1")}
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_appointments_counters_ad AFTER DELETE ON appointments
+        BEGIN {_bump("substr(OLD.starts_at, 1, 10)", "appointments", "-1")} END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_vitals_counters_ai AFTER INSERT ON vitals
+        BEGIN {_bump("substr(NEW.recorded_at, 1, 10)", "vitals", "1")} END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_vitals_counters_au AFTER UPDATE OF recorded_at ON vitals
+        WHEN substr(OLD.recorded_at, 1, 10) IS NOT substr(NEW.recorded_at, 1, 10)
+        BEGIN
+            {_bump("substr(OLD.recorded_at, 1, 10)", "vitals", "-1")}
+            {_bump("substr(NEW.recorded_at, 1, 10)", "vitals", "1")}
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_vitals_counters_ad AFTER DELETE ON vitals
+        BEGIN {_bump("substr(OLD.recorded_at, 1, 10)", "vitals", "-1")} END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_lab_order_items_counters_ai AFTER INSERT ON lab_order_items
+        WHEN NEW.status <> 'Completed'
+        BEGIN {_bump("''", "labs_pending", "1")} END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_lab_order_items_counters_au AFTER UPDATE OF status ON lab_order_items
+        WHEN (OLD.status <> 'Completed') <> (NEW.status <> 'Completed')
+        BEGIN {_bump("''", "labs_pending", "(NEW.status <> 'Completed') - (OLD.status <> 'Completed')")} END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_lab_order_items_counters_ad AFTER DELETE ON lab_order_items
+        WHEN OLD.status <> 'Completed'
+        BEGIN {_bump("''", "labs_pending", "-1")} END;
+    """)
+    conn.execute(f"INSERT INTO daily_counters(day, counter, value) {DAILY_COUNTER_SOURCES}")
+
+
+# Full-text search (search.py). Each source table gets two external-content
+# FTS5 indexes over the same columns: <table>_fts (words, prefix queries) and
+# <table>_trigram (substrings, typo-tolerant queries), keyed on the table's
+# integer id. patients has none, so its indexes read the patients_search view,
+# which pairs each usn with a stable id from patient_search_keys (migration 13).
+SEARCH_INDEXES = {
+    "patients": ("id", ("full_name", "contact", "address")),
+    "case_reports": ("id", (
+        "chief_complaint", "history_of_present_illness", "past_medical_history",
+        "family_history", "social_history", "physical_examination", "investigations",
+        "diagnosis", "treatment", "prognosis", "recommendations", "follow_up",
+    )),
+    "prescriptions": ("id", ("diagnosis", "notes")),
+}
+# Content table of an index, where it is not the table itself
+SEARCH_CONTENT = {"patients": "patients_search"}
+
+# Index suffix -> FTS5 options; prefix indexes keep short "as*" queries cheap
+SEARCH_INDEX_OPTIONS = {
+    "fts": "tokenize='unicode61 remove_diacritics 2', prefix='2 3'",
+    "trigram": "tokenize='trigram'",
+}
+
+
+@migration(6, "FTS5 search indexes over patients, case reports and prescriptions")
+def _m0006_search(conn: sqlite3.Connection) -> None:
+    for table, (key, columns) in SEARCH_INDEXES.items():
+        if table == "patients":
+            key = "rowid"  # as first shipped; migration 13 re-keys patients
+        cols = ", ".join(columns)
+        new_vals = ", ".join(f"NEW.{c}" for c in columns)
+        old_vals = ", ".join(f"OLD.{c}" for c in columns)
+        for suffix, options in SEARCH_INDEX_OPTIONS.items():
+            fts = f"{table}_{suffix}"
+            run_script(conn, f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                    {cols}, content='{table}', content_rowid='{key}', {options}
+                );
+
+                CREATE TRIGGER IF NOT EXISTS trg_{fts}_ai AFTER INSERT ON {table}
+                BEGIN
+                    INSERT INTO {fts}(rowid, {cols}) VALUES (NEW.{key}, {new_vals});
+                END;
+
+                CREATE TRIGGER IF NOT EXISTS trg_{fts}_au AFTER UPDATE OF {cols} ON {table}
+                BEGIN
+                    INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', OLD.{key}, {old_vals});
+                    INSERT INTO {fts}(rowid, {cols}) VALUES (NEW.{key}, {new_vals});
+                END;
+
+                CREATE TRIGGER IF NOT EXISTS trg_{fts}_ad AFTER DELETE ON {table}
+                BEGIN
+                    INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', OLD.{key}, {old_vals});
+                END;
+            """)
+            conn.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+# Latest vitals per patient: a pointer to the newest vitals row by
+# (recorded_at, id), plus the patient's vitals count. Triggers keep it current
+# whatever order rows arrive in (offline sync posts old readings late). Also
+# used by reconciliation (latest_vitals.py).
+LATEST_VITALS_SOURCE = """
+    SELECT usn, id, recorded_at, n FROM (
+        SELECT usn, id, recorded_at, COUNT(*) OVER (PARTITION BY usn) AS n,
+               ROW_NUMBER() OVER (PARTITION BY usn ORDER BY recorded_at DESC, id DESC) AS rn
+        FROM vitals
+    ) WHERE rn = 1
+"""
+
+# Count NEW in, and point at it if it is newer than the current latest
+_LATEST_VITALS_ADD = """
+    INSERT INTO latest_vitals(usn, vitals_id, recorded_at, vitals_count)
+    VALUES (NEW.usn, NEW.id, NEW.recorded_at, 1)
+    ON CONFLICT(usn) DO UPDATE SET
+        vitals_count = vitals_count + 1,
+        vitals_id = CASE WHEN (excluded.recorded_at, excluded.vitals_id) > (recorded_at, vitals_id)
+                         THEN excluded.vitals_id ELSE vitals_id END,
+        recorded_at = CASE WHEN (excluded.recorded_at, excluded.vitals_id) > (recorded_at, vitals_id)
+                           THEN excluded.recorded_at ELSE recorded_at END;
+"""
+
+# Count OLD out; if it was the latest, re-seek the newest remaining row
+_LATEST_VITALS_REMOVE = """
+    UPDATE latest_vitals SET vitals_count = vitals_count - 1 WHERE usn = OLD.usn;
+    DELETE FROM latest_vitals WHERE usn = OLD.usn AND vitals_count <= 0;
+    UPDATE latest_vitals SET (vitals_id, recorded_at) = (
+        SELECT id, recorded_at FROM vitals WHERE usn = OLD.usn ORDER BY recorded_at DESC, id DESC LIMIT 1
+    ) WHERE usn = OLD.usn AND vitals_id = OLD.id;
+"""
+
+
+@migration(7, "trigger-maintained latest_vitals (newest vitals row per patient)")
+def _m0007_latest_vitals(conn: sqlite3.Connection) -> None:
+    run_script(conn, f"""
+        CREATE TABLE IF NOT EXISTS latest_vitals (
+            usn TEXT PRIMARY KEY,
+            vitals_id INTEGER NOT NULL,
+            recorded_at TEXT NOT NULL,
+            vitals_count INTEGER NOT NULL
+        ) WITHOUT ROWID;
+
+        CREATE TRIGGER IF NOT EXISTS trg_vitals_latest_ai AFTER INSERT ON vitals
+        BEGIN {_LATEST_VITALS_ADD} END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_vitals_latest_au AFTER UPDATE OF usn, recorded_at ON vitals
+        WHEN OLD.usn IS NOT NEW.usn OR OLD.recorded_at IS NOT NEW.recorded_at
+        BEGIN {_LATEST_VITALS_REMOVE} {_LATEST_VITALS_ADD} END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_vitals_latest_ad AFTER DELETE ON vitals
+        BEGIN {_LATEST_VITALS_REMOVE} END;
+    """)
+    conn.execute(
+        f"INSERT INTO latest_vitals(usn, vitals_id, recorded_at, vitals_count) {LATEST_VITALS_SOURCE}"
+    )
+
+
+# Vitals rollups: per patient, per day/week/month bucket, each measure's count,
+# sum, min and max, so long-range charts read a few hundred rows whatever the
+# history length. Buckets are the start date (weeks start on Monday); rows whose
+# recorded_at SQLite cannot parse are left out. Also used by reconciliation
+# (vitals_rollups.py).
+ROLLUP_RESOLUTIONS = {
+    "day": ("date({t})", "date({b}, '+1 day')"),
+    "week": ("date({t}, '-6 days', 'weekday 1')", "date({b}, '+7 days')"),
+    "month": ("date({t}, 'start of month')", "date({b}, '+1 month')"),
+}
+ROLLUP_MEASURES = (
+    "weight", "bmi", "blood_pressure_systolic", "blood_pressure_diastolic",
+    "heart_rate", "temperature", "oxygen_saturation",
+)
+ROLLUP_COLUMNS = ["usn", "resolution", "bucket", "n"] + [
+    f"{c}_{agg}" for c in ROLLUP_MEASURES for agg in ("n", "sum", "min", "max")
+]
+_ROLLUP_AGGREGATES = ", ".join(
+    f"COUNT({c}), TOTAL({c}), MIN({c}), MAX({c})" for c in ROLLUP_MEASURES
+)
+
+
+def _rollup_select(resolution: str, where: str = "TRUE") -> str:
+    bucket = ROLLUP_RESOLUTIONS[resolution][0].format(t="recorded_at")
+    return (
+        f"SELECT usn, '{resolution}', {bucket} AS bucket, COUNT(*), {_ROLLUP_AGGREGATES} "
+        f"FROM vitals WHERE {bucket} IS NOT NULL AND {where} GROUP BY usn, bucket"
+    )
+
+
+VITALS_ROLLUP_SOURCE = " UNION ALL ".join(_rollup_select(r) for r in ROLLUP_RESOLUTIONS)
+
+
+def _rollup_add(resolution: str) -> str:
+    """Fold NEW into its bucket: counts and sums add up, min/max widen."""
+    bucket = ROLLUP_RESOLUTIONS[resolution][0].format(t="NEW.recorded_at")
+    values = ", ".join(
+        f"NEW.{c} IS NOT NULL, COALESCE(NEW.{c}, 0), NEW.{c}, NEW.{c}" for c in ROLLUP_MEASURES
+    )
+    updates = ", ".join(
+        f"{c}_n = {c}_n + excluded.{c}_n, {c}_sum = {c}_sum + excluded.{c}_sum, "
+        f"{c}_min = COALESCE(min({c}_min, excluded.{c}_min), {c}_min, excluded.{c}_min), "
+        f"{c}_max = COALESCE(max({c}_max, excluded.{c}_max), {c}_max, excluded.{c}_max)"
+        for c in ROLLUP_MEASURES
+    )
+    return (
+        f"INSERT INTO vitals_rollups({', '.join(ROLLUP_COLUMNS)}) "
+        f"SELECT NEW.usn, '{resolution}', b, 1, {values} FROM (SELECT {bucket} AS b) WHERE b IS NOT NULL "
+        f"ON CONFLICT(usn, resolution, bucket) DO UPDATE SET n = n + 1, {updates};"
+    )
+
+
+def _rollup_recompute(row: str, resolution: str) -> str:
+    """Re-aggregate ``row``'s bucket from vitals (min/max cannot be taken back incrementally)."""
+    bucket_of, next_bucket = ROLLUP_RESOLUTIONS[resolution]
+    b = bucket_of.format(t=f"{row}.recorded_at")
+    where = (f"usn = {row}.usn AND recorded_at >= {b} AND recorded_at < {next_bucket.format(b=b)} "
+             f"AND {bucket_of.format(t='recorded_at')} = {b}")
+    return (
+        f"DELETE FROM vitals_rollups WHERE usn = {row}.usn AND resolution = '{resolution}' AND bucket = {b}; "
+        f"INSERT INTO vitals_rollups({', '.join(ROLLUP_COLUMNS)}) {_rollup_select(resolution, where)};"
+    )
+
+
+@migration(8, "trigger-maintained vitals_rollups (day/week/month aggregates per patient)")
+def _m0008_vitals_rollups(conn: sqlite3.Connection) -> None:
+    measure_columns = ",\n".join(
+        f"{c}_n INTEGER NOT NULL, {c}_sum REAL NOT NULL, {c}_min REAL, {c}_max REAL" for c in ROLLUP_MEASURES
+    )
+    tracked = ("usn", "recorded_at", "weight", "height", "blood_pressure_systolic", "blood_pressure_diastolic",
+               "heart_rate", "temperature", "oxygen_saturation")
+    changed = " OR ".join(f"OLD.{c} IS NOT NEW.{c}" for c in tracked)
+    add = " ".join(_rollup_add(r) for r in ROLLUP_RESOLUTIONS)
+    remove_old = " ".join(_rollup_recompute("OLD", r) for r in ROLLUP_RESOLUTIONS)
+    recompute_new = " ".join(_rollup_recompute("NEW", r) for r in ROLLUP_RESOLUTIONS)
+    run_script(conn, f"""
+        CREATE TABLE IF NOT EXISTS vitals_rollups (
+            usn TEXT NOT NULL,
+            resolution TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            {measure_columns},
+            PRIMARY KEY (usn, resolution, bucket)
+        ) WITHOUT ROWID;
+
+        CREATE TRIGGER IF NOT EXISTS trg_vitals_rollups_ai AFTER INSERT ON vitals
+        BEGIN {add} END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_vitals_rollups_au AFTER UPDATE OF {', '.join(tracked)} ON vitals
+        WHEN {changed}
+        BEGIN {remove_old} {recompute_new} END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_vitals_rollups_ad AFTER DELETE ON vitals
+        BEGIN {remove_old} END;
+    """)
+    conn.execute(f"INSERT INTO vitals_rollups({', '.join(ROLLUP_COLUMNS)}) {VITALS_ROLLUP_SOURCE}")
+
+
+# Prescription items: prescriptions.medications (the JSON array the SPA posts)
+# stays the record as written; prescription_items is its normalised form, one
+# row per array element linked to the medications master, so "who was
+# prescribed X" is an index lookup. Triggers derive the items from the JSON on
+# every write, whatever the writer. Elements come in two shapes:
+# hmis-standalone.html {name, dosage, frequency, duration: "5 days",
+# instructions} and the React form {medicationId, medicationName, dose, route,
+# frequency, durationDays, instructions}. A medication is matched by id, then
+# by name, then by "name strength"; unmatched names are added to the master.
+def _rx_item_fields(item: str) -> str:
+    def get(key: str) -> str:
+        return f"json_extract({item}, '$.{key}')"
+
+    def days(expr: str) -> str:
+        return f"CASE WHEN CAST({expr} AS TEXT) GLOB '[0-9]*' THEN CAST({expr} AS INTEGER) END"
+
+    return (
+        f"TRIM(CAST(COALESCE({get('name')}, {get('medicationName')}, '') AS TEXT)) AS label, "
+        f"{get('medicationId')} AS hint, "
+        f"CAST(COALESCE({get('dose')}, {get('dosage')}) AS TEXT) AS dose, "
+        f"CAST({get('route')} AS TEXT) AS route, "
+        f"CAST({get('frequency')} AS TEXT) AS frequency, "
+        f"COALESCE({days(get('durationDays'))}, {days(get('duration'))}) AS duration_days, "
+        f"NULLIF(CAST({get('duration')} AS TEXT), '') AS duration, "
+        f"NULLIF(CAST({get('instructions')} AS TEXT), '') AS instructions"
+    )
+
+
+_RX_MEDICATION_ID = """COALESCE(
+    (SELECT id FROM medications WHERE id = CAST(hint AS INTEGER)),
+    (SELECT id FROM medications WHERE name = label ORDER BY id LIMIT 1),
+    (SELECT id FROM medications WHERE name || ' ' || strength = label ORDER BY id LIMIT 1)
+)"""
+
+
+def _rx_items_source(rx_id: str, medications: str, source: str = "") -> str:
+    """Items of the JSON array ``medications`` of prescription ``rx_id``, with medication_id resolved."""
+    array = (f"CASE WHEN json_valid({medications}) AND json_type({medications}) = 'array' "
+             f"THEN {medications} ELSE '[]' END")
+    return f"""
+        SELECT prescription_id, position, label, {_RX_MEDICATION_ID} AS medication_id,
+               dose, route, frequency, duration_days, duration, instructions
+        FROM (
+            SELECT {rx_id} AS prescription_id, CAST(j.key AS INTEGER) AS position, {_rx_item_fields('j.value')}
+            FROM {source}json_each({array}) j
+            WHERE j.type = 'object'
+        )
+    """
+
+
+PRESCRIPTION_ITEM_COLUMNS = (
+    "prescription_id", "position", "medication_id", "dose", "route", "frequency", "duration_days",
+    "duration", "instructions",
+)
+
+
+def _rx_items_add(rx_id: str, medications: str, source: str = "") -> str:
+    items = _rx_items_source(rx_id, medications, source)
+    cols = ", ".join(PRESCRIPTION_ITEM_COLUMNS)
+    return f"""
+        INSERT INTO medications(name)
+        SELECT DISTINCT label FROM ({items}) WHERE medication_id IS NULL AND label <> '';
+        INSERT INTO prescription_items({cols})
+        SELECT {cols} FROM ({items}) WHERE medication_id IS NOT NULL;
+    """
+
+
+# Every prescription's items, for the backfill and reconciliation (prescription_items.py)
+PRESCRIPTION_ITEMS_REBUILD = _rx_items_add("p.id", "p.medications", "prescriptions p, ")
+
+# Items added by the old itemised form lived only in prescription_items; fold
+# them into the JSON first so the rebuild keeps them
+_RX_LEGACY_ITEMS_TO_JSON = """
+    UPDATE prescriptions SET medications = (
+        SELECT json_group_array(json(value)) FROM (
+            SELECT value FROM json_each(CASE WHEN json_valid(prescriptions.medications)
+                AND json_type(prescriptions.medications) = 'array' THEN prescriptions.medications ELSE '[]' END)
+            UNION ALL
+            SELECT * FROM (
+                SELECT json_object('name', m.name, 'medicationId', m.id, 'dose', pi.dose, 'route', pi.route,
+                                   'frequency', pi.frequency, 'durationDays', pi.duration_days,
+                                   'instructions', pi.instructions)
+                FROM prescription_items pi JOIN medications m ON m.id = pi.medication_id
+                WHERE pi.prescription_id = prescriptions.id ORDER BY pi.id
+            )
+        )
+    ) WHERE id IN (SELECT prescription_id FROM prescription_items)
+"""
+
+PRESCRIPTION_ITEM_INDEXES = {
+    # Covering for "prescriptions of medication X"
+    "idx_prescription_items_medication_rx": ("prescription_items", "medication_id, prescription_id"),
+    "idx_prescription_items_prescription_pos": ("prescription_items", "prescription_id, position"),
+    # Matches the "name strength" labels of the standalone SPA
+    "idx_medications_label": ("medications", "name || ' ' || strength"),
+}
+
+
+@migration(9, "prescription_items derived from prescriptions.medications by triggers")
+def _m0009_prescription_items(conn: sqlite3.Connection) -> None:
+    conn.execute("ALTER TABLE prescription_items ADD COLUMN position INTEGER NOT NULL DEFAULT 0")
+    conn.execute("ALTER TABLE prescription_items ADD COLUMN duration TEXT NULL")
+    conn.execute(_RX_LEGACY_ITEMS_TO_JSON)
+    conn.execute("DELETE FROM prescription_items")
+    create_indexes(conn, PRESCRIPTION_ITEM_INDEXES)
+    for name in ("idx_prescription_items_prescription", "idx_prescription_items_medication"):
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    add = _rx_items_add("NEW.id", "NEW.medications")
+    run_script(conn, f"""
+        CREATE TRIGGER IF NOT EXISTS trg_prescriptions_items_ai AFTER INSERT ON prescriptions
+        BEGIN {add} END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_prescriptions_items_au AFTER UPDATE OF id, medications ON prescriptions
+        WHEN OLD.id IS NOT NEW.id OR OLD.medications IS NOT NEW.medications
+        BEGIN
+            DELETE FROM prescription_items WHERE prescription_id = OLD.id;
+            {add}
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_prescriptions_items_ad AFTER DELETE ON prescriptions
+        BEGIN DELETE FROM prescription_items WHERE prescription_id = OLD.id; END;
+    """)
+    run_script(conn, PRESCRIPTION_ITEMS_REBUILD)
+
+
+@migration(10, "change tracking on the medications master (medication_index.py)")
+def _m0010_medications_tracking(conn: sqlite3.Connection) -> None:
+    # Not offered by /api/sync/changes; the in-process suggest index follows it
+    add_change_tracking(conn, "medications", "id")
+
+
+# Prescribe-time safety screening (medication_safety.py). Rules name
+# substances or groups of them (substance_groups: amoxicillin -> penicillin),
+# normalised by the app; kind 'condition' rules pair a substance with a
+# condition from the patient's active problems. The seed covers the clinic
+# formulary; clinics extend it through /api/interaction-rules.
+SAFETY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS substance_groups (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    member TEXT NOT NULL,
+    substance TEXT NOT NULL,
+    UNIQUE(member, substance)
+);
+
+CREATE TABLE IF NOT EXISTS interaction_rules (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL DEFAULT 'drug' CHECK (kind IN ('drug', 'condition')),
+    substance_a TEXT NOT NULL,
+    substance_b TEXT NOT NULL, -- a substance or group, or a condition for kind 'condition'
+    severity TEXT NOT NULL DEFAULT 'moderate' CHECK (severity IN ('major', 'moderate', 'minor')),
+    message TEXT NOT NULL,
+    is_active INTEGER NOT NULL DEFAULT 1,
+    UNIQUE(kind, substance_a, substance_b)
+);
+
+-- Warnings raised for a prescription, at prescribe time or by a re-screen
+CREATE TABLE IF NOT EXISTS prescription_alerts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    prescription_id INTEGER NOT NULL,
+    kind TEXT NOT NULL, -- allergy, interaction or condition
+    severity TEXT NOT NULL,
+    medication TEXT NOT NULL,
+    other TEXT NOT NULL, -- the allergy, the other medication or the condition
+    message TEXT NOT NULL,
+    screened_at TEXT NOT NULL,
+    FOREIGN KEY (prescription_id) REFERENCES prescriptions(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_prescription_alerts_prescription ON prescription_alerts(prescription_id);
+
+CREATE TRIGGER IF NOT EXISTS trg_prescriptions_alerts_ad AFTER DELETE ON prescriptions
+BEGIN DELETE FROM prescription_alerts WHERE prescription_id = OLD.id; END;
+"""
+
+SEED_SUBSTANCE_GROUPS = [
+    ("amoxicillin", "penicillin"), ("ampicillin", "penicillin"), ("cloxacillin", "penicillin"),
+    ("ibuprofen", "nsaid"), ("diclofenac", "nsaid"), ("naproxen", "nsaid"), ("aspirin", "nsaid"),
+    ("mefenamic acid", "nsaid"), ("ketorolac", "nsaid"),
+    ("sulfamethoxazole", "sulfonamide"),
+    ("acetaminophen", "paracetamol"),
+    ("cetirizine", "antihistamine"), ("levocetirizine", "antihistamine"), ("fexofenadine", "antihistamine"),
+    ("omeprazole", "proton pump inhibitor"), ("pantoprazole", "proton pump inhibitor"),
+    ("sumatriptan", "triptan"),
+]
+
+# kind, substance_a, substance_b, severity, message
+SEED_INTERACTION_RULES = [
+    ("drug", "nsaid", "nsaid", "moderate",
+     "Two NSAIDs together add gastrointestinal bleeding and kidney risk without added benefit"),
+    ("drug", "antihistamine", "antihistamine", "minor", "Duplicate antihistamines: more drowsiness"),
+    ("drug", "proton pump inhibitor", "proton pump inhibitor", "minor", "Duplicate proton pump inhibitors"),
+    ("drug", "atorvastatin", "fluconazole", "major", "Fluconazole raises atorvastatin levels: risk of myopathy"),
+    ("drug", "fluconazole", "ondansetron", "moderate", "Both prolong the QT interval"),
+    ("drug", "azithromycin", "ondansetron", "moderate", "Both prolong the QT interval"),
+    ("drug", "ondansetron", "triptan", "moderate", "Serotonergic combination: watch for serotonin syndrome"),
+    ("drug", "ferrous sulfate", "proton pump inhibitor", "minor", "Proton pump inhibitors reduce iron absorption"),
+    ("condition", "nsaid", "asthma", "moderate", "NSAIDs can trigger bronchospasm in asthma"),
+    ("condition", "nsaid", "gastritis", "moderate", "NSAIDs worsen gastritis; prefer paracetamol"),
+]
+
+
+@migration(11, "allergy/interaction screening tables and seed rules (medication_safety.py)")
+def _m0011_medication_safety(conn: sqlite3.Connection) -> None:
+    run_script(conn, SAFETY_SCHEMA)
+    conn.executemany("INSERT OR IGNORE INTO substance_groups(member, substance) VALUES(?,?)",
+                     SEED_SUBSTANCE_GROUPS)
+    conn.executemany(
+        "INSERT OR IGNORE INTO interaction_rules(kind, substance_a, substance_b, severity, message) "
+        "VALUES(?,?,?,?,?)",
+        SEED_INTERACTION_RULES,
+    )
+    # Stamped like the synced tables so the in-process rule maps see edits
+    for table in ("substance_groups", "interaction_rules"):
+        add_change_tracking(conn, table, "id")
+
+
+# Lab result flags (lab_ranges.py). Results are parsed to a number when
+# written and flagged against their test's parsed reference range and
+# critical limits; the parsers and the flag rule live here so the backfill
+# below, the write path and the recompute job agree.
+LAB_FLAGS = ("low", "normal", "high", "critical")
+ABNORMAL_LAB_FLAGS = ("low", "high", "critical")
+# Both the partial index and the view say this, so queries on the view can use the index
+_ABNORMAL_LAB = f"flag IN ({', '.join(repr(f) for f in ABNORMAL_LAB_FLAGS)})"
+
+ABNORMAL_LAB_RESULTS_VIEW = f"""
+CREATE VIEW IF NOT EXISTS abnormal_lab_results AS
+SELECT loi.id, loi.lab_order_id, lo.usn, lt.code, lt.name, loi.result_value, lt.unit, lt.ref_range,
+       loi.flag, loi.result_at, lo.ordered_at
+FROM lab_order_items loi
+JOIN lab_orders lo ON lo.id = loi.lab_order_id
+JOIN lab_tests lt ON lt.id = loi.lab_test_id
+WHERE loi.{_ABNORMAL_LAB}
+"""
+
+
+@migration(12, "parsed, range-flagged lab results and the abnormal worklist index (lab_ranges.py)")
+def _m0012_lab_flags(conn: sqlite3.Connection) -> None:
+    # The backfill's parser and flag rule, frozen as shipped here; the live
+    # ones, used on every write and recompute, are in lab_ranges.py
+    number = r"(-?\d+(?:\.\d+)?)"
+    lab_value = re.compile(rf"^\s*(?:[<>]=?|≤|≥)?\s*{number}(?![\d.:/])")
+    ref_between = re.compile(rf"^\s*{number}\s*(?:-|–|to)\s*{number}", re.IGNORECASE)
+    ref_upper = re.compile(rf"^\s*(?:<=?|≤|up to)\s*{number}", re.IGNORECASE)
+    ref_lower = re.compile(rf"^\s*(?:>=?|≥)\s*{number}")
+
+    def parse_lab_value(text: Optional[str]) -> Optional[float]:
+        m = lab_value.match(text or "")
+        return float(m.group(1)) if m else None
+
+    def parse_ref_range(text: Optional[str]) -> Tuple[Optional[float], Optional[float]]:
+        text = text or ""
+        m = ref_between.match(text)
+        if m:
+            return float(m.group(1)), float(m.group(2))
+        m = ref_upper.match(text)
+        if m:
+            return None, float(m.group(1))
+        m = ref_lower.match(text)
+        if m:
+            return float(m.group(1)), None
+        return None, None
+
+    flag_sql = """CASE
+        WHEN result_numeric IS NULL THEN NULL
+        WHEN (:critical_low IS NOT NULL AND result_numeric < :critical_low)
+          OR (:critical_high IS NOT NULL AND result_numeric > :critical_high) THEN 'critical'
+        WHEN :low IS NOT NULL AND result_numeric < :low THEN 'low'
+        WHEN :high IS NOT NULL AND result_numeric > :high THEN 'high'
+        ELSE 'normal'
+    END"""
+
+    conn.execute("ALTER TABLE lab_order_items ADD COLUMN result_numeric REAL NULL")
+    flags = ", ".join(f"'{f}'" for f in LAB_FLAGS)
+    conn.execute(f"ALTER TABLE lab_order_items ADD COLUMN flag TEXT NULL CHECK (flag IN ({flags}))")
+    conn.execute("ALTER TABLE lab_tests ADD COLUMN critical_low REAL NULL")
+    conn.execute("ALTER TABLE lab_tests ADD COLUMN critical_high REAL NULL")
+    conn.execute("UPDATE lab_tests SET critical_low = 40, critical_high = 400 WHERE code = 'GLU'")
+    # The range cache reloads when a test is stamped
+    add_change_tracking(conn, "lab_tests", "id")
+
+    # Backfill: parse every stored result, then flag each test's results in one pass
+    conn.create_function("lab_number", 1, parse_lab_value, deterministic=True)
+    conn.execute("UPDATE lab_order_items SET result_numeric = lab_number(result_value) "
+                 "WHERE result_value IS NOT NULL")
+    for test_id, ref_range, critical_low, critical_high in conn.execute(
+            "SELECT id, ref_range, critical_low, critical_high FROM lab_tests").fetchall():
+        low, high = parse_ref_range(ref_range)
+        bounds = {"low": low, "high": high, "critical_low": critical_low, "critical_high": critical_high}
+        if any(v is not None for v in bounds.values()):
+            conn.execute(f"UPDATE lab_order_items SET flag = {flag_sql} WHERE lab_test_id = :test_id",
+                         dict(bounds, test_id=test_id))
+
+    # Worklist of abnormal results, newest first: only flagged rows are indexed
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_lab_order_items_abnormal ON lab_order_items(result_at DESC, id DESC) "
+        f"WHERE {_ABNORMAL_LAB}"
+    )
+    conn.execute(ABNORMAL_LAB_RESULTS_VIEW)
+
+
+def _patient_search_sync(fts: str, columns: Sequence[str], usn: str, row: str, delete: bool = False) -> str:
+    """Statement adding (or with ``delete`` removing) ``row``'s values under ``usn``'s search key."""
+    cols = ", ".join(columns)
+    vals = ", ".join(f"{row}.{c}" for c in columns)
+    if delete:
+        return (f"INSERT INTO {fts}({fts}, rowid, {cols}) "
+                f"SELECT 'delete', id, {vals} FROM patient_search_keys WHERE usn = {usn};")
+    return f"INSERT INTO {fts}(rowid, {cols}) SELECT id, {vals} FROM patient_search_keys WHERE usn = {usn};"
+
+
+@migration(13, "stable integer keys for the patient search indexes")
+def _m0013_patient_search_keys(conn: sqlite3.Connection) -> None:
+    # Migration 6 keyed patients_fts/patients_trigram on the implicit rowid,
+    # which VACUUM may renumber. Give every usn an INTEGER PRIMARY KEY id
+    # instead and index patients through a view keyed on it.
+    _, columns = SEARCH_INDEXES["patients"]
+    cols = ", ".join(columns)
+    indexes = [f"patients_{suffix}" for suffix in SEARCH_INDEX_OPTIONS]
+    run_script(conn, f"""
+        CREATE TABLE IF NOT EXISTS patient_search_keys (
+            id INTEGER PRIMARY KEY,
+            usn TEXT NOT NULL UNIQUE
+        );
+        INSERT OR IGNORE INTO patient_search_keys(usn) SELECT usn FROM patients ORDER BY usn;
+
+        CREATE VIEW IF NOT EXISTS patients_search AS
+            SELECT k.id, p.* FROM patient_search_keys k JOIN patients p ON p.usn = k.usn;
+    """)
+    for suffix, options in SEARCH_INDEX_OPTIONS.items():
+        fts = f"patients_{suffix}"
+        run_script(conn, f"""
+            DROP TRIGGER IF EXISTS trg_{fts}_ai;
+            DROP TRIGGER IF EXISTS trg_{fts}_au;
+            DROP TRIGGER IF EXISTS trg_{fts}_ad;
+            DROP TABLE IF EXISTS {fts};
+        """)
+        conn.execute(f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='patients_search', "
+                     f"content_rowid='id', {options})")
+        conn.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+    # One trigger per event for both indexes and the key, so nothing depends
+    # on the order SQLite fires triggers in
+    run_script(conn, f"""
+        CREATE TRIGGER IF NOT EXISTS trg_patients_search_ai AFTER INSERT ON patients
+        BEGIN
+            INSERT OR IGNORE INTO patient_search_keys(usn) VALUES (NEW.usn);
+            {"".join(_patient_search_sync(f, columns, "NEW.usn", "NEW") for f in indexes)}
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_patients_search_au AFTER UPDATE OF usn, {cols} ON patients
+        BEGIN
+            {"".join(_patient_search_sync(f, columns, "OLD.usn", "OLD", delete=True) for f in indexes)}
+            UPDATE patient_search_keys SET usn = NEW.usn WHERE usn = OLD.usn AND NEW.usn IS NOT OLD.usn;
+            {"".join(_patient_search_sync(f, columns, "NEW.usn", "NEW") for f in indexes)}
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_patients_search_ad AFTER DELETE ON patients
+        BEGIN
+            {"".join(_patient_search_sync(f, columns, "OLD.usn", "OLD", delete=True) for f in indexes)}
+            DELETE FROM patient_search_keys WHERE usn = OLD.usn;
+        END;
+    """)
+
+
+@migration(14, "change-tracking update triggers that cover every column")
+def _m0014_stamp_all_columns(conn: sqlite3.Connection) -> None:
+    # Until now trg_<table>_sync_au fired on UPDATE OF the columns that existed
+    # when tracking was added, so edits to later columns (lab_tests.critical_low)
+    # were never stamped. Re-create each as a plain AFTER UPDATE, for the
+    # tables given change tracking by migrations 3, 10, 11 and 12.
+    tracked = {**SYNCED_TABLES, "medications": "id", "interaction_rules": "id", "substance_groups": "id",
+               "lab_tests": "id"}
+    for table, key in tracked.items():
+        conn.execute(f"DROP TRIGGER IF EXISTS trg_{table}_sync_au")
+        run_script(conn, _stamp_on_update_trigger(table, key))
+
+
+@migration(15, "insert stamps that keep a rowversion the writer already assigned")
+def _m0015_prestamped_inserts(conn: sqlite3.Connection) -> None:
+    # sync_ingest reserves a block of change_seq for a whole batch and writes
+    # rowversion/updated_at with the rows, saving the per-row counter bump and
+    # self-UPDATE. Every other insert leaves rowversion NULL and is stamped here.
+    for table, key in SYNCED_TABLES.items():
+        conn.execute(f"DROP TRIGGER IF EXISTS trg_{table}_sync_ai")
+        run_script(conn, f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_sync_ai AFTER INSERT ON {table}
+            WHEN NEW.rowversion IS NULL
+            BEGIN {_stamp_sql(table, key)} END;
+        """)
@@ -0,0 +1,94 @@
+"""
+Prescription items, normalised from prescriptions.medications.
+
+Triggers on prescriptions (migration 9) turn each element of the medications
+JSON into a ``prescription_items`` row linked to the ``medications`` master,
+adding unknown medications on the way, so every writer (the API, the sync
+endpoints, the legacy forms) goes through the same code path. Readers that
+need items (the prescriptions export, "who was prescribed X") query them
+instead of parsing JSON per row. If the items and the JSON ever disagree,
+``reconcile`` (``python prescription_items.py``) rebuilds the items and
+reports the drift.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+from typing import Any, Dict, List, Tuple
+
+from migrations import PRESCRIPTION_ITEMS_REBUILD, run_script
+
+# Prescriptions (as ``id``) with an item of the medication named ``?``: either
+# its name or "name strength" as the standalone SPA writes it
+MEDICATION_FILTER = """id IN (
+    SELECT pi.prescription_id FROM prescription_items pi
+    WHERE pi.medication_id IN (SELECT id FROM medications WHERE name = ? OR name || ' ' || strength = ?)
+)"""
+
+# Per prescription: "name strength; ..." and "name: dose frequency for duration; ..."
+EXPORT_JOIN = """
+    LEFT JOIN (
+        SELECT prescription_id, group_concat(name, '; ') AS medications_text,
+               group_concat(name || ': ' || dosage, '; ') AS dosage_instructions
+        FROM (
+            SELECT pi.prescription_id, m.name || COALESCE(' ' || m.strength, '') AS name,
+                   COALESCE(pi.dose, '') || ' ' || COALESCE(pi.frequency, '') || ' for '
+                   || COALESCE(pi.duration, pi.duration_days || ' days', '') AS dosage
+            FROM prescription_items pi JOIN medications m ON m.id = pi.medication_id
+            ORDER BY pi.prescription_id, pi.position
+        )
+        GROUP BY prescription_id
+    ) rx ON rx.prescription_id = p.id
+"""
+
+
+def append_item(conn: sqlite3.Connection, prescription_id: int, item: Dict[str, Any]) -> bool:
+    """Add one medication object to a prescription's JSON (the triggers redo its items)."""
+    cur = conn.execute(
+        """UPDATE prescriptions SET medications = json_insert(
+               CASE WHEN json_valid(medications) AND json_type(medications) = 'array'
+                    THEN medications ELSE '[]' END, '$[#]', json(?))
+           WHERE id = ?""",
+        (json.dumps(item), prescription_id),
+    )
+    return cur.rowcount > 0
+
+
+def _items(conn: sqlite3.Connection) -> Dict[int, Tuple[int, ...]]:
+    items: Dict[int, List[int]] = {}
+    for rx_id, med_id in conn.execute(
+        "SELECT prescription_id, medication_id FROM prescription_items ORDER BY prescription_id, position"
+    ):
+        items.setdefault(rx_id, []).append(med_id)
+    return {k: tuple(v) for k, v in items.items()}
+
+
+def reconcile(conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+    """Rebuild ``prescription_items`` from the JSON; return the prescriptions whose items had drifted."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        actual = _items(conn)
+        conn.execute("DELETE FROM prescription_items")
+        run_script(conn, PRESCRIPTION_ITEMS_REBUILD)
+        expected = _items(conn)
+        drift = [
+            {"prescription_id": rx_id, "expected": list(expected.get(rx_id, ())),
+             "actual": list(actual.get(rx_id, ()))}
+            for rx_id in sorted(expected.keys() | actual.keys())
+            if expected.get(rx_id) != actual.get(rx_id)
+        ]
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return drift
+
+
+if __name__ == "__main__":
+    from app import run_maintenance
+
+    rows = run_maintenance(reconcile)
+    for row in rows:
+        print(f"prescription {row['prescription_id']}: stored medications {row['actual']}, "
+              f"rebuilt {row['expected']}")
+    print(f"{len(rows)} prescription(s) drifted; prescription_items rebuilt")
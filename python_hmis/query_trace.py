@@ -0,0 +1,187 @@
+"""
+Per-request SQL tracing: statement counts, slow-query log and N+1 detection.
+
+While a request runs, every statement on its pooled connection, and on the
+writer thread for the writes it submits, is recorded with its execute and
+fetch time (``db_pool.TimedCursor``). Responses carry ``X-Query-Count`` and
+``X-DB-Time`` (milliseconds); statements run while a streamed response is
+being sent are analysed but not in those headers, which are already gone.
+
+When the request ends:
+
+* statements slower than ``HMIS_SLOW_QUERY_MS`` (100) are logged to the
+  ``hmis.sql`` logger with their ``EXPLAIN QUERY PLAN``;
+* statement shapes (SQL with literals and IN-lists folded) run more than
+  ``HMIS_QUERY_REPEAT_LIMIT`` (20) times are flagged as likely N+1 loops.
+
+The most recent findings are kept for ``GET /api/debug/queries``. Set
+``HMIS_QUERY_TRACE=0`` to turn tracing off.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter, deque
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from flask import Flask, Response, g, request
+
+from db_pool import set_query_trace
+
+log = logging.getLogger("hmis.sql")
+
+# Statements EXPLAIN QUERY PLAN has nothing to say about
+NO_PLAN = ("BEGIN", "COMMIT", "END", "ROLLBACK", "SAVEPOINT", "RELEASE", "PRAGMA")
+# Slow statements explained per request; the rest are still logged
+MAX_EXPLAINS = 5
+
+
+def trace_enabled_from_env() -> bool:
+    return os.environ.get("HMIS_QUERY_TRACE", "1") not in ("0", "false", "off")
+
+
+def trace_config_from_env() -> Dict[str, Any]:
+    env = os.environ.get
+    return {
+        "slow_ms": float(env("HMIS_SLOW_QUERY_MS", "100")),
+        "repeat_limit": int(env("HMIS_QUERY_REPEAT_LIMIT", "20")),
+    }
+
+
+@lru_cache(maxsize=2048)
+def shape(sql: str) -> str:
+    """``sql`` with literals as ``?``, IN-lists as ``(?)`` and whitespace collapsed."""
+    s = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    s = re.sub(r"\b\d+(?:\.\d+)?\b", "?", s)
+    s = re.sub(r"\(\s*\?(?:\s*,\s*\?)+\s*\)", "(?)", s)
+    return " ".join(s.split())
+
+
+class _Entry:
+    __slots__ = ("sql", "params", "seconds")
+
+    def __init__(self, sql: str, params: Any) -> None:
+        self.sql = sql
+        self.params = params
+        self.seconds = 0.0
+
+
+class QueryTrace:
+    """Statements of one request, filled in by TimedCursor."""
+
+    def __init__(self) -> None:
+        self.entries: List[_Entry] = []
+
+    def statement(self, sql: str, params: Any) -> _Entry:
+        entry = _Entry(sql, params)
+        self.entries.append(entry)
+        return entry
+
+    @property
+    def seconds(self) -> float:
+        return sum(e.seconds for e in self.entries)
+
+
+class QueryTracer:
+    def __init__(self, slow_ms: float = 100.0, repeat_limit: int = 20, keep: int = 200) -> None:
+        self.slow_ms = slow_ms
+        self.repeat_limit = repeat_limit
+        self._findings: Deque[Dict[str, Any]] = deque(maxlen=keep)
+        self._lock = threading.Lock()
+        self._explain_conn: Optional[Callable[[], sqlite3.Connection]] = None
+        self._stats = {"requests": 0, "statements": 0, "slow": 0, "repeated": 0}
+
+    def init_app(self, app: Flask, explain_conn: Callable[[], sqlite3.Connection]) -> None:
+        """Trace every request; ``explain_conn`` opens a connection for EXPLAIN (closed after)."""
+        self._explain_conn = explain_conn
+        app.before_request(self._before)
+        app.after_request(self._after)
+        app.teardown_request(self._teardown)
+
+    def _before(self) -> None:
+        trace = QueryTrace()
+        g._query_trace = trace
+        set_query_trace(trace)
+
+    def _after(self, response: Response) -> Response:
+        trace = g.get("_query_trace")
+        if trace is not None:
+            response.headers["X-Query-Count"] = str(len(trace.entries))
+            response.headers["X-DB-Time"] = f"{trace.seconds * 1000:.3f}"
+        return response
+
+    def _teardown(self, exc: Optional[BaseException] = None) -> None:
+        trace = g.pop("_query_trace", None)
+        set_query_trace(None)
+        if trace is None:
+            return
+        entries = trace.entries
+        slow = [e for e in entries if e.seconds * 1000 >= self.slow_ms]
+        counts = Counter(shape(e.sql) for e in entries)
+        repeated = [(sql, n) for sql, n in counts.most_common() if n > self.repeat_limit]
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["statements"] += len(entries)
+            self._stats["slow"] += len(slow)
+            self._stats["repeated"] += len(repeated)
+        if not (slow or repeated):
+            return
+
+        # The route rule, not the URL: paths and query strings carry patient
+        # identifiers and names (/api/patients/<usn>, /api/search?q=)
+        rule = request.url_rule
+        where = {
+            "at": datetime.utcnow().isoformat(timespec="seconds"),
+            "method": request.method,
+            "route": rule.rule if rule is not None else request.path,
+        }
+        findings: List[Dict[str, Any]] = []
+        plans = self._explain(slow[:MAX_EXPLAINS])
+        for i, entry in enumerate(slow):
+            finding = dict(where, kind="slow", sql=shape(entry.sql), ms=round(entry.seconds * 1000, 3),
+                           plan=plans[i] if i < len(plans) else None)
+            log.warning("slow query %.1f ms in %s %s: %s\n  plan: %s", finding["ms"], request.method,
+                        where["route"], finding["sql"], "; ".join(finding["plan"]) if finding["plan"] else "(none)")
+            findings.append(finding)
+        for sql, n in repeated:
+            ms = sum(e.seconds for e in entries if shape(e.sql) == sql) * 1000
+            findings.append(dict(where, kind="repeated", sql=sql, count=n, ms=round(ms, 3)))
+            log.warning("%d x same statement in %s %s (possible N+1, %.1f ms total): %s",
+                        n, request.method, where["route"], ms, sql)
+        with self._lock:
+            self._findings.extend(findings)
+
+    def _explain(self, entries: List[_Entry]) -> List[Optional[List[str]]]:
+        if not entries or self._explain_conn is None:
+            return []
+        conn = self._explain_conn()
+        try:
+            plans: List[Optional[List[str]]] = []
+            for entry in entries:
+                params = entry.params if isinstance(entry.params, (tuple, list, dict)) else ()
+                if (entry.sql.split() or [""])[0].upper() in NO_PLAN:
+                    plans.append(None)
+                    continue
+                try:
+                    rows = conn.execute("EXPLAIN QUERY PLAN " + entry.sql, params).fetchall()
+                    plans.append([r["detail"] for r in rows])
+                except sqlite3.Error:
+                    # executemany parameters are not kept, so placeholders cannot be bound
+                    plans.append(None)
+            return plans
+        finally:
+            conn.close()
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "slow_query_ms": self.slow_ms,
+                "repeat_limit": self.repeat_limit,
+                "totals": dict(self._stats),
+                "recent": list(reversed(self._findings)),
+            }
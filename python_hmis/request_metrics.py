@@ -0,0 +1,163 @@
+"""
+Per-route request metrics, exposed in Prometheus text format at /metrics.
+
+For every request: latency histogram, status counts, bytes out and the split
+between time spent in SQLite (pooled reads plus waiting on the writer, see
+``db_pool.take_db_time``) and everything else. Routes are labelled by their
+URL rule (``/api/patients/<usn>/chart``), so label cardinality stays fixed;
+unmatched URLs share ``<unmatched>``. Streamed responses (CSV exports) are
+timed and counted until the last chunk is sent.
+
+The bookkeeping is a few dict and list updates under one lock, cheap enough
+to leave on; ``benchmarks/bench_request_metrics.py`` measures it. Set
+``HMIS_REQUEST_METRICS=0`` to turn it off.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from flask import Flask, Response, g, request
+
+from db_pool import take_db_time
+
+# Upper bounds in seconds; +Inf is implied
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def metrics_enabled_from_env() -> bool:
+    return os.environ.get("HMIS_REQUEST_METRICS", "1") not in ("0", "false", "off")
+
+
+class _RouteStats:
+    __slots__ = ("buckets", "count", "seconds", "db_seconds", "bytes_out", "statuses")
+
+    def __init__(self) -> None:
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.db_seconds = 0.0
+        self.bytes_out = 0
+        self.statuses: Dict[int, int] = {}
+
+    def copy(self) -> "_RouteStats":
+        other = _RouteStats()
+        other.buckets = list(self.buckets)
+        other.count, other.seconds, other.db_seconds = self.count, self.seconds, self.db_seconds
+        other.bytes_out, other.statuses = self.bytes_out, dict(self.statuses)
+        return other
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class RequestMetrics:
+    def __init__(self) -> None:
+        self._routes: Dict[Tuple[str, str], _RouteStats] = {}
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app: Flask) -> None:
+        # First before_request hook, so the other hooks are timed as well
+        app.before_request_funcs.setdefault(None, []).insert(0, self._before)
+        app.after_request(self._after)
+        app.teardown_request(self._teardown)
+
+    def _before(self) -> None:
+        take_db_time()
+        g._metrics = [time.perf_counter(), 500, 0]  # start, status, bytes out
+        with self._lock:
+            self._in_flight += 1
+
+    def _after(self, response: Response) -> Response:
+        state = g.get("_metrics")
+        if state is None:
+            return response
+        state[1] = response.status_code
+        if response.is_streamed:
+            response.response = _counting(response.response, state)
+        else:
+            state[2] = response.content_length or 0
+        return response
+
+    def _teardown(self, exc: Optional[BaseException] = None) -> None:
+        state = g.pop("_metrics", None)
+        if state is None:
+            return
+        elapsed = time.perf_counter() - state[0]
+        db_seconds = take_db_time()
+        rule = request.url_rule
+        key = (request.method, rule.rule if rule is not None else "<unmatched>")
+        # GeneratorExit: the client stopped reading a stream, not a server error
+        status = 500 if exc is not None and not isinstance(exc, GeneratorExit) else state[1]
+        with self._lock:
+            self._in_flight -= 1
+            stats = self._routes.get(key)
+            if stats is None:
+                stats = self._routes[key] = _RouteStats()
+            stats.buckets[bisect_left(BUCKETS, elapsed)] += 1
+            stats.count += 1
+            stats.seconds += elapsed
+            stats.db_seconds += db_seconds
+            stats.bytes_out += state[2]
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+    def render(self) -> str:
+        with self._lock:
+            routes = [(key, s.copy()) for key, s in sorted(self._routes.items())]
+            in_flight = self._in_flight
+
+        def labels(key: Tuple[str, str]) -> str:
+            return f'method="{key[0]}",route="{_label(key[1])}"'
+
+        out: List[str] = [
+            "# HELP hmis_http_request_duration_seconds Request latency by route.",
+            "# TYPE hmis_http_request_duration_seconds histogram",
+        ]
+        for key, s in routes:
+            cumulative = 0
+            for bound, n in zip(BUCKETS, s.buckets):
+                cumulative += n
+                out.append(f'hmis_http_request_duration_seconds_bucket{{{labels(key)},le="{bound}"}} {cumulative}')
+            out.append(f'hmis_http_request_duration_seconds_bucket{{{labels(key)},le="+Inf"}} {s.count}')
+            out.append(f"hmis_http_request_duration_seconds_sum{{{labels(key)}}} {s.seconds:.6f}")
+            out.append(f"hmis_http_request_duration_seconds_count{{{labels(key)}}} {s.count}")
+
+        out += ["# HELP hmis_http_requests_total Requests by route and status.",
+                "# TYPE hmis_http_requests_total counter"]
+        for key, s in routes:
+            for status, n in sorted(s.statuses.items()):
+                out.append(f'hmis_http_requests_total{{{labels(key)},status="{status}"}} {n}')
+
+        for name, help_text, value in (
+            ("hmis_http_request_db_seconds_total", "Time spent in SQLite, by route.",
+             lambda s: f"{s.db_seconds:.6f}"),
+            ("hmis_http_request_python_seconds_total", "Request time outside SQLite, by route.",
+             lambda s: f"{max(s.seconds - s.db_seconds, 0.0):.6f}"),
+            ("hmis_http_response_bytes_total", "Response body bytes sent, by route.",
+             lambda s: str(s.bytes_out)),
+        ):
+            out += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            out += [f"{name}{{{labels(key)}}} {value(s)}" for key, s in routes]
+
+        out += ["# HELP hmis_http_requests_in_flight Requests currently being served.",
+                "# TYPE hmis_http_requests_in_flight gauge",
+                f"hmis_http_requests_in_flight {in_flight}"]
+        return "\n".join(out) + "\n"
+
+
+def _counting(body: Iterable[bytes], state: list) -> Iterator[bytes]:
+    try:
+        for chunk in body:
+            state[2] += len(chunk.encode() if isinstance(chunk, str) else chunk)
+            yield chunk
+    finally:
+        # The stream's close() is what ends a stream_with_context request
+        close = getattr(body, "close", None)
+        if close is not None:
+            close()
@@ -0,0 +1,183 @@
+"""
+In-process response cache for the read-mostly JSON endpoints.
+
+Views decorated with ``@cache.cached("table", ...)`` have their 200 GET
+responses stored under (path, sorted query string), together with the
+generation of every table the response was built from. Write paths call
+``cache.bump("table", ...)`` after they commit; that makes every entry built
+from an older generation stale, so there is no per-route invalidation list
+to keep in sync. Patient deletes cascade everywhere and use ``bump_all()``.
+
+Hits are served from memory with a strong ETag; a matching If-None-Match
+gets ``304 Not Modified`` without touching the database. Entries are
+evicted least-recently-used once the cache holds ``max_bytes``.
+
+The generations live in this process only: writes made by another process
+(or by hand in the sqlite shell) are not seen until the next local write to
+the same table. Set ``HMIS_RESPONSE_CACHE_MB=0`` to disable the cache.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from flask import Response, request
+
+
+class _Entry(NamedTuple):
+    generations: Tuple[int, ...]
+    etag: str
+    body: bytes
+    status: int
+    headers: List[Tuple[str, str]]
+
+
+class ResponseCache:
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        # A single entry may use at most this share of the cache
+        self.max_entry_bytes = max_bytes // 4
+        self._entries: "OrderedDict[Tuple[Any, ...], _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._generations: Dict[str, int] = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "not_modified": 0,
+            "misses": 0,
+            "stale": 0,
+            "stores": 0,
+            "evictions": 0,
+            "too_large": 0,
+            "bumps": 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def bump(self, *tables: str) -> None:
+        """Mark ``tables`` as changed. Call after the write has committed."""
+        with self._lock:
+            for table in tables:
+                self._generations[table] = self._generations.get(table, 0) + 1
+            self._stats["bumps"] += 1
+
+    def bump_all(self) -> None:
+        with self._lock:
+            self._epoch += 1
+            self._stats["bumps"] += 1
+
+    def _snapshot(self, tables: Tuple[str, ...]) -> Tuple[int, ...]:
+        gens = self._generations
+        return (self._epoch, *(gens.get(t, 0) for t in tables))
+
+    def _lookup(self, key: Tuple[Any, ...], tables: Tuple[str, ...]) -> Tuple[Optional[_Entry], Tuple[int, ...]]:
+        with self._lock:
+            current = self._snapshot(tables)
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None, current
+            if entry.generations != current:
+                self._stats["stale"] += 1
+                self._discard(key)
+                return None, current
+            self._entries.move_to_end(key)
+            return entry, current
+
+    def _discard(self, key: Tuple[Any, ...]) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= len(entry.body)
+
+    def _store(self, key: Tuple[Any, ...], entry: _Entry) -> None:
+        size = len(entry.body)
+        with self._lock:
+            if size > self.max_entry_bytes:
+                self._stats["too_large"] += 1
+                return
+            if key in self._entries:
+                self._discard(key)
+            while self._entries and self._bytes + size > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+            self._entries[key] = entry
+            self._bytes += size
+            self._stats["stores"] += 1
+
+    def _respond(self, entry: _Entry, hit: bool) -> Response:
+        if request.if_none_match.contains(entry.etag.strip('"')):
+            with self._lock:
+                self._stats["not_modified"] += 1
+            response = Response(status=304)
+        else:
+            if hit:
+                with self._lock:
+                    self._stats["hits"] += 1
+            response = Response(entry.body, status=entry.status, headers=entry.headers)
+        response.headers["ETag"] = entry.etag
+        # Let browsers keep the body but revalidate before every use
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["X-Cache"] = "HIT" if hit else "MISS"
+        return response
+
+    def cached(self, *tables: str, vary: Optional[Callable[[], Any]] = None):
+        """Cache a view's GET responses; ``tables`` are the tables it reads.
+
+        ``vary`` adds something besides the URL to the key (e.g. today's date).
+        """
+        def decorator(view: Callable[..., Any]):
+            @wraps(view)
+            def wrapper(*args: Any, **kwargs: Any):
+                if request.method != "GET" or not self.enabled:
+                    return view(*args, **kwargs)
+                key = (request.path, tuple(sorted(request.args.items(multi=True))),
+                       vary() if vary else None)
+                entry, generations = self._lookup(key, tables)
+                if entry is not None:
+                    return self._respond(entry, hit=True)
+
+                # generations were read before the view ran, so a write that
+                # lands meanwhile leaves this entry stale rather than wrong
+                response = _as_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                body = response.get_data()
+                etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+                headers = [(k, v) for k, v in response.headers.items() if k != "Content-Length"]
+                entry = _Entry(generations, etag, body, response.status_code, headers)
+                self._store(key, entry)
+                return self._respond(entry, hit=False)
+            return wrapper
+        return decorator
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out.update({
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "generations": dict(self._generations, _all=self._epoch),
+            })
+        return out
+
+
+def _as_response(rv: Any) -> Response:
+    from flask import current_app
+    return current_app.make_response(rv)
+
+
+def cache_config_from_env() -> int:
+    """Cache size in bytes from ``HMIS_RESPONSE_CACHE_MB`` (default 32 MB)."""
+    return int(float(os.environ.get("HMIS_RESPONSE_CACHE_MB", "32")) * 1024 * 1024)
@@ -0,0 +1,191 @@
+"""
+Ranked full-text search over patients, case reports and prescriptions.
+
+The FTS5 indexes are created and kept in sync by triggers in migration 6
+(patients: migration 13).
+Two modes are offered:
+
+* ``prefix``: every word must start a word in the record ("ash ra" finds
+  "Asha Rao"). Uses the ``<table>_fts`` word index.
+* ``trigram``: every word must appear as a substring ("arma" finds
+  "Sharma"). Uses the ``<table>_trigram`` index. If that finds nothing for
+  a type, it retries allowing one typo per word (swapped, extra, missing or
+  wrong letter), so "Shrama", "Sharmma" and "Sherma" still find "Sharma".
+  The best trigram hits by bm25 are re-ranked by spelling similarity to
+  the query.
+
+Words shorter than three characters cannot be matched by the trigram
+tokenizer; trigram mode falls back to prefix mode when no longer word is
+given.
+"""
+from __future__ import annotations
+
+import re
+import sqlite3
+from typing import Any, Callable, Dict, List, NamedTuple, Sequence, Set
+
+from migrations import SEARCH_CONTENT, SEARCH_INDEXES, SEARCH_INDEX_OPTIONS
+
+MODES = ("prefix", "trigram")
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+# Best trigram hits by bm25 re-ranked in Python per type
+TRIGRAM_CANDIDATES = 200
+
+
+class SearchType(NamedTuple):
+    alias: str
+    # Select list over the source table; {fts} is replaced by the index table
+    columns: str
+    to_json: Callable[[sqlite3.Row, float], Dict[str, Any]]
+
+
+SEARCH_TYPES: Dict[str, SearchType] = {
+    "patients": SearchType(
+        "p", "p.usn, p.full_name, p.age, p.gender, p.contact",
+        lambda r, score: {
+            "usn": r["usn"], "fullName": r["full_name"], "age": r["age"],
+            "gender": r["gender"], "contact": r["contact"], "score": score,
+        },
+    ),
+    "case_reports": SearchType(
+        "c", "c.id, c.report_number, c.usn, c.patient_name, c.created_at, "
+             "snippet({fts}, -1, '[', ']', '...', 12) AS snippet",
+        lambda r, score: {
+            "id": r["id"], "report_number": r["report_number"], "usn": r["usn"],
+            "patient_name": r["patient_name"], "created_at": r["created_at"],
+            "snippet": r["snippet"], "score": score,
+        },
+    ),
+    "prescriptions": SearchType(
+        "r", "r.id, r.usn, r.diagnosis, r.prescribed_at, r.patient_name, "
+             "snippet({fts}, -1, '[', ']', '...', 12) AS snippet",
+        lambda r, score: {
+            "id": r["id"], "usn": r["usn"], "diagnosis": r["diagnosis"],
+            "prescribedAt": r["prescribed_at"], "patientName": r["patient_name"],
+            "snippet": r["snippet"], "score": score,
+        },
+    ),
+}
+
+
+def words(q: str) -> List[str]:
+    return re.findall(r"\w+", q.lower())
+
+
+def _quote(term: str) -> str:
+    # \w+ words never contain quotes, but keep FTS5 string syntax honest anyway
+    return '"' + term.replace('"', '""') + '"'
+
+
+def prefix_query(terms: Sequence[str]) -> str:
+    return " ".join(_quote(t) + "*" for t in terms)
+
+
+def substring_query(terms: Sequence[str]) -> str:
+    return " ".join(_quote(t) for t in terms if len(t) >= 3)
+
+
+def _near_misses(term: str) -> str:
+    """FTS5 OR-group matching ``term`` give or take one typo.
+
+    Swapped neighbours and one extra letter are matched as whole substrings;
+    a missing or wrong letter as the two pieces either side of it.
+    """
+    if len(term) < 4:
+        return _quote(term)
+    alts = {term}
+    alts.update(term[:i] + term[i + 1] + term[i] + term[i + 2:] for i in range(len(term) - 1))
+    alts.update(term[:i] + term[i + 1:] for i in range(len(term)))
+    options = [_quote(a) for a in sorted(alts) if len(a) >= 3]
+    pieces = set()
+    for i in range(1, len(term)):
+        for left, right in ((term[:i], term[i:]), (term[:i], term[i + 1:])):
+            kept = tuple(p for p in (left, right) if len(p) >= 3)
+            if kept:
+                pieces.add(kept)
+    options += ["(" + " AND ".join(_quote(p) for p in kept) + ")" for kept in sorted(pieces)]
+    return "(" + " OR ".join(options) + ")"
+
+
+def fuzzy_query(terms: Sequence[str]) -> str:
+    return " AND ".join(_near_misses(t) for t in terms if len(t) >= 3)
+
+
+def _grams(word: str) -> Set[str]:
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(terms: Sequence[str], text: str) -> float:
+    """Mean over ``terms`` of the best trigram Jaccard against any word of ``text`` (0..1)."""
+    text_grams = [_grams(w) for w in set(words(text))]
+    total = 0.0
+    for term in terms:
+        g = _grams(term)
+        total += max((len(g & w) / len(g | w) for w in text_grams), default=0.0)
+    return total / len(terms)
+
+
+def _select(name: str, fts: str, ranked: bool) -> str:
+    kind = SEARCH_TYPES[name]
+    key, columns = SEARCH_INDEXES[name]
+    select = kind.columns.format(fts=fts)
+    if ranked:
+        select += ", f.rank"
+    else:
+        text = " || ' ' || ".join(f"coalesce({kind.alias}.{c}, '')" for c in columns)
+        select += f", {text} AS search_text"
+    source = SEARCH_CONTENT.get(name, name)
+    return (f"SELECT {select} FROM {fts} f JOIN {source} {kind.alias} "
+            f"ON {kind.alias}.{key} = f.rowid WHERE {fts} MATCH ?")
+
+
+def _ranked(conn: sqlite3.Connection, name: str, match: str, limit: int) -> List[Dict[str, Any]]:
+    rows = conn.execute(_select(name, f"{name}_fts", True) + " ORDER BY f.rank LIMIT ?",
+                        (match, limit)).fetchall()
+    # bm25 is lower-is-better; flip it so clients can sort descending
+    return [SEARCH_TYPES[name].to_json(r, round(-r["rank"], 4)) for r in rows]
+
+
+def _by_similarity(conn: sqlite3.Connection, name: str, match: str, terms: Sequence[str],
+                   limit: int) -> List[Dict[str, Any]]:
+    # Spelling similarity is computed in Python, too slow for every hit of a
+    # common substring, so SQLite picks the best candidates by bm25 first
+    # (shorter records with more matching trigrams) and only those are re-ranked.
+    rows = conn.execute(_select(name, f"{name}_trigram", False) + " ORDER BY f.rank LIMIT ?",
+                        (match, TRIGRAM_CANDIDATES)).fetchall()
+    scored = sorted(((similarity(terms, r["search_text"]), r) for r in rows),
+                    key=lambda pair: pair[0], reverse=True)
+    return [SEARCH_TYPES[name].to_json(r, round(score, 4)) for score, r in scored[:limit]]
+
+
+def search(conn: sqlite3.Connection, q: str, mode: str = "prefix",
+           types: Sequence[str] = tuple(SEARCH_TYPES), limit: int = DEFAULT_LIMIT) -> Dict[str, List[Dict[str, Any]]]:
+    terms = words(q)
+    results: Dict[str, List[Dict[str, Any]]] = {t: [] for t in types}
+    if not terms:
+        return results
+    if mode == "trigram" and not substring_query(terms):
+        mode = "prefix"
+    for name in types:
+        if mode == "prefix":
+            results[name] = _ranked(conn, name, prefix_query(terms), limit)
+            continue
+        hits = _by_similarity(conn, name, substring_query(terms), terms, limit)
+        results[name] = hits or _by_similarity(conn, name, fuzzy_query(terms), terms, limit)
+    return results
+
+
+def rebuild_indexes(conn: sqlite3.Connection) -> None:
+    """Re-derive every search index from its table, on suspected drift."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for table in SEARCH_INDEXES:
+            for suffix in SEARCH_INDEX_OPTIONS:
+                fts = f"{table}_{suffix}"
+                conn.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
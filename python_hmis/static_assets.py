@@ -0,0 +1,122 @@
+"""
+In-memory, precompressed static files for the SPA.
+
+Files are read once at startup, compressed with gzip (and brotli when the
+optional ``brotli`` package is installed) and served from memory with the
+best encoding the client accepts, so a page load never touches the disk.
+
+Every asset is also reachable at ``assets/<content hash>/<name>``; those URLs
+never change meaning, so they are sent with a one-year immutable
+Cache-Control. HTML pages have their ``./<asset>`` references rewritten to
+the hashed URLs and are themselves served with ``no-cache`` plus a strong
+ETag, so a reload costs one 304 and nothing else.
+
+Edits to the files on disk are picked up on the next restart.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import mimetypes
+import os
+from typing import Dict, Optional
+
+from flask import Response, request
+
+try:
+    import brotli  # optional, see requirements-optional.txt
+except ImportError:
+    brotli = None
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Compressed variants that save less than this are not worth a Content-Encoding
+MIN_SAVING = 0.1
+# Preferred first when the client accepts several
+ENCODINGS = ("br", "gzip")
+
+
+class Asset:
+    def __init__(self, name: str, body: bytes) -> None:
+        self.name = name
+        self.mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        self.digest = hashlib.blake2b(body, digest_size=8).hexdigest()
+        self.variants: Dict[str, bytes] = {"": body}
+        compressed = {"gzip": gzip.compress(body, 9, mtime=0)}
+        if brotli is not None:
+            compressed["br"] = brotli.compress(body, quality=11)
+        for encoding, data in compressed.items():
+            if len(data) <= len(body) * (1 - MIN_SAVING):
+                self.variants[encoding] = data
+
+    @property
+    def url(self) -> str:
+        return f"assets/{self.digest}/{self.name}"
+
+    def etag(self, encoding: str) -> str:
+        # Strong ETags must differ per representation
+        return f'"{self.digest}-{encoding}"' if encoding else f'"{self.digest}"'
+
+
+class StaticAssets:
+    def __init__(self) -> None:
+        self._by_name: Dict[str, Asset] = {}
+
+    def add(self, name: str, *dirs: str) -> Optional[Asset]:
+        """Load ``name`` from the first of ``dirs`` that has it; None if none do.
+
+        HTML files get ``./<name>`` references to already-added assets
+        rewritten to their hashed URLs, so add those assets first.
+        """
+        for directory in dirs:
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                break
+        else:
+            return None
+        with open(path, "rb") as f:
+            body = f.read()
+        if name.endswith(".html"):
+            for other in self._by_name.values():
+                body = body.replace(f"./{other.name}".encode(), f"./{other.url}".encode())
+        return self._register(Asset(name, body))
+
+    def add_dir(self, directory: str, prefix: str) -> None:
+        """Load every file under ``directory`` as ``<prefix><relative path>``."""
+        for root, _dirs, files in os.walk(directory):
+            for filename in files:
+                rel = os.path.relpath(os.path.join(root, filename), directory).replace(os.sep, "/")
+                with open(os.path.join(root, filename), "rb") as f:
+                    self._register(Asset(prefix + rel, f.read()))
+
+    def _register(self, asset: Asset) -> Asset:
+        self._by_name[asset.name] = asset
+        return asset
+
+    def get(self, name: str) -> Optional[Asset]:
+        return self._by_name.get(name)
+
+    def get_hashed(self, digest: str, name: str) -> Optional[Asset]:
+        # A stale digest (file changed since the page was built) is a miss
+        asset = self._by_name.get(name)
+        return asset if asset is not None and asset.digest == digest else None
+
+    def response(self, asset: Asset, immutable: bool = False) -> Response:
+        accepted = request.accept_encodings
+        encoding = next((e for e in ENCODINGS if e in asset.variants and accepted[e] > 0), "")
+        etag = asset.etag(encoding)
+        if request.if_none_match.contains(etag.strip('"')):
+            response = Response(status=304)
+        else:
+            response = Response(asset.variants[encoding], mimetype=asset.mimetype)
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
+        response.headers["ETag"] = etag
+        response.headers["Vary"] = "Accept-Encoding"
+        response.headers["Cache-Control"] = IMMUTABLE if immutable else "no-cache"
+        return response
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            name: {encoding or "identity": len(data) for encoding, data in asset.variants.items()}
+            for name, asset in sorted(self._by_name.items())
+        }
@@ -0,0 +1,358 @@
+"""
+Set-based bulk ingest for the /api/sync/* endpoints.
+
+An offline client posts its whole backlog in one request. Instead of probing
+and inserting record by record, a batch is:
+
+1. validated and normalised in memory (bad records become error reports),
+2. checked against ``patients`` with one set-based lookup,
+3. written with ``executemany`` inside a single explicit transaction,
+   carrying rowversions from one block reserved in ``change_seq``.
+
+If SQLite still rejects a record (say a unique clash validation cannot see),
+the transaction is rolled back and the batch replayed record by record so
+only the offending records are reported.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+MAX_ERRORS_REPORTED = 500
+
+
+class SyncSpec(NamedTuple):
+    entity: str
+    # Client field that identifies a record in error reports
+    key_field: str
+    columns: Tuple[str, ...]
+    # Returns the record's parameters in ``columns`` order
+    normalise: Callable[[Dict[str, Any]], Tuple[Any, ...]]
+    # "require": unknown usn is an error; "create": add a placeholder patient
+    patient_mode: Optional[str]
+    conflict_sql: str
+
+
+class IngestResult:
+    def __init__(self, total: int) -> None:
+        self.total = total
+        self.synced = 0
+        self.skipped = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    def skip(self, index: int, key: Any, message: str) -> None:
+        self.skipped += 1
+        self.errors.append({"index": index, "key": key, "error": message})
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "status": "success",
+            "synced_count": self.synced,
+            "total_received": self.total,
+            "skipped_count": self.skipped,
+            "errors": sorted(self.errors, key=lambda e: e["index"])[:MAX_ERRORS_REPORTED],
+            "errors_truncated": len(self.errors) > MAX_ERRORS_REPORTED,
+        }
+
+
+# --- Field coercion ---
+
+def _text(value: Any) -> str:
+    return "" if value is None else str(value).strip()
+
+
+def _opt_text(value: Any) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+def _number(rec: Dict[str, Any], field: str, cast: Callable[[Any], Any]) -> Any:
+    value = rec.get(field)
+    if type(value) in (int, float):
+        return cast(value)
+    if value is None or _text(value) == "":
+        raise ValueError(f"{field} required")
+    try:
+        return cast(float(value)) if cast is int else cast(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be numeric")
+
+
+def _opt_number(rec: Dict[str, Any], field: str, cast: Callable[[Any], Any]) -> Any:
+    value = rec.get(field)
+    if value is None or _text(value) == "":
+        return None
+    return _number(rec, field, cast)
+
+
+def _record_id(rec: Dict[str, Any]) -> Optional[int]:
+    value = rec.get("id")
+    if value is None or _text(value) == "":
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError("id must be an integer")
+
+
+def _required(rec: Dict[str, Any], field: str) -> str:
+    value = _text(rec.get(field))
+    if not value:
+        raise ValueError(f"{field} required")
+    return value
+
+
+# --- Normalisers (client camelCase -> DB parameter tuples) ---
+# Each returns its row already in the order of the matching *_COLUMNS tuple
+# below, so the batch goes to executemany without a per-record dict.
+
+def _patient(rec: Dict[str, Any]) -> Tuple[Any, ...]:
+    usn = _required(rec, "usn")
+    full_name = _required(rec, "fullName")
+    age_val = rec.get("age")
+    try:
+        age = int(float(age_val)) if _text(age_val) else 0
+    except (TypeError, ValueError):
+        age = 0
+    return (
+        usn,
+        full_name,
+        age,
+        _text(rec.get("gender")) or "Unknown",
+        _text(rec.get("contact") or rec.get("phone")),
+        _text(rec.get("address")),
+    )
+
+
+def _vital(rec: Dict[str, Any]) -> Tuple[Any, ...]:
+    return (
+        _record_id(rec),
+        _required(rec, "usn"),
+        _number(rec, "weight", float),
+        _number(rec, "height", float),
+        _number(rec, "bloodPressureSystolic", int),
+        _number(rec, "bloodPressureDiastolic", int),
+        _number(rec, "heartRate", int),
+        _number(rec, "temperature", float),
+        _opt_number(rec, "respiratoryRate", int),
+        _opt_number(rec, "oxygenSaturation", int),
+        _opt_text(rec.get("notes")),
+        _required(rec, "recordedAt"),
+        _text(rec.get("recordedBy")) or "System User",
+    )
+
+
+def _prescription(rec: Dict[str, Any]) -> Tuple[Any, ...]:
+    return (
+        _record_id(rec),
+        _required(rec, "usn"),
+        _text(rec.get("diagnosis")),
+        json.dumps(rec.get("medications") or []),
+        _text(rec.get("notes")),
+        _opt_text(rec.get("followUpDate")),
+        _required(rec, "prescribedAt"),
+        _text(rec.get("prescribedBy")) or "NHCE Clinic",
+        _text(rec.get("status")) or "Active",
+        rec.get("patientName"),
+        _opt_number(rec, "patientAge", int),
+        rec.get("patientGender"),
+    )
+
+
+def _case_report(rec: Dict[str, Any]) -> Tuple[Any, ...]:
+    return (
+        _record_id(rec),
+        _required(rec, "reportNumber"),
+        _required(rec, "usn"),
+        rec.get("patientName"),
+        _opt_number(rec, "patientAge", int),
+        rec.get("patientGender"),
+        rec.get("reportType") or "medical",
+        rec.get("chiefComplaint"),
+        rec.get("historyOfPresentIllness"),
+        rec.get("pastMedicalHistory"),
+        rec.get("familyHistory"),
+        rec.get("socialHistory"),
+        rec.get("physicalExamination"),
+        rec.get("investigations"),
+        rec.get("diagnosis"),
+        rec.get("treatment"),
+        rec.get("prognosis"),
+        rec.get("recommendations"),
+        rec.get("followUp"),
+        rec.get("doctorName"),
+        rec.get("reportDate"),
+        rec.get("status") or "Active",
+        rec.get("createdAt") or datetime.utcnow().isoformat(),
+    )
+
+
+def _sick_intimation(rec: Dict[str, Any]) -> Tuple[Any, ...]:
+    return (
+        _record_id(rec),
+        _required(rec, "intimationNumber"),
+        _required(rec, "usn"),
+        rec.get("patientName"),
+        _opt_number(rec, "patientAge", int),
+        rec.get("patientGender"),
+        rec.get("caseReportId"),
+        _required(rec, "sickLeaveFrom"),
+        _required(rec, "sickLeaveTo"),
+        _opt_number(rec, "totalDays", int),
+        _required(rec, "reason"),
+        rec.get("symptoms"),
+        1 if rec.get("restRecommended", True) else 0,
+        rec.get("doctorName"),
+        rec.get("issueDate"),
+        rec.get("status") or "Active",
+        rec.get("createdAt") or datetime.utcnow().isoformat(),
+    )
+
+
+def _upsert_sql(table: str, columns: Tuple[str, ...], conflict: str) -> str:
+    # Upserts rather than INSERT OR REPLACE: REPLACE deletes the old row,
+    # which cascades to child tables and skips DELETE triggers. The batch's
+    # own rowversion/updated_at ride along (see _write), so the change-tracking
+    # triggers have nothing left to stamp.
+    columns = columns + STAMP_COLUMNS
+    cols = ", ".join(columns)
+    marks = ", ".join("?" for _ in columns)
+    updates = ", ".join(f"{c}=excluded.{c}" for c in columns if c not in ("id", conflict))
+    return (
+        f"INSERT INTO {table}({cols}) VALUES({marks}) "
+        f"ON CONFLICT({conflict}) DO UPDATE SET {updates}"
+    )
+
+
+STAMP_COLUMNS = ("rowversion", "updated_at")
+PATIENT_COLUMNS = ("usn", "full_name", "age", "gender", "contact", "address")
+VITAL_COLUMNS = (
+    "id", "usn", "weight", "height", "blood_pressure_systolic", "blood_pressure_diastolic",
+    "heart_rate", "temperature", "respiratory_rate", "oxygen_saturation", "notes",
+    "recorded_at", "recorded_by",
+)
+PRESCRIPTION_COLUMNS = (
+    "id", "usn", "diagnosis", "medications", "notes", "follow_up_date", "prescribed_at",
+    "prescribed_by", "status", "patient_name", "patient_age", "patient_gender",
+)
+CASE_REPORT_COLUMNS = (
+    "id", "report_number", "usn", "patient_name", "patient_age", "patient_gender", "report_type",
+    "chief_complaint", "history_of_present_illness", "past_medical_history", "family_history",
+    "social_history", "physical_examination", "investigations", "diagnosis", "treatment", "prognosis",
+    "recommendations", "follow_up", "doctor_name", "report_date", "status", "created_at",
+)
+SICK_INTIMATION_COLUMNS = (
+    "id", "intimation_number", "usn", "patient_name", "patient_age", "patient_gender", "case_report_id",
+    "sick_leave_from", "sick_leave_to", "total_days", "reason", "symptoms", "rest_recommended",
+    "doctor_name", "issue_date", "status", "created_at",
+)
+
+PATIENTS = SyncSpec("patient", "usn", PATIENT_COLUMNS, _patient, None,
+                    _upsert_sql("patients", PATIENT_COLUMNS, "usn"))
+VITALS = SyncSpec("vital", "id", VITAL_COLUMNS, _vital, "require",
+                  _upsert_sql("vitals", VITAL_COLUMNS, "id"))
+PRESCRIPTIONS = SyncSpec("prescription", "id", PRESCRIPTION_COLUMNS, _prescription, "require",
+                         _upsert_sql("prescriptions", PRESCRIPTION_COLUMNS, "id"))
+CASE_REPORTS = SyncSpec("case report", "reportNumber", CASE_REPORT_COLUMNS, _case_report, "create",
+                        _upsert_sql("case_reports", CASE_REPORT_COLUMNS, "report_number"))
+SICK_INTIMATIONS = SyncSpec("sick intimation", "intimationNumber", SICK_INTIMATION_COLUMNS,
+                            _sick_intimation, "create",
+                            _upsert_sql("sick_intimations", SICK_INTIMATION_COLUMNS, "intimation_number"))
+
+
+# --- Ingest ---
+
+def existing_usns(conn: sqlite3.Connection, usns: Iterable[str]) -> Set[str]:
+    """Resolve which of ``usns`` exist with one statement, whatever the batch size."""
+    payload = json.dumps(sorted(set(usns)))
+    rows = conn.execute(
+        "SELECT usn FROM patients WHERE usn IN (SELECT value FROM json_each(?))",
+        (payload,),
+    ).fetchall()
+    return {r[0] for r in rows}
+
+
+def _write(conn: sqlite3.Connection, spec: SyncSpec, placeholders: List[Tuple[Any, ...]],
+           rows: List[Tuple[int, Any, Tuple[Any, ...]]], result: IngestResult, row_by_row: bool) -> None:
+    if placeholders:
+        # Minimal placeholder patients for records synced before their patient
+        conn.executemany(
+            "INSERT OR IGNORE INTO patients(usn, full_name, age, gender, contact, address) VALUES(?,?,?,?,?,?)",
+            placeholders,
+        )
+    # One change_seq bump for the whole batch instead of one per row; the
+    # rows take consecutive versions from the reserved block
+    first, now = conn.execute(
+        "UPDATE change_seq SET seq = seq + ? WHERE id = 1 "
+        "RETURNING seq - ? + 1, strftime('%Y-%m-%dT%H:%M:%f', 'now')",
+        (len(rows), len(rows)),
+    ).fetchone()
+    if not row_by_row:
+        conn.executemany(spec.conflict_sql, (
+            params + (first + n, now) for n, (_, _, params) in enumerate(rows)
+        ))
+        result.synced += len(rows)
+        return
+    # Each failing statement rolls back on its own, so the rest of the batch stands
+    for n, (index, key, params) in enumerate(rows):
+        try:
+            conn.execute(spec.conflict_sql, params + (first + n, now))
+            result.synced += 1
+        except sqlite3.Error as e:
+            result.skip(index, key, str(e))
+
+
+def ingest(conn: sqlite3.Connection, spec: SyncSpec, records: List[Any]) -> IngestResult:
+    result = IngestResult(len(records))
+
+    usn_pos = spec.columns.index("usn")
+    create = spec.patient_mode == "create"
+    age_pos = spec.columns.index("patient_age") if create else None
+    normalise, key_field = spec.normalise, spec.key_field
+    rows: List[Tuple[int, Any, Tuple[Any, ...]]] = []
+    placeholders: Dict[str, Tuple[Any, ...]] = {}
+    for index, rec in enumerate(records):
+        if not isinstance(rec, dict):
+            result.skip(index, None, f"Expected {spec.entity} object")
+            continue
+        key = rec.get(key_field)
+        try:
+            params = normalise(rec)
+        except ValueError as e:
+            result.skip(index, key, str(e))
+            continue
+        rows.append((index, key, params))
+        if create and params[usn_pos] not in placeholders:
+            placeholders[params[usn_pos]] = (
+                params[usn_pos], rec.get("patientName") or "Unknown",
+                params[age_pos] or 0, rec.get("patientGender") or "Unknown", "", "",
+            )
+
+    if spec.patient_mode:
+        known = existing_usns(conn, (params[usn_pos] for _, _, params in rows))
+        if spec.patient_mode == "require":
+            kept = []
+            for row in rows:
+                if row[2][usn_pos] in known:
+                    kept.append(row)
+                else:
+                    result.skip(row[0], row[1], "Patient not found")
+            rows = kept
+        else:
+            placeholders = {u: p for u, p in placeholders.items() if u not in known}
+
+    for row_by_row in (False, True):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _write(conn, spec, list(placeholders.values()), rows, result, row_by_row)
+            conn.commit()
+            return result
+        except sqlite3.Error:
+            conn.rollback()
+            if row_by_row:
+                raise
+            # Something validation could not catch (e.g. a unique clash);
+            # replay the batch record by record to pinpoint it
+            result.synced = 0
+    return result
@@ -0,0 +1,425 @@
+"""
+Vitals analytics for GET /api/analytics/vitals.
+
+The vitals table is mirrored in memory as NumPy columns (``VitalsColumns``):
+id, patient code, time in seconds since 2000-01-01 and the seven measures as
+int16 tenths (-1 when missing), about 30 bytes a row. The first request loads
+it in chunks; after that each request only reads the rows stamped since the
+last one (``rowversion``) and the vitals tombstones, both from the delta-sync
+change tracking, so a refresh costs as much as the change since the previous
+request.
+
+Every statistic is then computed over whole arrays: percentiles from value
+histograms (exact to 0.1 units), BP categories and out-of-range flags from
+vectorised masks, and per-patient least-squares slopes from ``np.bincount``
+sums. No per-row Python runs after loading.
+
+NumPy is optional (requirements-optional.txt); without it the endpoint answers
+501 and the rest of the app is unaffected.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+try:
+    import numpy as np  # optional, see requirements-optional.txt
+except ImportError:
+    np = None
+
+# API name -> vitals column, in storage order
+METRICS = {
+    "weight": "weight",
+    "bmi": "bmi",
+    "systolic": "blood_pressure_systolic",
+    "diastolic": "blood_pressure_diastolic",
+    "heart_rate": "heart_rate",
+    "temperature": "temperature",
+    "spo2": "oxygen_saturation",
+}
+# Reference ranges (inclusive) behind the out-of-range flags; None is open-ended.
+# Temperature is in °F, as recorded by the app.
+NORMAL_RANGES: Dict[str, Tuple[Optional[float], Optional[float]]] = {
+    "bmi": (18.5, 24.9),
+    "systolic": (90, 139),
+    "diastolic": (60, 89),
+    "heart_rate": (60, 100),
+    "temperature": (97.0, 99.5),
+    "spo2": (95, None),
+}
+# (systolic, diastolic) lower bounds; either reading reaching a bound puts it in that category
+BP_HIGH = (140, 90)
+BP_ELEVATED = (120, 80)
+BP_NORMAL_MIN = (90, 60)
+BP_CATEGORIES = ("Low", "Normal", "Elevated", "High")
+
+PERCENTILES = (5, 25, 50, 75, 95)
+DEFAULT_WINDOW_DAYS = 90
+DEFAULT_ROLLING = 5
+MAX_PATIENTS = 50
+MAX_TREND_LIMIT = 500
+MISSING = -1
+EPOCH = date(2000, 1, 1)
+_EPOCH_DT = datetime(2000, 1, 1)
+DAY = 86400
+# julianday('2000-01-01'); recorded_at -> seconds since EPOCH, clamped to int32
+_T_SQL = ("COALESCE(max(min(CAST((julianday(recorded_at) - 2451544.5) * 86400 AS INTEGER), "
+          "2147483647), -2147483647), -2147483648)")
+
+
+def bp_category(systolic: Optional[int], diastolic: Optional[int]) -> str:
+    systolic = systolic or 0
+    diastolic = diastolic or 0
+    if systolic >= BP_HIGH[0] or diastolic >= BP_HIGH[1]:
+        return "High"
+    if systolic >= BP_ELEVATED[0] or diastolic >= BP_ELEVATED[1]:
+        return "Elevated"
+    if systolic >= BP_NORMAL_MIN[0] and diastolic >= BP_NORMAL_MIN[1]:
+        return "Normal"
+    return "Low"
+
+
+def available() -> bool:
+    return np is not None
+
+
+class AnalyticsError(ValueError):
+    """Bad analytics parameters; the message is safe to return."""
+
+
+class Query(NamedTuple):
+    start: date
+    end: date  # inclusive
+    metrics: Tuple[str, ...]
+    usns: Tuple[str, ...]
+    trend: Optional[str]
+    falling: bool
+    limit: int
+    min_readings: int
+    rolling: int
+    series: bool
+
+
+def parse_query(args: Mapping[str, str], today: date) -> Query:
+    def integer(name: str, default: int, low: int, high: int) -> int:
+        try:
+            value = int(args.get(name) or default)
+        except ValueError:
+            raise AnalyticsError(f"{name} must be an integer")
+        if not low <= value <= high:
+            raise AnalyticsError(f"{name} must be between {low} and {high}")
+        return value
+
+    try:
+        end = date.fromisoformat(args["to"]) if args.get("to") else today
+        start = (date.fromisoformat(args["from"]) if args.get("from")
+                 else end - timedelta(days=DEFAULT_WINDOW_DAYS - 1))
+    except ValueError:
+        raise AnalyticsError("from and to must be YYYY-MM-DD dates")
+    if start > end:
+        raise AnalyticsError("from must not be after to")
+
+    metrics = tuple(m for m in (args.get("metrics") or "").split(",") if m) or tuple(METRICS)
+    unknown = [m for m in metrics if m not in METRICS]
+    if unknown:
+        raise AnalyticsError(f"unknown metrics: {', '.join(unknown)} (known: {', '.join(METRICS)})")
+    usns = tuple(dict.fromkeys(u.strip() for u in (args.get("usn") or "").split(",") if u.strip()))
+    if len(usns) > MAX_PATIENTS:
+        raise AnalyticsError(f"at most {MAX_PATIENTS} usns per request")
+    trend = args.get("trend") or None
+    if trend is not None and trend not in METRICS:
+        raise AnalyticsError(f"unknown trend metric: {trend}")
+    direction = args.get("direction") or "rising"
+    if direction not in ("rising", "falling"):
+        raise AnalyticsError("direction must be rising or falling")
+    return Query(
+        start=start, end=end, metrics=metrics, usns=usns, trend=trend, falling=direction == "falling",
+        limit=integer("limit", 20, 1, MAX_TREND_LIMIT),
+        min_readings=integer("min_readings", 3, 2, 1000),
+        rolling=integer("rolling", DEFAULT_ROLLING, 1, 100),
+        series=(args.get("series") or "") in ("1", "true"),
+    )
+
+
+class Columns(NamedTuple):
+    ids: "np.ndarray"  # int64
+    patient: "np.ndarray"  # int32 index into VitalsColumns.usns
+    t: "np.ndarray"  # int32 seconds since EPOCH
+    values: "np.ndarray"  # int16 (len(METRICS), n) tenths, MISSING when NULL
+
+    def take(self, keep: "np.ndarray") -> "Columns":
+        return Columns(self.ids[keep], self.patient[keep], self.t[keep], self.values[:, keep])
+
+
+def _concat(parts: Sequence[Columns]) -> Columns:
+    return Columns(
+        np.concatenate([p.ids for p in parts]),
+        np.concatenate([p.patient for p in parts]),
+        np.concatenate([p.t for p in parts]),
+        np.concatenate([p.values for p in parts], axis=1),
+    )
+
+
+def _empty() -> Columns:
+    return Columns(np.empty(0, np.int64), np.empty(0, np.int32), np.empty(0, np.int32),
+                   np.empty((len(METRICS), 0), np.int16))
+
+
+class VitalsColumns:
+    """In-memory columnar copy of vitals, refreshed from the change stamps."""
+
+    def __init__(self, chunk: int = 50_000) -> None:
+        self.chunk = chunk
+        self.usns: List[str] = []
+        self._codes: Dict[str, int] = {}
+        self._data: Optional[Columns] = None
+        self._cursor = -1
+        self._lock = threading.Lock()
+        self._stats = {"full_loads": 0, "refreshes": 0, "last_refresh_ms": 0.0}
+
+    def _code(self, usn: str) -> int:
+        code = self._codes.get(usn)
+        if code is None:
+            code = self._codes[usn] = len(self.usns)
+            self.usns.append(usn)
+        return code
+
+    def _load(self, conn, where: str = "", params: Tuple[Any, ...] = ()) -> Columns:
+        measures = ", ".join(
+            f"COALESCE(max(min(CAST(round({col} * 10) AS INTEGER), 32767), 0), {MISSING})"
+            for col in METRICS.values()
+        )
+        cur = conn.execute(f"SELECT id, usn, {_T_SQL}, {measures} FROM vitals {where}", params)
+        parts = []
+        while True:
+            rows = cur.fetchmany(self.chunk)
+            if not rows:
+                break
+            cols = list(zip(*rows))
+            parts.append(Columns(
+                np.array(cols[0], np.int64),
+                np.fromiter(map(self._code, cols[1]), np.int32, len(rows)),
+                np.array(cols[2], np.int32),
+                np.array(cols[3:], np.int16),
+            ))
+        return _concat(parts) if parts else _empty()
+
+    def snapshot(self, conn) -> Columns:
+        """Bring the copy up to date with ``conn`` and return it (treat as read-only)."""
+        with self._lock:
+            t0 = time.perf_counter()
+            conn.execute("BEGIN")  # one read snapshot for the stamp and the rows
+            try:
+                seq = conn.execute("SELECT seq FROM change_seq WHERE id = 1").fetchone()[0]
+                if self._data is None or seq < self._cursor:
+                    # First use, or the database was replaced
+                    self._data = self._load(conn)
+                    self._stats["full_loads"] += 1
+                elif seq != self._cursor:
+                    changed = self._load(conn, "WHERE rowversion > ?", (self._cursor,))
+                    deleted = np.array([r[0] for r in conn.execute(
+                        "SELECT CAST(row_key AS INTEGER) FROM sync_tombstones "
+                        "WHERE table_name = 'vitals' AND rowversion > ?", (self._cursor,))], np.int64)
+                    data = self._data
+                    # Updated or deleted rows are dropped and re-added; pure appends skip the scan
+                    if deleted.size or (changed.ids.size and data.ids.size
+                                        and changed.ids.min() <= data.ids.max()):
+                        data = data.take(~np.isin(data.ids, np.concatenate([changed.ids, deleted])))
+                    self._data = _concat([data, changed]) if changed.ids.size else data
+                    self._stats["refreshes"] += 1
+                self._cursor = seq
+            finally:
+                conn.rollback()
+            self._stats["last_refresh_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+            return self._data
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = 0 if self._data is None else self._data.ids.size
+            nbytes = 0 if self._data is None else sum(a.nbytes for a in self._data)
+            return dict(self._stats, rows=rows, patients=len(self.usns), bytes=nbytes, cursor=self._cursor)
+
+
+def _seconds(d: date) -> int:
+    return (d - EPOCH).days * DAY
+
+
+def _ts(seconds: int) -> str:
+    return (_EPOCH_DT + timedelta(seconds=int(seconds))).isoformat()
+
+
+def _tenths(value: float) -> int:
+    return int(round(value * 10))
+
+
+def _summary(tenths: "np.ndarray", metric: str) -> Dict[str, Any]:
+    """n, mean, min, max, percentiles and out-of-range counts of one measure (valid values only)."""
+    n = int(tenths.size)
+    out: Dict[str, Any] = {"n": n}
+    if not n:
+        return out
+    counts = np.bincount(tenths)
+    cum = np.cumsum(counts)
+    # Nearest-rank percentiles straight off the histogram
+    ranks = np.maximum(np.ceil(np.array(PERCENTILES) / 100 * n), 1)
+    at = np.searchsorted(cum, ranks)
+    out.update({
+        "mean": round(float(np.dot(counts, np.arange(counts.size))) / n / 10, 2),
+        "min": int(np.argmax(counts > 0)) / 10,
+        "max": (counts.size - 1) / 10,
+    })
+    out.update({f"p{p}": int(v) / 10 for p, v in zip(PERCENTILES, at)})
+    low, high = NORMAL_RANGES.get(metric, (None, None))
+    if low is not None:
+        out["below_range"] = int(cum[min(_tenths(low), counts.size) - 1])
+    if high is not None:
+        out["above_range"] = n - int(cum[min(_tenths(high), counts.size - 1)])
+    return out
+
+
+def _out_of_range(values: "np.ndarray") -> "np.ndarray":
+    """Per reading: any measure outside NORMAL_RANGES."""
+    flag = np.zeros(values.shape[1], bool)
+    for i, metric in enumerate(METRICS):
+        low, high = NORMAL_RANGES.get(metric, (None, None))
+        v = values[i]
+        if low is not None:
+            flag |= (v >= 0) & (v < _tenths(low))
+        if high is not None:
+            flag |= v > _tenths(high)
+    return flag
+
+
+def bp_categories(systolic: "np.ndarray", diastolic: "np.ndarray") -> Dict[str, int]:
+    """Counts per BP category; same rules as ``bp_category``, over arrays of whole mmHg."""
+    high = (systolic >= BP_HIGH[0]) | (diastolic >= BP_HIGH[1])
+    elevated = ~high & ((systolic >= BP_ELEVATED[0]) | (diastolic >= BP_ELEVATED[1]))
+    normal = ~high & ~elevated & (systolic >= BP_NORMAL_MIN[0]) & (diastolic >= BP_NORMAL_MIN[1])
+    n_high, n_elevated, n_normal = int(high.sum()), int(elevated.sum()), int(normal.sum())
+    return {"Low": int(systolic.size) - n_high - n_elevated - n_normal, "Normal": n_normal,
+            "Elevated": n_elevated, "High": n_high}
+
+
+def _slopes(patient: "np.ndarray", days: "np.ndarray", y: "np.ndarray", size: int):
+    """Per-patient n and least-squares slope of ``y`` over ``days`` (NaN below two distinct times)."""
+    n = np.bincount(patient, minlength=size).astype(np.float64)
+    sx = np.bincount(patient, days, size)
+    sy = np.bincount(patient, y, size)
+    sxx = np.bincount(patient, days * days, size)
+    sxy = np.bincount(patient, days * y, size)
+    den = n * sxx - sx * sx
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.where(den > 1e-9, (n * sxy - sx * sy) / den, np.nan)
+    return n, slope
+
+
+def _trend(data: Columns, window: "np.ndarray", usns: List[str], q: Query) -> List[Dict[str, Any]]:
+    """Patients whose ``q.trend`` measure rose (or fell) fastest over the window."""
+    i = list(METRICS).index(q.trend)
+    sel = window & (data.values[i] >= 0)
+    patient = data.patient[sel]
+    if not patient.size:
+        return []
+    days = (data.t[sel] - _seconds(q.start)) / DAY
+    y = data.values[i][sel] / 10
+    n, slope = _slopes(patient, days, y, len(usns))
+    slope[n < q.min_readings] = np.nan
+    ranked = np.where(~np.isnan(slope))[0]
+    order = ranked[np.argsort(slope[ranked] if q.falling else -slope[ranked], kind="stable")][:q.limit]
+    means = np.bincount(patient, y, len(usns))
+    return [
+        {"usn": usns[p], "n": int(n[p]), "slope_per_30d": round(float(slope[p]) * 30, 3),
+         "mean": round(float(means[p] / n[p]), 2)}
+        for p in order
+    ]
+
+
+def _rolling(y: "np.ndarray", w: int) -> "np.ndarray":
+    c = np.cumsum(np.insert(y, 0, 0.0))
+    out = np.full(y.size, np.nan)
+    if y.size >= w:
+        out[w - 1:] = (c[w:] - c[:-w]) / w
+    return out
+
+
+def _patient(data: Columns, window: "np.ndarray", code: Optional[int], q: Query) -> Optional[Dict[str, Any]]:
+    if code is None:
+        return None
+    sel = np.where(window & (data.patient == code))[0]
+    sel = sel[np.argsort(data.t[sel], kind="stable")]
+    t = data.t[sel]
+    out: Dict[str, Any] = {"n": int(sel.size)}
+    if not sel.size:
+        return out
+    out["first"], out["last"] = _ts(t[0]), _ts(t[-1])
+    for metric in q.metrics:
+        i = list(METRICS).index(metric)
+        raw = data.values[i][sel]
+        ok = raw >= 0
+        y, days = raw[ok] / 10, (t[ok] - t[0]) / DAY
+        m: Dict[str, Any] = {"n": int(y.size)}
+        if y.size:
+            rolling = _rolling(y, q.rolling)
+            slope = np.nan
+            if y.size >= 2 and np.ptp(days) > 0:
+                slope = float(np.polyfit(days, y, 1)[0])
+            m.update({
+                "mean": round(float(y.mean()), 2), "min": float(y.min()), "max": float(y.max()),
+                "last": float(y[-1]),
+                "rolling_mean": None if np.isnan(rolling[-1]) else round(float(rolling[-1]), 2),
+                "slope_per_30d": None if np.isnan(slope) else round(slope * 30, 3),
+            })
+            low, high = NORMAL_RANGES.get(metric, (None, None))
+            if low is not None or high is not None:
+                m["out_of_range"] = int((y < low).sum() if low is not None else 0) + \
+                    int((y > high).sum() if high is not None else 0)
+            if q.series:
+                m["series"] = [
+                    {"t": _ts(ts), "value": float(v), "rolling_mean": None if np.isnan(r) else round(float(r), 2)}
+                    for ts, v, r in zip(t[ok], y, rolling)
+                ]
+        out[metric] = m
+    return out
+
+
+def analyse(store: VitalsColumns, conn, q: Query) -> Dict[str, Any]:
+    data = store.snapshot(conn)
+    usns = store.usns
+    t0 = time.perf_counter()
+    window = (data.t >= _seconds(q.start)) & (data.t < _seconds(q.end + timedelta(days=1)))
+    values = data.values[:, window]
+    result: Dict[str, Any] = {
+        "window": {
+            "from": q.start.isoformat(), "to": q.end.isoformat(), "readings": int(values.shape[1]),
+            "patients": int(np.count_nonzero(np.bincount(data.patient[window], minlength=len(usns)))),
+        },
+    }
+
+    metrics = {}
+    for metric in q.metrics:
+        v = values[list(METRICS).index(metric)]
+        metrics[metric] = _summary(v[v >= 0], metric)
+    result["metrics"] = metrics
+
+    sys_i, dia_i = list(METRICS).index("systolic"), list(METRICS).index("diastolic")
+    both = (values[sys_i] >= 0) & (values[dia_i] >= 0)
+    result["bp_categories"] = bp_categories(values[sys_i][both] // 10, values[dia_i][both] // 10)
+
+    flagged = _out_of_range(values)
+    result["out_of_range"] = {
+        "readings": int(flagged.sum()),
+        "patients": int(np.count_nonzero(np.bincount(data.patient[window][flagged], minlength=len(usns)))),
+        "ranges": {k: list(v) for k, v in NORMAL_RANGES.items()},
+    }
+
+    if q.trend:
+        result["trend"] = {"metric": q.trend, "direction": "falling" if q.falling else "rising",
+                           "patients": _trend(data, window, usns, q)}
+    if q.usns:
+        codes = store._codes
+        result["patients"] = {usn: _patient(data, window, codes.get(usn), q) for usn in q.usns}
+
+    result["source"] = dict(store.stats(), compute_ms=round((time.perf_counter() - t0) * 1000, 3))
+    return result
@@ -0,0 +1,151 @@
+"""
+Downsampled vitals series for long-history charts.
+
+``vitals_rollups`` holds, per patient and per day, week (from Monday) and
+month, each measure's count, sum, min and max. Triggers on vitals
+(migration 8) fold new readings into their buckets and re-aggregate a
+bucket from vitals when a reading in it is changed or deleted, so a chart
+reads one row per bucket instead of every reading. ``reconcile`` rebuilds
+the table from vitals and reports any drift; this module's CLI runs it.
+"""
+from __future__ import annotations
+
+import sqlite3
+from datetime import date
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+from migrations import ROLLUP_COLUMNS, ROLLUP_RESOLUTIONS, VITALS_ROLLUP_SOURCE
+from vitals_analytics import METRICS
+
+AGGREGATES = ("min", "max", "mean")
+# resolution=auto picks the finest resolution with at most this many buckets
+MAX_AUTO_POINTS = 400
+
+
+class RollupError(ValueError):
+    """Bad series parameters; the message is safe to return."""
+
+
+class SeriesQuery(NamedTuple):
+    resolution: str  # day, week, month or auto
+    metrics: Tuple[str, ...]
+    aggregates: Tuple[str, ...]
+    start: Optional[str]  # inclusive bucket bounds, YYYY-MM-DD
+    end: Optional[str]
+
+
+def parse_query(args: Mapping[str, str]) -> SeriesQuery:
+    resolution = args.get("resolution") or "auto"
+    if resolution != "auto" and resolution not in ROLLUP_RESOLUTIONS:
+        raise RollupError(f"resolution must be auto or one of: {', '.join(ROLLUP_RESOLUTIONS)}")
+    metrics = tuple(m for m in (args.get("metrics") or "").split(",") if m) or tuple(METRICS)
+    unknown = [m for m in metrics if m not in METRICS]
+    if unknown:
+        raise RollupError(f"unknown metrics: {', '.join(unknown)} (known: {', '.join(METRICS)})")
+    aggregates = tuple(a for a in (args.get("agg") or "").split(",") if a) or AGGREGATES
+    unknown = [a for a in aggregates if a not in AGGREGATES]
+    if unknown:
+        raise RollupError(f"unknown agg: {', '.join(unknown)} (known: {', '.join(AGGREGATES)})")
+    bounds = []
+    for name in ("from", "to"):
+        value = args.get(name) or None
+        if value is not None:
+            try:
+                value = date.fromisoformat(value).isoformat()
+            except ValueError:
+                raise RollupError(f"{name} must be a YYYY-MM-DD date")
+        bounds.append(value)
+    return SeriesQuery(resolution, metrics, aggregates, bounds[0], bounds[1])
+
+
+def _window(resolution: str, q: SeriesQuery) -> Tuple[str, Tuple[Any, ...]]:
+    where, params = "", []
+    if q.start:
+        # From the bucket that contains ``from``
+        where += f" AND bucket >= {ROLLUP_RESOLUTIONS[resolution][0].format(t='?')}"
+        params.append(q.start)
+    if q.end:
+        where += " AND bucket <= ?"
+        params.append(q.end)
+    return where, tuple(params)
+
+
+def _pick_resolution(conn: sqlite3.Connection, usn: str, q: SeriesQuery) -> str:
+    for resolution in ROLLUP_RESOLUTIONS:
+        where, params = _window(resolution, q)
+        points = conn.execute(
+            f"SELECT COUNT(*) FROM vitals_rollups WHERE usn = ? AND resolution = ?{where}",
+            (usn, resolution) + params,
+        ).fetchone()[0]
+        if points <= MAX_AUTO_POINTS:
+            return resolution
+    return resolution
+
+
+def read_series(conn: sqlite3.Connection, usn: str, q: SeriesQuery) -> Dict[str, Any]:
+    """One point per bucket: reading count and the requested aggregates of each metric."""
+    resolution = _pick_resolution(conn, usn, q) if q.resolution == "auto" else q.resolution
+    where, params = _window(resolution, q)
+    columns = ["bucket", "n"] + [
+        f"{METRICS[m]}_{agg}" for m in q.metrics for agg in ("n", "sum", "min", "max")
+    ]
+    rows = conn.execute(
+        f"SELECT {', '.join(columns)} FROM vitals_rollups WHERE usn = ? AND resolution = ?{where} "
+        "ORDER BY bucket",
+        (usn, resolution) + params,
+    ).fetchall()
+
+    points = []
+    for row in rows:
+        point: Dict[str, Any] = {"t": row[0], "n": row[1]}
+        for i, metric in enumerate(q.metrics):
+            n, total, low, high = row[2 + 4 * i: 6 + 4 * i]
+            if not n:
+                point[metric] = None
+                continue
+            values = {"min": round(low, 2), "max": round(high, 2), "mean": round(total / n, 2)}
+            point[metric] = dict({a: values[a] for a in q.aggregates}, n=n)
+        points.append(point)
+    return {
+        "usn": usn, "resolution": resolution, "from": q.start, "to": q.end,
+        "metrics": list(q.metrics), "agg": list(q.aggregates), "points": points,
+    }
+
+
+def reconcile(conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+    """Rebuild ``vitals_rollups`` from vitals; return the buckets that had drifted."""
+    def key(row: Tuple[Any, ...]):
+        return tuple(row[:3])
+
+    def values(row: Tuple[Any, ...]):
+        # Sums are floats added in a different order by the triggers
+        return tuple(round(v, 6) if isinstance(v, float) else v for v in row[3:])
+
+    columns = ", ".join(ROLLUP_COLUMNS)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        expected = {key(r): values(r) for r in conn.execute(VITALS_ROLLUP_SOURCE)}
+        actual = {key(r): values(r) for r in conn.execute(f"SELECT {columns} FROM vitals_rollups")}
+        drift = [
+            {"usn": k[0], "resolution": k[1], "bucket": k[2],
+             "expected_n": (expected.get(k) or (0,))[0], "actual_n": (actual.get(k) or (0,))[0]}
+            for k in sorted(expected.keys() | actual.keys())
+            if expected.get(k) != actual.get(k)
+        ]
+        conn.execute("DELETE FROM vitals_rollups")
+        conn.execute(f"INSERT INTO vitals_rollups({columns}) {VITALS_ROLLUP_SOURCE}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return drift
+
+
+if __name__ == "__main__":
+    from app import run_maintenance
+
+    rows = run_maintenance(reconcile)
+    for row in rows:
+        print(f"{row['usn']} {row['resolution']} {row['bucket']}: stored n={row['actual_n']}, "
+              f"recomputed n={row['expected_n']}")
+    print(f"{len(rows)} bucket(s) drifted; vitals_rollups rebuilt")
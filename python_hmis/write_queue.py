@@ -0,0 +1,220 @@
+"""
+Single-writer queue for the HMIS backend.
+
+SQLite allows one writer at a time. With Waitress running handlers on many
+threads, each committing on its own pooled connection, concurrent POSTs
+queue up on the file lock and the unlucky ones give up with ``database is
+locked``. Instead, handlers hand their writes to one writer thread that owns
+its own connection:
+
+    new_id = writer.submit(lambda conn: conn.execute("INSERT ...", params).lastrowid)
+
+``submit`` blocks until the unit has committed and returns its result (or
+re-raises its exception). Whatever is queued when the writer wakes up is run
+in one ``BEGIN IMMEDIATE`` transaction and one commit (group commit); each
+unit runs under its own savepoint, so a failing unit is rolled back alone
+and the rest of the batch still commits. Units must not commit themselves.
+
+Work that manages its own transactions (sync ingest, counter reconcile,
+index rebuilds) is submitted with ``exclusive=True`` and runs by itself
+between batches. Reads stay on the pooled connections.
+
+Tuning via ``HMIS_WRITE_BATCH`` (max units per commit, default 64) and
+``HMIS_WRITE_TIMEOUT`` (seconds a unit may wait in the queue, default 30).
+"""
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from db_pool import add_db_time, current_query_trace, set_query_trace
+
+WriteFn = Callable[[sqlite3.Connection], Any]
+
+
+class WriteTimeout(RuntimeError):
+    """Raised when a write is still queued after the queue timeout."""
+
+
+class _Unit:
+    __slots__ = ("fn", "exclusive", "queued_at", "done", "result", "error", "trace")
+
+    def __init__(self, fn: WriteFn, exclusive: bool) -> None:
+        self.fn = fn
+        self.exclusive = exclusive
+        self.queued_at = time.monotonic()
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        # The submitting request's query trace, so its writes show up there too
+        self.trace = current_query_trace()
+
+
+def write_config_from_env() -> Dict[str, Any]:
+    env = os.environ.get
+    return {
+        "max_batch": int(env("HMIS_WRITE_BATCH", "64")),
+        "timeout": float(env("HMIS_WRITE_TIMEOUT", "30")),
+    }
+
+
+class WriteQueue:
+    def __init__(self, connect: Callable[[], sqlite3.Connection], max_batch: int = 64,
+                 timeout: float = 30.0) -> None:
+        self._connect = connect
+        self.max_batch = max(1, max_batch)
+        self.timeout = timeout
+        self._pending: Deque[_Unit] = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {
+            "submitted": 0,
+            "committed": 0,
+            "failed": 0,
+            "timeouts": 0,
+            "batches": 0,
+            "exclusive": 0,
+            "peak_queue_depth": 0,
+            "last_batch_size": 0,
+            "max_batch_size": 0,
+            "queue_wait_seconds": 0.0,
+            "max_queue_wait_seconds": 0.0,
+            "commit_seconds": 0.0,
+        }
+        # Batch sizes by power-of-two bucket: "1", "2", "4", ... (upper bounds)
+        self._batch_sizes: Dict[str, int] = {}
+
+    def submit(self, fn: WriteFn, exclusive: bool = False) -> Any:
+        """Run ``fn(conn)`` on the writer; return its result once committed."""
+        if threading.current_thread() is self._thread:
+            # Already on the writer (a unit submitting more work): just run it
+            return fn(self._conn)
+        unit = _Unit(fn, exclusive)
+        t0 = time.perf_counter()
+        with self._cond:
+            self._ensure_started()
+            self._pending.append(unit)
+            self._stats["submitted"] += 1
+            if len(self._pending) > self._stats["peak_queue_depth"]:
+                self._stats["peak_queue_depth"] = len(self._pending)
+            self._cond.notify()
+        if not unit.done.wait(self.timeout):
+            with self._cond:
+                if unit in self._pending:
+                    self._pending.remove(unit)
+                    self._stats["timeouts"] += 1
+                    raise WriteTimeout(f"Write still queued after {self.timeout:.0f}s")
+            # Already running: it will finish, so wait for the outcome
+            unit.done.wait()
+        # Waiting on the writer counts as the caller's SQLite time
+        add_db_time(time.perf_counter() - t0)
+        if unit.error is not None:
+            raise unit.error
+        return unit.result
+
+    def _ensure_started(self) -> None:
+        if self._thread is None:
+            self._conn = self._connect()
+            self._thread = threading.Thread(target=self._run, name="hmis-writer", daemon=True)
+            self._thread.start()
+
+    def _next_batch(self) -> List[_Unit]:
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            batch = [self._pending.popleft()]
+            if not batch[0].exclusive:
+                while (self._pending and len(batch) < self.max_batch
+                       and not self._pending[0].exclusive):
+                    batch.append(self._pending.popleft())
+            now = time.monotonic()
+            for unit in batch:
+                waited = now - unit.queued_at
+                self._stats["queue_wait_seconds"] += waited
+                if waited > self._stats["max_queue_wait_seconds"]:
+                    self._stats["max_queue_wait_seconds"] = waited
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            t0 = time.monotonic()
+            if batch[0].exclusive:
+                self._run_exclusive(batch[0])
+            else:
+                self._run_batch(batch)
+            elapsed = time.monotonic() - t0
+            with self._cond:
+                self._record(batch, elapsed)
+            for unit in batch:
+                unit.done.set()
+
+    def _run_exclusive(self, unit: _Unit) -> None:
+        set_query_trace(unit.trace)
+        try:
+            unit.result = unit.fn(self._conn)
+        except BaseException as e:
+            unit.error = e
+        finally:
+            set_query_trace(None)
+            if self._conn.in_transaction:
+                self._conn.rollback()
+
+    def _run_batch(self, batch: List[_Unit]) -> None:
+        conn = self._conn
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for unit in batch:
+                conn.execute("SAVEPOINT unit")
+                set_query_trace(unit.trace)
+                try:
+                    unit.result = unit.fn(conn)
+                except Exception as e:
+                    unit.error = e
+                    conn.execute("ROLLBACK TO unit")
+                finally:
+                    set_query_trace(None)
+                conn.execute("RELEASE unit")
+            conn.commit()
+        except BaseException as e:
+            # BEGIN/COMMIT failed, or a unit left the transaction unusable
+            if conn.in_transaction:
+                conn.rollback()
+            for unit in batch:
+                unit.result = None
+                unit.error = unit.error or e
+
+    def _record(self, batch: List[_Unit], elapsed: float) -> None:
+        stats = self._stats
+        failed = sum(1 for unit in batch if unit.error is not None)
+        stats["failed"] += failed
+        stats["committed"] += len(batch) - failed
+        stats["commit_seconds"] += elapsed
+        if batch[0].exclusive:
+            stats["exclusive"] += 1
+            return
+        stats["batches"] += 1
+        stats["last_batch_size"] = len(batch)
+        if len(batch) > stats["max_batch_size"]:
+            stats["max_batch_size"] = len(batch)
+        bucket = str(1 << (len(batch) - 1).bit_length())
+        self._batch_sizes[bucket] = self._batch_sizes.get(bucket, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            out: Dict[str, Any] = dict(self._stats)
+            grouped = self._stats["committed"] + self._stats["failed"] - self._stats["exclusive"]
+            out.update({
+                "queue_depth": len(self._pending),
+                "max_batch": self.max_batch,
+                "mean_batch_size": round(grouped / self._stats["batches"], 2) if self._stats["batches"] else 0,
+                "batch_sizes": dict(sorted(self._batch_sizes.items(), key=lambda kv: int(kv[0]))),
+                "queue_wait_seconds": round(self._stats["queue_wait_seconds"], 6),
+                "max_queue_wait_seconds": round(self._stats["max_queue_wait_seconds"], 6),
+                "commit_seconds": round(self._stats["commit_seconds"], 6),
+            })
+        return out